@@ -6,9 +6,11 @@ When it is time, move the I2B2 annotation reader to a Annotation subtype,
 and move these tests tos omewhere functional
 """
 
+import os
+import tempfile
 import unittest
 
-from text2phenotype.annotations.i2b2_reader import I2B2Reader, I2B2Entry
+from text2phenotype.annotations.i2b2_reader import I2B2Reader, I2B2Entry, I2B2TokenIndex
 from text2phenotype.annotations.file_helpers import Annotation
 
 class I2B2AnnotationReader(unittest.TestCase):
@@ -249,6 +251,51 @@ of pills."""
         self.assertEqual(expected_ann["label"], ann_set.entries[0].label)
         self.assertEqual(expected_ann["text_range"], ann_set.entries[0].text_range)
 
+    def test_doc_token_index(self):
+        raw_text = "HISTORY OF  PRESENT\n\n  known history"
+        token_index = self.i2b2_reader.get_doc_token_index(raw_text)
+
+        self.assertEqual(3, token_index.line_count)
+        self.assertEqual(3, token_index.line_token_count(0))
+        self.assertEqual(0, token_index.line_token_count(1))
+        self.assertEqual((12, 19), token_index.char_range(0, 2))
+        self.assertEqual((23, 28), token_index.char_range(2, 0))
+        # negative indexes count from the end, as in the nested token lists
+        self.assertEqual((29, 36), token_index.char_range(-1, -1))
+        with self.assertRaises(IndexError):
+            token_index.char_range(1, 0)
+        with self.assertRaises(IndexError):
+            token_index.char_range(0, 3)
+
+        doc_token_ranges = self.i2b2_reader.get_doc_token_ranges(raw_text)
+        self.assertEqual({"token": "history", "text_range": (29, 36)}, doc_token_ranges[2][1])
+        from_ranges = I2B2TokenIndex.from_token_ranges(doc_token_ranges)
+        self.assertListEqual(token_index.token_starts.tolist(), from_ranges.token_starts.tolist())
+        self.assertListEqual(token_index.line_token_offsets.tolist(), from_ranges.line_token_offsets.tolist())
+
+    def test_parse_annotation_files(self):
+        raw_text = "\n" * 42 + "spit , folate 1 mg p.o. q.d. , Haldol 2 mg IV q. 6 p.r.n. agitation"
+        ann_text = 'c="agitation" 43:15 43:15||t="problem"\nc="folate" 43:2 43:2||t="problem"'
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_paths = []
+            for i in range(3):
+                text_path = os.path.join(temp_dir, f"{i}.txt")
+                ann_path = os.path.join(temp_dir, f"{i}.con")
+                with open(text_path, "w") as f:
+                    f.write(raw_text)
+                with open(ann_path, "w") as f:
+                    f.write(ann_text)
+                file_paths.append((text_path, ann_path))
+
+            for n_jobs in (1, 2):
+                ann_sets = self.i2b2_reader.parse_i2b2_label_annotation_files(
+                    file_paths, "Problem", "c", n_jobs=n_jobs)
+                self.assertEqual(3, len(ann_sets))
+                for ann_set in ann_sets:
+                    self.assertListEqual(
+                        [("agitation", [100, 109]), ("folate", [49, 55])],
+                        [(entry.text, entry.text_range) for entry in ann_set.entries])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,108 @@
+"""
+Import time of the package entry points, measured with `python -X importtime` in fresh interpreters.
+
+python -m tests.benchmarks.import_benchmark text2phenotype.tasks.rmq_worker --runs 5 --top 15
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import (
+    Dict,
+    List,
+    NamedTuple,
+    Set,
+)
+
+# imported by short-lived tools and workers only if they really use them
+HEAVY_MODULES = (
+    'bs4',
+    'coloredlogs',
+    'django',
+    'elasticapm',
+    'git',
+    'nltk',
+    'pandas',
+)
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    # 0 for the modules imported directly by the measured statement (or the interpreter startup)
+    depth: int
+
+
+def parse_importtime(stderr: str) -> List[ImportTime]:
+    """Parse the `-X importtime` output: 'import time: self [us] | cumulative | imported package'"""
+    result = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # header line
+            continue
+        name = fields[2][1:]
+        module = name.lstrip(' ')
+        result.append(ImportTime(module=module,
+                                 self_us=int(fields[0]),
+                                 cumulative_us=int(fields[1]),
+                                 depth=(len(name) - len(module)) // 2))
+    return result
+
+
+def measure_import(module: str) -> List[ImportTime]:
+    """Import the module in a new interpreter, return the import times of all the imported modules"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}' if module else 'pass'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               universal_newlines=True, check=True)
+    return parse_importtime(completed.stderr)
+
+
+def total_import_time(import_times: List[ImportTime], startup_modules: Set[str]) -> int:
+    """Time of all the imports triggered by the measured statement (interpreter startup excluded), microseconds"""
+    return sum(import_time.cumulative_us for import_time in import_times
+               if import_time.depth == 0 and import_time.module not in startup_modules)
+
+
+def imported_heavy_modules(import_times: List[ImportTime]) -> List[str]:
+    """Top level heavy dependencies (see HEAVY_MODULES) imported with the module"""
+    return sorted({import_time.module.split('.')[0] for import_time in import_times} & set(HEAVY_MODULES))
+
+
+def benchmark(module: str, runs: int = 5) -> Dict:
+    startup_modules = {import_time.module for import_time in measure_import('')}
+    times = []
+    import_times = []
+    for _ in range(runs):
+        import_times = measure_import(module)
+        times.append(total_import_time(import_times, startup_modules))
+
+    return {
+        'module': module,
+        'median_ms': statistics.median(times) / 1000,
+        'min_ms': min(times) / 1000,
+        'heavy_modules': imported_heavy_modules(import_times),
+        'slowest': sorted(import_times, key=lambda item: item.self_us, reverse=True),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(usage='Import time benchmark')
+    parser.add_argument('modules', nargs='+', help='modules to import, e.g. text2phenotype.tasks.rmq_worker')
+    parser.add_argument('--runs', type=int, default=5, help='number of fresh interpreters per module')
+    parser.add_argument('--top', type=int, default=10, help='number of the slowest imports to show')
+    args = parser.parse_args()
+
+    for module in args.modules:
+        result = benchmark(module, runs=args.runs)
+        print(f'{module}: median {result["median_ms"]:.1f} ms, min {result["min_ms"]:.1f} ms, '
+              f'heavy dependencies: {", ".join(result["heavy_modules"]) or "none"}')
+        for import_time in result['slowest'][:args.top]:
+            print(f'    {import_time.self_us / 1000:8.1f} ms  {import_time.module}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Throughput of a log heavy worker with the synchronous and the queue based (background writer) logging.
+
+python -m tests.benchmarks.log_benchmark --threads 4 --messages 20000 --write-delay 20
+
+--write-delay simulates a slow log sink (e.g. stdout consumed by a busy log driver), in microseconds per record
+"""
+import argparse
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from logging.handlers import QueueListener
+from typing import Dict
+
+from text2phenotype.common.log import (
+    LogQueueHandler,
+    OperationsAdapter,
+)
+from text2phenotype.common.log_context import (
+    LazyMessage,
+    LogContextFilter,
+    log_context,
+)
+from text2phenotype.common.log_formatters import OperationsFormatter
+
+
+def _worker(adapter: OperationsAdapter, worker_id: int, messages: int):
+    with log_context(worker_name='BenchmarkWorker', document_id=f'doc{worker_id}', chunk_number='1'):
+        for i in range(messages):
+            adapter.info(f'Processed token {i} of document doc{worker_id}', tid=f'tid{worker_id}')
+            # disabled debug messages cost nothing with LazyMessage
+            adapter.debug(LazyMessage(lambda: f'Tokens: {list(range(100))}'), tid=f'tid{worker_id}')
+
+
+class _SlowFileHandler(logging.FileHandler):
+    def __init__(self, filename: str, write_delay: float):
+        super().__init__(filename)
+        self.write_delay = write_delay
+
+    def emit(self, record: logging.LogRecord) -> None:
+        super().emit(record)
+        if self.write_delay:
+            time.sleep(self.write_delay)
+
+
+def run(log_async: bool, threads: int, messages: int, log_dir: str, write_delay: float = 0) -> Dict[str, float]:
+    name = f'log_benchmark_{"async" if log_async else "sync"}'
+    log_file = os.path.join(log_dir, f'{name}.log')
+
+    file_handler = _SlowFileHandler(log_file, write_delay)
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(OperationsFormatter())
+    listener = None
+    if log_async:
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        listener.start()
+        handler = LogQueueHandler(log_queue)
+    else:
+        handler = file_handler
+
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addFilter(LogContextFilter())
+    logger.addHandler(handler)
+    adapter = OperationsAdapter(logger, {})
+
+    workers = [threading.Thread(target=_worker, args=(adapter, i, messages)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    workers_time = time.perf_counter() - start
+
+    if listener:
+        listener.stop()
+    total_time = time.perf_counter() - start
+    logger.removeHandler(handler)
+    file_handler.close()
+
+    with open(log_file) as f:
+        lines = sum(1 for _ in f)
+
+    return {
+        'lines': lines,
+        'workers_seconds': workers_time,
+        'total_seconds': total_time,
+        'messages_per_second': threads * messages / workers_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(usage='Logging throughput benchmark')
+    parser.add_argument('--threads', type=int, default=4, help='number of worker threads')
+    parser.add_argument('--messages', type=int, default=20000, help='log messages per worker thread')
+    parser.add_argument('--write-delay', type=float, default=0, help='slow log sink, microseconds per record')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        for log_async in (False, True):
+            result = run(log_async, args.threads, args.messages, log_dir, write_delay=args.write_delay / 1e6)
+            print(f'{"async" if log_async else "sync":>5}: '
+                  f'{result["messages_per_second"]:>10.0f} messages/s in the workers, '
+                  f'workers {result["workers_seconds"]:.2f}s, '
+                  f'all written {result["total_seconds"]:.2f}s ({result["lines"]} lines)')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,11 @@
 import string
 import unittest
 
-from text2phenotype.common.common import chunk_text_by_size
+from text2phenotype.common.common import (
+    SplitPointIndex,
+    chunk_text_by_size,
+    get_best_split_point,
+)
 
 
 class TestChunking(unittest.TestCase):
@@ -33,6 +37,47 @@ class TestChunking(unittest.TestCase):
 
         self.assertEqual(full_text_check, text)
 
+    def test_chunks_text_split_points(self):
+        text = TEST_TEXT
+        split_index = SplitPointIndex(text)
+        for start in range(0, len(text), 997):
+            expected = start + 5000
+            if expected < len(text):
+                text_lower = text.lower()
+                for section in split_index.sections:
+                    end_point = text_lower.rfind(section, start + 4000, start + 5000)
+                    if end_point != -1:
+                        expected = end_point
+                        break
+            self.assertEqual(expected, get_best_split_point(text, start, 5000, 4000, split_index=split_index))
+
+
+class TestSplitPointIndex(unittest.TestCase):
+
+    def test_overlapping_sections(self):
+        split_index = SplitPointIndex('a\n\n\n\nb', sections=['\n\n\n'])
+        self.assertListEqual([1, 2], split_index.positions('\n\n\n').tolist())
+
+    def test_last_position(self):
+        split_index = SplitPointIndex('Page 1 text. PAGE 2 text. page 3')
+        self.assertListEqual([0, 13, 26], split_index.positions('page').tolist())
+        self.assertEqual(13, split_index.last_position('page', 0, 26))
+        # the section has to end before the end position
+        self.assertEqual(13, split_index.last_position('page', 0, 29))
+        self.assertEqual(26, split_index.last_position('page', 0, 30))
+        self.assertIsNone(split_index.last_position('page', 1, 13))
+
+    def test_best_split_point_section_order(self):
+        text = 'first part. second part\nthird part. fourth part and more text'
+        split_index = SplitPointIndex(text)
+        # '\n' is found in the window, but '. ' comes first in BEGINNING_SECTIONS
+        self.assertEqual(34, split_index.best_split_point(0, 40, 20))
+        self.assertEqual(23, split_index.best_split_point(0, 30, 15))
+        # no section in the window
+        self.assertEqual(45, split_index.best_split_point(40, 5, 1))
+        # end of the text
+        self.assertEqual(100, split_index.best_split_point(0, 100, 90))
+
 
 TEST_TEXT = """Note: Uploaded by patient, Steven Keating, after a brain tumor surgery (astrocytoma). This is the BWH legal medical record,
 with doctor phone numbers and patient ID codes/details blanked out. If interested, more information on this case-specific
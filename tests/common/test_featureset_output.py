@@ -1,5 +1,5 @@
 import unittest
-from text2phenotype.common.featureset_annotations import MachineAnnotation, Vectorization
+from text2phenotype.common.featureset_annotations import DocumentTypeAnnotation, MachineAnnotation, Vectorization
 from text2phenotype.constants.features import FeatureType
 
 
@@ -94,4 +94,40 @@ class TestBiomed1306AnnotationClass(unittest.TestCase):
                                                       'topography': [0]})
 
 
-
+class TestDocumentTypeAnnotation(unittest.TestCase):
+    @staticmethod
+    def section(code):
+        return [{'umlsConcept': [{'cui': code}]}]
+
+    def test_merge_section_tokens(self):
+        tokenization_results = [{'token': 'Page', 'range': [0, 4], 'speech': 'NN'},
+                                {'token': '1', 'range': [5, 6], 'speech': 'CD'},
+                                {'token': 'HISTORY', 'range': [7, 14], 'speech': 'NN'},
+                                {'token': 'of', 'range': [15, 17], 'speech': 'IN'},
+                                {'token': 'illness', 'range': [18, 25], 'speech': 'NN'},
+                                {'token': 'PLAN', 'range': [27, 31], 'speech': 'NN'},
+                                {'token': 'rest', 'range': [32, 36], 'speech': 'NN'}]
+        annotation = MachineAnnotation(tokenization_output=tokenization_results)
+        annotation.add_item(FeatureType.loinc_section, {'2': self.section('C1'), 3: self.section('C1'),
+                                                        '4': self.section('C1'), '5': self.section('C1'),
+                                                        '6': self.section('C2')})
+        annotation.add_item(FeatureType.clinical, {'0': [1], '4': [2], '5': [3]})
+
+        document_type = DocumentTypeAnnotation(annotation)
+        self.assertListEqual(['HISTORY of illness', 'PLAN', 'rest'], document_type.tokens)
+        self.assertListEqual([[7, 25], [27, 31], [32, 36]], document_type.range)
+        self.assertDictEqual({'0': self.section('C1'), '1': self.section('C1'), '2': self.section('C2')},
+                             document_type[FeatureType.loinc_section].to_dict())
+        self.assertDictEqual({1: [3]}, document_type[FeatureType.clinical].to_dict())
+        self.assertNotIn(FeatureType.speech, document_type.output_dict)
+        # the source annotation is not changed
+        self.assertListEqual([7, 14], annotation.range[2])
+        self.assertEqual(7, len(annotation.tokens))
+
+    def test_no_sections(self):
+        annotation = MachineAnnotation(tokenization_output=[{'token': 'Page', 'range': [0, 4], 'speech': 'NN'}])
+        annotation.add_item(FeatureType.loinc_section, {})
+
+        document_type = DocumentTypeAnnotation(annotation)
+        self.assertListEqual([], document_type.tokens)
+        self.assertListEqual([], document_type.range)
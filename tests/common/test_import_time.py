@@ -0,0 +1,33 @@
+import unittest
+
+from tests.benchmarks.import_benchmark import (
+    imported_heavy_modules,
+    measure_import,
+    parse_importtime,
+    total_import_time,
+)
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_parse_importtime(self):
+        stderr = ('import time: self [us] | cumulative | imported package\n'
+                  'import time:       100 |        100 |   yaml.reader\n'
+                  'import time:        50 |        150 | yaml\n'
+                  'import time:        20 |         20 | site\n')
+        import_times = parse_importtime(stderr)
+
+        self.assertListEqual(['yaml.reader', 'yaml', 'site'], [item.module for item in import_times])
+        self.assertListEqual([1, 0, 0], [item.depth for item in import_times])
+        self.assertEqual(150, total_import_time(import_times, startup_modules={'site'}))
+
+    def test_entry_points_without_heavy_dependencies(self):
+        for module in ('text2phenotype.common.log',
+                       'text2phenotype.tasks.rmq_worker',
+                       'text2phenotype.doc_type.predict'):
+            with self.subTest(module=module):
+                self.assertListEqual([], imported_heavy_modules(measure_import(module)))
+
+
+if __name__ == '__main__':
+    unittest.main()
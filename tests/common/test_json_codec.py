@@ -0,0 +1,24 @@
+import json
+import math
+import unittest
+
+from text2phenotype.common import json_codec
+
+
+class TestJsonCodec(unittest.TestCase):
+    def test_loads(self):
+        data = {'text': 'é', 'numbers': [1, 2.5, None, True]}
+        self.assertDictEqual(data, json_codec.loads(json.dumps(data)))
+        self.assertDictEqual(data, json_codec.loads(json.dumps(data).encode()))
+
+    def test_json_extensions(self):
+        self.assertTrue(math.isnan(json_codec.loads('NaN')))
+        self.assertEqual(2 ** 70, json_codec.loads(str(2 ** 70)))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            json_codec.loads('{')
+
+
+if __name__ == '__main__':
+    unittest.main()
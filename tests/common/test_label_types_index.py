@@ -0,0 +1,60 @@
+import unittest
+
+from text2phenotype.annotations.file_helpers import Annotation
+from text2phenotype.constants.features.label_types import (
+    CancerLabel,
+    LabLabel,
+    LabelList,
+    MedLabel,
+    PHILabel,
+    ProblemLabel,
+    get_label_enum_from_member_name,
+    get_label_from_text,
+)
+
+
+class TestLabelEnumIndex(unittest.TestCase):
+    def test_from_brat(self):
+        self.assertEqual(PHILabel.from_brat('date'), PHILabel.date)
+        self.assertEqual(PHILabel.from_brat('DATE'), PHILabel.date)
+        self.assertEqual(PHILabel.from_brat('location'), PHILabel.street)
+        self.assertEqual(MedLabel.from_brat('medication'), MedLabel.med)
+        self.assertEqual(PHILabel.from_brat('not a label'), PHILabel.na)
+
+    def test_get_from_int(self):
+        for label_enum in LabelList:
+            for member in label_enum:
+                self.assertEqual(label_enum.get_from_int(member.value.column_index).value.column_index,
+                                 member.value.column_index)
+        self.assertEqual(PHILabel.get_from_int('1'), PHILabel.date)
+        self.assertIsNone(PHILabel.get_from_int(1000))
+
+    def test_get_from_persistent_label(self):
+        for label_enum in LabelList:
+            for member in label_enum:
+                self.assertEqual(label_enum.get_from_persistent_label(member.value.persistent_label).value,
+                                 member.value)
+        self.assertIsNone(ProblemLabel.get_from_persistent_label(None))
+
+    def test_get_column_indices(self):
+        column_indices = CancerLabel.get_column_indices()
+        self.assertListEqual(sorted(member.value.column_index for member in CancerLabel), column_indices)
+        # a copy, the cached index is not changed
+        column_indices.append(1000)
+        self.assertNotIn(1000, CancerLabel.get_column_indices())
+
+    def test_get_label_enum_from_member_name(self):
+        self.assertEqual(get_label_enum_from_member_name('street'), PHILabel)
+        self.assertIsNone(get_label_enum_from_member_name('not a label'))
+        self.assertEqual(Annotation.category_label_from_enum_label_name('street'), 'PHI')
+
+    def test_get_label_from_text(self):
+        self.assertEqual(get_label_from_text('street'), PHILabel.street)
+        self.assertIsNone(get_label_from_text('na'))
+        self.assertIsNone(get_label_from_text('not a label'))
+        self.assertIn(get_label_from_text('lab').__class__, LabelList)
+        self.assertEqual(LabLabel.from_brat('lab'), LabLabel.lab)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import io
+import json
+import logging
+import queue
+import threading
+import unittest
+from unittest.mock import (
+    MagicMock,
+    patch,
+)
+
+from text2phenotype.common.log import (
+    LogQueueHandler,
+    LogQueueListener,
+    OperationsAdapter,
+)
+from text2phenotype.common.log_context import (
+    LazyMessage,
+    LogContextFilter,
+    get_log_context,
+    log_context,
+)
+from text2phenotype.common.log_formatters import OperationsFormatter
+
+
+class TestLogContext(unittest.TestCase):
+
+    def test_nested_context(self):
+        with log_context(worker_name='Worker', document_id='doc'):
+            with log_context(chunk_number='2', job_id=None):
+                self.assertDictEqual({'worker_name': 'Worker', 'document_id': 'doc', 'chunk_number': '2'},
+                                     get_log_context())
+            self.assertDictEqual({'worker_name': 'Worker', 'document_id': 'doc'}, get_log_context())
+        self.assertDictEqual({}, get_log_context())
+
+    def test_thread_context(self):
+        contexts = {}
+
+        def worker(name):
+            with log_context(document_id=name):
+                barrier.wait()
+                contexts[name] = get_log_context()
+
+        barrier = threading.Barrier(2)
+        threads = [threading.Thread(target=worker, args=(name,)) for name in ('a', 'b')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertDictEqual({'a': {'document_id': 'a'}, 'b': {'document_id': 'b'}}, contexts)
+
+    def test_lazy_message(self):
+        build = MagicMock(return_value='expensive')
+        logger = logging.getLogger('test_lazy_message')
+        logger.setLevel(logging.INFO)
+
+        with self.assertLogs(logger, level=logging.INFO) as logs:
+            logger.debug(LazyMessage(build))
+            build.assert_not_called()
+            logger.info(LazyMessage(build))
+        self.assertListEqual(['INFO:test_lazy_message:expensive'], logs.output)
+
+
+class TestQueueLogging(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        stream_handler = logging.StreamHandler(self.stream)
+        stream_handler.setFormatter(OperationsFormatter())
+
+        self.queue = queue.SimpleQueue()
+        self.listener = LogQueueListener(self.queue, stream_handler, respect_handler_level=True)
+        self.listener.start()
+
+        self.logger = logging.getLogger('test_queue_logging')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addFilter(LogContextFilter())
+        self.handler = LogQueueHandler(self.queue)
+        self.logger.addHandler(self.handler)
+        self.adapter = OperationsAdapter(self.logger, {})
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        if self.listener.running:
+            self.listener.stop()
+
+    def records(self):
+        self.listener.stop()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_context_from_calling_thread(self):
+        args = ['first']
+        with log_context(worker_name='Worker', document_id='doc', chunk_number='3'):
+            self.adapter.info('Processing %s', args, tid='tid')
+        # the message is merged before the record is written
+        args.append('second')
+        self.adapter.info('No context')
+
+        with_context, without_context = self.records()
+        self.assertEqual("Processing ['first']", with_context['message'])
+        self.assertEqual('tid', with_context['transaction_id'])
+        self.assertEqual('Worker', with_context['worker_name'])
+        self.assertEqual('doc', with_context['document_id'])
+        self.assertEqual('3', with_context['chunk_number'])
+        self.assertNotIn('worker_name', without_context)
+
+    def test_exception(self):
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            self.adapter.exception('Failed')
+
+        record, = self.records()
+        self.assertEqual('Failed', record['message'])
+        self.assertIn('ValueError: boom', record['exc_info'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from text2phenotype.common.common import (
+    SpanMatcher,
+    clean_text,
+    longest_span,
+    match_query,
+)
+
+
+class TestSpanMatcher(unittest.TestCase):
+    document = 'Wedge biopsy of right upper lobe showing: Adenocarcinoma, Grade 2, Measuring 1 cm in diameter'
+
+    def test_match(self):
+        matcher = SpanMatcher(self.document)
+        for query in ['Adenocarcinoma', 'grade 2', 'lobe (showing', 'not there', '']:
+            self.assertEqual(match_query(query, self.document), matcher.match(query))
+
+    def test_longest_span(self):
+        matcher = SpanMatcher(self.document)
+        for query in ['Adenocarcinoma of lung, stage II', 'biopsy of right', 'no match']:
+            self.assertEqual(longest_span(query, self.document), matcher.longest_span(query))
+
+    def test_casesensitive(self):
+        matcher = SpanMatcher(self.document, casesensitive=True)
+        start = self.document.index('Grade 2')
+        self.assertEqual(['Grade 2', start, start + 7], matcher.match('Grade 2'))
+        self.assertIsNone(matcher.match('GRADE 2'))
+
+    def test_original_offsets(self):
+        document = 'Albuterol 90 MG/ACTUAT inhaler. Straße (daily) 2 MG/ACTUAT'
+        matcher = SpanMatcher(document)
+        self.assertEqual(clean_text(document), matcher.text)
+
+        query, start, end = matcher.match('inhaler')
+        self.assertEqual('INHALER', query)
+        self.assertEqual('inhaler', document[start:end])
+
+        query, start, end = matcher.match('strasse (daily')
+        self.assertEqual('STRASSE  DAILY', query)
+        self.assertEqual('Straße (daily', document[start:end])
+
+        # the space replacing ' MG/ACTUAT' spans the whole unit
+        _, start, end = matcher.match('90  inhaler')
+        self.assertEqual('90 MG/ACTUAT inhaler', document[start:end])
+        self.assertEqual((len(document) - 10, len(document)),
+                         matcher.document_span(len(matcher.text) - 1, len(matcher.text)))
+        self.assertEqual(['', 0, 0], matcher.match(''))
+
+    def test_match_all(self):
+        document = 'she sells sea shells. He (shells) hers'
+        queries = ['he', 'she', 'his', 'hers', 'shells', 'HE', 'sea shell', 'not there', '']
+        matcher = SpanMatcher(document)
+        self.assertDictEqual({query: matcher.match(query) for query in queries}, matcher.match_all(queries))
+        self.assertDictEqual({}, matcher.match_all([]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import re
+import unittest
+
+from text2phenotype.constants.common import OCR_PAGE_SPLITTING_KEY
+from text2phenotype.doc_type.predict import clean_ocr_text, get_doc_types
+
+
+def legacy_clean_ocr_text(text, stop_words):
+    text = text.lower()
+    text = re.sub(r'[^\x00-\x7F]', ' ', text)
+    text = text.translate({ord(c): " " for c in r"!@'#$%^&*()[]{};:,./<>?\|`~-=_+"})
+    text = re.sub(' +', ' ', text)
+    text = text.strip().replace('\n', ' ')
+    text = " ".join([token for token in text.split() if token not in stop_words])
+    text = re.sub(r'http\S+', ' ', text)
+    text = re.sub(r'(0[0-9]|1[0-9]|2[0-3]):[0-5][0-9]', ' ', text)
+    text = re.sub(r'(?:(?:31(\/|-|\.)(?:0?[13578]|1[02]|(?:Jan|Mar|May|Jul|Aug|Oct|Dec)))\1|(?:(?:29|30)(\/|-|\.)'
+                  r'(?:0?[1,3-9]|1[0-2]|(?:Jan|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec))\2))'
+                  r'(?:(?:1[6-9]|[2-9]\d)?\d{2})$|^(?:29(\/|-|\.)(?:0?2|(?:Feb))\3(?:(?:(?:1[6-9]|[2-9]\d)?'
+                  r'(?:0[48]|[2468][048]|[13579][26])|(?:(?:16|[2468][048]|[3579][26])00))))$|^(?:0?[1-9]|1\d|2[0-8])'
+                  r'(\/|-|\.)(?:(?:0?[1-9]|(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep))|(?:1[0-2]|(?:Oct|Nov|Dec)))'
+                  r'\4(?:(?:1[6-9]|[2-9]\d)?\d{2})', ' ', text)
+    return re.sub(' +', ' ', text)
+
+
+class FakeClassifier:
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, text):
+        self.calls.append(text)
+        if isinstance(text, list):
+            return [self.__label(t) for t in text], [[len(t) / 100] for t in text]
+        return self.__label(text), [len(text) / 100]
+
+    @staticmethod
+    def __label(text):
+        return ['__label__lab' if 'lab' in text else '__label__note']
+
+
+class TestDocTypePredict(unittest.TestCase):
+    STOP_WORDS = ['the', 'and', 'of', 'a']
+    TEXTS = [
+        'The patient was seen on 12/31/2019 at 10:45 and discharged.',
+        '  Lab RESULTS:\n\nGlucose  105 mg/dL\t(ref 70-99) http://example.com/a?b=c  xhttps://x.y ',
+        'Résumé — naïve café 29-02-2020 ; https end http',
+        'İstanbul ß ﬁle ½ ~~~ ___ +++',
+        'https://first token',
+        '',
+        '   \n\t ',
+    ]
+
+    def test_clean_ocr_text_matches_legacy(self):
+        for text in self.TEXTS:
+            with self.subTest(text=text):
+                self.assertEqual(legacy_clean_ocr_text(text, self.STOP_WORDS),
+                                 clean_ocr_text(text, set(self.STOP_WORDS)))
+                self.assertEqual(legacy_clean_ocr_text(text, self.STOP_WORDS),
+                                 clean_ocr_text(text, self.STOP_WORDS))
+
+    def test_get_doc_types_batch(self):
+        page_break = OCR_PAGE_SPLITTING_KEY[0]
+        text = page_break.join(['Lab results of the day', '', 'Progress note', 'the lab'])
+
+        single_classifier = FakeClassifier()
+        expected = get_doc_types(text, single_classifier, self.STOP_WORDS)
+        self.assertEqual(3, len(single_classifier.calls))
+        self.assertListEqual(['lab', 'note', 'lab'], [result['label'] for result in expected])
+        self.assertEqual((0, 22), expected[0]['range'])
+
+        batch_classifier = FakeClassifier()
+        self.assertListEqual(expected, get_doc_types(text, batch_classifier, self.STOP_WORDS, batch=True))
+        self.assertEqual(1, len(batch_classifier.calls))
+
+    def test_get_doc_types_empty(self):
+        classifier = FakeClassifier()
+        self.assertListEqual([], get_doc_types('', classifier, self.STOP_WORDS, batch=True))
+        self.assertListEqual([], get_doc_types(OCR_PAGE_SPLITTING_KEY[0] * 2, classifier, self.STOP_WORDS, batch=True))
+        self.assertListEqual([], classifier.calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from text2phenotype.ocr.layout import (
+    cluster_rows,
+    horizontal_projections,
+    mean_space_gap,
+    projection_stats,
+    row_breaks,
+    split_by_breaks,
+)
+
+
+class TestLayout(unittest.TestCase):
+
+    def test_horizontal_projections(self):
+        projections = horizontal_projections([0, 2, 3], [3, 4, 3])
+        self.assertListEqual([1, 1, 2, 3, 1], projections.tolist())
+        self.assertTupleEqual((1, 5, 1, 0), projection_stats(projections))
+
+    def test_horizontal_projections_gaps(self):
+        projections = horizontal_projections([2, 6], [3, 6])
+        self.assertListEqual([0, 0, 1, 1, 0, 0, 1], projections.tolist())
+        self.assertTupleEqual((0, 3, 0, 4), projection_stats(projections))
+
+    def test_cluster_rows(self):
+        labels, ranges = cluster_rows([100, 102, 150, 98, 151, 300], delta=5, half_height=2)
+        self.assertListEqual([0, 0, 1, 0, 1, 2], labels.tolist())
+        self.assertListEqual([(96, 104), (148, 153), (298, 302)], ranges)
+
+        # the rows are numbered from the top, the gaps up to half_height + delta are in the row
+        labels, ranges = cluster_rows([122, 100, 107, 114], delta=5, half_height=2)
+        self.assertListEqual([1, 0, 0, 0], labels.tolist())
+        self.assertListEqual([(98, 116), (120, 124)], ranges)
+
+        labels, ranges = cluster_rows([], delta=5, half_height=2)
+        self.assertListEqual([], labels.tolist())
+        self.assertListEqual([], ranges)
+
+    def test_mean_space_gap(self):
+        labels, _ = cluster_rows([10, 10, 10, 50], delta=1, half_height=1)
+        gap = mean_space_gap(labels, lefts=[50, 0, 120, 0], rights=[100, 40, 150, 10],
+                             heights=[10, 10, 10, 10], spaces=[1, 1, 1, 1])
+        # gaps 0 -> 50 and 50 -> 120 in the first row
+        self.assertAlmostEqual((1 + 2) / 2, gap)
+        self.assertEqual(0, mean_space_gap(labels[:0], [], [], [], []))
+
+    def test_row_breaks(self):
+        # two lines of the same row, then a line below
+        breaks = row_breaks(tops=[0, 0, 30], bottoms=[20, 20, 50], lefts=[0, 200, 0], rights=[100, 300, 100])
+        self.assertListEqual([False, True], breaks.tolist())
+        self.assertListEqual([['a', 'b'], ['c']], split_by_breaks(['a', 'b', 'c'], breaks))
+        self.assertListEqual([], split_by_breaks([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from google.cloud.vision import enums, types
+
+from text2phenotype.constants.common import OCR_PAGE_SPLITTING_KEY
+from text2phenotype.constants.environment import Environment
+from text2phenotype.ocr import azure
+from text2phenotype.ocr.google import google_ocr_pdf_file
+
+BreakType = enums.TextAnnotation.DetectedBreak.BreakType
+
+PAGES = [
+    'Patient name John\nDOB 01 01 1970',
+    'Lab results\nGlucose 105',
+    'Signed',
+]
+
+
+def _set_box(bounding_box, left, top, right, bottom):
+    for x, y in [(left, top), (right, top), (right, bottom), (left, bottom)]:
+        vertex = bounding_box.vertices.add()
+        vertex.x = x
+        vertex.y = y
+
+
+class FakeGoogleClient:
+    """Builds Google Vision response out of the PNG content (plain text)"""
+
+    def document_text_detection(self, image):
+        text = image.content.decode()
+        response = types.AnnotateImageResponse()
+        response.full_text_annotation.text = text
+        page = response.full_text_annotation.pages.add()
+        for row, line in enumerate(text.split('\n')):
+            top = row * 50
+            block = page.blocks.add()
+            _set_box(block.bounding_box, 0, top, 1000, top + 20)
+            paragraph = block.paragraphs.add()
+            words = line.split()
+            for col, word_text in enumerate(words):
+                word = paragraph.words.add()
+                _set_box(word.bounding_box, col * 100, top, col * 100 + 80, top + 20)
+                for i, char in enumerate(word_text):
+                    symbol = word.symbols.add()
+                    symbol.text = char
+                    if i == len(word_text) - 1:
+                        symbol.property.detected_break.type = \
+                            BreakType.LINE_BREAK if col == len(words) - 1 else BreakType.SPACE
+        return response
+
+
+class FakeAzureClient:
+    """Azure Computer Vision client, the operation id is the PNG content (plain text)"""
+
+    def batch_read_file_in_stream(self, image, raw):
+        return SimpleNamespace(headers={'Operation-Location': f'https://ocr/operations/{image.read().decode()}'})
+
+    def get_read_operation_result(self, operation_id):
+        lines = []
+        for row, line in enumerate(operation_id.split('\n')):
+            top = row * 50
+            words = [SimpleNamespace(text=word, bounding_box=[col * 100, top, 0, 0, col * 100 + 80, top + 20, 0, 0])
+                     for col, word in enumerate(line.split())]
+            lines.append(SimpleNamespace(words=words, bounding_box=[0, top, 0, 0, len(words) * 100, top + 20, 0, 0]))
+        return SimpleNamespace(status=azure.TextOperationStatusCodes.succeeded,
+                               recognition_results=[SimpleNamespace(lines=lines, width=1000)])
+
+
+class TestOCRInMemoryResults(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.png_inputs = []
+        for pg, text in enumerate(PAGES, start=1):
+            png_file = os.path.join(self.work_dir, f'doc_page_{pg - 1:04d}.png')
+            with open(png_file, 'w') as f:
+                f.write(text)
+            self.png_inputs.append((pg, png_file, 'tid'))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+        Environment.OCR_SPILL_RESPONSES.refresh()
+
+    def pickle_files(self):
+        return [f for f in os.listdir(self.work_dir) if f.endswith('.pkl')]
+
+    def assert_document(self, text, pages):
+        self.assertListEqual([1, 2, 3], [page.page for page in pages])
+        self.assertListEqual([f'{page}\n' for page in PAGES], [page.text for page in pages])
+
+        full_text = ''.join(page.text for page in pages)
+        order = 0
+        for page in pages:
+            for coord in page.coordinates:
+                self.assertEqual(order, coord.order)
+                self.assertEqual(coord.text, full_text[coord.document_index_first:coord.document_index_last + 1])
+                self.assertEqual(coord.text, page.text[coord.page_index_first:coord.page_index_last + 1])
+                order += 1
+
+        self.assertEqual(len(PAGES) - 1, text.rstrip(OCR_PAGE_SPLITTING_KEY[0]).count(OCR_PAGE_SPLITTING_KEY[0]))
+
+    @patch('text2phenotype.ocr.google.get_image_annotator_client', return_value=FakeGoogleClient())
+    def test_google_in_memory(self, mock_client):
+        text, pages = google_ocr_pdf_file('doc.pdf', self.work_dir, png_inputs=self.png_inputs)
+
+        self.assert_document(text, pages)
+        self.assertListEqual([], self.pickle_files())
+
+    @patch('text2phenotype.ocr.google.get_image_annotator_client', return_value=FakeGoogleClient())
+    def test_google_spill_responses(self, mock_client):
+        Environment.OCR_SPILL_RESPONSES.value = True
+        google_ocr_pdf_file('doc.pdf', self.work_dir, png_inputs=self.png_inputs)
+
+        self.assertEqual(len(PAGES), len(self.pickle_files()))
+
+    @patch('text2phenotype.ocr.azure.get_computer_vision_client', return_value=FakeAzureClient())
+    @patch('text2phenotype.ocr.azure.iter_pngs_from_pdf')
+    def test_azure_in_memory(self, mock_pngs, mock_client):
+        mock_pngs.return_value = iter(self.png_inputs)
+        text, pages = azure.ocr_pdf_file('doc.pdf', self.work_dir)
+
+        self.assert_document(text, pages)
+        self.assertListEqual([], self.pickle_files())
+
+
+if __name__ == '__main__':
+    unittest.main()
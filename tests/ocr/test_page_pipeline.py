@@ -0,0 +1,93 @@
+import concurrent.futures
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from text2phenotype.ocr.ocr_helpers import iter_pngs_from_pdf
+from text2phenotype.ocr.page_pipeline import run_page_pipeline
+
+
+class FakeOCRBackend:
+    """Local OCR backend, tracks the number of pages produced and not processed yet"""
+
+    def __init__(self, delay: float = 0.01, fail_page: int = None):
+        self.delay = delay
+        self.fail_page = fail_page
+        self.lock = threading.Lock()
+        self.produced = 0
+        self.processed = 0
+        self.max_pending = 0
+        self.calls = []
+
+    def produce(self, page_count: int):
+        for pg in range(1, page_count + 1):
+            with self.lock:
+                self.produced += 1
+                self.max_pending = max(self.max_pending, self.produced - self.processed)
+            yield pg, f'page_{pg:04d}.png', 'tid'
+
+    def ocr(self, pg: int, png_file: str, tid: str = None):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls.append(pg)
+            self.processed += 1
+        if pg == self.fail_page:
+            raise ValueError(f'OCR failed for {png_file}')
+        return pg, png_file, f'text of {pg}'
+
+
+class TestPagePipeline(unittest.TestCase):
+
+    def test_results_in_page_order(self):
+        backend = FakeOCRBackend()
+        results = run_page_pipeline(backend.produce(25), backend.ocr, max_workers=4)
+
+        self.assertListEqual(list(range(1, 26)), [pg for pg, _, _ in results])
+        self.assertEqual('text of 7', results[6][2])
+
+    def test_bounded_in_flight_pages(self):
+        backend = FakeOCRBackend()
+        run_page_pipeline(backend.produce(30), backend.ocr, max_workers=2, max_in_flight=3)
+
+        self.assertEqual(30, backend.processed)
+        self.assertLessEqual(backend.max_pending, 3)
+
+    def test_error_stops_producer(self):
+        backend = FakeOCRBackend(fail_page=2)
+        with self.assertRaises(ValueError):
+            run_page_pipeline(backend.produce(100), backend.ocr, max_workers=1, max_in_flight=1)
+
+        self.assertLess(backend.produced, 100)
+
+    def test_timeout_for_all_pages(self):
+        # every page is processed within the timeout, all of them are not
+        backend = FakeOCRBackend(delay=0.1)
+        start = time.monotonic()
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            run_page_pipeline(backend.produce(10), backend.ocr, max_workers=1, max_in_flight=2, timeout=0.35)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertLess(backend.produced, 10)
+
+    def test_plain_list_input(self):
+        backend = FakeOCRBackend(delay=0)
+        results = run_page_pipeline([(1, 'a.png'), (2, 'b.png')], backend.ocr, max_workers=2)
+        self.assertListEqual([(1, 'a.png', 'text of 1'), (2, 'b.png', 'text of 2')], results)
+
+    @patch('text2phenotype.ocr.ocr_helpers.get_pdf_page_count', return_value=5)
+    @patch('text2phenotype.ocr.ocr_helpers.make_png_from_pdf_page', side_effect=lambda pdf, idx, png: png)
+    def test_iter_pngs_from_pdf(self, mock_make_png, mock_page_count):
+        pages = iter_pngs_from_pdf('/tmp/doc.pdf', '/tmp/work', page_offset=10, tid='tid', parallel_jobs=2)
+        first = next(pages)
+
+        self.assertEqual((11, '/tmp/work/doc_page_0000.png', 'tid'), first)
+        # only the lookahead pages are rasterized
+        self.assertLessEqual(mock_make_png.call_count, 2)
+
+        self.assertListEqual([12, 13, 14, 15], [pg for pg, _, _ in pages])
+        self.assertEqual(5, mock_make_png.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from google.api_core.exceptions import TooManyRequests
+
+from text2phenotype.ocr.scheduler import (
+    AdaptiveConcurrencyLimiter,
+    OCRRequestScheduler,
+    TokenBucket,
+    is_http_throttled,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+
+        self.assertEqual(0, bucket.try_acquire())
+        self.assertEqual(0, bucket.try_acquire())
+        self.assertAlmostEqual(0.5, bucket.try_acquire())
+
+        clock.now += 0.5
+        self.assertEqual(0, bucket.try_acquire())
+        self.assertAlmostEqual(0.5, bucket.try_acquire())
+
+        # tokens are capped by the capacity
+        clock.now += 100
+        for _ in range(2):
+            self.assertEqual(0, bucket.try_acquire())
+        self.assertGreater(bucket.try_acquire(), 0)
+
+    def test_unlimited(self):
+        bucket = TokenBucket(rate=0)
+        for _ in range(1000):
+            self.assertEqual(0, bucket.try_acquire())
+
+
+class TestAdaptiveConcurrencyLimiter(unittest.TestCase):
+
+    def test_decrease_on_throttling(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=8, min_limit=1)
+        limiter.acquire()
+        limiter.release(throttled=True)
+        self.assertEqual(4, limiter.limit)
+
+        for _ in range(5):
+            limiter.acquire()
+            limiter.release(throttled=True)
+        self.assertEqual(1, limiter.limit)
+
+    def test_decrease_on_latency(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=5, target_latency=1)
+        limiter.acquire()
+        limiter.release(latency=2)
+        self.assertEqual(4, limiter.limit)
+
+    def test_additive_increase(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=4)
+        limiter.acquire()
+        limiter.release(throttled=True)
+        self.assertEqual(1, limiter.limit)
+
+        for _ in range(100):
+            limiter.acquire()
+            limiter.release(latency=0.1)
+        self.assertEqual(4, limiter.limit)
+
+    def test_limit_concurrency(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2)
+        lock = threading.Lock()
+        counters = {'active': 0, 'max_active': 0}
+
+        def request():
+            limiter.acquire()
+            with lock:
+                counters['active'] += 1
+                counters['max_active'] = max(counters['max_active'], counters['active'])
+            time.sleep(0.01)
+            with lock:
+                counters['active'] -= 1
+            limiter.release(latency=0.01)
+
+        threads = [threading.Thread(target=request) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(counters['max_active'], 2)
+        self.assertEqual(0, limiter.in_flight)
+
+
+class TestOCRRequestScheduler(unittest.TestCase):
+
+    def test_call_metrics(self):
+        scheduler = OCRRequestScheduler('fake', rate=0, max_concurrency=4)
+
+        self.assertEqual(3, scheduler.call(lambda a, b: a + b, 1, b=2))
+        with self.assertRaises(TooManyRequests):
+            scheduler.call(self.raise_error, TooManyRequests('quota'))
+        with self.assertRaises(ValueError):
+            scheduler.call(self.raise_error, ValueError('boom'))
+
+        metrics = scheduler.metrics()
+        self.assertEqual('fake', metrics['backend'])
+        self.assertEqual(3, metrics['requests'])
+        self.assertEqual(1, metrics['throttled'])
+        self.assertEqual(1, metrics['errors'])
+        self.assertEqual(0, metrics['in_flight'])
+        self.assertEqual(2, metrics['concurrency_limit'])
+
+    def test_poll_with_backoff(self):
+        scheduler = OCRRequestScheduler('fake', rate=0, max_concurrency=1,
+                                        poll_initial_delay=0.01, poll_max_delay=0.02)
+        statuses = {name: iter(['running', 'running', 'succeeded']) for name in ('a', 'b', 'c')}
+
+        futures = {name: scheduler.poll(lambda name=name: next(statuses[name]),
+                                        lambda status: status == 'succeeded',
+                                        timeout=5)
+                   for name in statuses}
+
+        for future in futures.values():
+            self.assertEqual('succeeded', future.result(timeout=5))
+        self.assertEqual(9, scheduler.metrics()['polls'])
+
+    def test_poll_failure_and_timeout(self):
+        scheduler = OCRRequestScheduler('fake', rate=0, max_concurrency=1,
+                                        poll_initial_delay=0.01, poll_max_delay=0.01)
+
+        failed = scheduler.poll(lambda: 'failed', lambda status: self.raise_error(ValueError(status)), timeout=5)
+        with self.assertRaises(ValueError):
+            failed.result(timeout=5)
+
+        pending = scheduler.poll(lambda: 'running', lambda status: False, timeout=0.05, description='page 1')
+        with self.assertRaisesRegex(TimeoutError, 'page 1'):
+            pending.result(timeout=5)
+
+        metrics = scheduler.metrics()
+        self.assertEqual(1, metrics['poll_errors'])
+        self.assertEqual(1, metrics['poll_timeouts'])
+
+    def test_is_http_throttled(self):
+        self.assertTrue(is_http_throttled(TooManyRequests('quota')))
+        self.assertTrue(is_http_throttled(SimpleNamespace(response=SimpleNamespace(status_code=429))))
+        self.assertFalse(is_http_throttled(SimpleNamespace(response=SimpleNamespace(status_code=500))))
+        self.assertFalse(is_http_throttled(ValueError()))
+
+    @staticmethod
+    def raise_error(err):
+        raise err
+
+
+if __name__ == '__main__':
+    unittest.main()
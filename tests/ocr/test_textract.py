@@ -4,6 +4,7 @@ import unittest
 
 from text2phenotype.common import common
 from text2phenotype.ocr import textract
+from text2phenotype.ocr.textract_index import TextractIndex
 from text2phenotype.constants.common import OCR_PAGE_SPLITTING_KEY
 from tests.ocr.fixtures import OCR_FIXTURES_DIR
 
@@ -68,6 +69,35 @@ class TestTextract(unittest.TestCase):
             self.assertFalse(txt[-1] == OCR_PAGE_SPLITTING_KEY[0])
             self.assertEqual(expected_text, txt)
 
+    def test_textract_file_to_txt_stream(self):
+        examples = [
+            "biomed_636_files/stephan_garcia/stephan-garcia_textract.json",
+            "steve_apple_concat/steve_apple_textract.json",
+        ]
+        for json_file in examples:
+            json_path = os.path.join(OCR_FIXTURES_DIR, json_file)
+            for lines_only in (False, True):
+                expected_text = textract.textract_json_to_txt(common.read_json(json_path), lines_only=lines_only)
+                txt = textract.textract_file_to_txt(json_path, lines_only=lines_only, stream=True)
+                self.assertEqual(expected_text, txt)
+
+    def test_convert_textract_json_files_parallel(self):
+        input_dir = os.path.join(OCR_FIXTURES_DIR, "steve_apple_concat")
+        with tempfile.TemporaryDirectory() as output_dir:
+            textract.convert_textract_json_files(input_dir, output_dir, n_jobs=2, stream=True)
+            expected_text = common.read_text(os.path.join(input_dir, "steve_apple_textract.txt"))
+            self.assertEqual(expected_text, common.read_text(os.path.join(output_dir, "steve_apple_textract.txt")))
+
+    def test_parse_page_text_matches_index(self):
+        doc = textract.textract_doc(self.textract_json)
+        index = TextractIndex(self.textract_json)
+        self.assertEqual(len(doc.pages), len(index.pages))
+        for page, page_index in zip(doc.pages, index.pages):
+            self.assertEqual(textract.parse_page_text(page), page_index.layout_text())
+            self.assertEqual(page.text, page_index.text)
+            # trp objects are only built on demand
+            self.assertEqual(page.text, page_index.page.text)
+
     def test_tables_to_csv(self):
         doc = textract.textract_doc(self.textract_json)
         temp_file = tempfile.NamedTemporaryFile(suffix='.csv')
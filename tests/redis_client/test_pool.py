@@ -0,0 +1,150 @@
+import threading
+import time
+import unittest
+
+import fakeredis
+from redis import Redis
+from redis.exceptions import ConnectionError
+
+from text2phenotype.constants.environment import Environment
+from text2phenotype.redis_client.client import RedisClient
+from text2phenotype.redis_client.pool import (
+    CONNECTION_POOLS,
+    InstrumentedConnectionPool,
+    InstrumentedSentinelConnectionPool,
+    MASTER,
+    RedisConnectionPools,
+    SLAVE,
+)
+
+
+class TestInstrumentedConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = InstrumentedConnectionPool(connection_class=fakeredis.FakeConnection,
+                                               server=fakeredis.FakeServer(),
+                                               max_connections=1,
+                                               timeout=5)
+
+    def test_stats(self):
+        client = Redis(connection_pool=self.pool)
+        client.set('key', 'value')
+        self.assertEqual(b'value', client.get('key'))
+
+        stats = self.pool.stats()
+        self.assertEqual(1, stats.max_connections)
+        self.assertEqual(1, stats.created)
+        self.assertEqual(0, stats.in_use)
+        self.assertEqual(0, stats.waits)
+
+        connection = self.pool.get_connection('GET')
+        self.assertEqual(1, self.pool.stats().in_use)
+        self.pool.release(connection)
+        self.assertEqual(0, self.pool.stats().in_use)
+
+    def test_waits(self):
+        connection = self.pool.get_connection('GET')
+        acquired = []
+
+        def wait_for_connection():
+            acquired.append(self.pool.get_connection('GET'))
+
+        thread = threading.Thread(target=wait_for_connection)
+        thread.start()
+        time.sleep(0.05)
+        self.pool.release(connection)
+        thread.join()
+
+        self.assertListEqual([connection], acquired)
+        stats = self.pool.stats()
+        self.assertEqual(1, stats.waits)
+        self.assertGreater(stats.wait_seconds, 0)
+        self.assertEqual(1, stats.in_use)
+
+    def test_timeout(self):
+        self.pool.timeout = 0.01
+        self.pool.get_connection('GET')
+        with self.assertRaises(ConnectionError):
+            self.pool.get_connection('GET')
+        self.assertEqual(1, self.pool.stats().in_use)
+
+
+class TestRedisConnectionPools(unittest.TestCase):
+    def setUp(self):
+        self.pools = RedisConnectionPools()
+        self.addCleanup(self.pools.disconnect)
+
+    def set_ha_mode(self, ha_mode: bool):
+        self.addCleanup(setattr, Environment.REDIS_HA_MODE, 'value', Environment.REDIS_HA_MODE.value)
+        Environment.REDIS_HA_MODE.value = ha_mode
+
+    def test_shared_pools(self):
+        self.set_ha_mode(True)
+        master = self.pools.get(1, MASTER, 'worker')
+        slave = self.pools.get(1, SLAVE, 'worker')
+
+        self.assertIsInstance(master, InstrumentedSentinelConnectionPool)
+        self.assertIs(master, self.pools.get(1, MASTER, 'worker'))
+        self.assertIsNot(master, slave)
+        self.assertIsNot(master, self.pools.get(2, MASTER, 'worker'))
+        self.assertIsNot(master, self.pools.get(1, MASTER, 'other worker'))
+        # the Sentinel connections are shared by all the databases
+        self.assertIs(master.sentinel_manager, self.pools.get(2, SLAVE).sentinel_manager)
+        self.assertEqual('worker', master.connection_kwargs['client_name'])
+        self.assertEqual(1, master.connection_kwargs['db'])
+
+    def test_single_server(self):
+        self.set_ha_mode(False)
+        master = self.pools.get(1, MASTER)
+
+        self.assertIsInstance(master, InstrumentedConnectionPool)
+        self.assertIs(master, self.pools.get(1, SLAVE))
+        self.assertSetEqual({(1, MASTER, None)}, set(self.pools.stats()))
+
+    def test_threads(self):
+        barrier = threading.Barrier(8)
+        pools = []
+
+        def get_pool():
+            barrier.wait()
+            pools.append(self.pools.get(3, MASTER))
+
+        threads = [threading.Thread(target=get_pool) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(8, len(pools))
+        self.assertEqual(1, len({id(pool) for pool in pools}))
+
+    def test_redis_clients(self):
+        first = RedisClient(db=5, client_name='test_redis_clients')
+        second = RedisClient(db=5, client_name='test_redis_clients')
+        self.addCleanup(CONNECTION_POOLS.disconnect)
+
+        self.assertIs(first._writer.connection_pool, second._writer.connection_pool)
+        self.assertIs(first._reader.connection_pool, second._reader.connection_pool)
+        self.assertSetEqual({MASTER, SLAVE}, set(first.pool_stats()))
+
+
+class TestRedisClientLock(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(CONNECTION_POOLS.disconnect)
+        fake_redis = Redis(connection_pool=InstrumentedConnectionPool(connection_class=fakeredis.FakeConnection,
+                                                                      server=fakeredis.FakeServer()))
+        self.clients = [RedisClient(), RedisClient()]
+        for client in self.clients:
+            client._reader = client._writer = fake_redis
+
+    def test_is_locked(self):
+        first, second = self.clients
+
+        self.assertFalse(first.is_locked('key'))
+        with first.lock('key'):
+            self.assertFalse(first.is_locked('key'))
+            self.assertTrue(second.is_locked('key'))
+        self.assertFalse(second.is_locked('key'))
+
+
+if __name__ == '__main__':
+    unittest.main()
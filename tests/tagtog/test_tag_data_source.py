@@ -1,6 +1,10 @@
+import shutil
+import tempfile
 import unittest
 import os
+from unittest.mock import patch
 
+from text2phenotype.common import common
 from text2phenotype.tagtog.tag_tog_async_data_source import TagTogAsyncDataSource
 
 
@@ -47,3 +51,58 @@ class TestTagTogDataSource(unittest.TestCase):
             self.data_source.raw_ann_out_path(
                 file_id='john_stevens', project_subfolder='OpenEMR',
                 annotator_dir='members/sfee')))
+
+    def test_annotation_files_index(self):
+        ds = TagTogAsyncDataSource(parent_dir=os.path.dirname(__file__),
+                                   project='tag_tog_sample_output', include_master_annotations=True)
+        annotation_files = ds._index_annotation_files()
+        self.assertEqual(4, len(annotation_files))
+        complete = {ann_file.file_id for ann_file in annotation_files if ann_file.anncomplete}
+        self.assertIn('a9zIFuYOKAoe4oce9LYnEMq4vSfe-john_stevens', complete)
+        self.assertLess(len(complete), len(annotation_files))
+        for ann_file in annotation_files:
+            self.assertTrue(os.path.isfile(ann_file.path))
+
+    def test_get_tagtog_text(self):
+        tag_tog_text = self.data_source.get_tagtog_text('john_stevens')
+        self.assertTrue(tag_tog_text.raw_text.startswith('Page 1 of 3\nPATIENT:Stevens, John'))
+        self.assertIsNone(self.data_source.get_tagtog_text('not_a_file'))
+
+    def test_write_output_parallel(self):
+        with tempfile.TemporaryDirectory() as parent_dir:
+            shutil.copytree(os.path.join(os.path.dirname(__file__), 'tag_tog_sample_output'),
+                            os.path.join(parent_dir, 'tag_tog_sample_output'))
+            outputs = {}
+            for n_jobs in (1, 2):
+                data_source = TagTogAsyncDataSource(parent_dir=parent_dir, project='tag_tog_sample_output')
+                data_source.write_raw_materials_for_annotated_materials(create_combined=True, n_jobs=n_jobs)
+
+                ann_path = data_source.raw_ann_out_path(
+                    file_id='text', project_subfolder='', annotator_dir='members/sfee')
+                combined_path = ann_path.replace('/sfee/', '/combined/')
+                outputs[n_jobs] = [
+                    [line.split('\t', 1)[1] for line in open(path)] for path in (ann_path, combined_path)
+                ]
+                self.assertTrue(os.path.isfile(
+                    data_source.raw_text_out_path(file_id='text', project_subfolder='')))
+                self.assertTrue(outputs[n_jobs][0])
+                shutil.rmtree(data_source.output_parent_dir)
+
+            self.assertListEqual(outputs[1], outputs[2])
+
+    def test_ann_json_not_kept(self):
+        with tempfile.TemporaryDirectory() as parent_dir:
+            shutil.copytree(os.path.join(os.path.dirname(__file__), 'tag_tog_sample_output'),
+                            os.path.join(parent_dir, 'tag_tog_sample_output'))
+            data_source = TagTogAsyncDataSource(parent_dir=parent_dir, project='tag_tog_sample_output')
+
+            with patch('text2phenotype.tagtog.tag_tog_async_data_source.common.read_json',
+                       side_effect=common.read_json) as read_json:
+                data_source.write_raw_materials_for_annotated_materials()
+
+            ann_json_paths = [call.args[0] for call in read_json.call_args_list
+                              if call.args[0].endswith(TagTogAsyncDataSource.ANN_JSON_SUFFIX)]
+            self.assertTrue(ann_json_paths)
+            # parsed by the index for the anncomplete flag, then by the conversion
+            self.assertEqual(len(data_source.annotation_files), len(set(ann_json_paths)))
+            self.assertEqual(2 * len(set(ann_json_paths)), len(ann_json_paths))
@@ -59,3 +59,24 @@ class TestTagTogHTMLTOTEXT(TagTogBase):
             page_breaks = tag_tog_text_obj.txt_page_break_pos
             self.assertEqual(expected_page_breaks[i], page_breaks)
 
+
+    def test_cached_parsing(self):
+        html_input = common.read_text(os.path.join(self.BASE_DIR, self.DIR_TO_HTML, self.POOL, self.SPECIFIC_FILES[0]))
+        first = TagTogText(html_input)
+        first.html_mapping_to_text['extra'] = 0
+        second = TagTogText(html_input)
+        self.assertEqual(first.raw_text, second.raw_text)
+        self.assertNotIn('extra', second.html_mapping_to_text)
+
+    def test_offsets_from_text_positions(self):
+        tag_tog_text_obj = TagTogText(common.read_text(
+            os.path.join(self.BASE_DIR, self.DIR_TO_HTML, self.POOL, self.SPECIFIC_FILES[0])))
+        positions = [-1, 0, 33, 34, 100, len(tag_tog_text_obj.raw_text) + 10]
+        part_offsets = tag_tog_text_obj.offsets_from_text_positions(positions)
+
+        self.assertEqual((None, None), part_offsets[0])
+        self.assertEqual(('s1p2', 3), part_offsets[3])
+        self.assertEqual(('s1p5', 11), part_offsets[4])
+        self.assertListEqual([tag_tog_text_obj.offset_from_text_pos(position) for position in positions],
+                             part_offsets)
+        self.assertListEqual([], tag_tog_text_obj.offsets_from_text_positions([]))
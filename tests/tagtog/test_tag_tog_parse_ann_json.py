@@ -75,6 +75,28 @@ class TestTagTogAnnotationSet(TagTogBase):
         # here, that means the normed "gold" text range, matching the reformatted gold text output
         self.assertEqual([403, 418], normed_ann.text_range)
 
+    def test_from_annotation_set_with_tag_tog_text(self):
+        tag_tog_text = TagTogText(common.read_text(
+            os.path.join(self.BASE_DIR, self.DIR_TO_HTML, self.POOL, self.SPECIFIC_FILES[3])))
+        part_start = tag_tog_text.html_mapping_to_text['s1p5']
+        # "Who Name: Mr. John Stevens External ID: 235-21-0677"
+        other_part_start = tag_tog_text.html_mapping_to_text['s1p8']
+        ann_set = AnnotationSet()
+        ann_set.directory = {
+            # "John Stevens", a part
+            'T1': Annotation(text='John Stevens', text_range=[part_start, part_start + 12], label='patient'),
+            # off by 2
+            'T2': Annotation(text='Stevens', text_range=[other_part_start + 21, other_part_start + 28],
+                             label='patient'),
+            # spans two parts
+            'T3': Annotation(text='Stevens', text_range=[part_start - 5, part_start + 10], label='patient'),
+        }
+        ann_json = TagTogAnnotationSet()
+        ann_json.from_annotation_set_with_tag_tog_text(ann_set, {'patient': 'e_13'}, tag_tog_text)
+
+        self.assertListEqual([('John Stevens', [0, 12], 's1p5'), ('Stevens', [19, 26], 's1p8')],
+                             [(entity.text, entity.range, entity.part) for entity in ann_json.entities])
+
 
 class TestTagTogEntity(unittest.TestCase):
     entity_in = TagTogEntity(**{
@@ -0,0 +1,100 @@
+from unittest.mock import patch
+from uuid import uuid4
+
+from text2phenotype.constants.environment import Environment
+from text2phenotype.tasks.fair_dispatcher import FairTaskDispatcher
+from text2phenotype.tasks.mixins import RedisMethodsMixin
+from text2phenotype.tasks.task_enums import WorkType
+from text2phenotype.tasks.task_message import TaskMessage
+from text2phenotype.tests.mocks import RedisPatchTestCase
+from text2phenotype.tests.mocks.rmq_patch import MockRmqBasicPublisher
+
+
+def create_messages(count: int, priority: int = 0):
+    return [TaskMessage(work_type=WorkType.document, redis_key=uuid4().hex, priority=priority)
+            for _ in range(count)]
+
+
+class TestFairTaskDispatcher(RedisPatchTestCase):
+    QUEUE_NAME = 'fair-dispatch-queue'
+
+    def setUp(self):
+        super().setUp()
+        self.dispatcher = FairTaskDispatcher(RedisMethodsMixin.get_redis_client(WorkType.job), self.QUEUE_NAME)
+
+    def taken(self, max_messages: int):
+        return [(message.job_id, message.message) for message in self.dispatcher.take(max_messages)]
+
+    def in_flight(self):
+        return self.fake_redis_client.llen(self.dispatcher.in_flight_key)
+
+    def test_keys(self):
+        # one Redis Cluster slot
+        for key in (self.dispatcher.ring_key, self.dispatcher.weights_key, self.dispatcher.in_flight_key,
+                    self.dispatcher.messages_key('job')):
+            self.assertIn(f'{{{self.QUEUE_NAME}}}', key)
+
+    def test_take(self):
+        bulk_messages, small_messages = create_messages(5), create_messages(2, priority=1)
+        self.dispatcher.enqueue('bulk', bulk_messages)
+        self.dispatcher.enqueue('small', small_messages)
+
+        self.assertDictEqual({'bulk': 5, 'small': 2}, self.dispatcher.queue_depths())
+
+        # 1 message of the bulk job, 2 messages (the weight) of the small job in turn
+        self.assertListEqual([('bulk', bulk_messages[0]), ('small', small_messages[0]),
+                              ('small', small_messages[1]), ('bulk', bulk_messages[1])], self.taken(4))
+        self.assertDictEqual({'bulk': 3}, self.dispatcher.queue_depths())
+        self.assertEqual(4, self.in_flight())
+
+        self.assertListEqual([('bulk', message) for message in bulk_messages[2:]], self.taken(10))
+        self.assertListEqual([], self.taken(10))
+        self.assertDictEqual({}, self.dispatcher.queue_depths())
+
+    def test_enqueue_batches(self):
+        self.addCleanup(setattr, Environment.REDIS_BATCH_SIZE, 'value', Environment.REDIS_BATCH_SIZE.value)
+        Environment.REDIS_BATCH_SIZE.value = 2
+        messages = create_messages(5)
+
+        self.assertEqual(5, self.dispatcher.enqueue('job', messages, weight=10))
+        self.assertListEqual([('job', message) for message in messages], self.taken(10))
+
+    def test_recover(self):
+        messages = create_messages(3)
+        self.dispatcher.enqueue('job', messages)
+        taken = self.dispatcher.take(2)
+
+        # the dispatcher crashed before the messages were published
+        self.dispatcher.ack(taken[:1])
+        self.assertEqual(1, self.dispatcher.recover())
+
+        self.assertEqual(0, self.in_flight())
+        self.assertListEqual([('job', messages[2]), ('job', messages[1])], self.taken(10))
+
+    def test_dispatch(self):
+        messages = create_messages(3, priority=2)
+        self.dispatcher.enqueue('job', messages)
+
+        with patch('text2phenotype.tasks.fair_dispatcher.RMQBasicPublisher', MockRmqBasicPublisher):
+            self.addCleanup(MockRmqBasicPublisher._queues.pop, self.QUEUE_NAME, None)
+            self.assertEqual(3, self.dispatcher.dispatch())
+            self.assertEqual(0, self.dispatcher.dispatch())
+
+        self.assertListEqual([message.to_json() for message in messages],
+                             list(MockRmqBasicPublisher.get_queue(self.QUEUE_NAME)))
+        self.assertEqual(0, self.in_flight())
+
+    def test_dispatch_failed(self):
+        messages = create_messages(3)
+        self.dispatcher.enqueue('job', messages)
+
+        with patch('text2phenotype.tasks.fair_dispatcher.RMQBasicPublisher') as publisher:
+            # one connection for the round, failed after the first message
+            publisher.return_value.publish_messages.return_value = 1
+            with self.assertRaises(ConnectionError):
+                self.dispatcher.dispatch()
+            publisher.return_value.publish_message.assert_not_called()
+
+        # the unpublished messages are waiting again
+        self.assertEqual(0, self.in_flight())
+        self.assertListEqual([('job', message) for message in messages[1:]], self.taken(10))
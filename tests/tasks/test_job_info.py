@@ -61,6 +61,7 @@ class TestJobInfo(unittest.TestCase):
             'reprocess_options': None,
             'user_canceled': None,
             'stop_documents_on_failure': True,
+            'priority': None,
             'summary_tasks': [],
             'user_actions_log': self.job_info.user_actions_log,
             'deid_filter': None
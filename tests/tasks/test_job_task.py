@@ -1,6 +1,7 @@
 import unittest
 import uuid
 
+from text2phenotype.constants.environment import Environment
 from text2phenotype.tasks.job_task import (
     JobDocumentInfo,
     JobTask,
@@ -24,3 +25,67 @@ class TestJobTask(unittest.TestCase):
         self.job_task.document_info[uuid.uuid4().hex] = JobDocumentInfo(status=WorkStatus.completed_success)
         self.job_task.document_info[uuid.uuid4().hex] = JobDocumentInfo(status=WorkStatus.completed_failure)
         self.assertEqual(self.job_task.status, WorkStatus.completed_failure)
+
+    def test_job_task_canceling_status(self):
+        self.job_task.document_info[uuid.uuid4().hex] = JobDocumentInfo(status=WorkStatus.processing)
+        self.job_task.user_canceled = True
+        self.assertEqual(self.job_task.status, WorkStatus.canceling)
+
+    def test_status_counts(self):
+        self.assertEqual(self.job_task.status, WorkStatus.not_started)
+
+        self.job_task.add_file('a.txt', 'a')
+        self.job_task.add_file('b.txt', 'b')
+        self.job_task.document_info['a'].status = WorkStatus.completed_success
+        self.assertDictEqual({WorkStatus.processing: 1, WorkStatus.completed_success: 1},
+                             self.job_task.status_counts)
+        self.assertEqual(self.job_task.status, WorkStatus.processing)
+
+        self.job_task.document_info['b'] = JobDocumentInfo(status=WorkStatus.completed_failure, filename='c.txt')
+        self.assertEqual(self.job_task.status, WorkStatus.completed_failure)
+        self.assertDictEqual({'a.txt': 'a', 'c.txt': 'b'}, self.job_task.processed_files)
+
+        del self.job_task.document_info['b']
+        self.assertEqual(self.job_task.status, WorkStatus.completed_success)
+        self.assertDictEqual({'a.txt': 'a'}, self.job_task.processed_files)
+
+        # copies of a document don't change the job
+        document = self.job_task.document_info['a'].copy()
+        document.status = WorkStatus.processing
+        self.assertDictEqual({WorkStatus.completed_success: 1}, self.job_task.status_counts)
+
+        self.job_task.document_info = {'d': {'status': WorkStatus.canceled, 'filename': 'd.txt'}}
+        self.assertEqual(self.job_task.status, WorkStatus.canceled)
+        self.assertDictEqual({'d.txt': 'd'}, self.job_task.processed_files)
+
+        # a copy of the index
+        self.job_task.processed_files['e.txt'] = 'e'
+        self.assertDictEqual({'d.txt': 'd'}, self.job_task.processed_files)
+
+    def test_status_counts_after_parse(self):
+        self.job_task.add_file('a.txt', 'a')
+        self.job_task.document_info['a'].status = WorkStatus.completed_success
+
+        job_task = JobTask.from_json(self.job_task.to_json())
+        self.assertDictEqual(self.job_task.status_counts, job_task.status_counts)
+
+        job_task.document_info['a'].status = WorkStatus.canceled
+        self.assertEqual(job_task.status, WorkStatus.canceled)
+        self.assertEqual(self.job_task.status, WorkStatus.completed_success)
+
+    def test_message_priority(self):
+        self.addCleanup(setattr, Environment.RMQ_MAX_PRIORITY, 'value', Environment.RMQ_MAX_PRIORITY.value)
+        Environment.RMQ_MAX_PRIORITY.value = 3
+
+        self.assertEqual(3, self.job_task.message_priority())
+        self.job_task.add_file('a.txt', 'a')
+        self.assertEqual(3, self.job_task.message_priority())
+        self.assertEqual(2, self.job_task.message_priority(10))
+        self.assertEqual(0, self.job_task.message_priority(100000))
+
+        self.job_task.priority = 10
+        self.assertEqual(3, self.job_task.message_priority(100000))
+
+        # no priority queues
+        Environment.RMQ_MAX_PRIORITY.value = 0
+        self.assertEqual(0, self.job_task.message_priority())
@@ -4,10 +4,18 @@ from typing import (
 )
 from uuid import uuid4
 
-from text2phenotype.tasks.job_task import JobTask
+from text2phenotype.constants.environment import Environment
+from text2phenotype.tasks.job_task import (
+    JobDocumentInfo,
+    JobTask,
+)
 from text2phenotype.tasks.mixins import RedisMethodsMixin
-from text2phenotype.tasks.task_enums import WorkType
+from text2phenotype.tasks.task_enums import (
+    WorkStatus,
+    WorkType,
+)
 from text2phenotype.tasks.work_tasks import (
+    ChunkTask,
     DocumentInfo,
     DocumentTask,
     WorkTask,
@@ -123,3 +131,131 @@ class TestRedisMethodsMixin(RedisPatchTestCase):
 
             cached_job_task = RedisMethodsMixin.refresh_task(self.job_task, cached_properties=True)
             self.assertIsNone(cached_job_task)
+
+    def enable_documents_hash(self):
+        self.addCleanup(setattr, Environment.JOB_DOCUMENTS_HASH_ENABLED, 'value',
+                        Environment.JOB_DOCUMENTS_HASH_ENABLED.value)
+        Environment.JOB_DOCUMENTS_HASH_ENABLED.value = True
+
+    def test_job_documents_hash(self):
+        self.enable_documents_hash()
+        self.job_task.add_file('second.txt', 'second')
+        RedisMethodsMixin.set_task(self.job_task)
+
+        documents_key = RedisMethodsMixin._job_documents_key(self.job_task.redis_key)
+        self.assertNotIn('document_info', self.fake_redis_client.get(self.job_task.redis_key).decode())
+        self.assertEqual(2, self.fake_redis_client.hlen(documents_key))
+
+        job_task = RedisMethodsMixin.refresh_task(self.job_task)
+        self.assertDictEqual(self.job_task.document_info, job_task.document_info)
+        self.assertDictEqual(self.job_task.processed_files, job_task.processed_files)
+
+        # only the changed documents are written
+        not_changed = JobDocumentInfo(status=WorkStatus.canceled).json()
+        self.fake_redis_client.hset(documents_key, self.doc_task.document_id, not_changed)
+        job_task.document_info['second'].status = WorkStatus.completed_success
+        RedisMethodsMixin.set_task(job_task)
+        self.assertEqual(not_changed, self.fake_redis_client.hget(documents_key, self.doc_task.document_id).decode())
+        self.assertEqual(WorkStatus.completed_success,
+                         JobDocumentInfo.parse_raw(self.fake_redis_client.hget(documents_key, 'second')).status)
+
+        # a job not read from Redis replaces all the documents
+        new_job_task = JobTask.from_json(self.job_task.to_json())
+        RedisMethodsMixin.set_task(new_job_task)
+        job_task = RedisMethodsMixin.refresh_task(self.job_task)
+        self.assertDictEqual(new_job_task.document_info, job_task.document_info)
+
+        RedisMethodsMixin.delete_task(self.job_task)
+        self.assertFalse(self.fake_redis_client.exists(documents_key))
+
+    def test_job_documents_json(self):
+        # JOB_DOCUMENTS_HASH_ENABLED is off: the whole JSON, for the readers with an older library
+        RedisMethodsMixin.set_task(self.job_task)
+        stored = JobTask.from_json(self.fake_redis_client.get(self.job_task.redis_key))
+        self.assertDictEqual(self.job_task.document_info, stored.document_info)
+
+        # the hash written while enabled is replaced by the JSON
+        self.enable_documents_hash()
+        self.job_task.add_file('second.txt', 'second')
+        RedisMethodsMixin.set_task(self.job_task)
+        Environment.JOB_DOCUMENTS_HASH_ENABLED.value = False
+        job_task = RedisMethodsMixin.refresh_task(self.job_task)
+        self.assertEqual(2, len(job_task.document_info))
+        job_task.document_info['second'].status = WorkStatus.completed_success
+        RedisMethodsMixin.set_task(job_task)
+
+        documents_key = RedisMethodsMixin._job_documents_key(self.job_task.redis_key)
+        self.assertFalse(self.fake_redis_client.exists(documents_key))
+        stored = JobTask.from_json(self.fake_redis_client.get(self.job_task.redis_key))
+        self.assertDictEqual(job_task.document_info, stored.document_info)
+
+    def test_get_job_message_priority(self):
+        self.addCleanup(setattr, Environment.RMQ_MAX_PRIORITY, 'value', Environment.RMQ_MAX_PRIORITY.value)
+        Environment.RMQ_MAX_PRIORITY.value = 3
+        self.enable_documents_hash()
+        for i in range(9):
+            self.job_task.add_file(f'{i}.txt', str(i))
+        RedisMethodsMixin.set_task(self.job_task)
+
+        self.assertEqual(2, RedisMethodsMixin.get_job_message_priority(self.job_task.job_id))
+        self.assertIsNone(RedisMethodsMixin.get_job_message_priority(uuid4().hex))
+
+        self.job_task.priority = 3
+        RedisMethodsMixin.set_task(self.job_task)
+        self.assertEqual(3, RedisMethodsMixin.get_job_message_priority(self.job_task.job_id))
+
+        # job JSON with the documents, written before the documents hash
+        self.job_task.priority = None
+        RedisMethodsMixin.delete_task(self.job_task)
+        self.fake_redis_client.set(self.job_task.redis_key, self.job_task.json())
+        self.assertEqual(2, RedisMethodsMixin.get_job_message_priority(self.job_task.job_id))
+
+    def create_chunks(self, count: int):
+        chunks = [ChunkTask(document_id=self.doc_task.document_id,
+                            job_id=self.job_task.job_id,
+                            text_span=[i * 10, (i + 1) * 10],
+                            chunk_num=i,
+                            chunk_size=10)
+                  for i in range(count)]
+        for chunk in chunks:
+            self.doc_task.add_chunk(chunk)
+        return chunks
+
+    def set_batch_size(self, batch_size: int):
+        self.addCleanup(setattr, Environment.REDIS_BATCH_SIZE, 'value', Environment.REDIS_BATCH_SIZE.value)
+        Environment.REDIS_BATCH_SIZE.value = batch_size
+
+    def test_set_and_get_tasks(self):
+        self.set_batch_size(2)
+        chunks = self.create_chunks(5)
+        RedisMethodsMixin.set_tasks(chunks + [self.doc_task, self.job_task])
+
+        self.assertListEqual(chunks, RedisMethodsMixin.get_document_chunk_tasks(self.doc_task))
+        self.assertListEqual([chunks[1], None, chunks[0]],
+                             RedisMethodsMixin.mget_tasks(WorkType.chunk, [chunks[1].redis_key, 'missing',
+                                                                            chunks[0].redis_key]))
+        self.assertListEqual([], RedisMethodsMixin.mget_tasks(WorkType.chunk, []))
+
+        job_task, = RedisMethodsMixin.mget_tasks(WorkType.job, [self.job_task.redis_key])
+        self.assertEqual(RedisMethodsMixin.refresh_task(self.job_task), job_task)
+        self.assertTrue(job_task.document_info)
+
+        # the cached properties only
+        for task in (self.job_task, self.doc_task):
+            cached_task, = RedisMethodsMixin.mget_tasks(task.WORK_TYPE, [task.redis_key], cached_properties=True)
+            fields = task.CACHED_PROPERTIES | task.DEFAULT_CACHED_PROPERTIES
+            self.assertDictEqual(task.dict(include=fields), cached_task.dict(include=fields))
+            self.assertLess(len(cached_task.json()), len(task.json()))
+
+    def test_delete_tasks(self):
+        self.set_batch_size(2)
+        chunks = self.create_chunks(3)
+        RedisMethodsMixin.set_tasks(chunks + [self.doc_task, self.job_task])
+
+        self.assertEqual(4, RedisMethodsMixin.delete_tasks(chunks + [self.job_task]))
+        self.assertListEqual([None] * 3, RedisMethodsMixin.get_document_chunk_tasks(self.doc_task))
+        self.assertIsNone(RedisMethodsMixin.refresh_task(self.job_task, cached_properties=True))
+        self.assertFalse(self.fake_redis_client.exists(
+            RedisMethodsMixin._job_documents_key(self.job_task.redis_key)))
+        self.assertIsNotNone(RedisMethodsMixin.refresh_task(self.doc_task))
+        self.assertEqual(0, RedisMethodsMixin.delete_tasks([]))
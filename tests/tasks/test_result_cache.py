@@ -0,0 +1,86 @@
+import time
+
+from text2phenotype.tasks.mixins import RedisMethodsMixin
+from text2phenotype.tasks.result_cache import (
+    CacheStats,
+    ChunkResultCache,
+)
+from text2phenotype.tasks.task_enums import (
+    TaskEnum,
+    WorkType,
+)
+from text2phenotype.tests.mocks import RedisPatchTestCase
+from text2phenotype.tests.mocks.storage_patch import MockStorageContainer
+
+
+def cache_key(text: bytes, task: TaskEnum, version: str) -> str:
+    return ChunkResultCache.cache_key(ChunkResultCache.text_digest(text), task, version)
+
+
+class TestChunkResultCache(RedisPatchTestCase):
+    EXTENSION = 'drug.json'
+
+    def setUp(self):
+        super().setUp()
+        self.storage = MockStorageContainer()
+        self.cache = ChunkResultCache(RedisMethodsMixin.get_redis_client(WorkType.chunk), self.storage,
+                                      ttl=60, max_entries=2)
+
+    def test_cache_key(self):
+        key = cache_key(b'text', TaskEnum.drug, 'v1')
+
+        self.assertEqual(key, cache_key(b'text', TaskEnum.drug, 'v1'))
+        self.assertNotEqual(key, cache_key(b'text', TaskEnum.lab, 'v1'))
+        self.assertNotEqual(key, cache_key(b'text', TaskEnum.drug, 'v2'))
+        self.assertNotEqual(key, cache_key(b'other text', TaskEnum.drug, 'v1'))
+
+    def test_get_put(self):
+        key = cache_key(b'text', TaskEnum.drug, 'v1')
+
+        self.assertIsNone(self.cache.get(key, TaskEnum.drug))
+        self.cache.put(key, TaskEnum.drug, b'[]', self.EXTENSION)
+        self.assertEqual(b'[]', self.cache.get(key, TaskEnum.drug))
+        self.assertEqual(b'[]', self.cache.get(key, TaskEnum.drug))
+
+        stats = self.cache.stats()
+        self.assertDictEqual({TaskEnum.drug: CacheStats(hits=2, misses=1)}, stats)
+        self.assertAlmostEqual(2 / 3, stats[TaskEnum.drug].hit_rate)
+
+    def test_evict(self):
+        keys = [cache_key(text, TaskEnum.drug, 'v1') for text in (b'1', b'2', b'3')]
+
+        self.cache.put(keys[0], TaskEnum.drug, b'1', self.EXTENSION)
+        self.cache.put(keys[1], TaskEnum.drug, b'2', self.EXTENSION)
+        # the first entry is used last
+        self.cache.get(keys[0], TaskEnum.drug)
+        self.cache.put(keys[2], TaskEnum.drug, b'3', self.EXTENSION)
+
+        self.assertIsNone(self.cache.get(keys[1], TaskEnum.drug))
+        self.assertEqual(b'1', self.cache.get(keys[0], TaskEnum.drug))
+        self.assertEqual(b'3', self.cache.get(keys[2], TaskEnum.drug))
+        self.assertNotIn(ChunkResultCache.storage_key(keys[1], TaskEnum.drug, self.EXTENSION), self.storage)
+        self.assertEqual(2, len(self.storage))
+
+    def test_expired(self):
+        key = cache_key(b'text', TaskEnum.drug, 'v1')
+        self.cache.put(key, TaskEnum.drug, b'[]', self.EXTENSION)
+        self.fake_redis_client.delete(f'{ChunkResultCache.INDEX_PREFIX}{key}')
+
+        self.assertIsNone(self.cache.get(key, TaskEnum.drug))
+        # the object of the expired entry is deleted on eviction
+        self.assertEqual(1, self.cache.evict(1))
+        self.assertDictEqual({}, self.storage)
+
+    def test_evict_expired(self):
+        keys = [cache_key(text, TaskEnum.drug, 'v1') for text in (b'1', b'2')]
+        self.cache.put(keys[0], TaskEnum.drug, b'1', self.EXTENSION)
+        expired_key = ChunkResultCache.storage_key(keys[0], TaskEnum.drug, self.EXTENSION)
+        # unused for the ttl, the index entry expired
+        self.fake_redis_client.zadd(ChunkResultCache.LRU_KEY, {expired_key: time.time() - 61})
+        self.fake_redis_client.delete(f'{ChunkResultCache.INDEX_PREFIX}{keys[0]}')
+
+        # the object of the expired entry is deleted by the next put
+        self.cache.put(keys[1], TaskEnum.drug, b'2', self.EXTENSION)
+        self.assertNotIn(expired_key, self.storage)
+        self.assertEqual(1, len(self.storage))
+        self.assertEqual(1, self.fake_redis_client.zcard(ChunkResultCache.LRU_KEY))
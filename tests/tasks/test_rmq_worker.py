@@ -2,6 +2,7 @@ import concurrent.futures
 from unittest import TestCase
 from unittest.mock import (
     MagicMock,
+    call,
     patch,
     PropertyMock,
 )
@@ -10,11 +11,13 @@ from uuid import uuid4
 import pika
 from pika import BasicProperties
 
+from text2phenotype.common.log_context import get_log_context
 from text2phenotype.constants.environment import Environment
 from text2phenotype.tasks.document_info import DocumentInfo
 from text2phenotype.tasks.job_task import JobTask
 from text2phenotype.tasks.mixins import RedisMethodsMixin
 from text2phenotype.tasks.rmq_worker import (
+    BatchItem,
     RMQConsumerTaskWorker,
     RMQConsumerWorker,
 )
@@ -23,15 +26,24 @@ from text2phenotype.tasks.task_enums import (
     TaskStatus,
     WorkType,
 )
+from text2phenotype.tasks.task_lease import (
+    TaskLease,
+    TaskLeaseHeld,
+)
 from text2phenotype.tasks.task_info import (
     DrugModelTaskInfo,
     TaskInfo,
 )
 from text2phenotype.tasks.task_message import TaskMessage
+from text2phenotype.tasks.task_state import (
+    TRANSITION_APPLIED,
+    TRANSITION_LOCKED,
+)
 from text2phenotype.tasks.work_tasks import (
     ChunkTask,
     DocumentTask,
 )
+from text2phenotype.tests.mocks import RedisPatchTestCase
 
 
 class Worker(RMQConsumerWorker):
@@ -93,6 +105,32 @@ class TestRMQConsumerWorker(TestCase):
             self.worker.on_process_done(self.future)
             reject.assert_called_once_with(1)
 
+    def test_publish_message_priority(self):
+        message = TaskMessage(work_type=WorkType.chunk, redis_key='Test Key', priority=2)
+
+        with patch('text2phenotype.tasks.rmq_worker.RMQBasicPublisher') as publisher:
+            self.worker.publish_message('queue', message)
+            self.worker.publish_message('queue', 'body')
+
+        publish_message = publisher.return_value.publish_message
+        message.sender = self.worker.NAME
+        self.assertListEqual([call(message.to_json(), priority=2), call('body', priority=None)],
+                             publish_message.call_args_list)
+
+    def test_queue_declare(self):
+        self.worker._channel = MagicMock()
+        self.addCleanup(setattr, Environment.RMQ_MAX_PRIORITY, 'value', Environment.RMQ_MAX_PRIORITY.value)
+
+        Environment.RMQ_MAX_PRIORITY.value = 0
+        self.worker.on_exchange_declareok(None, None)
+        self.assertTrue(self.worker._channel.queue_declare.call_args.kwargs['passive'])
+
+        # priority queue
+        Environment.RMQ_MAX_PRIORITY.value = 5
+        self.worker.on_exchange_declareok(None, None)
+        self.assertDictEqual({'x-max-priority': 5},
+                             self.worker._channel.queue_declare.call_args.kwargs['arguments'])
+
 
 class DrugModelWorker(RMQConsumerTaskWorker):
     TASK_TYPE = TaskEnum.drug
@@ -144,23 +182,22 @@ class TestRMQConsumerTaskWorker(TestCase):
             text_span=[],
         )
 
-        init_work_task_patch = patch.object(DrugModelWorker, 'init_work_task').start()
-        refresh_work_task_patch = patch.object(DrugModelWorker, 'refresh_work_task').start()
-        save_work_task_patch = patch.object(DrugModelWorker, 'save_work_task').start()
+        patch.object(DrugModelWorker, 'init_work_task').start()
+        patch.object(DrugModelWorker, 'refresh_work_task').start()
+        patch.object(DrugModelWorker, 'save_work_task').start()
         redis_patch = patch('text2phenotype.tasks.mixins.RedisClient').start()
-
-        self.addCleanup(
-            initial_task_message_patch.stop,
-            init_work_task_patch.stop,
-            self.task_info_patch.stop,
-            self.get_job_task_patch.stop,
-            self.get_document_task_patch.stop,
-            refresh_work_task_patch.stop,
-            save_work_task_patch.stop,
-            self.do_work_patch.stop,
-            self.work_task_patch.stop,
-            redis_patch.stop,
-        )
+        patch.object(RedisMethodsMixin, '_redis_clients', {}).start()
+        # the task status transitions are applied by the script
+        self.transition_script = redis_patch.return_value.script.return_value
+        self.transition_script.return_value = TRANSITION_APPLIED
+        self.addCleanup(setattr, Environment.TASK_STATE_SCRIPT_ENABLED, 'value',
+                        Environment.TASK_STATE_SCRIPT_ENABLED.value)
+        Environment.TASK_STATE_SCRIPT_ENABLED.value = True
+        # the leases are tested with the fake Redis server
+        self.addCleanup(setattr, Environment.TASK_LEASE_ENABLED, 'value', Environment.TASK_LEASE_ENABLED.value)
+        Environment.TASK_LEASE_ENABLED.value = False
+
+        self.addCleanup(patch.stopall)
 
     def test_on_message(self):
         deliver = pika.spec.Basic.Deliver(delivery_tag=1)
@@ -277,6 +314,33 @@ class TestRMQConsumerTaskWorker(TestCase):
         self.assertEqual(TaskStatus.completed_success, self.worker.work_task.task_statuses[TaskEnum.drug].status)
         self.assertEqual(1, self.worker.task_info.attempts)
 
+    def test_publish_message_job_priority(self):
+        self.addCleanup(setattr, Environment.RMQ_MAX_PRIORITY, 'value', Environment.RMQ_MAX_PRIORITY.value)
+        Environment.RMQ_MAX_PRIORITY.value = 3
+        get_task = patch.object(DrugModelWorker, 'get_task', return_value=self.work_task_patch.return_value).start()
+        get_job_message_priority = patch.object(DrugModelWorker, 'get_job_message_priority', return_value=2).start()
+        publisher = patch('text2phenotype.tasks.rmq_worker.RMQBasicPublisher').start()
+        publish_message = publisher.return_value.publish_message
+
+        message = TaskMessage(work_type=WorkType.chunk, redis_key='Test Key')
+        self.worker.publish_message('queue', message)
+        get_task.assert_called_once_with(WorkType.chunk, 'Test Key', cached_properties=True)
+        get_job_message_priority.assert_called_once_with(self.job_task.job_id)
+        self.assertEqual(2, publish_message.call_args.kwargs['priority'])
+        self.assertIsNone(message.priority)
+
+        # the priority of the message is kept
+        message.priority = 1
+        self.worker.publish_message('queue', message)
+        self.assertEqual(1, publish_message.call_args.kwargs['priority'])
+        get_job_message_priority.assert_called_once()
+
+        # no priority queues
+        Environment.RMQ_MAX_PRIORITY.value = 0
+        self.worker.publish_message('queue', TaskMessage(work_type=WorkType.job, redis_key=self.job_task.job_id))
+        self.assertIsNone(publish_message.call_args.kwargs['priority'])
+        get_job_message_priority.assert_called_once()
+
     def test_send_back_to_sequencer(self):
         message = TaskMessage(work_type=WorkType.chunk, redis_key='Test Key')
         deliver = pika.spec.Basic.Deliver(delivery_tag=1)
@@ -304,3 +368,291 @@ class TestRMQConsumerTaskWorker(TestCase):
 
                     on_process_done.assert_called_once_with(future)
                     publish_message.assert_called_once_with(Environment.SEQUENCER_QUEUE.value, message)
+
+        with self.subTest('Lease held by another worker'):
+            future = concurrent.futures.Future()
+            future.set_exception(TaskLeaseHeld('in progress'))
+            setattr(future, 'message', message.json())
+            setattr(future, 'deliver', deliver)
+            with patch.object(DrugModelWorker, 'requeue') as requeue, \
+                    patch.object(DrugModelWorker, 'publish_message') as publish_message:
+                self.worker.on_process_done(future)
+
+                requeue.assert_called_once_with(deliver.delivery_tag)
+                publish_message.assert_not_called()
+
+    def test_task_events(self):
+        chunk_task = self.worker.work_task
+
+        self.assertTupleEqual((), DrugModelWorker.task_events(chunk_task))
+        chunk_task.task_statuses[TaskEnum.drug].status = TaskStatus.started
+        self.assertTupleEqual((), DrugModelWorker.task_events(chunk_task))
+        # the document task of the chunk is not the work task of the worker
+        self.assertTupleEqual((), DrugModelWorker.task_events(self.doc_task))
+
+        for status in (TaskStatus.completed_success, TaskStatus.failed, TaskStatus.canceled):
+            chunk_task.task_statuses[TaskEnum.drug].status = status
+            event, = DrugModelWorker.task_events(chunk_task)
+            self.assertIs(TaskEnum.drug, event.task)
+            self.assertIs(WorkType.chunk, event.work_type)
+            self.assertEqual(chunk_task.redis_key, event.redis_key)
+            self.assertIs(status, event.status)
+
+    def test_transition_task_locked(self):
+        self.transition_script.return_value = TRANSITION_LOCKED
+
+        with patch.object(DrugModelWorker, 'task_update_manager') as task_update_manager:
+            self.worker.process_message()
+
+        # started with the lock, then the results are saved with the lock
+        self.transition_script.assert_called_once()
+        self.assertEqual(2, task_update_manager.call_count)
+        self.assertIsNotNone(self.worker.task_info.started_at)
+
+    def test_result_cache(self):
+        self.addCleanup(setattr, Environment.CHUNK_RESULT_CACHE_ENABLED, 'value',
+                        Environment.CHUNK_RESULT_CACHE_ENABLED.value)
+        Environment.CHUNK_RESULT_CACHE_ENABLED.value = True
+        self.worker.work_task.text_file_key = 'chunk.txt'
+        self.do_work_patch.return_value = DrugModelTaskInfo(results_file_key='drug.json')
+
+        patch.object(DrugModelWorker, 'version_info', new_callable=PropertyMock).start()
+        download = patch.object(DrugModelWorker, 'download_object_bytes', return_value=b'text').start()
+        upload_results = patch.object(DrugModelWorker, 'upload_results', return_value='drug.json').start()
+        cache_class = patch('text2phenotype.tasks.rmq_worker.ChunkResultCache').start()
+        cache = cache_class.return_value
+
+        with self.subTest('Miss'):
+            cache.get.return_value = None
+
+            self.worker.process_message()
+
+            self.do_work_patch.assert_called_once()
+            cache.put.assert_called_once()
+            self.assertEqual(b'text', cache.put.call_args[0][2])
+
+        with self.subTest('Hit'):
+            self.do_work_patch.reset_mock()
+            cache.get.return_value = b'[]'
+            self.worker.task_info.status = TaskStatus.not_started
+
+            self.worker.process_message()
+
+            self.do_work_patch.assert_not_called()
+            upload_results.assert_called_once_with(b'[]')
+            self.assertEqual('drug.json', self.worker.task_info.results_file_key)
+
+        with self.subTest('Text digest of the chunk'):
+            download.reset_mock()
+            self.worker.work_task.text_digest = 'digest'
+            self.worker.task_info.status = TaskStatus.not_started
+
+            self.worker.process_message()
+
+            # the chunk text is not downloaded
+            download.assert_not_called()
+            self.assertEqual('digest', cache_class.cache_key.call_args[0][0])
+
+    def test_task_lease(self):
+        Environment.TASK_LEASE_ENABLED.value = True
+        patch('text2phenotype.tasks.rmq_worker.time.sleep').start()
+        lease = patch('text2phenotype.tasks.rmq_worker.TaskLease').start().return_value
+        lease.expire = 60
+        lease_manager = patch('text2phenotype.tasks.rmq_worker.LEASE_MANAGER').start()
+
+        with self.subTest('Acquired'):
+            self.worker.process_message()
+
+            self.do_work_patch.assert_called_once()
+            lease_manager.add.assert_called_once_with(lease)
+            lease_manager.remove.assert_called_once_with(lease)
+            lease.release.assert_called_once()
+
+        with self.subTest('Completed in another worker'):
+            self.do_work_patch.reset_mock()
+            self.worker.task_info.status = TaskStatus.started
+
+            def acquire():
+                if lease.acquire.call_count < 3:
+                    return False
+                self.worker.task_info.status = TaskStatus.completed_success
+                return True
+
+            lease.acquire.side_effect = acquire
+            self.worker.process_message()
+
+            self.assertEqual(3, lease.acquire.call_count)
+            self.do_work_patch.assert_not_called()
+
+        with self.subTest('Renewed by another worker'):
+            lease.reset_mock()
+            self.worker.task_info.status = TaskStatus.started
+            lease.acquire.side_effect = None
+            lease.acquire.return_value = False
+            # the lease of a dead worker would have expired
+            patch('text2phenotype.tasks.rmq_worker.time.monotonic', side_effect=[0, 40, 81]).start()
+
+            # the message is requeued, not acked
+            with self.assertRaises(TaskLeaseHeld):
+                self.worker.process_message()
+
+            self.assertEqual(3, lease.acquire.call_count)
+            self.do_work_patch.assert_not_called()
+            lease.release.assert_not_called()
+
+
+class TestTaskCheckpoints(RedisPatchTestCase):
+    def setUp(self):
+        super().setUp()
+        self.worker = DrugModelWorker()
+        self.chunk_task = ChunkTask(job_id=uuid4().hex,
+                                    document_id=uuid4().hex,
+                                    task_statuses={TaskEnum.drug: DrugModelTaskInfo()},
+                                    chunk_num=1,
+                                    chunk_size=1000,
+                                    text_span=[0, 1000])
+        work_task_patch = patch.object(DrugModelWorker, 'work_task', new_callable=PropertyMock,
+                                       return_value=self.chunk_task)
+        work_task_patch.start()
+        self.addCleanup(work_task_patch.stop)
+
+    def test_checkpoints(self):
+        self.assertDictEqual({}, self.worker.get_checkpoints())
+
+        self.worker.save_checkpoint('page_1', 'page_1.json')
+        self.worker.save_checkpoint('page_2')
+        self.assertDictEqual({'page_1': 'page_1.json', 'page_2': ''}, self.worker.get_checkpoints())
+        self.assertGreater(self.fake_redis_client.ttl(self.worker.checkpoints_key), 0)
+
+        self.worker.clear_checkpoints()
+        self.assertDictEqual({}, self.worker.get_checkpoints())
+
+    def test_delete_task(self):
+        RedisMethodsMixin.set_task(self.chunk_task)
+        self.worker.save_checkpoint('page_1')
+
+        RedisMethodsMixin.delete_tasks([self.chunk_task])
+
+        self.assertDictEqual({}, self.worker.get_checkpoints())
+
+
+class BatchDrugModelWorker(DrugModelWorker):
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+        self.log_chunk_numbers = []
+
+    def do_batch_work(self, items):
+        batch, results = [], []
+        for item in items:
+            with self.batch_item_context(item):
+                batch.append(self.work_task.redis_key)
+                self.log_chunk_numbers.append(get_log_context().get('chunk_number'))
+                if self.work_task.chunk_num == 2:
+                    results.append(ValueError('bad chunk'))
+                else:
+                    task_result = self.init_task_result()
+                    task_result.results_file_key = f'{self.work_task.redis_key}.json'
+                    results.append(task_result)
+        self.batches.append(batch)
+        return results
+
+
+class TestTaskBatch(RedisPatchTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(setattr, Environment.TASK_BATCH_SIZE, 'value', Environment.TASK_BATCH_SIZE.value)
+        Environment.TASK_BATCH_SIZE.value = 4
+        self.addCleanup(setattr, Environment.TASK_LEASE_ENABLED, 'value', Environment.TASK_LEASE_ENABLED.value)
+        Environment.TASK_LEASE_ENABLED.value = True
+        lease_manager_patch = patch('text2phenotype.tasks.rmq_worker.LEASE_MANAGER')
+        lease_manager_patch.start()
+        self.addCleanup(lease_manager_patch.stop)
+
+        self.worker = BatchDrugModelWorker()
+        self.job_task = JobTask(job_id=uuid4().hex)
+        self.doc_task = DocumentTask(document_info=DocumentInfo(document_id=uuid4().hex, source='', tid=''),
+                                     job_id=self.job_task.job_id)
+        self.chunks = [ChunkTask(job_id=self.job_task.job_id,
+                                 document_id=self.doc_task.document_id,
+                                 task_statuses={TaskEnum.drug: DrugModelTaskInfo()},
+                                 chunk_num=i,
+                                 chunk_size=10,
+                                 text_span=[i * 10, (i + 1) * 10],
+                                 model_version='v2' if i == 4 else 'v1')
+                       for i in range(1, 5)]
+        RedisMethodsMixin.set_tasks([self.job_task, self.doc_task, *self.chunks])
+
+    def test_on_message(self):
+        self.assertEqual(8, self.worker._prefetch_count)
+        connection = self.worker._RMQConsumerWorker__connection = MagicMock()
+        executor = self.worker.executor = MagicMock()
+
+        futures = [self.worker.on_message(pika.spec.Channel(), pika.spec.Basic.Deliver(delivery_tag=i),
+                                          BasicProperties(), chunk.create_task_message().json().encode())
+                   for i, chunk in enumerate(self.chunks)]
+
+        connection.ioloop.call_later.assert_called_once()
+        connection.ioloop.remove_timeout.assert_called_once()
+        (process_batch, batch), _ = executor.submit.call_args
+        self.assertEqual(self.worker.process_batch, process_batch)
+        self.assertListEqual(futures, [item.future for item in batch])
+        self.assertListEqual([], self.worker._batch)
+
+    def test_process_batch(self):
+        messages = [chunk.create_task_message().json() for chunk in self.chunks]
+        # not a chunk message
+        messages.append(self.doc_task.create_task_message().json())
+        batch = [BatchItem(message, pika.spec.Basic.Deliver(delivery_tag=i)) for i, message in enumerate(messages)]
+
+        self.worker.process_batch(batch)
+
+        # one call per model version
+        self.assertListEqual([[chunk.redis_key for chunk in self.chunks[:3]], [self.chunks[3].redis_key]],
+                             self.worker.batches)
+        for item in batch[:4]:
+            self.assertIsNone(item.future.exception())
+        self.assertIsNotNone(batch[4].future.exception())
+
+        statuses = [RedisMethodsMixin.refresh_task(chunk).task_statuses[TaskEnum.drug] for chunk in self.chunks]
+        self.assertListEqual([TaskStatus.completed_success, TaskStatus.failed,
+                              TaskStatus.completed_success, TaskStatus.completed_success],
+                             [task_info.status for task_info in statuses])
+        self.assertEqual(f'{self.chunks[0].redis_key}.json', statuses[0].results_file_key)
+        self.assertListEqual([1, 1, 1, 1], [task_info.attempts for task_info in statuses])
+        self.assertListEqual(["ValueError('bad chunk')"], statuses[1].error_messages)
+        # the leases are released
+        self.assertListEqual([], self.fake_redis_client.keys('lease:*'))
+
+        # the completed tasks are skipped
+        self.worker.batches.clear()
+        self.worker.process_batch([BatchItem(messages[0], pika.spec.Basic.Deliver(delivery_tag=5))])
+        self.assertListEqual([], self.worker.batches)
+
+    def test_process_batch_log_context(self):
+        batch = [BatchItem(chunk.create_task_message().json(), pika.spec.Basic.Deliver(delivery_tag=i))
+                 for i, chunk in enumerate(self.chunks)]
+
+        self.worker.process_batch(batch)
+
+        self.assertListEqual([chunk.redis_key.split('_')[1] for chunk in self.chunks], self.worker.log_chunk_numbers)
+        self.assertDictEqual({}, get_log_context())
+
+    def test_process_batch_leased(self):
+        # the first chunk is in progress in another worker
+        lease = TaskLease(RedisMethodsMixin.get_redis_client(WorkType.chunk), self.chunks[0].redis_key, TaskEnum.drug)
+        self.assertTrue(lease.acquire())
+        sleep = patch('text2phenotype.tasks.rmq_worker.time.sleep', side_effect=lambda _: lease.release()).start()
+        self.addCleanup(sleep.stop)
+
+        batch = [BatchItem(chunk.create_task_message().json(), pika.spec.Basic.Deliver(delivery_tag=i))
+                 for i, chunk in enumerate(self.chunks)]
+        self.worker.process_batch(batch)
+
+        # the rest of the batch did not wait for the lease
+        self.assertListEqual([[chunk.redis_key for chunk in self.chunks[1:3]], [self.chunks[3].redis_key],
+                              [self.chunks[0].redis_key]],
+                             self.worker.batches)
+        sleep.assert_called_once()
+        for item in batch:
+            self.assertIsNone(item.future.exception())
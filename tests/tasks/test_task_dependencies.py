@@ -4,9 +4,10 @@ import unittest
 from text2phenotype.tasks.task_enums import (
     TaskEnum,
     TaskOperation,
+    TaskStatus,
     WorkType,
 )
-from text2phenotype.tasks.task_info import TaskDependencies, TASK_MAPPING
+from text2phenotype.tasks.task_info import TaskDependencies, TASK_DEPENDENCY_GRAPH, TASK_MAPPING
 
 
 class TestTaskDependencies(unittest.TestCase):
@@ -101,3 +102,53 @@ class TestTaskDependencies(unittest.TestCase):
     def test_phi_token_requires_demographics(self):
         phi_token_tasks = TaskDependencies.get_chunk_tasks(operations=[TaskOperation.phi_tokens])
         self.assertIn(TaskEnum.demographics, phi_token_tasks)
+
+    def test_iter_dependent_tasks(self):
+        dependent_tasks = list(TaskDependencies.iter_dependent_tasks(TaskEnum.vectorize))
+        self.assertEqual(TaskEnum.vectorize, dependent_tasks[0])
+        self.assertIn(TaskEnum.family_history, dependent_tasks)
+        self.assertIn(TaskEnum.clinical_summary, dependent_tasks)
+        self.assertNotIn(TaskEnum.annotate, dependent_tasks)
+        self.assertEqual(len(dependent_tasks), len(set(dependent_tasks)))
+
+    def test_topological_order(self):
+        order = TASK_DEPENDENCY_GRAPH.topological_order
+        self.assertSetEqual(set(TASK_MAPPING), set(order))
+        positions = {task: i for i, task in enumerate(order)}
+        for task, node in TASK_DEPENDENCY_GRAPH.nodes.items():
+            for sub_task in node.sub_tasks:
+                self.assertLess(positions[sub_task], positions[task])
+
+    def test_new_task_info_objects(self):
+        operations = [TaskOperation.clinical_summary, TaskOperation.pdf_embedder]
+        doc_tasks = TaskDependencies.get_document_tasks(operations)
+        doc_tasks[TaskEnum.discharge].dependencies.append(TaskEnum.train_test)
+        chunk_tasks = TaskDependencies.get_chunk_tasks(operations)
+        chunk_tasks[TaskEnum.vectorize].status = TaskStatus.completed_success
+
+        self.assertNotIn(TaskEnum.train_test,
+                         TaskDependencies.get_document_tasks(operations)[TaskEnum.discharge].dependencies)
+        self.assertIs(TaskStatus.not_started, TaskDependencies.get_chunk_tasks(operations)[TaskEnum.vectorize].status)
+
+    def test_ready_tasks(self):
+        planned = TaskDependencies.get_chunk_tasks([TaskOperation.deid])
+        graph = TASK_DEPENDENCY_GRAPH
+
+        self.assertTupleEqual((TaskEnum.annotate,), graph.ready_tasks(planned, set()))
+        self.assertTupleEqual((TaskEnum.vectorize,), graph.ready_tasks(planned, {TaskEnum.annotate}))
+        self.assertTupleEqual((TaskEnum.demographics,),
+                              graph.ready_tasks(planned, {TaskEnum.annotate, TaskEnum.vectorize}))
+        # phi_tokens waits for demographics too
+        self.assertTupleEqual((TaskEnum.demographics,),
+                              graph.ready_tasks(planned, {TaskEnum.annotate, TaskEnum.vectorize},
+                                                completed_task=TaskEnum.vectorize))
+        self.assertTupleEqual((),
+                              graph.ready_tasks(planned, {TaskEnum.annotate, TaskEnum.vectorize},
+                                                completed_task=TaskEnum.annotate))
+        self.assertTupleEqual((TaskEnum.phi_tokens,),
+                              graph.ready_tasks(planned, {TaskEnum.annotate, TaskEnum.vectorize,
+                                                          TaskEnum.demographics}))
+        self.assertTupleEqual((), graph.ready_tasks(planned, set(planned)))
+
+        # the dependencies not planned for the work task are not waited for
+        self.assertTupleEqual((TaskEnum.demographics,), graph.ready_tasks([TaskEnum.demographics], set()))
@@ -0,0 +1,225 @@
+import unittest
+from datetime import (
+    datetime,
+    timezone,
+)
+from unittest.mock import (
+    call,
+    patch,
+)
+from uuid import uuid4
+
+from lupa import LuaRuntime
+from redis.exceptions import ResponseError
+
+from text2phenotype.constants.environment import Environment
+from text2phenotype.redis_client.client import RedisClient
+from text2phenotype.tasks.mixins import RedisMethodsMixin
+from text2phenotype.tasks.task_enums import (
+    TaskEnum,
+    TaskStatus,
+    WorkType,
+)
+from text2phenotype.tasks.task_events import (
+    TaskEvent,
+    TaskEventStream,
+)
+from text2phenotype.tasks.task_info import DrugModelTaskInfo
+from text2phenotype.tasks.task_state import (
+    TRANSITION_APPLIED,
+    TRANSITION_SCRIPT,
+    TaskStateChange,
+    event_script_args,
+)
+from text2phenotype.tasks.work_tasks import ChunkTask
+from text2phenotype.tests.mocks import RedisPatchTestCase
+
+NOW = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+
+class TestTaskEvent(unittest.TestCase):
+    def test_fields(self):
+        event = TaskEvent(task=TaskEnum.drug, work_type=WorkType.chunk, redis_key='chunk',
+                          status=TaskStatus.completed_success)
+
+        fields = event.to_fields()
+        self.assertDictEqual({'task': 'drug', 'work_type': 'chunk', 'redis_key': 'chunk',
+                              'status': 'completed - success'}, fields)
+        self.assertEqual(event, TaskEvent.from_fields(fields))
+
+
+class TestTaskEventStream(RedisPatchTestCase):
+    GROUP = 'sequencer'
+
+    def setUp(self):
+        super().setUp()
+        try:
+            self.fake_redis_client.xlen('stream')
+        except ResponseError:
+            self.skipTest('The fake Redis server does not support streams')
+
+        self.chunk_task = ChunkTask(job_id=uuid4().hex,
+                                    document_id=uuid4().hex,
+                                    task_statuses={TaskEnum.drug: DrugModelTaskInfo()},
+                                    chunk_num=1,
+                                    chunk_size=1000,
+                                    text_span=[0, 1000])
+        self.stream = RedisMethodsMixin.get_task_event_stream(WorkType.chunk)
+
+    def event(self, status: TaskStatus) -> TaskEvent:
+        return TaskEvent(task=TaskEnum.drug, work_type=WorkType.chunk, redis_key=self.chunk_task.redis_key,
+                         status=status)
+
+    def test_set_task_events(self):
+        event = self.event(TaskStatus.completed_success)
+
+        RedisMethodsMixin.set_task(self.chunk_task, events=[event])
+        self.assertFalse(self.fake_redis_client.exists(self.stream.name))
+
+        self.addCleanup(setattr, Environment.TASK_EVENTS_ENABLED, 'value', Environment.TASK_EVENTS_ENABLED.value)
+        Environment.TASK_EVENTS_ENABLED.value = True
+        RedisMethodsMixin.set_task(self.chunk_task, events=[event])
+
+        self.assertTrue(self.stream.create_group(self.GROUP))
+        self.assertFalse(self.stream.create_group(self.GROUP))
+        (_, read_event), = self.stream.read(self.GROUP, 'consumer')
+        self.assertEqual(event, read_event)
+
+    def test_consumer_group(self):
+        self.stream.create_group(self.GROUP)
+        events = [self.event(TaskStatus.failed), self.event(TaskStatus.completed_success)]
+        self.stream.add(events)
+
+        first = self.stream.read(self.GROUP, 'first', count=1)
+        second = self.stream.read(self.GROUP, 'second', count=10)
+        self.assertListEqual(events, [event for _, event in first + second])
+        self.assertListEqual([], self.stream.read(self.GROUP, 'second'))
+
+        # the events of the first consumer are not acked
+        self.assertEqual(1, self.stream.ack(self.GROUP, [event_id for event_id, _ in second]))
+        self.assertListEqual([], self.stream.claim_pending(self.GROUP, 'second', min_idle_time=60000))
+        self.assertListEqual(first, self.stream.claim_pending(self.GROUP, 'second', min_idle_time=0))
+
+
+class TestTaskEventStreamCommands(unittest.TestCase):
+    """The stream commands sent to Redis, the fake Redis server of the tests does not support streams"""
+    STREAM = 'events'
+    GROUP = 'sequencer'
+    FIELDS = {'task': 'drug', 'work_type': 'chunk', 'redis_key': 'chunk', 'status': 'failed'}
+
+    def setUp(self):
+        redis_patch = patch('text2phenotype.redis_client.client.Redis')
+        self.writer = redis_patch.start().return_value
+        self.addCleanup(redis_patch.stop)
+
+        self.client = RedisClient()
+        self.stream = TaskEventStream(self.client, name=self.STREAM, max_len=100)
+        self.event = TaskEvent.from_fields(self.FIELDS)
+
+    def test_add(self):
+        self.stream.add([self.event, self.event])
+
+        pipeline = self.writer.pipeline.return_value
+        self.assertListEqual([call(self.STREAM, self.FIELDS, maxlen=100, approximate=True)] * 2,
+                             pipeline.xadd.call_args_list)
+        pipeline.execute.assert_called_once()
+
+    def test_set_task_events(self):
+        self.addCleanup(setattr, Environment.TASK_EVENTS_ENABLED, 'value', Environment.TASK_EVENTS_ENABLED.value)
+        Environment.TASK_EVENTS_ENABLED.value = True
+        chunk_task = ChunkTask(job_id=uuid4().hex, document_id=uuid4().hex, chunk_num=1, chunk_size=10,
+                               text_span=[0, 10])
+        clients_patch = patch.object(RedisMethodsMixin, '_redis_clients', {WorkType.chunk: self.client})
+        clients_patch.start()
+        self.addCleanup(clients_patch.stop)
+
+        RedisMethodsMixin.set_task(chunk_task, events=[self.event])
+
+        # in the transaction writing the task
+        self.writer.pipeline.assert_called_once_with(transaction=True)
+        pipeline = self.writer.pipeline.return_value
+        pipeline.set.assert_any_call(chunk_task.redis_key, chunk_task.to_json())
+        pipeline.xadd.assert_called_once_with(Environment.TASK_EVENTS_STREAM.value, self.FIELDS,
+                                              maxlen=Environment.TASK_EVENTS_STREAM_MAX_LEN.value,
+                                              approximate=True)
+        pipeline.execute.assert_called_once()
+
+    def test_create_group(self):
+        self.assertTrue(self.stream.create_group(self.GROUP, last_id='$'))
+        self.writer.xgroup_create.assert_called_once_with(self.STREAM, self.GROUP, id='$', mkstream=True)
+
+        self.writer.xgroup_create.side_effect = ResponseError('BUSYGROUP Consumer Group name already exists')
+        self.assertFalse(self.stream.create_group(self.GROUP))
+
+        self.writer.xgroup_create.side_effect = ResponseError('WRONGTYPE')
+        with self.assertRaises(ResponseError):
+            self.stream.create_group(self.GROUP)
+
+    def test_read_ack(self):
+        fields = {field.encode(): value.encode() for field, value in self.FIELDS.items()}
+        self.writer.xreadgroup.return_value = [[self.STREAM.encode(), [(b'1-0', fields), (b'2-0', fields)]]]
+
+        self.assertListEqual([('1-0', self.event), ('2-0', self.event)],
+                             self.stream.read(self.GROUP, 'consumer', count=10, block=5))
+        self.writer.xreadgroup.assert_called_once_with(self.GROUP, 'consumer', {self.STREAM: '>'}, count=10, block=5)
+
+        self.writer.xreadgroup.return_value = None
+        self.assertListEqual([], self.stream.read(self.GROUP, 'consumer'))
+
+        self.stream.ack(self.GROUP, ['1-0', '2-0'])
+        self.writer.xack.assert_called_once_with(self.STREAM, self.GROUP, '1-0', '2-0')
+        self.assertEqual(0, self.stream.ack(self.GROUP, []))
+        self.writer.xack.assert_called_once()
+
+    def test_claim_pending(self):
+        fields = {field.encode(): value.encode() for field, value in self.FIELDS.items()}
+        self.writer.xpending_range.return_value = [{'message_id': b'1-0'}, {'message_id': b'2-0'}]
+        # the second event was deleted from the stream
+        self.writer.xclaim.return_value = [(b'1-0', fields), (b'2-0', {})]
+
+        self.assertListEqual([('1-0', self.event)],
+                             self.stream.claim_pending(self.GROUP, 'consumer', min_idle_time=1000, count=5))
+        self.writer.xpending_range.assert_called_once_with(self.STREAM, self.GROUP, '-', '+', 5)
+        self.writer.xclaim.assert_called_once_with(self.STREAM, self.GROUP, 'consumer', 1000, [b'1-0', b'2-0'])
+
+        self.writer.xpending_range.return_value = []
+        self.assertListEqual([], self.stream.claim_pending(self.GROUP, 'consumer', min_idle_time=1000))
+        self.writer.xclaim.assert_called_once()
+
+
+class TestTransitionScriptEvents(unittest.TestCase):
+    """XADD of TRANSITION_SCRIPT, run with the redis.call() of the test"""
+
+    def run_script(self, keys, args):
+        calls = []
+
+        def redis_call(*command):
+            calls.append(list(command))
+            # the task exists and is not locked
+            return int(command[0] == 'EXISTS' and command[1] == keys[0])
+
+        lua = LuaRuntime()
+        lua_globals = lua.globals()
+        lua_globals.KEYS = lua.table_from(keys)
+        lua_globals.ARGV = lua.table_from(args)
+        lua_globals.redis = lua.table_from({'call': redis_call})
+        return lua.execute(TRANSITION_SCRIPT), calls
+
+    def test_events(self):
+        change = TaskStateChange().fail(TaskEnum.drug, NOW, 'error')
+        events = [{'task': 'drug', 'status': 'failed'}, {'task': 'lab', 'status': 'canceled'}]
+        args = change.script_args() + event_script_args(100, events)
+
+        result, calls = self.run_script(['task', 'task-state', 'lock:task', 'events'], args)
+
+        self.assertEqual(TRANSITION_APPLIED, result)
+        self.assertListEqual([['XADD', 'events', 'MAXLEN', '~', '100', '*', 'task', 'drug', 'status', 'failed'],
+                              ['XADD', 'events', 'MAXLEN', '~', '100', '*', 'task', 'lab', 'status', 'canceled']],
+                             [command for command in calls if command[0] == 'XADD'])
+
+    def test_no_events(self):
+        result, calls = self.run_script(['task', 'task-state', 'lock:task'],
+                                        TaskStateChange().start(TaskEnum.drug, NOW).script_args())
+
+        self.assertEqual(TRANSITION_APPLIED, result)
+        self.assertListEqual([], [command for command in calls if command[0] == 'XADD'])
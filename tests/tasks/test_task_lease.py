@@ -0,0 +1,108 @@
+import threading
+from unittest.mock import patch
+from uuid import uuid4
+
+from text2phenotype.constants.environment import Environment
+from text2phenotype.tasks.mixins import RedisMethodsMixin
+from text2phenotype.tasks.task_enums import (
+    TaskEnum,
+    WorkType,
+)
+from text2phenotype.tasks.task_lease import (
+    LeaseManager,
+    TaskLease,
+)
+from text2phenotype.tests.mocks import RedisPatchTestCase
+
+
+class TestTaskLease(RedisPatchTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = RedisMethodsMixin.get_redis_client(WorkType.chunk)
+        self.redis_key = uuid4().hex
+
+    def lease(self, expire: int = 60) -> TaskLease:
+        return TaskLease(self.client, self.redis_key, TaskEnum.drug, expire=expire)
+
+    def test_acquire_release(self):
+        lease, other_lease = self.lease(), self.lease()
+
+        self.assertTrue(lease.acquire())
+        self.assertFalse(other_lease.acquire())
+        self.assertTrue(other_lease.is_held())
+
+        # only the owner releases the lease
+        other_lease.release()
+        self.assertFalse(other_lease.acquire())
+        lease.release()
+        self.assertTrue(other_lease.acquire())
+
+        # the lease of another task
+        self.assertTrue(TaskLease(self.client, self.redis_key, TaskEnum.lab).acquire())
+
+    def test_renew(self):
+        lease, other_lease = self.lease(expire=100), self.lease(expire=100)
+        lease.acquire()
+        self.fake_redis_client.expire(lease.key, 1)
+
+        self.assertFalse(other_lease.renew())
+        self.assertTrue(lease.renew())
+        self.assertGreater(self.fake_redis_client.ttl(lease.key), 1)
+
+        self.fake_redis_client.delete(lease.key)
+        self.assertFalse(lease.renew())
+
+    def test_lease_manager(self):
+        manager = LeaseManager()
+        lease = self.lease(expire=90)
+        lease.acquire()
+        self.fake_redis_client.expire(lease.key, 1)
+
+        manager.add(lease)
+        self.assertTrue(manager.is_alive())
+        self.assertEqual(30, manager.interval)
+        manager.renew()
+        self.assertGreater(self.fake_redis_client.ttl(lease.key), 1)
+        manager.remove(lease)
+
+    def test_lease_manager_progress(self):
+        manager = LeaseManager()
+        lease = self.lease(expire=90)
+        lease.acquire()
+        manager.add(lease)
+        self.addCleanup(manager.remove, lease)
+        self.fake_redis_client.expire(lease.key, 1)
+
+        # no progress of the worker thread: the lease is left to expire
+        with patch('text2phenotype.tasks.task_lease.time.monotonic',
+                   return_value=lease.progressed_at + Environment.TASK_LEASE_PROGRESS_TIMEOUT.value + 1):
+            self.assertTrue(lease.is_stalled())
+            manager.renew()
+            self.assertEqual(1, self.fake_redis_client.ttl(lease.key))
+
+            # the progress of another thread
+            manager.progress(thread_id=-1)
+            self.assertTrue(lease.is_stalled())
+
+            manager.progress()
+            self.assertFalse(lease.is_stalled())
+            manager.renew()
+        self.assertGreater(self.fake_redis_client.ttl(lease.key), 1)
+
+    def test_lease_manager_restart(self):
+        manager = LeaseManager()
+        # the renewal thread died
+        manager._thread = threading.Thread(target=lambda: None)
+        manager._thread.start()
+        manager._thread.join()
+
+        lease = self.lease()
+        manager.add(lease)
+        self.assertTrue(manager.is_alive())
+
+        # the child process after fork starts its own thread
+        manager._reset()
+        self.assertFalse(manager.is_alive())
+        manager.add(lease)
+        self.assertTrue(manager.is_alive())
+        manager.remove(lease)
@@ -0,0 +1,136 @@
+import unittest
+from datetime import (
+    datetime,
+    timezone,
+)
+from uuid import uuid4
+
+from text2phenotype.constants.environment import Environment
+from text2phenotype.tasks.document_info import DocumentInfo
+from text2phenotype.tasks.mixins import RedisMethodsMixin
+from text2phenotype.tasks.task_enums import (
+    TaskEnum,
+    TaskStatus,
+    WorkType,
+)
+from text2phenotype.tasks.task_info import (
+    DrugModelTaskInfo,
+    LabModelTaskInfo,
+)
+from text2phenotype.tasks.task_state import TaskStateChange
+from text2phenotype.tasks.work_tasks import (
+    ChunkTask,
+    DocumentTask,
+)
+from text2phenotype.tests.mocks import RedisPatchTestCase
+
+NOW = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+
+def create_chunk_task() -> ChunkTask:
+    return ChunkTask(job_id=uuid4().hex,
+                     document_id=uuid4().hex,
+                     task_statuses={TaskEnum.drug: DrugModelTaskInfo(), TaskEnum.lab: LabModelTaskInfo()},
+                     chunk_num=1,
+                     chunk_size=1000,
+                     text_span=[0, 1000])
+
+
+class TestTaskStateChange(unittest.TestCase):
+    def test_apply(self):
+        chunk_task = create_chunk_task()
+
+        TaskStateChange().start(TaskEnum.drug, NOW).fail(TaskEnum.drug, NOW, 'error').apply(chunk_task)
+        TaskStateChange().cancel(TaskEnum.drug, NOW).apply(chunk_task)
+
+        task_info = chunk_task.task_statuses[TaskEnum.drug]
+        self.assertIs(TaskStatus.canceled, task_info.status)
+        self.assertEqual(2, task_info.attempts)
+        self.assertEqual(NOW, task_info.started_at)
+        self.assertEqual(NOW, task_info.completed_at)
+        self.assertListEqual(['error'], task_info.error_messages)
+        self.assertIs(TaskStatus.not_started, chunk_task.task_statuses[TaskEnum.lab].status)
+
+    def test_apply_task_info(self):
+        task_info = DrugModelTaskInfo(completed_at=NOW)
+
+        TaskStateChange().start(TaskEnum.drug, NOW).start(TaskEnum.lab, NOW).apply_task_info(TaskEnum.drug,
+                                                                                              task_info)
+
+        self.assertIs(TaskStatus.started, task_info.status)
+        self.assertEqual(1, task_info.attempts)
+        self.assertIsNone(task_info.completed_at)
+
+    def test_append_failed_task(self):
+        document_task = DocumentTask()
+
+        change = TaskStateChange().append_failed_task(TaskEnum.drug, 'chunk').append_failed_task(TaskEnum.lab)
+        change.apply(document_task)
+
+        self.assertListEqual([TaskEnum.drug, TaskEnum.lab], document_task.failed_tasks)
+        self.assertDictEqual({'chunk': [TaskEnum.drug]}, document_task.failed_chunks)
+
+
+class TestSetTaskState(RedisPatchTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(setattr, Environment.TASK_STATE_SCRIPT_ENABLED, 'value',
+                        Environment.TASK_STATE_SCRIPT_ENABLED.value)
+        Environment.TASK_STATE_SCRIPT_ENABLED.value = True
+        self.chunk_task = create_chunk_task()
+        RedisMethodsMixin.set_task(self.chunk_task)
+
+    def get_chunk_task(self) -> ChunkTask:
+        return RedisMethodsMixin.get_task(WorkType.chunk, self.chunk_task.redis_key)
+
+    def test_set_task_state(self):
+        for _ in range(2):
+            self.assertTrue(RedisMethodsMixin.set_task_state(
+                WorkType.chunk, self.chunk_task.redis_key,
+                TaskStateChange().start(TaskEnum.drug, NOW).fail(TaskEnum.drug, NOW, 'error')))
+
+        task_info = self.get_chunk_task().task_statuses[TaskEnum.drug]
+        self.assertIs(TaskStatus.failed, task_info.status)
+        self.assertEqual(2, task_info.attempts)
+        self.assertListEqual(['error', 'error'], task_info.error_messages)
+
+        chunk_task, = RedisMethodsMixin.mget_tasks(WorkType.chunk, [self.chunk_task.redis_key])
+        self.assertEqual(task_info, chunk_task.task_statuses[TaskEnum.drug])
+
+    def test_set_task(self):
+        RedisMethodsMixin.set_task_state(WorkType.chunk, self.chunk_task.redis_key,
+                                         TaskStateChange().start(TaskEnum.drug, NOW))
+        chunk_task = self.get_chunk_task()
+        RedisMethodsMixin.set_task(chunk_task)
+
+        # the state is saved with the task, not applied twice
+        self.assertEqual(chunk_task, self.get_chunk_task())
+        self.assertEqual(1, chunk_task.task_statuses[TaskEnum.drug].attempts)
+
+    def test_locked_or_missing(self):
+        change = TaskStateChange().start(TaskEnum.drug, NOW)
+
+        with RedisMethodsMixin.task_update_manager(self.chunk_task):
+            self.assertFalse(RedisMethodsMixin.set_task_state(WorkType.chunk, self.chunk_task.redis_key, change))
+        self.assertFalse(RedisMethodsMixin.set_task_state(WorkType.chunk, uuid4().hex, change))
+
+        self.assertEqual(0, self.get_chunk_task().task_statuses[TaskEnum.drug].attempts)
+
+    def test_disabled(self):
+        Environment.TASK_STATE_SCRIPT_ENABLED.value = False
+
+        self.assertFalse(RedisMethodsMixin.set_task_state(WorkType.chunk, self.chunk_task.redis_key,
+                                                          TaskStateChange().start(TaskEnum.drug, NOW)))
+        self.assertFalse(self.fake_redis_client.exists(RedisMethodsMixin._task_state_key(self.chunk_task.redis_key)))
+
+    def test_document_failed_tasks(self):
+        document_task = DocumentTask(document_info=DocumentInfo(document_id=uuid4().hex, source='', tid=''))
+        RedisMethodsMixin.set_task(document_task)
+
+        for task in (TaskEnum.drug, TaskEnum.lab):
+            RedisMethodsMixin.set_task_state(WorkType.document, document_task.redis_key,
+                                             TaskStateChange().append_failed_task(task, 'chunk'))
+
+        document_task = RedisMethodsMixin.get_task(WorkType.document, document_task.redis_key)
+        self.assertListEqual([TaskEnum.drug, TaskEnum.lab], document_task.failed_tasks)
+        self.assertDictEqual({'chunk': [TaskEnum.drug, TaskEnum.lab]}, document_task.failed_chunks)
@@ -1,11 +1,13 @@
 import bisect
 import itertools
 import json
+import sys
 
 from functools import wraps
 from hashlib import sha256
 from io import IOBase
 from typing import (
+    TYPE_CHECKING,
     Dict,
     Iterable,
     List,
@@ -16,23 +18,21 @@ from uuid import uuid4
 
 import ijson
 import numpy
-import pandas
 
 from recordclass import dataobject
 
-from django.core.cache import cache as default_cache
-from django.core.exceptions import ImproperlyConfigured
-from django.utils.decorators import classproperty
-
 from text2phenotype.common.log import operations_logger
 from text2phenotype.common.feature_data_parsing import is_digit
 from text2phenotype.constants.common import VERSION_INFO_KEY
 from text2phenotype.constants.features.label_types import (
     DuplicateDocumentLabel,
-    LabelList,
+    get_label_enum_from_member_name,
 )
 from text2phenotype.services import get_storage_service
 
+if TYPE_CHECKING:
+    import pandas
+
 
 DOCUMENT_INDEX_FIRST = 'document_index_first'
 DOCUMENT_INDEX_LAST = 'document_index_last'
@@ -40,6 +40,25 @@ DOCUMENT_INDEX_LAST = 'document_index_last'
 DEFAULT_CACHE_TTL = 3600  # One hour
 
 
+def __getattr__(name: str):
+    # django cache is imported on the first use (PEP 562)
+    if name == 'default_cache':
+        from django.core.cache import cache
+        globals()[name] = cache
+        return cache
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+class classproperty:
+    """Read-only class property, same as django.utils.decorators.classproperty"""
+
+    def __init__(self, method):
+        self.fget = method
+
+    def __get__(self, instance, cls=None):
+        return self.fget(cls)
+
+
 class _JsonListGenerator(list):
     def __init__(self, generator):
         generator = iter(generator or [])
@@ -124,6 +143,9 @@ class Cache:
     @classproperty
     def cache_backend(cls):
         if cls.__cache_backend is None:
+            from django.core.exceptions import ImproperlyConfigured
+
+            default_cache = sys.modules[__name__].default_cache
             try:
                 # Check the default cache-backend is available
                 default_cache.get('test')
@@ -570,9 +592,9 @@ class Annotation:
             eg, "diagnosis" returns Disability instead of DiseaseDisorder,
             "signsymptom" returns Disability instead of SignSymptom,
         """
-        for label_enum in LabelList:
-            if label_name in label_enum.__members__:
-                return label_enum.get_category_label().persistent_label
+        label_enum = get_label_enum_from_member_name(label_name)
+        if label_enum is not None:
+            return label_enum.get_category_label().persistent_label
 
 
 class TextCoordinateSet:
@@ -647,8 +669,10 @@ class TextCoordinateSet:
         return result
 
     @property
-    def dataframe(self) -> pandas.DataFrame:
+    def dataframe(self) -> 'pandas.DataFrame':
         if self._dataframe is None:
+            import pandas
+
             self._dataframe = pandas.DataFrame([tc.to_dict() for tc in self])
             if self:
                 self._dataframe.set_index([DOCUMENT_INDEX_FIRST, DOCUMENT_INDEX_LAST])
@@ -1,18 +1,23 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 import os
 import re
 import shutil
 import string
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Union
 
 import numpy as np
+from text2phenotype.common import common
 from text2phenotype.common.log import operations_logger
 from text2phenotype.annotations.file_helpers import AnnotationSet
 
 
 # used to strip from ends of text
 STOP_PUNCTUATION = ",.:;?!"
+# removes all whitespace and punctuation, see I2B2Reader._text_equal()
+_TEXT_EQUAL_TRANSLATION = str.maketrans("", "", string.whitespace + string.punctuation)
+_TOKEN_PATTERN = re.compile(r"\S+")
 
 
 class UnmatchedDiscontinuousText(Exception):
@@ -49,6 +54,97 @@ class I2B2Entry:
     label: Optional[str] = None
 
 
+class I2B2TokenIndex:
+    """
+    Document char positions of the whitespace separated tokens, indexed by (line, token)
+    The tokens of all the lines are stored in flat arrays, line_token_offsets[line] is the position
+    of the first token of the line, so a (line, token) lookup is O(1)
+    NOTE: line and token indexes are 0 based here, and negative indexes count from the end
+        (as in the nested lists returned by I2B2Reader.get_doc_token_ranges())
+    """
+
+    def __init__(self, token_starts: np.ndarray, token_ends: np.ndarray, line_token_offsets: np.ndarray):
+        self.token_starts = token_starts
+        self.token_ends = token_ends
+        self.line_token_offsets = line_token_offsets
+
+    @classmethod
+    def from_text(cls, raw_text: str) -> 'I2B2TokenIndex':
+        """
+        NOTE: char coordinates are assuming that any newline '\n' character counts the same as a space
+        """
+        token_starts = []
+        token_ends = []
+        line_token_offsets = [0]
+        line_start = 0
+        for line in raw_text.split("\n"):
+            for m in _TOKEN_PATTERN.finditer(line):
+                token_starts.append(line_start + m.start())
+                token_ends.append(line_start + m.end())
+            line_token_offsets.append(len(token_starts))
+            line_start += len(line) + 1  # incl \n char in len
+        return cls(np.array(token_starts, dtype=np.int64),
+                   np.array(token_ends, dtype=np.int64),
+                   np.array(line_token_offsets, dtype=np.int64))
+
+    @classmethod
+    def from_token_ranges(cls, doc_token_ranges: List[List[Dict[str, Any]]]) -> 'I2B2TokenIndex':
+        """Index the output of I2B2Reader.get_doc_token_ranges()"""
+        ranges = [token["text_range"] for line_tokens in doc_token_ranges for token in line_tokens]
+        ranges = np.array(ranges, dtype=np.int64).reshape(-1, 2)
+        line_token_offsets = np.cumsum([0] + [len(line_tokens) for line_tokens in doc_token_ranges])
+        return cls(ranges[:, 0], ranges[:, 1], line_token_offsets.astype(np.int64))
+
+    @property
+    def line_count(self) -> int:
+        return len(self.line_token_offsets) - 1
+
+    def _line(self, line_idx: int) -> int:
+        if line_idx < 0:
+            line_idx += self.line_count
+        if not 0 <= line_idx < self.line_count:
+            raise IndexError(f"line index out of range: {line_idx}")
+        return line_idx
+
+    def line_token_count(self, line_idx: int) -> int:
+        line_idx = self._line(line_idx)
+        return int(self.line_token_offsets[line_idx + 1] - self.line_token_offsets[line_idx])
+
+    def _token(self, line_idx: int, token_idx: int) -> int:
+        """Position of the token in the flat arrays"""
+        line_idx = self._line(line_idx)
+        token_count = int(self.line_token_offsets[line_idx + 1] - self.line_token_offsets[line_idx])
+        if token_idx < 0:
+            token_idx += token_count
+        if not 0 <= token_idx < token_count:
+            raise IndexError(f"token index out of range: {line_idx}:{token_idx}")
+        return int(self.line_token_offsets[line_idx]) + token_idx
+
+    def char_range(self, line_idx: int, token_idx: int) -> Tuple[int, int]:
+        """Document char range of the token, the end position is exclusive"""
+        position = self._token(line_idx, token_idx)
+        return int(self.token_starts[position]), int(self.token_ends[position])
+
+    def char_start(self, line_idx: int, token_idx: int) -> int:
+        return int(self.token_starts[self._token(line_idx, token_idx)])
+
+    def char_end(self, line_idx: int, token_idx: int) -> int:
+        return int(self.token_ends[self._token(line_idx, token_idx)])
+
+    def to_token_ranges(self, raw_text: str) -> List[List[Dict[str, Any]]]:
+        """The nested lists of token dicts, see I2B2Reader.get_doc_token_ranges()"""
+        starts = self.token_starts.tolist()
+        ends = self.token_ends.tolist()
+        offsets = self.line_token_offsets.tolist()
+        return [
+            [
+                {"token": raw_text[starts[i]:ends[i]], "text_range": (starts[i], ends[i])}
+                for i in range(offsets[line_idx], offsets[line_idx + 1])
+            ]
+            for line_idx in range(self.line_count)
+        ]
+
+
 class I2B2Reader(ABC):
     """
     Abstract base class for reading I2B2 formatted annotation files
@@ -79,14 +175,13 @@ class I2B2Reader(ABC):
         Main entry point to create AnnotationSet from i2b2 annotation file and text
         Creates document line/token coordinates used for character position matching
         """
-        raw_text_concat = raw_text.replace("\n", " ")
         # get the line and token position conversion to char position
-        doc_token_ranges = self.get_doc_token_ranges(raw_text)
+        doc_token_index = self.get_doc_token_index(raw_text)
 
         ann_lines = ann_text.split("\n")  # split i2b2 annotation lines to create line coordinates
         ann_set = self.get_label_annotation_set(
             ann_lines,
-            doc_token_ranges,
+            doc_token_index,
             i2b2_label,
             target_label,
             raw_text=raw_text,
@@ -96,6 +191,64 @@ class I2B2Reader(ABC):
         )
         return ann_set
 
+    def parse_i2b2_label_annotation_file(
+            self,
+            text_path: str,
+            ann_path: str,
+            target_label: str,
+            i2b2_label: str,
+            label_filter_type_marker: str = None,
+            label_filter_type_target: str = None,
+    ) -> AnnotationSet:
+        """parse_i2b2_label_annotation_text() of an i2b2 text file and its annotation file"""
+        return self.parse_i2b2_label_annotation_text(
+            common.read_text(ann_path),
+            common.read_text(text_path),
+            target_label,
+            i2b2_label,
+            label_filter_type_marker=label_filter_type_marker,
+            label_filter_type_target=label_filter_type_target,
+        )
+
+    def parse_i2b2_label_annotation_files(
+            self,
+            file_paths: List[Tuple[str, str]],
+            target_label: str,
+            i2b2_label: str,
+            label_filter_type_marker: str = None,
+            label_filter_type_target: str = None,
+            n_jobs: int = 1,
+    ) -> List[AnnotationSet]:
+        """
+        Parse a whole i2b2 corpus, see parse_i2b2_label_annotation_file()
+
+        :param file_paths: list of (text file path, annotation file path)
+        :param n_jobs: number of worker processes parsing the files
+        :return: the AnnotationSet of every file, in the file_paths order
+        """
+        args = (target_label, i2b2_label, label_filter_type_marker, label_filter_type_target)
+        if n_jobs <= 1:
+            return [self.parse_i2b2_label_annotation_file(text_path, ann_path, *args)
+                    for text_path, ann_path in file_paths]
+
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [
+                executor.submit(self.parse_i2b2_label_annotation_file, text_path, ann_path, *args)
+                for text_path, ann_path in file_paths
+            ]
+            ann_sets = []
+            for i, future in enumerate(futures):
+                ann_sets.append(future.result())
+                operations_logger.debug(f"[{i + 1}/{len(futures)}] Parsed {file_paths[i][1]}")
+            return ann_sets
+
+    def get_doc_token_index(self, raw_text: str) -> I2B2TokenIndex:
+        """
+        Document char positions of the tokens indexed by line and token, see get_doc_token_ranges()
+        NOTE: the index lines start at 0, file lines in i2b2 start with line number 1
+        """
+        return I2B2TokenIndex.from_text(raw_text)
+
     def get_doc_token_ranges(self, raw_text: str) -> List[List[Dict[str, Any]]]:
         """
         From a list of raw text lines, return the start and end char coordinates for each token in document frame
@@ -113,34 +266,12 @@ class I2B2Reader(ABC):
                 'token': content field
                 'range': list with the token char start and end; end position is exclusive
         """
-        raw_text_lines = raw_text.split("\n")
-        raw_char_line_len = [len(line) + 1 for line in raw_text_lines]  # incl \n char in len
-        raw_char_line_start = [0] + np.cumsum(raw_char_line_len).tolist()
-        # split tokens by whitespace. note that whitespace maybe more than one char
-        doc_token_start_by_line = [self.get_token_line_char_coord(line) for line in raw_text_lines]
-
-        # for each line, iterate through the tokens and add the doc char position to the line-based
-        # token positions will yield a list of lists that can be indexed by line and token position
-        # to get the char position of the token
-        doc_token_ranges = [
-            [
-                {
-                    "token": token_dict["token"],
-                    "text_range": (
-                        line_start + token_dict["text_range"][0],
-                        line_start + token_dict["text_range"][1],
-                    ),
-                }
-                for token_dict in line_tokens
-            ]
-            for line_start, line_tokens in zip(raw_char_line_start, doc_token_start_by_line)
-        ]
-        return doc_token_ranges
+        return self.get_doc_token_index(raw_text).to_token_ranges(raw_text)
 
     def get_label_annotation_set(
             self,
             ann_lines: List[str],
-            doc_token_ranges: List[List[Dict[str, Any]]],
+            doc_token_ranges: Union[I2B2TokenIndex, List[List[Dict[str, Any]]]],
             i2b2_label: str,
             target_label_name: str,
             raw_text: str = None,
@@ -155,8 +286,9 @@ class I2B2Reader(ABC):
 
         :param ann_lines:
             List of string content from the annotation file by line
-        :param doc_token_ranges:  List[List[Dict[str, Any]]]
-            Coordinate map from line/token to doc char position, output from get_doc_token_ranges()
+        :param doc_token_ranges:  I2B2TokenIndex or List[List[Dict[str, Any]]]
+            Coordinate map from line/token to doc char position, output from get_doc_token_index()
+            or get_doc_token_ranges()
         :param i2b2_label:
             String for the target label type, maps from MedLabelMarkers
             eg, "m"
@@ -176,8 +308,14 @@ class I2B2Reader(ABC):
             raw_text_lines = raw_text.split("\n")
         else:
             raw_text_lines = None
+        if isinstance(doc_token_ranges, I2B2TokenIndex):
+            doc_token_index = doc_token_ranges
+        else:
+            doc_token_index = I2B2TokenIndex.from_token_ranges(doc_token_ranges)
 
         ann_set = AnnotationSet()
+        # (label, text_range, text) of the annotations in ann_set
+        added_annotations = set()
         for i, line in enumerate(ann_lines):
             if not line:
                 # empty new line
@@ -238,15 +376,16 @@ class I2B2Reader(ABC):
                     if end_line_idx == start_line_idx:
                         # if on the same line, pull back the end token index
                         i2b2_token_coords.end_token -= 1
-                label_char_start = doc_token_ranges[start_line_idx][i2b2_token_coords.start_token]["text_range"][0]
-                if i2b2_token_coords.end_token >= len(doc_token_ranges[end_line_idx]):
+                label_char_start = doc_token_index.char_start(start_line_idx, i2b2_token_coords.start_token)
+                if i2b2_token_coords.end_token >= doc_token_index.line_token_count(end_line_idx):
                     # sometimes the i2b2 annotation token position isnt correct,
                     # and the additional tokens are actually on the next line.
                     # Move cursor forward to next line and associated token
                     i2b2_token_coords.end_line += 1
                     end_line_idx = i2b2_token_coords.end_line - 1
-                    i2b2_token_coords.end_token = i2b2_token_coords.end_token - len(doc_token_ranges[end_line_idx]) - 1
-                label_char_end = doc_token_ranges[end_line_idx][i2b2_token_coords.end_token]["text_range"][1]
+                    i2b2_token_coords.end_token = (
+                        i2b2_token_coords.end_token - doc_token_index.line_token_count(end_line_idx) - 1)
+                label_char_end = doc_token_index.char_end(end_line_idx, i2b2_token_coords.end_token)
                 text_char_range = [label_char_start, label_char_end]
 
                 # sanity check the label char coordinates against the full doc text
@@ -276,12 +415,14 @@ class I2B2Reader(ABC):
                         )
                         i2b2_ann_text = doc_text_cleaned  # hopefully fixes all edge cases
                 # add to AnnotationSet
-                if ann_set.has_matching_annotation(target_label_name, text_range=text_char_range, text=i2b2_ann_text):
+                annotation_key = (target_label_name, label_char_start, label_char_end, i2b2_ann_text)
+                if annotation_key in added_annotations:
                     operations_logger.debug(
                         f"Found existing annotation in ann_set, skipping: label={target_label_name}, "
                         f"text_range={text_char_range}, text={i2b2_ann_text}"
                     )
                     continue
+                added_annotations.add(annotation_key)
                 ann_set.add_annotation_no_coord(target_label_name, text_range=text_char_range, text=i2b2_ann_text)
         return ann_set
 
@@ -293,8 +434,7 @@ class I2B2Reader(ABC):
     @staticmethod
     def _text_equal(t1: str, t2: str) -> bool:
         """Compare text strings with ignoring all whitespace and punctuation"""
-        trans = str.maketrans("", "", string.whitespace + string.punctuation)
-        return t1.translate(trans) == t2.translate(trans)
+        return t1.translate(_TEXT_EQUAL_TRANSLATION) == t2.translate(_TEXT_EQUAL_TRANSLATION)
 
     @staticmethod
     def extract_i2b2_text_coords(label_text: str) -> List[I2B2Entry]:
@@ -380,7 +520,7 @@ class I2B2Reader(ABC):
         """
         token_coords_list = []
         # group item at white spaces
-        for m in re.finditer(r"\S+", line):  # generator over all non-whitespace matches
+        for m in _TOKEN_PATTERN.finditer(line):  # generator over all non-whitespace matches
             index, item = m.start(), m.group()
             token_coords_list.append(
                 {
@@ -1,8 +1,5 @@
-import elasticapm
 import functools
 
-from elasticapm.utils import get_name_from_func
-
 from text2phenotype.constants.apm import (
     TEXT2PHENOTYPE_TXT_LEN,
     TEXT2PHENOTYPE_TID,
@@ -11,23 +8,51 @@ from text2phenotype.constants.apm import (
 )
 
 
-class text2phenotype_capture_span(elasticapm.capture_span):
-    def __call__(self, func):
-        self.name = self.name or get_name_from_func(func)
+class text2phenotype_capture_span:
+    """
+    elasticapm.capture_span adding the transaction id to the span.
+    elasticapm is slow to import, so the span is created on the first use instead of the module import
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._args = args
+        self._kwargs = kwargs
+        self._span = None
+
+    def _get_span(self, func=None):
+        if self._span is None:
+            import elasticapm
+            from elasticapm.utils import get_name_from_func
+
+            span = elasticapm.capture_span(*self._args, **self._kwargs)
+            if func is not None:
+                span.name = span.name or get_name_from_func(func)
+            self._span = span
+        return self._span
 
+    def __call__(self, func):
         @functools.wraps(func)
         def decorated(*args, **kwds):
-            self.extra = self.extra or {}
-            text2phenotype = self.extra.setdefault(TEXT2PHENOTYPE_KEY, {})
+            span = self._get_span(func)
+            span.extra = span.extra or {}
+            text2phenotype = span.extra.setdefault(TEXT2PHENOTYPE_KEY, {})
             text2phenotype[TEXT2PHENOTYPE_TID] = kwds.get('tid')
-            with self:
+            with span:
                 return func(*args, **kwds)
 
         return decorated
 
+    def __enter__(self):
+        return self._get_span().__enter__()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return self._get_span().__exit__(exc_type, exc_val, exc_tb)
+
 
 def text2phenotype_capture_text_info(text_length: int = None, token_count: int = None,
                             tid: str = None):
+    import elasticapm
+
     data = {
         TEXT2PHENOTYPE_TXT_LEN: text_length,
         TEXT2PHENOTYPE_TOK_COUNT: token_count,
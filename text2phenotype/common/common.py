@@ -1,9 +1,12 @@
+import bisect
 import csv
 import json
 import os
 import random
+import re
 import uuid
 import pickle
+from array import array
 from datetime import datetime
 from getpass import getuser
 from time import time
@@ -14,12 +17,11 @@ from typing import (
     Iterable,
     Iterator,
     List,
+    Optional,
+    Sequence,
     Tuple
 )
 
-import nltk
-from bs4 import BeautifulSoup
-
 from text2phenotype.common import jsonifiers
 from text2phenotype.common.log import operations_logger
 
@@ -353,11 +355,16 @@ def extract_text_from_element(title: str) -> str:
     :param str title: HTML element (like a div) to extract text
     :return: stripped element text
     """
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(title, "lxml")
     clean_value = soup.get_text("", strip=True)
     return clean_value
 
 
+_NON_SPACE = re.compile(r'\S')
+
+
 def iter_sentence(text: str) -> Iterator[Tuple[Tuple[int, int], str]]:
     """
     Break text into individual sentences.
@@ -367,26 +374,76 @@ def iter_sentence(text: str) -> Iterator[Tuple[Tuple[int, int], str]]:
     if not text or text.isspace():
         return []
 
-    remaining_text = text.lstrip()
-    start_index = len(text) - len(remaining_text)
+    import nltk
+
+    start_index = len(text) - len(text.lstrip())
 
-    for sentence in nltk.sent_tokenize(remaining_text):
-        if not remaining_text.startswith(sentence):
+    for sentence in nltk.sent_tokenize(text[start_index:]):
+        if not text.startswith(sentence, start_index):
             raise Exception("NLTK returned some funk!")
 
         end_index = start_index + len(sentence)
         yield (start_index, end_index), sentence
 
-        remaining_text = remaining_text[len(sentence):]
-        text_len = len(remaining_text)
-        remaining_text = remaining_text.lstrip()
-        start_index = end_index + text_len - len(remaining_text)
+        # skip the whitespace between the sentences
+        next_sentence = _NON_SPACE.search(text, end_index)
+        start_index = next_sentence.start() if next_sentence else len(text)
 
 
 def get_sentences(text: str) -> List[Tuple[Tuple[int, int], str]]:
     return list(iter_sentence(text))
 
 
+class SplitPointIndex:
+    """
+    Positions of the section beginnings (BEGINNING_SECTIONS) in a document, to find the chunk split points
+    with bisect lookups. The document is lower cased once, and each section is searched for once in the
+    whole document, the first time a split point needs it.
+    """
+
+    def __init__(self, text: str, sections: Sequence[str] = BEGINNING_SECTIONS):
+        self.text_len = len(text)
+        self.sections = sections
+        self._text_lower = text.lower()
+        self._positions: Dict[str, array] = {}
+
+    def positions(self, section: str) -> array:
+        """Sorted start positions of all the (possibly overlapping) occurrences of the section"""
+        positions = self._positions.get(section)
+        if positions is None:
+            text = self._text_lower
+            if any(section[:i] == section[-i:] for i in range(1, len(section))):
+                # occurrences may overlap, eg '\n\n' in '\n\n\n'
+                positions = array('q')
+                position = text.find(section)
+                while position != -1:
+                    positions.append(position)
+                    position = text.find(section, position + 1)
+            else:
+                positions = array('q', (match.start() for match in re.finditer(re.escape(section), text)))
+            self._positions[section] = positions
+        return positions
+
+    def last_position(self, section: str, start: int, end: int) -> Optional[int]:
+        """Start of the last occurrence of the section in text[start:end] (as str.rfind), None if not found"""
+        positions = self.positions(section)
+        i = bisect.bisect_right(positions, end - len(section)) - 1
+        if i >= 0 and positions[i] >= start:
+            return positions[i]
+        return None
+
+    def best_split_point(self, start_point: int, max_chunk_len: int, min_chunk_size: int) -> int:
+        """see get_best_split_point()"""
+        max_end_point = start_point + max_chunk_len
+        if max_end_point < self.text_len:
+            for section_name in self.sections:
+                end_point = self.last_position(section_name, start_point + min_chunk_size, max_end_point)
+                if end_point is not None:
+                    return end_point
+
+        return max_end_point
+
+
 def chunk_text_by_size(text: str, max_chunk_characters: int) -> List[Tuple[Tuple[int, int], str]]:
     """
     Break a document into chunks.
@@ -397,27 +454,27 @@ def chunk_text_by_size(text: str, max_chunk_characters: int) -> List[Tuple[Tuple
     if not text or text.isspace():
         return []
     text_len = len(text)
+    split_index = SplitPointIndex(text)
     chunks = []
     start = 0
     while start <= text_len:
-        end = get_best_split_point(text, start_point=start, max_chunk_len=max_chunk_characters,
-                                   min_chunk_size=int(max_chunk_characters * 0.9))
+        end = split_index.best_split_point(start_point=start, max_chunk_len=max_chunk_characters,
+                                           min_chunk_size=int(max_chunk_characters * 0.9))
         text_chunk = text[start: end]
         chunks.append(((start, end), text_chunk))
         start = end
     return chunks
 
 
-def get_best_split_point(text, start_point: int, max_chunk_len: int, min_chunk_size: int) -> int:
+def get_best_split_point(text, start_point: int, max_chunk_len: int, min_chunk_size: int,
+                         split_index: SplitPointIndex = None) -> int:
+    """
+    :param split_index: SplitPointIndex of the text, pass it when splitting the same text repeatedly
+    """
     # if theres a good split point between max chunk size and min chunk size, split on the point closes to max
-    max_end_point = start_point + max_chunk_len
-    if max_end_point < len(text):
-        for section_name in BEGINNING_SECTIONS:
-            end_point = text.lower().rfind(section_name, start_point+min_chunk_size, max_end_point)
-            if end_point != -1:
-                return end_point
-
-    return max_end_point
+    if split_index is None:
+        split_index = SplitPointIndex(text)
+    return split_index.best_split_point(start_point, max_chunk_len, min_chunk_size)
 
 
 def longest_span(query, document, casesensitive=False):
@@ -484,6 +541,169 @@ def sort_by_length(tokens):
     return reversed(tokens)
 
 
+_CLEAN_TEXT_UNIT = ' MG/ACTUAT'
+_CLEAN_TEXT_TRANSLATION = str.maketrans('./()', '    ')
+
+
+class SpanMatcher:
+    """
+    match_query/longest_span of many queries against the same document.
+    The document is cleaned once (see clean_text), the cleaned text keeps the offsets of its characters
+    in the original document, so the matches are returned in original text coordinates:
+
+    matcher = SpanMatcher(document)
+    matcher.longest_span('Adenocarcinoma of lung, stage II')  # ['ADENOCARCINOMA', start, end]
+    matcher.match_all(['Adenocarcinoma', 'Grade 2'])  # Aho-Corasick, a single pass over the document
+    """
+
+    def __init__(self, document: str, casesensitive: bool = False):
+        self.document = document
+        self.casesensitive = casesensitive
+        # original text span of each cleaned text character, None if the offsets didn't change
+        self._starts: Optional[array] = None
+        self._ends: Optional[array] = None
+        if casesensitive:
+            self.text = document
+        else:
+            self.text = self._clean_document(document)
+
+    def _clean_document(self, document: str) -> str:
+        cleaned = clean_text(document)
+        if len(cleaned) == len(document) and _CLEAN_TEXT_UNIT not in document:
+            return cleaned
+
+        starts, ends = array('q'), array('q')
+        parts = []
+        position = 0
+        for segment in document.split(_CLEAN_TEXT_UNIT):
+            upper = segment.upper()
+            if len(upper) == len(segment):
+                starts.extend(range(position, position + len(segment)))
+                ends.extend(range(position + 1, position + len(segment) + 1))
+            else:
+                # upper() expanded some characters ('ß' -> 'SS'), all of them point to the source character
+                for offset, char in enumerate(segment):
+                    char_len = len(char.upper())
+                    starts.extend([position + offset] * char_len)
+                    ends.extend([position + offset + 1] * char_len)
+            parts.append(upper)
+            position += len(segment)
+            if position < len(document):
+                # ' MG/ACTUAT' -> ' '
+                starts.append(position)
+                ends.append(position + len(_CLEAN_TEXT_UNIT))
+                parts.append(' ')
+                position += len(_CLEAN_TEXT_UNIT)
+
+        self._starts, self._ends = starts, ends
+        return ''.join(parts).translate(_CLEAN_TEXT_TRANSLATION)
+
+    def clean_query(self, query: str) -> str:
+        return query if self.casesensitive else clean_text(query)
+
+    def document_span(self, start: int, end: int) -> Tuple[int, int]:
+        """Original document span of the cleaned text span"""
+        if self._starts is None:
+            return start, end
+        if start == end:
+            original = self._starts[start] if start < len(self._starts) else len(self.document)
+            return original, original
+        return self._starts[start], self._ends[end - 1]
+
+    def _match(self, clean_query: str, start: int) -> list:
+        return [clean_query, *self.document_span(start, start + len(clean_query))]
+
+    def match(self, query: str) -> Optional[list]:
+        """
+        match_query against the document
+        :return: [cleaned query, start, end] in the original document, or None if the query is not in the document
+        """
+        clean_query = self.clean_query(query)
+        start = self.text.find(clean_query)
+        if start < 0:
+            return None
+        return self._match(clean_query, start)
+
+    def longest_span(self, query: str) -> Optional[list]:
+        """
+        longest_span against the document, the whole query first, then the longest single token.
+        Unlike longest_span, the tokens are matched with the matcher casesensitive too
+        """
+        match = self.match(query)
+        if match:
+            return match
+
+        for token in sort_by_length(query):
+            match = self.match(token)
+            if match:
+                return match
+
+        return None
+
+    def match_all(self, queries: Iterable[str]) -> Dict[str, Optional[list]]:
+        """
+        First match of every query, with a single pass over the document.
+        Faster than match() per query for many (hundreds of) queries
+        :return: {query: [cleaned query, start, end] or None}
+        """
+        queries = list(queries)
+        clean_queries = {query: self.clean_query(query) for query in queries}
+        first_starts = self._first_starts({clean_query for clean_query in clean_queries.values() if clean_query})
+        # the empty string is at the beginning of any text
+        first_starts[''] = 0
+
+        return {query: (self._match(clean_query, first_starts[clean_query])
+                        if clean_query in first_starts else None)
+                for query, clean_query in clean_queries.items()}
+
+    def _first_starts(self, patterns: Iterable[str]) -> Dict[str, int]:
+        """Aho-Corasick, first start position of every pattern in the cleaned text"""
+        patterns = set(patterns)
+        if not patterns:
+            return {}
+
+        # trie: node -> {char: next node}, the outputs of the node are the patterns ending at it
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[str]] = [[]]
+        for pattern in patterns:
+            node = 0
+            for char in pattern:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto[node][char] = next_node
+                    goto.append({})
+                    outputs.append([])
+                node = next_node
+            outputs[node].append(pattern)
+
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for node in queue:
+            for char, next_node in goto[node].items():
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fallback = goto[state].get(char, 0)
+                fail[next_node] = fallback if fallback != next_node else 0
+                outputs[next_node].extend(outputs[fail[next_node]])
+                queue.append(next_node)
+
+        first_starts = {}
+        node = 0
+        for position, char in enumerate(self.text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for pattern in outputs[node]:
+                if pattern not in first_starts:
+                    first_starts[pattern] = position - len(pattern) + 1
+                    if len(first_starts) == len(patterns):
+                        return first_starts
+
+        return first_starts
+
+
 def version_text(name: str) -> str:
     """
     Get label of version
@@ -240,75 +240,60 @@ class MachineAnnotation(FeatureServiceOutput):
 
 
 class DocumentTypeAnnotation(MachineAnnotation):
+    """
+    The loinc_section tokens of an annotation, the adjacent tokens of the same section merged into one token.
+    Built in a single pass over the section tokens, the features of the source annotation are not copied
+    and the source annotation is not changed
+    """
+    EXCLUDE_FEATURES = {FeatureType.len, FeatureType.speech, FeatureType.speech_bin}
+
     def __init__(self, annotation):
-        super().__init__(json_dict_input=annotation.to_dict())
-        self.__clean_annotations()
-        self.__merge_annotations()
-
-    def __clean_annotations(self):
-        section_keys = self.output_dict[FeatureType.loinc_section].input_dict.keys()
-        target_indices = [int(i) for i in section_keys]
-        exclude_features = {FeatureType.len, FeatureType.len.name, FeatureType.len.value,
-                            FeatureType.speech, FeatureType.speech.name, FeatureType.speech.value,
-                            FeatureType.speech_bin, FeatureType.speech_bin.name, FeatureType.speech_bin.value}
-
-        for feature in exclude_features:
-            if feature in self.output_dict:
-                del self.output_dict[feature]
-
-        for feature, annotations in self.output_dict.items():
-            if isinstance(annotations, list):
-                self.output_dict[feature] = [annotations[i] for i in target_indices]
-            else:
-                self.output_dict[feature] = IndividualFeatureOutput(
-                    {i: annotations[k] for i, k in enumerate(section_keys)})
-
-    def __merge_annotations(self):
-        ranges = self.output_dict['range']
-        tokens = self.output_dict['token']
-        sections = self.output_dict[FeatureType.loinc_section]
-
-        section_list = sorted([(int(index), section) for index, section in sections.input_dict.items()])
-        if not section_list:
-            return
-
-        new_tokens = [tokens[section_list[0][0]]]
-        new_ranges = [ranges[section_list[0][0]]]
-        new_sections = [section_list[0][1]]
-        valid_indices = [0]
-        for i in range(1, len(section_list)):
-            index, section = section_list[i]
-            curr_token = tokens[index]
+        super().__init__()
+        self.__build(annotation)
+
+    def __build(self, annotation: MachineAnnotation):
+        sections = annotation.output_dict[FeatureType.loinc_section].input_dict
+        section_keys = list(sections)
+        tokens = annotation.output_dict[TOKEN]
+        ranges = annotation.output_dict[RANGE]
+
+        # positions in section_keys of the merged tokens, the merged tokens are joined at the end
+        kept_positions = []
+        token_parts = []
+        new_ranges = []
+        previous_code = None
+        for position, key in enumerate(section_keys):
+            index = int(key)
             curr_range = ranges[index]
+            loinc_code = self.__get_loinc_code(sections[key])
 
-            loinc_code = self.__get_loinc_code(section)
-
-            same_code = loinc_code == self.__get_loinc_code(section_list[i - 1][1])
-            adj_index = new_ranges[-1][1] == curr_range[0] - 1
-            if same_code and adj_index:
-                new_tokens[-1] += ' ' + curr_token
-                new_ranges[-1][1] = curr_range[1]
+            if position and loinc_code == previous_code and new_ranges[-1][1] == curr_range[0] - 1:
+                token_parts[-1].append(tokens[index])
+                new_ranges[-1] = [new_ranges[-1][0], curr_range[1]]
             else:
-                new_sections.append(section)
-                valid_indices.append(index)
+                kept_positions.append(position)
+                token_parts.append([tokens[index]])
                 new_ranges.append(curr_range)
-                new_tokens.append(curr_token)
-
-        self.output_dict['range'] = new_ranges
-        self.output_dict['token'] = new_tokens
-        self.output_dict[FeatureType.loinc_section] = \
-            IndividualFeatureOutput({str(i): section for i, section in enumerate(new_sections)})
+            previous_code = loinc_code
 
-        preprocessed_features = {'range', 'token', FeatureType.loinc_section}
-        for feature, annotations in self.output_dict.items():
-            if feature in preprocessed_features:
+        kept_keys = [section_keys[position] for position in kept_positions]
+        for feature, annotations in annotation.output_dict.items():
+            self.features.add(feature)
+            if feature in self.EXCLUDE_FEATURES:
                 continue
 
-            if isinstance(annotations, list):
-                self.output_dict[feature] = [annotations[i] for i in valid_indices]
+            if feature == RANGE:
+                annotations = new_ranges
+            elif feature == TOKEN:
+                annotations = [' '.join(parts) for parts in token_parts]
+            elif feature == FeatureType.loinc_section:
+                annotations = IndividualFeatureOutput({str(i): sections[key] for i, key in enumerate(kept_keys)})
+            elif isinstance(annotations, list):
+                annotations = [annotations[int(key)] for key in kept_keys]
             else:
-                self.output_dict[feature] = IndividualFeatureOutput(
-                    {new_i: annotations[old_i] for new_i, old_i in enumerate(valid_indices) if old_i in annotations})
+                values = ((i, annotations[key]) for i, key in enumerate(kept_keys))
+                annotations = IndividualFeatureOutput({i: value for i, value in values if value is not None})
+            self.output_dict[feature] = annotations
 
     @staticmethod
     def __get_loinc_code(annotation):
@@ -0,0 +1,25 @@
+"""
+JSON decoding of the hot paths, e.g. the tasks read from Redis.
+orjson is used when installed, it is not a dependency of the package
+"""
+import json
+from typing import (
+    Any,
+    Union,
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """json.loads, faster with orjson"""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson rejects NaN, Infinity and the integers over 64 bits, json accepts them
+            pass
+    return json.loads(data)
@@ -0,0 +1,39 @@
+import importlib
+import sys
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+)
+
+
+def lazy_attributes(module_name: str, attributes: Dict[str, str]) -> Callable[[str], Any]:
+    """
+    Module __getattr__ (PEP 562) importing the attributes from the submodules on the first access,
+    so the heavy dependencies of the submodules (boto3, pika ...) are only imported when used:
+
+    __getattr__ = lazy_attributes(__name__, {'S3Storage': '.s3'})
+
+    :param module_name: name of the module defining __getattr__
+    :param attributes: attribute name -> submodule name, relative to the module package
+    """
+    def __getattr__(name: str) -> Any:
+        submodule_name = attributes.get(name)
+        if submodule_name is None:
+            raise AttributeError(f'module {module_name!r} has no attribute {name!r}')
+
+        value = getattr(importlib.import_module(submodule_name, module_name), name)
+        # next lookups don't get to __getattr__
+        setattr(sys.modules[module_name], name, value)
+        return value
+
+    return __getattr__
+
+
+def lazy_dir(module_globals: Dict[str, Any], attributes: Dict[str, str]) -> Callable[[], List[str]]:
+    """Module __dir__ listing the lazy attributes too"""
+    def __dir__() -> List[str]:
+        return sorted(set(module_globals) | set(attributes))
+
+    return __dir__
@@ -1,14 +1,26 @@
+import atexit
 import logging
+import os
+import queue
 import sys
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+)
+from typing import (
+    List,
+    Tuple,
+)
 
+from text2phenotype.common.log_context import LogContextFilter
 from text2phenotype.common.log_data import (
     ExtraKeys,
     HIPAALogData,
 )
 from text2phenotype.common.log_formatters import (
     HIPAAFormatter,
-    HumanReadableFormatter,
     OperationsFormatter,
+    get_human_readable_formatter_class,
 )
 from text2phenotype.constants.environment import Environment
 
@@ -30,18 +42,81 @@ class HIPAAAdapter(logging.LoggerAdapter):
         return msg, kwargs
 
 
+class LogQueueHandler(QueueHandler):
+    """
+    Puts the records to the queue of a background log writer (LogQueueListener),
+    the records are formatted and written by the listener handlers
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the message arguments may change after the call, so merge them on the calling thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class LogQueueListener(QueueListener):
+    """Background log writer of a LogQueueHandler queue"""
+
+    def __init__(self, log_queue, *handlers: logging.Handler, respect_handler_level: bool = False):
+        super().__init__(log_queue, *handlers, respect_handler_level=respect_handler_level)
+        self.running = False
+
+    def start(self):
+        super().start()
+        self.running = True
+
+    def stop(self):
+        self.running = False
+        super().stop()
+
+
 LOGLEVEL = Environment.LOGLEVEL.value
 LOGFILE = Environment.LOGFILE.value
 HIPAA_LOGFILE = Environment.HIPAA_LOGFILE.value
 HUMAN_READABLE = Environment.HUMAN_READABLE_LOGS.value
 LOG_TO_FILE = Environment.LOG_TO_FILE.value
+LOG_ASYNC = Environment.LOG_ASYNC.value
+
+# background log writers
+_log_pipelines: List[Tuple[LogQueueHandler, LogQueueListener]] = []
+
+
+def _async_handler(*handlers: logging.Handler) -> LogQueueHandler:
+    """Queue handler with a background thread writing the records to the handlers"""
+    log_queue = queue.SimpleQueue()
+    listener = LogQueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+
+    queue_handler = LogQueueHandler(log_queue)
+    _log_pipelines.append((queue_handler, listener))
+    return queue_handler
+
+
+def stop_log_writers() -> None:
+    """Write all the queued records and stop the background writers"""
+    for _, listener in _log_pipelines:
+        if listener.running:
+            listener.stop()
+
+
+def _restart_log_writers() -> None:
+    """Writer threads don't survive fork, the child process starts its own writers with new queues"""
+    for queue_handler, listener in _log_pipelines:
+        if listener.running:
+            queue_handler.queue = listener.queue = queue.SimpleQueue()
+            listener.start()
+
+
+atexit.register(stop_log_writers)
+os.register_at_fork(after_in_child=_restart_log_writers)
 
 
 # Define and Configure Loggers
 ##########################################################################
 # Log to console
 
-ops_formatter = HumanReadableFormatter() if HUMAN_READABLE else OperationsFormatter()
+ops_formatter = get_human_readable_formatter_class()() if HUMAN_READABLE else OperationsFormatter()
 ops_console_handler = logging.StreamHandler(sys.stdout)
 ops_console_handler.setLevel(LOGLEVEL)
 ops_console_handler.setFormatter(ops_formatter)
@@ -50,7 +125,7 @@ ops_stderr_handler = logging.StreamHandler(sys.stderr)
 ops_stderr_handler.setLevel(LOGLEVEL)
 ops_stderr_handler.setFormatter(ops_formatter)
 
-hipaa_formatter = HumanReadableFormatter() if HUMAN_READABLE else HIPAAFormatter()
+hipaa_formatter = get_human_readable_formatter_class()() if HUMAN_READABLE else HIPAAFormatter()
 hipaa_console_handler = logging.StreamHandler(sys.stdout)
 hipaa_console_handler.setLevel(LOGLEVEL)
 hipaa_console_handler.setFormatter(hipaa_formatter)
@@ -68,25 +143,42 @@ if LOG_TO_FILE:
     hipaa_file_handler.setFormatter(HIPAAFormatter())
 
 
+##########################################################################
+# Background writers
+
+ops_handlers: List[logging.Handler] = [ops_console_handler]
+hipaa_handlers: List[logging.Handler] = [hipaa_console_handler]
+if LOG_TO_FILE:
+    ops_handlers.append(ops_file_handler)
+    hipaa_handlers.append(hipaa_file_handler)
+
+if LOG_ASYNC:
+    ops_handlers = [_async_handler(*ops_handlers)]
+    hipaa_handlers = [_async_handler(*hipaa_handlers)]
+
+log_context_filter = LogContextFilter()
+
+
 ##########################################################################
 # Log for operations debugging
 
 # operations_logger = OperationsLogger('operations')
 _operations_logger = logging.getLogger('operations')
 _operations_logger.setLevel(LOGLEVEL)
-_operations_logger.addHandler(ops_console_handler)
-
-if LOG_TO_FILE:
-    _operations_logger.addHandler(ops_file_handler)
+_operations_logger.addFilter(log_context_filter)
+for handler in ops_handlers:
+    _operations_logger.addHandler(handler)
 
 operations_logger = OperationsAdapter(_operations_logger, {})
 
 
 ##########################################################################
 # Log for unhandled exceptions
+# written synchronously, the process may be terminated right after
 
 _exceptions_logger = logging.getLogger('errors')
 _exceptions_logger.setLevel(LOGLEVEL)
+_exceptions_logger.addFilter(log_context_filter)
 _exceptions_logger.addHandler(ops_stderr_handler)
 
 if LOG_TO_FILE:
@@ -112,10 +204,8 @@ sys.excepthook = exception_hook
 # hipaa_logger = HIPAALogger('hipaa')
 _hipaa_logger = logging.getLogger('hipaa')
 _hipaa_logger.setLevel(LOGLEVEL)
-_hipaa_logger.addHandler(hipaa_console_handler)
-
-if LOG_TO_FILE:
-    _hipaa_logger.addHandler(hipaa_file_handler)
+for handler in hipaa_handlers:
+    _hipaa_logger.addHandler(handler)
 
 hipaa_logger = HIPAAAdapter(_hipaa_logger, {})
 
@@ -124,7 +214,6 @@ hipaa_logger = HIPAAAdapter(_hipaa_logger, {})
 
 logger = logging.getLogger('text2phenotype_py')
 logger.setLevel(LOGLEVEL)
-logger.addHandler(ops_console_handler)
-
-if LOG_TO_FILE:
-    logger.addHandler(ops_file_handler)
+logger.addFilter(log_context_filter)
+for handler in ops_handlers:
+    logger.addHandler(handler)
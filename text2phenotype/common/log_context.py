@@ -0,0 +1,63 @@
+import contextlib
+import logging
+from contextvars import ContextVar
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+)
+
+# Fields added to every operations log record, e.g. worker name, document id and chunk number.
+# Context variables are local to the thread (and asyncio task), so every worker thread has its own context.
+_log_context: ContextVar[Dict[str, Any]] = ContextVar('log_context', default={})
+
+LOG_CONTEXT_ATTRIBUTE = 'log_context'
+
+
+def get_log_context() -> Dict[str, Any]:
+    """Log fields of the current context"""
+    return _log_context.get()
+
+
+@contextlib.contextmanager
+def log_context(**fields) -> Iterator[Dict[str, Any]]:
+    """
+    Add fields to all the log records created inside the block (in the current thread).
+    Fields with None values are dropped, nested blocks extend the outer context.
+
+    with log_context(worker_name='OCRTaskWorker', document_id=document_id):
+        operations_logger.info('Started')
+    """
+    context = {**_log_context.get(), **{key: value for key, value in fields.items() if value is not None}}
+    token = _log_context.set(context)
+    try:
+        yield context
+    finally:
+        _log_context.reset(token)
+
+
+class LogContextFilter(logging.Filter):
+    """Attach the current log context to the record, on the thread which created it"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, LOG_CONTEXT_ATTRIBUTE):
+            setattr(record, LOG_CONTEXT_ATTRIBUTE, _log_context.get())
+        return True
+
+
+class LazyMessage:
+    """
+    Log message built only if the record is emitted, for expensive debug messages:
+
+    operations_logger.debug(LazyMessage(lambda: f'Tokens: {json.dumps(tokens)}'))
+    """
+    __slots__ = ('func', 'args', 'kwargs')
+
+    def __init__(self, func: Callable[..., Any], *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self) -> str:
+        return str(self.func(*self.args, **self.kwargs))
@@ -3,23 +3,45 @@ import logging
 import socket
 
 from datetime import datetime
+from functools import (
+    cached_property,
+    lru_cache,
+)
 from typing import Dict
 
-import coloredlogs
-
-from django.utils.functional import cached_property
-
+from text2phenotype.common.log_context import LOG_CONTEXT_ATTRIBUTE
 from text2phenotype.constants.environment import Environment
 
+# same output as json.dumps(), without the circular references check
+_JSON_ENCODER = json.JSONEncoder(check_circular=False)
+
 
 class JSONFormatter(logging.Formatter):
 
     TYPE = 'Base'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # timestamps are formatted once per second (unless the format has microseconds)
+        self._timestamp_cache = (None, None, None)
+
     def format(self, record: 'logging.LogRecord') -> str:
         json_record = self.prepare_dictionary(record)
 
-        return json.dumps(json_record)
+        return _JSON_ENCODER.encode(json_record)
+
+    def format_timestamp(self, created: float) -> str:
+        """Record creation time, the record can be formatted later by a background log writer"""
+        timestamp_format = Environment.LOG_TIMESTAMP_FORMAT.value
+        second = int(created)
+        cached_format, cached_second, cached_timestamp = self._timestamp_cache
+        if cached_format == timestamp_format and cached_second == second:
+            return cached_timestamp
+
+        timestamp = datetime.fromtimestamp(created).strftime(timestamp_format)
+        if '%f' not in timestamp_format:
+            self._timestamp_cache = (timestamp_format, second, timestamp)
+        return timestamp
 
     @cached_property
     def fqdn(self):
@@ -28,7 +50,7 @@ class JSONFormatter(logging.Formatter):
     def prepare_dictionary(self, record: 'logging.LogRecord') -> Dict:
         result = dict()
         result['fqdn'] = self.fqdn
-        result['timestamp'] = datetime.now().strftime(Environment.LOG_TIMESTAMP_FORMAT.value)
+        result['timestamp'] = self.format_timestamp(record.created)
         result['level_name'] = record.levelname
         result['message'] = record.getMessage()
         result['module'] = record.module
@@ -76,6 +98,11 @@ class OperationsFormatter(JSONFormatter):
         else:
             result['exc_info'] = None
 
+        # worker, document, chunk ... fields, see log_context.log_context()
+        context = getattr(record, LOG_CONTEXT_ATTRIBUTE, None)
+        if context:
+            result.update(context)
+
         return result
 
 
@@ -110,67 +137,70 @@ class DefaultHumanReadableFormatter(CommonFormattersMixin, logging.Formatter):
         return super().format(record)
 
 
-class ColoredHumanReadableFormatter(CommonFormattersMixin, coloredlogs.ColoredFormatter):
-    CUSTOM_FIELD_STYLES = {
-        'asctime': {'color': 'cyan'},
-        'levelname': {'color': 'white'},
-        'module': {'color': 'blue'},
-        'funcName': {'color': 'magenta'},
-        'lineno': {'color': 'yellow'},
-        'filename': {'color': 'yellow'},
-        'pathname': {'color': 'yellow'},
-    }
+@lru_cache(maxsize=None)
+def _colored_human_readable_formatter_class() -> type:
+    """coloredlogs is only imported when the colored logs are enabled"""
+    import coloredlogs
 
-    def __init__(self):
-        field_styles = coloredlogs.DEFAULT_FIELD_STYLES.copy()
-        field_styles.update(self.CUSTOM_FIELD_STYLES)
+    class ColoredHumanReadableFormatter(CommonFormattersMixin, coloredlogs.ColoredFormatter):
+        CUSTOM_FIELD_STYLES = {
+            'asctime': {'color': 'cyan'},
+            'levelname': {'color': 'white'},
+            'module': {'color': 'blue'},
+            'funcName': {'color': 'magenta'},
+            'lineno': {'color': 'yellow'},
+            'filename': {'color': 'yellow'},
+            'pathname': {'color': 'yellow'},
+        }
 
-        super().__init__(fmt=DefaultHumanReadableFormatter.HUMAN_READABLE_DEFAULT_FORMAT,
-                         style='{',
-                         datefmt=Environment.LOG_TIMESTAMP_FORMAT.value,
-                         field_styles=field_styles)
+        def __init__(self):
+            field_styles = coloredlogs.DEFAULT_FIELD_STYLES.copy()
+            field_styles.update(self.CUSTOM_FIELD_STYLES)
 
-    def format(self, record):
-        msg = self.add_indent(record.msg, indent=9)
-        record.msg = coloredlogs.ansi_wrap(msg, bold=True)
+            super().__init__(fmt=DefaultHumanReadableFormatter.HUMAN_READABLE_DEFAULT_FORMAT,
+                             style='{',
+                             datefmt=Environment.LOG_TIMESTAMP_FORMAT.value,
+                             field_styles=field_styles)
 
-        formatted_text = super().format(record)
-        level_style = self.level_styles.get(record.levelname.lower())
+        def format(self, record):
+            msg = self.add_indent(record.msg, indent=9)
+            record.msg = coloredlogs.ansi_wrap(msg, bold=True)
 
-        if level_style:
-            colored_level = coloredlogs.ansi_wrap(record.levelname, **level_style)
-            formatted_text = formatted_text.replace(record.levelname, colored_level, 1)
+            formatted_text = super().format(record)
+            level_style = self.level_styles.get(record.levelname.lower())
 
-        return formatted_text
+            if level_style:
+                colored_level = coloredlogs.ansi_wrap(record.levelname, **level_style)
+                formatted_text = formatted_text.replace(record.levelname, colored_level, 1)
 
-    def formatException(self, exc_info):
-        text = super().formatException(exc_info)
-        return coloredlogs.ansi_wrap(text, color='red', bold=True)
+            return formatted_text
 
-    def formatStack(self, stack_info):
-        text = super().formatStack(stack_info)
-        return coloredlogs.ansi_wrap(text, color='red', bold=True)
+        def formatException(self, exc_info):
+            text = super().formatException(exc_info)
+            return coloredlogs.ansi_wrap(text, color='red', bold=True)
 
+        def formatStack(self, stack_info):
+            text = super().formatStack(stack_info)
+            return coloredlogs.ansi_wrap(text, color='red', bold=True)
 
-HumanReadableFormatter = (ColoredHumanReadableFormatter if Environment.COLORED_LOGS.value
-                          else DefaultHumanReadableFormatter)
+    return ColoredHumanReadableFormatter
 
 
-class WorkerFormatter(OperationsFormatter):
+def get_human_readable_formatter_class() -> type:
+    """Colored formatter if COLORED_LOGS is set, plain text formatter otherwise"""
+    if Environment.COLORED_LOGS.value:
+        return _colored_human_readable_formatter_class()
+    return DefaultHumanReadableFormatter
 
-    def __init__(self, worker_name, document_id=None, chunk_number=None, job_id=None):
-        super().__init__()
-        self.worker_name = worker_name
-        self.document_id = document_id
-        self.chunk_number = chunk_number
-        self.job_id = job_id
 
-    def prepare_dictionary(self, record: 'logging.LogRecord') -> Dict:
-        result = super().prepare_dictionary(record)
-        result['worker_name'] = self.worker_name
-        result['document_id'] = self.document_id
-        if self.chunk_number:
-            result['chunk_number'] = self.chunk_number
-        if self.job_id:
-            result['job_id'] = self.job_id
-        return result
+def __getattr__(name: str):
+    # ColoredHumanReadableFormatter and HumanReadableFormatter are built on the first access (PEP 562)
+    if name == 'ColoredHumanReadableFormatter':
+        value = _colored_human_readable_formatter_class()
+    elif name == 'HumanReadableFormatter':
+        value = get_human_readable_formatter_class()
+    else:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    globals()[name] = value
+    return value
+
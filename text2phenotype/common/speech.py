@@ -13,6 +13,7 @@ from nltk.tokenize.util import align_tokens
 
 from text2phenotype.apm.metrics import text2phenotype_capture_span
 from text2phenotype.common.common import (
+    SplitPointIndex,
     get_best_split_point,
     iter_sentence,
 )
@@ -168,6 +169,7 @@ def chunk_text(text: str, max_word_count: int) -> List[Tuple[Tuple[int, int], st
     chunks = []
     token_dict = tokenize(text)
     machine_annotation = MachineAnnotation(tokenization_output=token_dict, text_len=len(text))
+    split_index = SplitPointIndex(text)
     start_token = 0
     start_pos = 0
     while start_pos < len(text):
@@ -181,7 +183,8 @@ def chunk_text(text: str, max_word_count: int) -> List[Tuple[Tuple[int, int], st
             end_pos = get_best_split_point(text,
                                            start_point=start_pos,
                                            max_chunk_len=max_chunk_len,
-                                           min_chunk_size=min_chunk_len)
+                                           min_chunk_size=min_chunk_len,
+                                           split_index=split_index)
 
 
             text_chunk = text[start_pos: end_pos]
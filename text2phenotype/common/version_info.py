@@ -9,8 +9,6 @@ from typing import (
     Union,
 )
 
-import git
-
 
 class VersionInfo:
     def __init__(self, **kwargs):
@@ -127,6 +125,8 @@ def get_version_info(repo_path: Union[str, Path, None] = None) -> VersionInfo:
                           docker_image=docker_image)
 
     except FileNotFoundError:
+        # GitPython is slow to import and only needed outside of the docker images
+        import git
 
         repo = git.Repo(repo_path)
         try:
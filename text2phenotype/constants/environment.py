@@ -289,6 +289,10 @@ class Environment(AbstractEnvironment):
     LOGFILE = EnvironmentVariable(name='MDL_COMN_LOGFILE', legacy_name='LOGFILE', value='text2phenotype.log')
     HIPAA_LOGFILE = EnvironmentVariable(name='MDL_COMN_HIPAA_LOGFILE', legacy_name='HIPAA_LOGFILE', value='text2phenotype_hipaa.log')
 
+    # write the operations and HIPAA logs from background threads (opt-in, the records queued
+    # when the process is killed are lost)
+    LOG_ASYNC = EnvironmentVariable(name='MDL_COMN_LOG_ASYNC', expected_type=bool, value=False)
+
     # text2phenotype Samples
     text2phenotype_SAMPLES_PATH = EnvironmentVariable(name='MDL_COMN_text2phenotype_SAMPLES_PATH', legacy_name='text2phenotype_SAMPLES_PATH')
 
@@ -310,6 +314,9 @@ class Environment(AbstractEnvironment):
     AZURE_OCR_SUBSCRIPTION_KEY = EnvironmentVariable(name='MDL_TASK_OCR_AZURE_SUBSCRIPTION_KEY', legacy_name='AZURE_SUBSCRIPTION_KEY')
     AZURE_MAX_CONCURRENT_REQUESTS = EnvironmentVariable(name='MDL_TASK_OCR_AZURE_MAX_CONCURRENT_REQUESTS', value=10)
     AZURE_RESULT_WAITING_TIMEOUT = EnvironmentVariable(name='MDL_TASK_OCR_AZURE_RESULT_WAITING_TIMEOUT', value=60)
+    AZURE_REQUESTS_PER_SECOND = EnvironmentVariable(name='MDL_TASK_OCR_AZURE_REQUESTS_PER_SECOND', value=10.0)
+    AZURE_POLL_INTERVAL = EnvironmentVariable(name='MDL_TASK_OCR_AZURE_POLL_INTERVAL', value=1.0)  # seconds
+    AZURE_POLL_MAX_INTERVAL = EnvironmentVariable(name='MDL_TASK_OCR_AZURE_POLL_MAX_INTERVAL', value=5.0)  # seconds
 
     # RabbitMQ
     RMQ_HOST = EnvironmentVariable(name='MDL_COMN_RMQ_HOST', legacy_name='RMQ_HOST')
@@ -322,6 +329,9 @@ class Environment(AbstractEnvironment):
     RMQ_HEARTBEAT = EnvironmentVariable(name='MDL_COMN_RMQ_HEARTBEAT', value=60)
     RMQ_CONNECTION_ATTEMPTS = EnvironmentVariable(name='MDL_COMN_RMQ_CONNECTION_ATTEMPTS', value=3)
     RMQ_CONNECTION_RETRY_DELAY = EnvironmentVariable(name='MDL_COMN_RMQ_CONNECTION_RETRY_DELAY', value=2)  # seconds
+    # Priority queues (x-max-priority) when greater than 0. RabbitMQ refuses to redeclare an existing queue
+    # with other arguments, the queues must be recreated when the setting changes
+    RMQ_MAX_PRIORITY = EnvironmentVariable(name='MDL_COMN_RMQ_MAX_PRIORITY', expected_type=int, value=0)
 
     # KubeMQ
     KUBEMQ_HOST = EnvironmentVariable(name='MDL_COMN_KUBEMQ_HOST')
@@ -377,6 +387,42 @@ class Environment(AbstractEnvironment):
     BULK_INTAKE_QUEUE = EnvironmentVariable(name='MDL_COMN_INTAKE_BULK_DOCUMENT_QUEUE', value='document-intake-bulk')
 
     SEQUENCER_QUEUE = EnvironmentVariable(name='MDL_COMN_SEQUENCER_TASK_QUEUE', value='task-sequencer')
+    # Task completion events, a Redis stream in the database of every work type
+    TASK_EVENTS_ENABLED = EnvironmentVariable(name='MDL_COMN_TASK_EVENTS_ENABLED', expected_type=bool, value=False)
+    TASK_EVENTS_STREAM = EnvironmentVariable(name='MDL_COMN_TASK_EVENTS_STREAM', value='task-events')
+    TASK_EVENTS_STREAM_MAX_LEN = EnvironmentVariable(name='MDL_COMN_TASK_EVENTS_STREAM_MAX_LEN',
+                                                     expected_type=int, value=1000000)
+    # The task status transitions are written to the task state hash by a Lua script (see set_task_state)
+    # and merged on read. The services reading the tasks with an older library don't see them,
+    # all the readers must be upgraded before it is enabled
+    TASK_STATE_SCRIPT_ENABLED = EnvironmentVariable(name='MDL_COMN_TASK_STATE_SCRIPT_ENABLED',
+                                                    expected_type=bool, value=False)
+    # The job documents are written to the '<job id>-documents' hash (the changed ones only) instead of the
+    # job JSON. The services reading the jobs with an older library don't see them,
+    # all the readers must be upgraded before it is enabled
+    JOB_DOCUMENTS_HASH_ENABLED = EnvironmentVariable(name='MDL_COMN_JOB_DOCUMENTS_HASH_ENABLED',
+                                                     expected_type=bool, value=False)
+    # A worker holds the lease of its task while working on it, renewed every third of the expiration (seconds)
+    # while the worker makes progress (a checkpoint or a heartbeat within the progress timeout, seconds)
+    TASK_LEASE_ENABLED = EnvironmentVariable(name='MDL_COMN_TASK_LEASE_ENABLED', expected_type=bool, value=False)
+    TASK_LEASE_EXPIRATION = EnvironmentVariable(name='MDL_COMN_TASK_LEASE_EXPIRATION', expected_type=int, value=60)
+    TASK_LEASE_PROGRESS_TIMEOUT = EnvironmentVariable(name='MDL_COMN_TASK_LEASE_PROGRESS_TIMEOUT',
+                                                      expected_type=int, value=900)
+    # The completed steps of a task kept for its retries (seconds)
+    TASK_CHECKPOINTS_EXPIRATION = EnvironmentVariable(name='MDL_COMN_TASK_CHECKPOINTS_EXPIRATION',
+                                                      expected_type=int, value=7 * 24 * 3600)
+    # Up to TASK_BATCH_SIZE messages received within TASK_BATCH_WINDOW seconds are processed as one batch
+    # by the task workers (see RMQConsumerTaskWorker.process_batch), one message at a time if 1.
+    # Without a do_batch_work() override the messages of a batch are still processed one by one
+    TASK_BATCH_SIZE = EnvironmentVariable(name='MDL_COMN_TASK_BATCH_SIZE', expected_type=int, value=1)
+    TASK_BATCH_WINDOW = EnvironmentVariable(name='MDL_COMN_TASK_BATCH_WINDOW', expected_type=float, value=0.1)
+    # Results of the chunk tasks reused for the same chunk text (see ChunkResultCache)
+    CHUNK_RESULT_CACHE_ENABLED = EnvironmentVariable(name='MDL_COMN_CHUNK_RESULT_CACHE_ENABLED',
+                                                     expected_type=bool, value=False)
+    CHUNK_RESULT_CACHE_TTL = EnvironmentVariable(name='MDL_COMN_CHUNK_RESULT_CACHE_TTL',
+                                                 expected_type=int, value=7 * 24 * 3600)
+    CHUNK_RESULT_CACHE_MAX_ENTRIES = EnvironmentVariable(name='MDL_COMN_CHUNK_RESULT_CACHE_MAX_ENTRIES',
+                                                         expected_type=int, value=1000000)
     DISCHARGE_QUEUE = EnvironmentVariable(name='MDL_COMN_DISCHARGE_TASK_QUEUE', value='task-discharge')
 
     PURGE_QUEUE = EnvironmentVariable(name='MDL_COMN_PURGE_QUEUE', value='task-purge')
@@ -437,6 +483,12 @@ class Environment(AbstractEnvironment):
     REDIS_SOCKET_TIMEOUT = EnvironmentVariable(name='MDL_COMN_REDIS_SOCKET_TIMEOUT', value=0.5)
     REDIS_AUTH_REQUIRED = EnvironmentVariable(name='MDL_COMN_REDIS_AUTH_REQUIRED', value=False, expected_type=bool)
     REDIS_AUTH_PASSWORD = EnvironmentVariable(name='MDL_COMN_REDIS_AUTH_PASSWORD')
+    # Connections per pool (database and role) of the process, the threads wait up to the timeout (seconds)
+    # for a free connection
+    REDIS_MAX_CONNECTIONS = EnvironmentVariable(name='MDL_COMN_REDIS_MAX_CONNECTIONS', value=50)
+    REDIS_POOL_TIMEOUT = EnvironmentVariable(name='MDL_COMN_REDIS_POOL_TIMEOUT', value=20.0)
+    # Keys per command (MGET, DEL) or pipeline of the batch operations
+    REDIS_BATCH_SIZE = EnvironmentVariable(name='MDL_COMN_REDIS_BATCH_SIZE', value=500)
 
     OKTA_API_TOKEN = EnvironmentVariable(name='MDL_COMN_OKTA_API_TOKEN')
     OKTA_CUSTOMER_GROUP_ID = EnvironmentVariable(name='MDL_COMN_OKTA_CUSTOMER_GROUP_ID')
@@ -457,8 +509,13 @@ class Environment(AbstractEnvironment):
                                         value='http://0.0.0.0:8081')
 
     OCR_PDF_PARALLEL_JOBS = EnvironmentVariable(name='MDL_COMN_OCR_PDF_PARALLEL_JOBS', value=10)
+    OCR_MAX_PAGES_IN_FLIGHT = EnvironmentVariable(name='MDL_COMN_OCR_MAX_PAGES_IN_FLIGHT', value=20)
+    OCR_SPILL_RESPONSES = EnvironmentVariable(name='MDL_COMN_OCR_SPILL_RESPONSES', value=False, expected_type=bool)
     GVC_MAX_CONCURRENT_REQUESTS = EnvironmentVariable(name='MDL_COMN_OCR_GCV_MAX_REQUESTS', value=10)
     GVC_REQUEST_TIMEOUT = EnvironmentVariable(name='MDL_COMN_OCR_GVC_REQUEST_TIMEOUT', value=300)
+    GVC_REQUESTS_PER_SECOND = EnvironmentVariable(name='MDL_COMN_OCR_GVC_REQUESTS_PER_SECOND', value=25.0)
+    # OCR request latency (seconds) over which the concurrency is decreased, 0 - disabled
+    OCR_TARGET_LATENCY = EnvironmentVariable(name='MDL_COMN_OCR_TARGET_LATENCY', value=30.0)
 
     DJANGO_SECRET_KEY = EnvironmentVariable(name='MDL_COMN_DJANGO_SECRET_KEY')
     # All Django apps share a common database, including session storage, so need access to the same Secret Key
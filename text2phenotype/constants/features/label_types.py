@@ -1,6 +1,14 @@
 import enum
+import functools
 import sys
-from typing import List
+from typing import (
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+)
 
 from text2phenotype.common.annotations import AnnotationLabelConfig, AnnotationCategoryConfig
 from text2phenotype.common.log import operations_logger
@@ -24,7 +32,7 @@ class LabelEnum(enum.Enum):
         from_alternative_text_labels = cls.get_from_alternative_text_labels(brat_value)
         if from_alternative_text_labels:
             return from_alternative_text_labels
-        operations_logger.debug(f'{brat_value} not found to match any label in in {cls}')
+        operations_logger.debug('%s not found to match any label in in %s', brat_value, cls)
 
         return cls.get_default_label()
 
@@ -51,27 +59,46 @@ class LabelEnum(enum.Enum):
 
     @classmethod
     def get_from_int(cls, item):
-        item = int(item)
-
-        for member in cls:
-            if member.value.column_index == item:
-                return member
+        return _label_index(cls).column_indices.get(int(item))
 
     @classmethod
     def get_from_persistent_label(cls, item: str):
-        for member in cls:
-            if member.value.persistent_label == item:
-                return member
+        return _label_index(cls).persistent_labels.get(item)
 
     @classmethod
     def get_from_alternative_text_labels(cls, item: str):
-        for member in cls:
-            if item in member.value.alternative_text_labels:
-                return member
+        return _label_index(cls).alternative_text_labels.get(item)
 
     @classmethod
     def get_column_indices(cls):
-        return sorted([member.value.column_index for member in cls])
+        return list(_label_index(cls).sorted_column_indices)
+
+
+class LabelIndex(NamedTuple):
+    """Reverse lookups of the LabelEnum members, the first member in definition order wins (as the linear scans)"""
+    persistent_labels: Dict[str, LabelEnum]
+    alternative_text_labels: Dict[str, LabelEnum]
+    column_indices: Dict[int, LabelEnum]
+    sorted_column_indices: Tuple[int, ...]
+
+
+@functools.lru_cache(maxsize=None)
+def _label_index(label_enum: Type[LabelEnum]) -> LabelIndex:
+    """Built on the first lookup, the enums are immutable"""
+    persistent_labels = {}
+    alternative_text_labels = {}
+    column_indices = {}
+    for member in label_enum:
+        config = member.value
+        persistent_labels.setdefault(config.persistent_label, member)
+        column_indices.setdefault(config.column_index, member)
+        for text_label in config.alternative_text_labels:
+            alternative_text_labels.setdefault(text_label, member)
+
+    return LabelIndex(persistent_labels=persistent_labels,
+                      alternative_text_labels=alternative_text_labels,
+                      column_indices=column_indices,
+                      sorted_column_indices=tuple(sorted(member.value.column_index for member in label_enum)))
 
 
 class PHILabel(LabelEnum):
@@ -831,6 +858,37 @@ LabelList = {
     SequoiaBladderLabel, ProcedureLabel}
 
 
+@functools.lru_cache(maxsize=None)
+def _label_enums_by_member_name() -> Dict[str, Type[LabelEnum]]:
+    label_enums = {}
+    for label_enum in LabelList:
+        for member_name in label_enum.__members__:
+            label_enums.setdefault(member_name, label_enum)
+    return label_enums
+
+
+def get_label_enum_from_member_name(member_name: str) -> Optional[Type[LabelEnum]]:
+    """
+    The first LabelEnum of LabelList with a member named `member_name`
+    NOTE: the member names are not unique across the label types, e.g. "diagnosis"
+    """
+    return _label_enums_by_member_name().get(member_name)
+
+
+@functools.lru_cache(maxsize=4096)
+def get_label_from_text(text: str) -> Optional[LabelEnum]:
+    """
+    The label matching the text label (see LabelEnum.from_brat) in any of the LabelList types, None for N/A
+    NOTE: may return an incorrect label if the text matches labels of multiple label types
+    """
+    matched_label = None
+    for label_enum in LabelList:
+        label = label_enum.from_brat(text)
+        if label.value.column_index != 0 and label.value.persistent_label not in ('na', 'other'):
+            matched_label = label
+    return matched_label
+
+
 def list_annotation_labels() -> List[dict]:
     return [label_type.to_dict() for label_type in LabelList]
 
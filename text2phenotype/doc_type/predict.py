@@ -1,17 +1,32 @@
 import re
-from typing import List
+from typing import Collection, List
 
 from text2phenotype.apm.metrics import text2phenotype_capture_span
 from text2phenotype.constants.common import OCR_PAGE_SPLITTING_KEY
 
+# every punctuation character (and, via the ascii '?' replacement, every non-ascii character) becomes a space
+SPECIAL_CHARS_TABLE = str.maketrans({c: ' ' for c in r"!@'#$%^&*()[]{};:,./<>?\|`~-=_+"})
+
+URL_PATTERN = re.compile(r'http\S+')
+MULTI_SPACE_PATTERN = re.compile(' +')
+
 
 @text2phenotype_capture_span()
-def get_doc_types(text: str, classifier, stop_words) -> List[dict]:
+def get_doc_types(text: str, classifier, stop_words, batch: bool = False) -> List[dict]:
+    """
+    Predict the document type of every page in the text.
+    :param text: the OCR text, pages separated by OCR_PAGE_SPLITTING_KEY
+    :param classifier: fastText-like classifier
+    :param stop_words: collection of tokens dropped before prediction
+    :param batch: classify all pages with a single classifier.predict() call
+    :return: list of dicts with label, text, range and prob for every non-empty page
+    """
     if not text:
         return []
 
-    results = []
+    stop_words = as_stop_word_set(stop_words)
 
+    pages = []
     start = 0
     for page_text in text.split(OCR_PAGE_SPLITTING_KEY[0]):
         if not page_text:
@@ -19,55 +34,48 @@ def get_doc_types(text: str, classifier, stop_words) -> List[dict]:
             continue
 
         end = start + len(page_text)
-
-        clean_text = clean_ocr_text(page_text, stop_words)
-
-        prediction = classifier.predict(clean_text)
         if text[start:end] != page_text:
             raise Exception('Text location is incorrect!')
 
-        results.append({"label": prediction[0][0][9:],
-                        "text": clean_text[:50],
-                        "range": (start, end),
-                        "prob": prediction[1][0]})
+        pages.append((clean_ocr_text(page_text, stop_words), (start, end)))
 
         start = end + 1
 
-    return results
+    if not pages:
+        return []
 
+    if batch:
+        labels, probs = classifier.predict([clean_text for clean_text, _ in pages])
+    else:
+        labels, probs = [], []
+        for clean_text, _ in pages:
+            prediction = classifier.predict(clean_text)
+            labels.append(prediction[0])
+            probs.append(prediction[1])
 
-def clean_ocr_text(text, stop_words):
-    # Lowercase all text
-    text = text.lower()
+    return [{"label": page_labels[0][9:],
+             "text": clean_text[:50],
+             "range": text_range,
+             "prob": page_probs[0]}
+            for (clean_text, text_range), page_labels, page_probs in zip(pages, labels, probs)]
 
-    # Remove non-ASCII characters
-    text = re.sub(r'[^\x00-\x7F]', ' ', text)
 
-    # Remove special characters
-    text = text.translate({ord(c): " " for c in r"!@'#$%^&*()[]{};:,./<>?\|`~-=_+"})
+def as_stop_word_set(stop_words: Collection[str]) -> Collection[str]:
+    if isinstance(stop_words, (set, frozenset)):
+        return stop_words
+    return frozenset(stop_words or ())
 
-    # Remove multi-space
-    text = re.sub(' +', ' ', text)
 
-    # Strip spaces and line returns
-    text = text.strip().replace('\n', ' ')
+def clean_ocr_text(text: str, stop_words: Collection[str]) -> str:
+    # Lowercase, replace non-ASCII characters with '?' and all special characters with spaces
+    text = text.lower().encode('ascii', 'replace').decode('ascii').translate(SPECIAL_CHARS_TABLE)
 
-    # Remove stop words ***
-    text = " ".join([token for token in text.split() if token not in stop_words])
+    # Remove stop words, collapsing multi-spaces and line returns on the way
+    text = ' '.join([token for token in text.split() if token not in stop_words])
 
     # remove URLs
-    text = re.sub(r'http\S+', ' ', text)
-
-    # remove hours
-    text = re.sub(r'(0[0-9]|1[0-9]|2[0-3]):[0-5][0-9]', ' ', text)
-
-    # remove various data formats
-    text = re.sub(r'(?:(?:31(\/|-|\.)(?:0?[13578]|1[02]|(?:Jan|Mar|May|Jul|Aug|Oct|Dec)))\1|(?:(?:29|30)(\/|-|\.)'
-                  r'(?:0?[1,3-9]|1[0-2]|(?:Jan|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec))\2))'
-                  r'(?:(?:1[6-9]|[2-9]\d)?\d{2})$|^(?:29(\/|-|\.)(?:0?2|(?:Feb))\3(?:(?:(?:1[6-9]|[2-9]\d)?'
-                  r'(?:0[48]|[2468][048]|[13579][26])|(?:(?:16|[2468][048]|[3579][26])00))))$|^(?:0?[1-9]|1\d|2[0-8])'
-                  r'(\/|-|\.)(?:(?:0?[1-9]|(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep))|(?:1[0-2]|(?:Oct|Nov|Dec)))'
-                  r'\4(?:(?:1[6-9]|[2-9]\d)?\d{2})', ' ', text)
+    # NOTE: hour and date patterns never match here, their separators are special characters removed above
+    if 'http' in text:
+        text = MULTI_SPACE_PATTERN.sub(' ', URL_PATTERN.sub(' ', text))
 
-    # Remove multi-space
-    return re.sub(' +', ' ', text)
+    return text
@@ -1,10 +1,9 @@
-import concurrent.futures
+import functools
 import os
-import pickle
-import time
 
 from typing import Iterable, List, Tuple, Any, Generator
 
+import numpy as np
 from azure.cognitiveservices.vision.computervision import ComputerVisionClient
 from azure.cognitiveservices.vision.computervision.models import (
     TextRecognitionResult,
@@ -24,10 +23,14 @@ from text2phenotype.constants.environment import Environment
 from text2phenotype.ocr.data_structures import OCRPageInfo, OCRCoordinate
 
 from text2phenotype.ocr.ocr_helpers import (
-    make_pngs_from_pdf,
+    iter_pngs_from_pdf,
     calculate_doc_indices,
     mk_image_with_bboxes,
+    spill_ocr_response,
 )
+from text2phenotype.ocr.layout import row_breaks, split_by_breaks
+from text2phenotype.ocr.page_pipeline import run_page_pipeline
+from text2phenotype.ocr.scheduler import OCRBackend, get_scheduler
 
 
 class SeparatorInterruptedException(Exception):
@@ -103,38 +106,34 @@ def ocr_pdf_file(pdf_file_path: str, working_dir: str,
     :return: extracted text as a list of OCRPageInfo objects
     """
 
-    inputs = make_pngs_from_pdf(pdf_file_path, working_dir, tid)
+    # pages are sent to OCR as soon as they are rasterized
+    inputs = iter_pngs_from_pdf(pdf_file_path, working_dir, tid=tid)
 
     client = get_computer_vision_client()
-    inputs = [(client, i // 10 * 2, *elem) for i, elem in enumerate(inputs)]
+    workers_cnt = Environment.AZURE_MAX_CONCURRENT_REQUESTS.value
 
-    workers_cnt = min(Environment.AZURE_MAX_CONCURRENT_REQUESTS.value, len(inputs))
+    operations_logger.info(f'Sending PNGs to Azure OCR using {workers_cnt} threads', tid=tid)
+    results = run_page_pipeline(inputs,
+                                functools.partial(_ocr_azure_page, client, draw_boundaries=draw_boundaries),
+                                max_workers=workers_cnt,
+                                max_in_flight=Environment.OCR_MAX_PAGES_IN_FLIGHT.value,
+                                tid=tid)
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=workers_cnt) as executor:
-        operations_logger.info(f'Sending PNGs to Azure OCR using {workers_cnt} threads', tid=tid)
-        send_png_results = executor.map(_send_data_to_azure, *zip(*inputs))
-        operations_logger.info('Calling Azure OCR to retrieve results', tid=tid)
-        results = executor.map(_get_azure_recognition_result, *zip(*send_png_results))
+    operations_logger.info(f'Azure OCR scheduler metrics: {get_scheduler(OCRBackend.AZURE).metrics()}', tid=tid)
 
-    operations_logger.info('Formatting Azure OCR response', tid=tid)
+    # pages are already formatted in the OCR threads, only document level indexes are left
+    calculate_doc_indices(results)
+    document_full_text = OCR_PAGE_SPLITTING_KEY[0].join((p.text for p in results))
 
-    if draw_boundaries:
-        draw_bounding_boxes(results)
-
-    processed_result = process_recognition_results(results, tid)
-    document_full_text = OCR_PAGE_SPLITTING_KEY[0].join((p.text for p in processed_result))
-
-    return document_full_text, processed_result
+    return document_full_text, results
 
 
 @retry(ComputerVisionErrorException, logger=operations_logger)
-def _send_data_to_azure(client: ComputerVisionClient, sleep_time: int, pg: int, png_file: str, tid: str) -> Tuple[ComputerVisionClient, int, str, str, str]:
-    # Run Azure recognizing process
+def _send_data_to_azure(client: ComputerVisionClient, pg: int, png_file: str, tid: str) -> Tuple[ComputerVisionClient, int, str, str, str]:
+    # Run Azure recognizing process, the request rate and concurrency are controlled by the shared scheduler
     try:
-        time.sleep(sleep_time)
-
         with open(png_file, 'rb') as file:
-            response = client.batch_read_file_in_stream(image=file, raw=True)
+            response = get_scheduler(OCRBackend.AZURE).call(client.batch_read_file_in_stream, image=file, raw=True)
 
         # Get operation ID from returned headers
         operation_location_url = response.headers["Operation-Location"]
@@ -146,31 +145,46 @@ def _send_data_to_azure(client: ComputerVisionClient, sleep_time: int, pg: int,
         raise e
 
 
+def _ocr_azure_page(client: ComputerVisionClient, pg: int, png_file: str, tid: str = None,
+                    draw_boundaries: bool = False) -> OCRPageInfo:
+    """
+    OCR a single page and format the recognition result right in the OCR thread,
+    so formatting of the page overlaps with the requests for other pages.
+    """
+    pg, png_file, response = _get_azure_recognition_result(*_send_data_to_azure(client, pg, png_file, tid))
+
+    if draw_boundaries:
+        draw_bounding_boxes([(pg, png_file, response)])
+
+    return process_recognition_result(pg, png_file, response, tid)
+
+
 def _get_azure_recognition_result(client: ComputerVisionClient,
                                   pg: int,
                                   png_file: str,
                                   operation_id: str,
                                   tid: str = None) -> Tuple[int, str, Any]:
-    try:
-        start = time.time()
-        while time.time() - start < Environment.AZURE_RESULT_WAITING_TIMEOUT.value:
-                result = client.get_read_operation_result(operation_id)
-                if result.status == TextOperationStatusCodes.succeeded:
+    def is_done(result) -> bool:
+        if result.status == TextOperationStatusCodes.succeeded:
+            return True
+        if result.status in [TextOperationStatusCodes.not_started, TextOperationStatusCodes.running]:
+            return False
+        raise Exception(f'Azure OCR processing failed for {png_file}, pg #{pg},'
+                        f'operation id: {operation_id}')
 
-                    pickle_file = f'{png_file.rstrip(".png")}.pkl'
-                    pickle.dump(result.recognition_results, open(pickle_file, 'wb'))
+    try:
+        # all outstanding operations are polled with backoff by the single scheduler's poller
+        operation = get_scheduler(OCRBackend.AZURE).poll(
+            functools.partial(client.get_read_operation_result, operation_id),
+            is_done,
+            timeout=Environment.AZURE_RESULT_WAITING_TIMEOUT.value,
+            description=f'Azure OCR processing of {png_file}, page #{pg}, operation id: {operation_id}')
+        result = operation.result()
 
-                    operations_logger.info("Pickled response from Azure OCR API "
-                                           f"for {png_file} in {pickle_file}", tid=tid)
+        if Environment.OCR_SPILL_RESPONSES.value:
+            spill_ocr_response(result.recognition_results, png_file, tid)
 
-                    return pg, png_file, pickle_file
-                elif result.status in [TextOperationStatusCodes.not_started, TextOperationStatusCodes.running]:
-                    time.sleep(1)
-                else:
-                    raise Exception(f'Azure OCR processing failed for {png_file}, pg #{pg},'
-                        f'operation id: {operation_id}')
-        raise Exception(f'Azzure OCR proccessing timeout exceeded for {png_file}, page #{pg},'
-            f'operation id: {operation_id}')
+        return pg, png_file, result.recognition_results
 
     except Exception as e:
         operations_logger.exception("An exception occurred in the "
@@ -222,30 +236,6 @@ def enrich_block(block):
     return block
 
 
-def is_row_ended(a, b):
-    s = 0
-    low_coef = 0.15
-    high_coef = 0.4
-
-    h = a.bottom - a.top
-    d = a.bottom - b.top
-    if d > 0 and d / h < 0.32:
-        return True
-
-    if b.bottom <= a.top or 0 < (b.bottom - a.top) / h < 0.32:
-        return True
-
-    if b.top >= a.bottom:
-        s += high_coef
-    if b.top > a.top:
-        s += low_coef
-    if b.left <= a.left:
-        s += high_coef
-    if b.left < a.right:
-        s += low_coef
-    return s > 0.5
-
-
 def get_rows(text_result: TextRecognitionResult) -> List[Row]:
     """
     Get row by row horizontal projections of Azure line blocks
@@ -257,17 +247,21 @@ def get_rows(text_result: TextRecognitionResult) -> List[Row]:
     if not lines:
         return []
 
-    rows = []
-    lines[0].order = 0
-    row = Row([lines[0]])
-    for i, line in enumerate(lines[1:], start=1):
+    for i, line in enumerate(lines):
         line.order = i
-        if is_row_ended(lines[i - 1], line):
-            rows.append(row)
-            row = Row([line])
-        else:
-            row.append(line)
-    rows.append(row)
+
+    # the row end check of every pair of consecutive lines at once
+    breaks = row_breaks(tops=[line.top for line in lines],
+                        bottoms=[line.bottom for line in lines],
+                        lefts=[line.left for line in lines],
+                        rights=[line.right for line in lines])
+
+    rows = []
+    for row_lines in split_by_breaks(lines, breaks.tolist()):
+        # the row size is taken from the first line only, the same way as the rows were built line by line
+        row = Row(row_lines[:1])
+        row.extend(row_lines[1:])
+        rows.append(row)
     return rows
 
 
@@ -382,25 +376,18 @@ def reorder_lines_tabular(rows: List) -> Generator[List, None, None]:
 
     # get maximum line blocks counts in the row (assuming it's the count of table columns)
     column_count = max(map(len, rows))
-    cell_bounds = []
-    # go through all rows and collect left and right coordinate for cells in full rows (rows which len is equal to count fo columns)
-    i = 0
-    for r in rows:
-        if len(r) == column_count:
-            cell_bounds.append([])
-            for c in r:
-                cell_bounds[i].append(Box(c.left, c.right, 0, 0))
-            i += 1
+
+    # left and right coordinates of cells in full rows (rows which len is equal to count of columns),
+    # one matrix row per table row
+    full_rows = [r for r in rows if len(r) == column_count]
+    cell_lefts = np.array([[c.left for c in r] for r in full_rows])
+    cell_rights = np.array([[c.right for c in r] for r in full_rows])
 
     # wides coordinates for each cell
-    max_cell_bounds = []
-    for i in range(column_count):
-        max_cell_bounds.append(
-            Box(
-                min(c[i].left for c in cell_bounds),
-                max(c[i].right for c in cell_bounds),
-                0, 0)
-            )
+    max_cell_bounds = [Box(left, right, 0, 0)
+                       for left, right in zip(cell_lefts.min(axis=0).tolist(), cell_rights.max(axis=0).tolist())]
+    cell_bound_lefts = [0] + [box.right for box in max_cell_bounds[:-1]]
+    cell_bound_rights = [box.left for box in max_cell_bounds[1:]]
     cell_matrix = []
     table_row_number = -1
     table_started = False
@@ -439,9 +426,9 @@ def reorder_lines_tabular(rows: List) -> Generator[List, None, None]:
             # iterate through words and cells and put words to appropriate cell by checking its coordiantes and bounds
             while j < len(words):
                 w = words[j]
-                cell_bound_left = 0 if i == 0 else max_cell_bounds[i - 1].right
+                cell_bound_left = cell_bound_lefts[i]
 
-                cell_bound_right = w.right if i + 1 == len(max_cell_bounds) else max_cell_bounds[i + 1].left
+                cell_bound_right = w.right if i + 1 == len(max_cell_bounds) else cell_bound_rights[i]
 
                 if w.left >= cell_bound_left and w.right <= cell_bound_right + 10:
                     # cell found, go to the next word
@@ -461,69 +448,77 @@ def reorder_lines_tabular(rows: List) -> Generator[List, None, None]:
         yield [word for cell in row for word in cell]
 
 
-def process_recognition_results(recognition_results: List, tid: str) -> List[OCRPageInfo]:
+def process_recognition_results(recognition_results: Iterable[Tuple[int, str, Any]], tid: str) -> List[OCRPageInfo]:
     """
     Given result of Azure OCR service, convert in to list of OCRPageInfo objects
-    :param recognition_results: An array of text recognition result of the read operation.
+    :param recognition_results: (page number, png file, text recognition results of the read operation) for every page
     :return: extracted text as a list of OCRPageInfo objects
     """
 
-    result = list()
-    last_index = 0
-    for pg, png_file, pickled_response in recognition_results:
+    result = [process_recognition_result(pg, png_file, response, tid)
+              for pg, png_file, response in recognition_results]
+
+    calculate_doc_indices(result)
+    return result
 
-        operations_logger.info(f'Started processing {pickled_response}.', tid=tid)
 
-        response = pickle.load(open(pickled_response, 'rb'))
+def process_recognition_result(pg: int, png_file: str, response: List, tid: str = None) -> OCRPageInfo:
+    """
+    Convert Azure text recognition results of a single page to OCRPageInfo.
+    Coordinates get page level indexes, document level indexes are set by calculate_doc_indices()
+    once all pages are formatted.
+    :param pg: page number
+    :param png_file: path to the page PNG
+    :param response: an array of text recognition results of the read operation
+    :param tid: transaction id
+    :return: OCRPageInfo of the page
+    """
+    operations_logger.info(f'Started processing response for {png_file}.', tid=tid)
 
-        ocr_page = OCRPageInfo(text="",
-                               page=pg,
-                               png_path=png_file)
+    ocr_page = OCRPageInfo(text="",
+                           page=pg,
+                           png_path=png_file)
 
-        full_text = ""
-        index = order = 0
+    full_text = ""
+    index = order = 0
 
-        for text_result in response:
-            rows = get_rows(text_result)
-            page_width = text_result.width
-            orientation, ratio = detect_orientation(rows)
-            if orientation == Orientation.REGULAR:
-                lines = reorder_lines_by_separators(rows, page_width)
-            else:
-                lines = reorder_lines_tabular(rows)
-
-            for line in lines:
-                for i, word in enumerate(line):
-                    full_text += word.text
-                    coord = OCRCoordinate(text=word.text,
-                                          page=pg,
-                                          left=word.bounding_box[0],
-                                          top=word.bounding_box[1],
-                                          right=word.bounding_box[4],
-                                          bottom=word.bounding_box[5],
-                                          order=order,
-                                          page_index_first=index,
-                                          document_index_first=index + last_index)
-                    order += 1
-                    index += len(word.text)
-                    coord.page_index_last = index - 1
-                    coord.document_index_last = index + last_index - 1
-
-                    if i < len(line) - 1:
-                        coord.spaces = 1
-                        full_text += ' '
-                    else:
-                        coord.new_line = True
-                        full_text += '\n'
-                    index += 1
-                    ocr_page.coordinates.append(coord)
-
-        last_index += index
-        ocr_page.text = full_text
-        result.append(ocr_page)
+    for text_result in response:
+        rows = get_rows(text_result)
+        page_width = text_result.width
+        orientation, ratio = detect_orientation(rows)
+        if orientation == Orientation.REGULAR:
+            lines = reorder_lines_by_separators(rows, page_width)
+        else:
+            lines = reorder_lines_tabular(rows)
+
+        for line in lines:
+            for i, word in enumerate(line):
+                full_text += word.text
+                coord = OCRCoordinate(text=word.text,
+                                      page=pg,
+                                      left=word.bounding_box[0],
+                                      top=word.bounding_box[1],
+                                      right=word.bounding_box[4],
+                                      bottom=word.bounding_box[5],
+                                      order=order,
+                                      page_index_first=index,
+                                      document_index_first=index)
+                order += 1
+                index += len(word.text)
+                coord.page_index_last = index - 1
+                coord.document_index_last = index - 1
+
+                if i < len(line) - 1:
+                    coord.spaces = 1
+                    full_text += ' '
+                else:
+                    coord.new_line = True
+                    full_text += '\n'
+                index += 1
+                ocr_page.coordinates.append(coord)
 
-    calculate_doc_indices(result)
-    return result
+    ocr_page.text = full_text
+    return ocr_page
 
 
 def is_separator_at_page_center(x, page_width):
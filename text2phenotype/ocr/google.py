@@ -1,9 +1,9 @@
-import concurrent
+import functools
 import os
-import pickle
 
 from typing import Iterable, List, Tuple, Any
 
+import numpy as np
 from cachetools import (
     cached,
     TTLCache,
@@ -11,7 +11,7 @@ from cachetools import (
 from google.cloud import vision
 from google.cloud.vision import types
 from google.auth.exceptions import TransportError
-from google.api_core.exceptions import ServiceUnavailable
+from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable, TooManyRequests
 
 from text2phenotype.common.decorators import retry
 from text2phenotype.common.log import operations_logger
@@ -22,11 +22,16 @@ from text2phenotype.ocr.data_structures import (
     OCRPageInfo
 )
 from text2phenotype.ocr.ocr_helpers import (
-    make_pngs_from_pdf,
+    calculate_doc_indices,
+    iter_pngs_from_pdf,
+    spill_ocr_response,
     mk_image_with_bboxes,
     is_tabular_page,
     format_tabular_page
 )
+from text2phenotype.ocr.layout import horizontal_projections
+from text2phenotype.ocr.page_pipeline import run_page_pipeline
+from text2phenotype.ocr.scheduler import OCRBackend, get_scheduler
 
 BreakType = vision.enums.TextAnnotation.DetectedBreak.BreakType
 
@@ -53,134 +58,129 @@ def google_ocr_pdf_file(pdf_file_path: str,
     :return: extracted text as a list of OCRPageInfo objects
     """
     document_full_text = ''
-    inputs = png_inputs if png_inputs else make_pngs_from_pdf(pdf_file_path, working_dir, page_offset, tid)
+    # pages are sent to OCR as soon as they are rasterized
+    inputs = png_inputs if png_inputs else iter_pngs_from_pdf(pdf_file_path, working_dir, page_offset, tid)
     operations_logger.info('Calling Google OCR for each page', tid=tid)
 
-    # Add thread-safety google client to the `inputs`
+    # thread-safety google client is shared by all requests
     google_client = get_image_annotator_client()
-    inputs = [(google_client, *elem) for elem in inputs]
 
-    # parallel processing of png files, returns iterator of results
-    with concurrent.futures.ThreadPoolExecutor(max_workers=Environment.GVC_MAX_CONCURRENT_REQUESTS.value) as executor:
-        try:
-            results = executor.map(_ocr_helper_func, *zip(*inputs),
-                                   timeout=Environment.GVC_REQUEST_TIMEOUT.value)
+    results = run_page_pipeline(inputs,
+                                functools.partial(_ocr_and_format_page, google_client, draw_boundaries=draw_boundaries),
+                                max_workers=Environment.GVC_MAX_CONCURRENT_REQUESTS.value,
+                                max_in_flight=Environment.OCR_MAX_PAGES_IN_FLIGHT.value,
+                                timeout=Environment.GVC_REQUEST_TIMEOUT.value,
+                                tid=tid)
 
-        except Exception as err:
-            operations_logger.exception("An exception occurred in the "
-                                        "_ocr_helper_func ThreadPoolExecutor.",
-                                        exc_info=True, tid=tid)
-            raise err
+    operations_logger.info(f'Google OCR scheduler metrics: {get_scheduler(OCRBackend.GOOGLE).metrics()}', tid=tid)
 
-    if draw_boundaries:
-        draw_bounding_boxes(results)
-
-    operations_logger.info('Formatting Google OCR response.', tid=tid)
     result = list()
-    last_index = 0
-    order = 0
-    doc_order = 0
-    doc_index = 0
-
-    for pg, png_file, pickled_response in results:
-        operations_logger.info(f'Started processing {pickled_response}.', tid=tid)
-
-        response = pickle.load(open(pickled_response, 'rb'))
-
-        full_text = response.full_text_annotation.text
-
-        ocr_page = OCRPageInfo(text=full_text,
-                               page=pg,
-                               png_path=png_file)
-        index = 0
-        for page in response.full_text_annotation.pages:
-            page_text = ''
-            filtered_blocks = filter_overlapping_blocks(page.blocks)
-            for block in filtered_blocks:
-                for paragraph in block.paragraphs:
-                    for word in paragraph.words:
-                        coord = OCRCoordinate(text='',
-                                              page=pg,
-                                              left=word.bounding_box.vertices[0].x,
-                                              top=word.bounding_box.vertices[0].y,
-                                              right=word.bounding_box.vertices[2].x,
-                                              bottom=word.bounding_box.vertices[2].y,
-                                              order=order,
-                                              page_index_first=index,
-                                              document_index_first=index + last_index)
-                        ocr_page.coordinates.append(coord)
-                        order += 1
-
-                        for symbol in word.symbols:
-                            coord.text += symbol.text
-                            coord.page_index_last = index
-                            coord.document_index_last = index + last_index
-                            page_text += symbol.text
-
-                            if symbol.property.detected_break.type in \
-                                    {BreakType.SPACE, BreakType.SURE_SPACE}:
-                                index += 1
-                                coord.spaces += 1
-                                page_text += ' '
-                            elif symbol.property.detected_break.type == BreakType.HYPHEN:
-                                index += 2  # +1 for hyphen and +1 for newline
-                                coord.hyphen = True
-                                coord.new_line = True
-                                page_text += '-\n'
-                            elif symbol.property.detected_break.type in \
-                                    {BreakType.LINE_BREAK, BreakType.EOL_SURE_SPACE}:
-                                index += 1
-                                coord.new_line = True
-                                page_text += '\n'
+    for ocr_pages, page_text in results:
+        result.extend(ocr_pages)
 
-                            index += 1
+        document_full_text += page_text
+        document_full_text += OCR_PAGE_SPLITTING_KEY[0]
 
-            projections = get_block_horizontal_projections(page)
-            ocr_page.text = page_text
-            if is_tabular_page(projections):
-                operations_logger.debug(f'Tabular Formatting for page {pg}', tid=tid)
-                format_tabular_page(ocr_page)
+    calculate_doc_indices(result)
 
-            page_index = 0
-            for c in ocr_page.coordinates:
-                c.order = doc_order
+    operations_logger.info('Formatting Google OCR response complete.', tid=tid)
+    return document_full_text, result
 
-                c.document_index_first = doc_index
-                c.document_index_last = doc_index + len(c.text) - 1
-                c.page_index_first = page_index
-                c.page_index_last = page_index + len(c.text) - 1
 
-                doc_index += len(c.text)
-                page_index += len(c.text)
+def _ocr_and_format_page(client: vision.ImageAnnotatorClient,
+                         pg: int,
+                         png_file: str,
+                         tid: str = None,
+                         draw_boundaries: bool = False) -> Tuple[List[OCRPageInfo], str]:
+    """
+    OCR a single page and format the response right in the OCR thread,
+    so formatting of the page overlaps with the requests for other pages.
+    """
+    pg, png_file, response = _ocr_helper_func(client, pg, png_file, tid)
 
-                if c.spaces:
-                    doc_index += c.spaces
-                    page_index += c.spaces
+    if draw_boundaries:
+        draw_bounding_boxes([(pg, png_file, response)])
 
-                if c.hyphen:
-                    doc_index += 1
-                    page_index += 1
+    return format_google_response(pg, png_file, response, tid)
 
-                if c.new_line:
-                    doc_index += 1
-                    page_index += 1
 
-                doc_order += 1
+def format_google_response(pg: int, png_file: str, response: Any, tid: str = None) -> Tuple[List[OCRPageInfo], str]:
+    """
+    Convert Google Vision API response for a single PNG to OCRPageInfo objects.
+    Coordinates get page level indexes, document level indexes are set by calculate_doc_indices()
+    once all pages are formatted.
+    :param pg: page number
+    :param png_file: path to the page PNG
+    :param response: response object from Google Vision API
+    :param tid: transaction id
+    :return: list of OCRPageInfo objects and the page text
+    """
+    operations_logger.info(f'Started processing response for {png_file}.', tid=tid)
 
-            result.append(ocr_page)
+    full_text = response.full_text_annotation.text
 
-        document_full_text += ocr_page.text
-        document_full_text += OCR_PAGE_SPLITTING_KEY[0]
+    ocr_pages = list()
+    ocr_page = OCRPageInfo(text=full_text,
+                           page=pg,
+                           png_path=png_file)
+    index = 0
+    order = 0
+    for page in response.full_text_annotation.pages:
+        page_text = ''
+        filtered_blocks = filter_overlapping_blocks(page.blocks)
+        for block in filtered_blocks:
+            for paragraph in block.paragraphs:
+                for word in paragraph.words:
+                    coord = OCRCoordinate(text='',
+                                          page=pg,
+                                          left=word.bounding_box.vertices[0].x,
+                                          top=word.bounding_box.vertices[0].y,
+                                          right=word.bounding_box.vertices[2].x,
+                                          bottom=word.bounding_box.vertices[2].y,
+                                          order=order,
+                                          page_index_first=index,
+                                          document_index_first=index)
+                    ocr_page.coordinates.append(coord)
+                    order += 1
+
+                    for symbol in word.symbols:
+                        coord.text += symbol.text
+                        coord.page_index_last = index
+                        coord.document_index_last = index
+                        page_text += symbol.text
+
+                        if symbol.property.detected_break.type in \
+                                {BreakType.SPACE, BreakType.SURE_SPACE}:
+                            index += 1
+                            coord.spaces += 1
+                            page_text += ' '
+                        elif symbol.property.detected_break.type == BreakType.HYPHEN:
+                            index += 2  # +1 for hyphen and +1 for newline
+                            coord.hyphen = True
+                            coord.new_line = True
+                            page_text += '-\n'
+                        elif symbol.property.detected_break.type in \
+                                {BreakType.LINE_BREAK, BreakType.EOL_SURE_SPACE}:
+                            index += 1
+                            coord.new_line = True
+                            page_text += '\n'
 
-        last_index += index
+                        index += 1
 
-        operations_logger.info(f'Completed processing {pickled_response}.', tid=tid)
+        projections = get_block_horizontal_projections(page)
+        ocr_page.text = page_text
+        if is_tabular_page(projections):
+            operations_logger.debug(f'Tabular Formatting for page {pg}', tid=tid)
+            format_tabular_page(ocr_page)
 
-    operations_logger.info('Formatting Google OCR response complete.', tid=tid)
-    return document_full_text, result
+        ocr_pages.append(ocr_page)
 
+    operations_logger.info(f'Completed processing response for {png_file}.', tid=tid)
+    return ocr_pages, ocr_page.text
 
-@retry((TransportError, ServiceUnavailable, ConnectionError), logger=operations_logger)
+
+@retry((TransportError, ServiceUnavailable, TooManyRequests, ResourceExhausted, ConnectionError),
+       logger=operations_logger)
 def _ocr_helper_func(client: vision.ImageAnnotatorClient,
                      pg: int,
                      png_file: str,
@@ -193,7 +193,8 @@ def _ocr_helper_func(client: vision.ImageAnnotatorClient,
 
         # Get text from GCV OCR
         image = types.Image(content=content)
-        response = client.document_text_detection(image=image)
+        # the request is rate limited and its concurrency is adjusted by the shared scheduler
+        response = get_scheduler(OCRBackend.GOOGLE).call(client.document_text_detection, image=image)
 
         if response.error.code:
             # error if non-zero
@@ -201,13 +202,10 @@ def _ocr_helper_func(client: vision.ImageAnnotatorClient,
                             f'{response.error.code}, '
                             f'message: {response.error.message}', tid=tid)
 
-        pickle_file = f'{png_file.rstrip(".png")}.pkl'
-        pickle.dump(response, open(pickle_file, 'wb'))
-
-        operations_logger.info("Pickled response from Google Vision API "
-                               f"for {png_file} in {pickle_file}", tid=tid)
+        if Environment.OCR_SPILL_RESPONSES.value:
+            spill_ocr_response(response, png_file, tid)
 
-        return pg, png_file, pickle_file
+        return pg, png_file, response
 
     except Exception as err:
         operations_logger.exception("An exception occurred in the "
@@ -298,43 +296,19 @@ def draw_bounding_boxes(results: Iterable[Tuple[int, str, Any]]) -> None:
         mk_image_with_bboxes(png_file, block_bounds, 'blue', 0, output_path)
 
 
-def get_block_horizontal_projections(google_response_page: object) -> List[int]:
+def get_block_horizontal_projections(google_response_page: object) -> np.ndarray:
     """
     Creates a list of numbers where each cell represents a vertical pixel row of the document and
     the numeric value of that cell contains the number of text blocks that exist on that row.
     :param google_response_page: Google specif response object, straight from the API call.
-    :return: list as described above.
+    :return: array as described above.
     """
-    projections = [0]  # switch to 1-based counting
+    tops = []
+    bottoms = []
     for block in google_response_page.blocks:
+        vertices = block.bounding_box.vertices
+        # the highest top point and the lowest bottom point
+        tops.append(min(vertices[0].y, vertices[1].y))
+        bottoms.append(max(vertices[2].y, vertices[3].y))
 
-        # first, get the highest top point and the lowest bottom point
-        if block.bounding_box.vertices[0].y < block.bounding_box.vertices[1].y:
-            block_top = block.bounding_box.vertices[0].y
-        else:
-            block_top = block.bounding_box.vertices[1].y
-
-        if block.bounding_box.vertices[2].y > block.bounding_box.vertices[3].y:
-            block_bottom = block.bounding_box.vertices[2].y
-        else:
-            block_bottom = block.bounding_box.vertices[3].y
-
-        # ensure no negative numbers on top coordinate
-        if block_top < 0:
-            block_top = 0
-
-        # determine if projections needs to grow
-        # first condition is the whole block is the lowest on the page we've seen
-        if len(projections) < block_top:
-            projections += [0 for _ in range(len(projections), block_top)]
-            projections += [1 for _ in range(block_top, block_bottom + 1)]
-        # second condition is where the block is partially projected
-        elif len(projections) in range(block_top, block_bottom + 1):
-            for i in range(block_top, len(projections)):
-                projections[i] += 1
-            projections += [1 for _ in range(len(projections), block_bottom + 1)]
-        # last condition is if block is entirely in a projection
-        else:
-            for i in range(block_top, block_bottom + 1):
-                projections[i] += 1
-    return projections
+    return horizontal_projections(tops, bottoms)
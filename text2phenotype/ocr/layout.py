@@ -0,0 +1,154 @@
+"""
+Numpy implementation of the page layout computations used by the OCR formatters:
+horizontal projections of text blocks, tabular page detection, row clustering and row breaks.
+Every function works on coordinate arrays and keeps the results of the original per-object loops,
+except cluster_rows(), which groups the sorted bottoms instead of the greedy matching in the word order.
+"""
+from typing import (
+    Iterable,
+    List,
+    Sequence,
+    Tuple,
+)
+
+import numpy as np
+
+
+def horizontal_projections(tops: Sequence[int], bottoms: Sequence[int]) -> np.ndarray:
+    """
+    Number of blocks covering every pixel row of the page.
+    :param tops: top coordinate of every block
+    :param bottoms: bottom coordinate of every block (inclusive)
+    :return: array of block counts, index is the pixel row
+    """
+    tops = np.maximum(np.asarray(tops, dtype=np.int64), 0)
+    bottoms = np.asarray(bottoms, dtype=np.int64)
+
+    valid = bottoms >= tops
+    length = 1
+    if valid.any():
+        length = max(length, int(bottoms[valid].max()) + 1)
+    if not valid.all():
+        # inverted blocks don't cover any row but still extend the page up to their top
+        length = max(length, int(tops[~valid].max()))
+
+    # difference array: +1 at the block top, -1 right after the block bottom
+    diff = np.bincount(tops[valid], minlength=length + 1) - np.bincount(bottoms[valid] + 1, minlength=length + 1)
+    return np.cumsum(diff[:length])
+
+
+def projection_stats(projections: Sequence[int]) -> Tuple[int, int, int, int]:
+    """
+    :param projections: block counts per pixel row, see horizontal_projections()
+    :return: number of pixel rows with tables (>2 blocks), with blocks, with columns (2 blocks) and without blocks
+    """
+    projections = np.asarray(projections)
+    pixels_with_blocks = int(np.count_nonzero(projections > 0))
+    pixels_with_cols = int(np.count_nonzero(projections == 2))
+    pixels_with_tables = int(np.count_nonzero(projections > 2))
+    pixels_with_zero = len(projections) - pixels_with_blocks
+    return pixels_with_tables, pixels_with_blocks, pixels_with_cols, pixels_with_zero
+
+
+def cluster_rows(bottoms: Sequence[int], delta: int, half_height: int) -> Tuple[np.ndarray, List[Tuple]]:
+    """
+    Row detection by bottom coordinate: every word covers (bottom - half_height, bottom + half_height),
+    the words sorted by bottom are in the same row as long as the next bottom is within `delta`
+    of the range of the previous word.
+    :return: row number of every word (rows are numbered from the top) and the range of every row
+    """
+    bottoms = np.asarray(bottoms)
+    if not len(bottoms):
+        return np.empty(0, dtype=np.int64), []
+
+    order = np.argsort(bottoms, kind='stable')
+    sorted_bottoms = bottoms[order].astype(np.result_type(bottoms.dtype, np.int64))
+    breaks = np.diff(sorted_bottoms) > half_height + delta
+
+    labels = np.empty(len(bottoms), dtype=np.int64)
+    labels[order] = np.concatenate(([0], np.cumsum(breaks)))
+
+    starts = np.flatnonzero(np.concatenate(([True], breaks)))
+    ends = np.concatenate((starts[1:], [len(bottoms)])) - 1
+    ranges = list(zip((sorted_bottoms[starts] - half_height).tolist(),
+                      (sorted_bottoms[ends] + half_height).tolist()))
+    return labels, ranges
+
+
+def mean_space_gap(labels: np.ndarray,
+                   lefts: Sequence[int],
+                   rights: Sequence[int],
+                   heights: Sequence[int],
+                   spaces: Sequence[int]) -> float:
+    """
+    Mean gap between the neighbour words of the same row, weighted by the word height.
+    Only words followed by a space are counted.
+    :param labels: row number of every word, see cluster_rows()
+    :return: mean weighted gap, 0 if there are no gaps
+    """
+    if not len(labels):
+        return 0
+
+    lefts = np.asarray(lefts)
+    # words sorted by row, then by left coordinate, keeping the original order for equal keys
+    order = np.lexsort((lefts, labels))
+    same_row = labels[order][:-1] == labels[order][1:]
+    current, following = order[:-1][same_row], order[1:][same_row]
+
+    with_space = np.asarray(spaces)[current] != 0
+    current, following = current[with_space], following[with_space]
+
+    heights = np.asarray(heights)[current]
+    gaps = (lefts[following] - np.asarray(rights)[current]) / np.where(heights == 0, 1, heights)
+
+    # sequential sum to keep exactly the same float value as summing the gaps one by one
+    return sum(gaps.tolist()) / (len(gaps) or 1)
+
+
+def row_breaks(tops: Sequence[float],
+               bottoms: Sequence[float],
+               lefts: Sequence[float],
+               rights: Sequence[float]) -> np.ndarray:
+    """
+    Row end check for the consecutive Azure lines (see azure.get_rows()): the next line starts a new row
+    when the lines overlap vertically by less than 32% of the line height, or when it is below
+    and to the left of the line (weighted score of the top and left positions above 0.5).
+    :return: boolean array, item i is True when line i + 1 starts a new row
+    """
+    tops = np.asarray(tops, dtype=np.float64)
+    bottoms = np.asarray(bottoms, dtype=np.float64)
+    lefts = np.asarray(lefts, dtype=np.float64)
+    rights = np.asarray(rights, dtype=np.float64)
+
+    low_coef = 0.15
+    high_coef = 0.4
+
+    a_top, a_bottom, a_left, a_right = tops[:-1], bottoms[:-1], lefts[:-1], rights[:-1]
+    b_top, b_bottom, b_left = tops[1:], bottoms[1:], lefts[1:]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        h = a_bottom - a_top
+        d = a_bottom - b_top
+        overlap = (b_bottom - a_top) / h
+
+        ended = (d > 0) & (d / h < 0.32)
+        ended |= (b_bottom <= a_top) | ((0 < overlap) & (overlap < 0.32))
+
+    score = np.zeros(len(h))
+    score += np.where(b_top >= a_bottom, high_coef, 0)
+    score += np.where(b_top > a_top, low_coef, 0)
+    score += np.where(b_left <= a_left, high_coef, 0)
+    score += np.where(b_left < a_right, low_coef, 0)
+
+    return ended | (score > 0.5)
+
+
+def split_by_breaks(items: Sequence, breaks: Iterable[bool]) -> list:
+    """Split items into groups, a new group starts after every True break"""
+    groups = [[items[0]]] if len(items) else []
+    for item, is_break in zip(items[1:], breaks):
+        if is_break:
+            groups.append([item])
+        else:
+            groups[-1].append(item)
+    return groups
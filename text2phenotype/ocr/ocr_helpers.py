@@ -1,12 +1,16 @@
+import concurrent.futures
 import glob
 import os
+import pickle
 import subprocess
-from typing import List, Tuple
+from collections import deque
+from typing import Any, Iterator, List, Sequence, Tuple
 
 from text2phenotype.common.log import operations_logger
 from text2phenotype.constants.environment import Environment
 
 from text2phenotype.ocr.data_structures import OCRPageInfo, OCRCoordinate, Row
+from text2phenotype.ocr.layout import cluster_rows, mean_space_gap, projection_stats
 
 
 TABULAR_THRESHOLD = 0.3
@@ -23,21 +27,7 @@ def make_pngs_from_pdf(pdf_file_path: str,
     png_files = f"{working_dir}/{file_name}_page_%04d.png"
     png_files_star = f"{working_dir}/{file_name}_page_*.png"
 
-    # get number of pages in PDF
-    process = subprocess.Popen(["pdfinfo", pdf_file_path],
-                               encoding='UTF-8',
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.PIPE)
-
-    pdf_info, stderr = process.communicate()
-    if process.returncode != 0:
-        operations_logger.exception(msg=stderr)
-        raise Exception(stderr)
-    pdf_info_lines = pdf_info.split('\n')
-    for line in pdf_info_lines:
-        if line.startswith('Pages:'):
-            label, value = line.split(':')
-            pdf_len = int(value.strip())
+    pdf_len = get_pdf_page_count(pdf_file_path)
     page_nums = [str(x) for x in range(pdf_len)]
 
     # convert PDF to PNG (one per page)
@@ -70,6 +60,92 @@ def make_pngs_from_pdf(pdf_file_path: str,
     return png_paths
 
 
+def get_pdf_page_count(pdf_file_path: str) -> int:
+    """
+    Get number of pages in the PDF file using `pdfinfo`
+    :param pdf_file_path: path to the PDF file
+    :return: number of pages
+    """
+    process = subprocess.Popen(["pdfinfo", pdf_file_path],
+                               encoding='UTF-8',
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+
+    pdf_info, stderr = process.communicate()
+    if process.returncode != 0:
+        operations_logger.exception(msg=stderr)
+        raise Exception(stderr)
+
+    for line in pdf_info.split('\n'):
+        if line.startswith('Pages:'):
+            label, value = line.split(':')
+            return int(value.strip())
+
+    raise Exception(f'Unable to get number of pages for {pdf_file_path}')
+
+
+def make_png_from_pdf_page(pdf_file_path: str, page_index: int, png_file: str) -> str:
+    """
+    Rasterize a single PDF page (0-based index) to PNG.
+    Google OCR accepts images in PNG8 and PNG24 that have a maximum of 20M pixels,
+    see make_pngs_from_pdf() for the options.
+    """
+    subprocess.check_output(['convert', '-background', 'White', '-density', '300',
+                             '-define', 'png:format=png8', '-resize', '20000000@',
+                             f'{pdf_file_path}[{page_index}]', png_file])
+    return png_file
+
+
+def iter_pngs_from_pdf(pdf_file_path: str,
+                       working_dir: str,
+                       page_offset: int = None,
+                       tid: str = None,
+                       parallel_jobs: int = None) -> Iterator[Tuple[int, str, str]]:
+    """
+    Lazy version of make_pngs_from_pdf(): yields (page number, png path, tid) in page order
+    as soon as the page is rasterized. At most `parallel_jobs` pages are rasterized ahead
+    of the consumer, so a slow consumer (OCR) throttles the rasterization.
+    The PNGs are kept in `working_dir` (OCRPageInfo.png_path, e.g. for the redaction),
+    the caller removes them with the working directory.
+    """
+    file_name, _ = os.path.splitext(os.path.basename(pdf_file_path))
+    page_offset = page_offset or 0
+
+    pdf_len = get_pdf_page_count(pdf_file_path)
+    parallel_jobs = max(1, min(parallel_jobs or Environment.OCR_PDF_PARALLEL_JOBS.value, pdf_len))
+
+    operations_logger.info(f'Streaming {pdf_len}-page PDF to PNG using {parallel_jobs} jobs', tid=tid)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=parallel_jobs) as executor:
+        pending = deque()
+        for page_index in range(pdf_len):
+            png_file = f"{working_dir}/{file_name}_page_{page_index:04d}.png"
+            pending.append((page_index + 1 + page_offset,
+                            executor.submit(make_png_from_pdf_page, pdf_file_path, page_index, png_file)))
+
+            if len(pending) >= parallel_jobs:
+                pg, future = pending.popleft()
+                yield pg, future.result(), tid
+
+        while pending:
+            pg, future = pending.popleft()
+            yield pg, future.result(), tid
+
+
+def spill_ocr_response(response: Any, png_file: str, tid: str = None) -> str:
+    """
+    Pickle the raw OCR response next to the page PNG, for debugging only
+    (enabled with MDL_COMN_OCR_SPILL_RESPONSES), the OCR results are passed to formatting in memory.
+    :return: path to the pickle file
+    """
+    pickle_file = f'{os.path.splitext(png_file)[0]}.pkl'
+    with open(pickle_file, 'wb') as f:
+        pickle.dump(response, f)
+
+    operations_logger.debug(f"Pickled OCR response for {png_file} in {pickle_file}", tid=tid)
+    return pickle_file
+
+
 def calculate_doc_indices(results: List[OCRPageInfo]) -> None:
     # Calculate indexes
     order = 0
@@ -102,25 +178,13 @@ def calculate_doc_indices(results: List[OCRPageInfo]) -> None:
             order += 1
 
 
-def is_tabular_page(projections: List[int]) -> bool:
+def is_tabular_page(projections: Sequence[int]) -> bool:
     """
     Takes a list of numbers and determines if the page should be formatted tabularly.
     :param projections: list of numbers from get_block_horizontal_projections.
     :return: bool indicating if the format_tabular_page func should be used
     """
-    pixels_with_blocks = 0
-    pixels_with_cols = 0
-    pixels_with_tables = 0
-    pixels_with_zero = 0
-    for i in range(len(projections)):
-        if projections[i] > 0:
-            pixels_with_blocks += 1
-            if projections[i] == 2:
-                pixels_with_cols += 1
-            if projections[i] > 2:
-                pixels_with_tables += 1
-        else:
-            pixels_with_zero += 1
+    pixels_with_tables, pixels_with_blocks, pixels_with_cols, pixels_with_zero = projection_stats(projections)
     table_ratio = pixels_with_tables / pixels_with_blocks if pixels_with_blocks > 0 else 0
     operations_logger.debug(
         f"{pixels_with_tables} table pixels, {pixels_with_blocks} block pixels, {table_ratio} ratio, "
@@ -165,46 +229,26 @@ def format_tabular_page(page: OCRPageInfo) -> None:
         return new_last_word
 
     last_word = None
-    rows = []
     bottom_delta = 6
     # Filter out words longer than 50 chars (exclude unrecognized table rows)
     page.coordinates = [c for c in page.coordinates if len(c.text) < 50]
+    coordinates = page.coordinates
+
     # Detect rows by bottom coordinate
-    for c in page.coordinates:
-        matched_existent_row = False
-        for rw in rows:
-            if rw.range[0] - bottom_delta <= c.bottom <= rw.range[1] + bottom_delta:
-                rw.words.append(c)
-                matched_existent_row = True
-                if rw.range[0] > c.bottom:
-                    rw.range = (c.bottom, rw.range[1])
-                elif rw.range[1] < c.bottom:
-                    rw.range = (rw.range[0], c.bottom)
-                break
-        if not matched_existent_row:
-            rows.append(
-                Row(
-                    range=(c.bottom - 5, c.bottom + 5),
-                    words=[c],
-                )
-            )
+    row_labels, row_ranges = cluster_rows([c.bottom for c in coordinates], bottom_delta, 5)
+    rows = [Row(range=row_range, words=[]) for row_range in row_ranges]
+    for c, label in zip(coordinates, row_labels.tolist()):
+        rows[label].words.append(c)
 
     postponed_rows = []
     is_column_block = False
 
     # Calculate mean space gap size for the whole page weighted by word height
-    spaces = []
-    for row in rows:
-        words = sorted(row.words, key=lambda w: w.left)
-        for i, word in enumerate(words):
-            if word.spaces and i + 1 < len(words):
-                # avoid divide by zero errors
-                word_height = 1 if word.height == 0 else word.height
-                spaces.append(word.get_gap_with(words[i + 1]) / word_height)
-
-    # avoid divide by zero errors
-    len_spaces = 1 if len(spaces) == 0 else len(spaces)
-    space_gap_size = sum(spaces) / len_spaces
+    space_gap_size = mean_space_gap(row_labels,
+                                    lefts=[c.left for c in coordinates],
+                                    rights=[c.right for c in coordinates],
+                                    heights=[c.height for c in coordinates],
+                                    spaces=[c.spaces for c in coordinates])
 
     # Loop through the rows and assign order from scratch corresponding to left coordinate of word
     for row in sorted(rows, key=lambda r: r.words[0].bottom):
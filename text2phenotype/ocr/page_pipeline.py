@@ -0,0 +1,80 @@
+import concurrent.futures
+import threading
+import time
+from typing import (
+    Callable,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from text2phenotype.common.log import operations_logger
+
+T = TypeVar('T')
+
+PageInput = Tuple[int, str, str]  # page number, png path, tid
+
+
+def run_page_pipeline(page_inputs: Iterable[PageInput],
+                      ocr_func: Callable[..., T],
+                      max_workers: int,
+                      max_in_flight: int = None,
+                      timeout: float = None,
+                      tid: str = None) -> List[T]:
+    """
+    Producer/consumer pipeline for page OCR.
+    Every page is submitted to `ocr_func` as soon as the producer (e.g. iter_pngs_from_pdf()) yields it,
+    so rasterization of the next pages overlaps with the OCR requests for the previous ones.
+
+    The producer is consumed lazily: no more than `max_in_flight` pages are handed over
+    and not completed yet, which bounds the number of PNGs waiting for the OCR backend.
+
+    :param page_inputs: iterable of (page number, png path, tid), usually a generator
+    :param ocr_func: OCR backend function, called as ocr_func(pg, png_file, tid)
+    :param max_workers: number of concurrent OCR requests
+    :param max_in_flight: max number of pages taken from the producer and not processed yet,
+           defaults to twice the number of workers
+    :param timeout: max number of seconds to wait for all the page results, from the call
+    :param tid: transaction id
+    :return: list of ocr_func results in page order
+    """
+    max_workers = max(1, max_workers)
+    in_flight = threading.BoundedSemaphore(max(max_in_flight or 2 * max_workers, 1))
+    failed = threading.Event()
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def remaining() -> Optional[float]:
+        return None if deadline is None else max(0, deadline - time.monotonic())
+
+    def release(future: concurrent.futures.Future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            failed.set()
+        in_flight.release()
+
+    futures = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            page_iterator = iter(page_inputs)
+            while True:
+                # wait for a free slot before asking the producer for the next page
+                if not in_flight.acquire(timeout=remaining()):
+                    raise concurrent.futures.TimeoutError(f'The OCR pages are not processed in {timeout} seconds')
+                page_input = None if failed.is_set() else next(page_iterator, None)
+                if page_input is None:
+                    in_flight.release()
+                    break
+
+                future = executor.submit(ocr_func, *page_input)
+                future.add_done_callback(release)
+                futures.append(future)
+
+            operations_logger.info(f'All {len(futures)} pages are submitted to OCR', tid=tid)
+            return [future.result(timeout=remaining()) for future in futures]
+
+        except Exception:
+            operations_logger.exception('An exception occurred in the OCR page pipeline', exc_info=True, tid=tid)
+            for future in futures:
+                future.cancel()
+            raise
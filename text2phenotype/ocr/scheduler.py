@@ -0,0 +1,386 @@
+"""
+Shared request scheduler for the OCR backends (Google Vision, Azure Computer Vision).
+
+- TokenBucket keeps the request rate under the backend quota
+- AdaptiveConcurrencyLimiter adjusts the number of concurrent requests (AIMD):
+  it backs off on throttling (HTTP 429) or slow responses and slowly grows back otherwise
+- OperationPoller polls all outstanding long-running operations (Azure Read API) from a single thread,
+  with exponential backoff per operation
+- every scheduler collects its own metrics, see OCRRequestScheduler.metrics()
+"""
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import Future
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Optional,
+)
+
+from text2phenotype.common.log import operations_logger
+from text2phenotype.constants.environment import Environment
+
+
+class OCRBackend:
+    GOOGLE = 'google'
+    AZURE = 'azure'
+
+
+class TokenBucket:
+    """Thread-safe token bucket, rate <= 0 means unlimited"""
+
+    def __init__(self, rate: float, capacity: float = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = max(capacity or rate, 1)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """Take tokens if available.
+        :return: 0 if tokens are taken, otherwise number of seconds to wait for them
+        """
+        if self.rate <= 0:
+            return 0
+
+        with self._lock:
+            self._refill(self._clock())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Block until tokens are available.
+        :return: number of seconds spent waiting
+        """
+        waited = 0
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit: multiplicative decrease on throttling,
+    -1 when the latency is over the target and +1 per `limit` successful requests otherwise.
+    """
+
+    def __init__(self,
+                 initial_limit: int,
+                 min_limit: int = 1,
+                 max_limit: int = None,
+                 target_latency: float = None,
+                 decrease_factor: float = 0.5):
+        self.min_limit = max(min_limit, 1)
+        self.max_limit = max(max_limit or initial_limit, self.min_limit)
+        self.target_latency = target_latency
+        self.decrease_factor = decrease_factor
+
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self) -> float:
+        """Block until the number of requests in flight is under the limit.
+        :return: number of seconds spent waiting
+        """
+        start = time.monotonic()
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+        return time.monotonic() - start
+
+    def release(self, latency: float = None, throttled: bool = False, failed: bool = False) -> None:
+        """
+        :param latency: request latency in seconds
+        :param throttled: the request was rejected by the backend because of the rate/quota
+        :param failed: the request failed for another reason, the limit is kept as is
+        """
+        with self._condition:
+            self._in_flight -= 1
+
+            if failed and not throttled:
+                pass
+            elif throttled:
+                self._limit = max(self.min_limit, math.floor(self._limit * self.decrease_factor))
+            elif self.target_latency and latency is not None and latency > self.target_latency:
+                self._limit = max(self.min_limit, self._limit - 1)
+            else:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+            self._condition.notify_all()
+
+
+class OCRSchedulerMetrics:
+    """Thread-safe counters of a single OCR backend"""
+
+    COUNTERS = ('requests', 'errors', 'throttled', 'polls', 'poll_errors', 'poll_timeouts')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.COUNTERS, 0)
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._rate_wait_total = 0.0
+        self._concurrency_wait_total = 0.0
+
+    def increment(self, counter: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[counter] += value
+
+    def record_request(self, latency: float, rate_wait: float, concurrency_wait: float) -> None:
+        with self._lock:
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+            self._rate_wait_total += rate_wait
+            self._concurrency_wait_total += concurrency_wait
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            data = dict(self._counters)
+            data['latency_avg'] = self._latency_total / data['requests'] if data['requests'] else 0.0
+            data['latency_max'] = self._latency_max
+            data['rate_wait_total'] = self._rate_wait_total
+            data['concurrency_wait_total'] = self._concurrency_wait_total
+            return data
+
+
+class _PendingOperation:
+    __slots__ = ('poll_func', 'is_done', 'future', 'deadline', 'delay', 'description')
+
+    def __init__(self, poll_func, is_done, future, deadline, delay, description):
+        self.poll_func = poll_func
+        self.is_done = is_done
+        self.future = future
+        self.deadline = deadline
+        self.delay = delay
+        self.description = description
+
+
+class OperationPoller:
+    """
+    Polls all outstanding operations of a backend from a single daemon thread.
+    Every operation is polled with its own exponential backoff, the poll requests share the backend rate limit.
+    """
+
+    def __init__(self,
+                 rate_limiter: TokenBucket,
+                 metrics: OCRSchedulerMetrics,
+                 initial_delay: float = 1.0,
+                 max_delay: float = 5.0,
+                 backoff: float = 1.5,
+                 name: str = 'ocr-poller'):
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.name = name
+
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self,
+               poll_func: Callable[[], Any],
+               is_done: Callable[[Any], bool],
+               timeout: float,
+               description: str = '') -> Future:
+        """
+        Schedule polling of an operation.
+        :param poll_func: function requesting the operation status
+        :param is_done: returns True when the poll_func result is final, False to poll again, raises on failure
+        :param timeout: max number of seconds to wait for the operation
+        :param description: operation description for the timeout error
+        :return: Future with the final poll_func result
+        """
+        future = Future()
+        now = time.monotonic()
+        operation = _PendingOperation(poll_func, is_done, future, now + timeout, self.initial_delay, description)
+        self._schedule(operation, now)
+        return future
+
+    @property
+    def outstanding(self) -> int:
+        return len(self._heap)
+
+    def _schedule(self, operation: _PendingOperation, poll_at: float) -> None:
+        with self._condition:
+            heapq.heappush(self._heap, (poll_at, next(self._sequence), operation))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+
+                poll_at, _, operation = self._heap[0]
+                wait = poll_at - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+
+                heapq.heappop(self._heap)
+
+            self._poll(operation)
+
+    def _poll(self, operation: _PendingOperation) -> None:
+        if operation.future.cancelled():
+            return
+
+        self.rate_limiter.acquire()
+        try:
+            result = operation.poll_func()
+            done = operation.is_done(result)
+        except Exception as err:
+            self.metrics.increment('poll_errors')
+            operation.future.set_exception(err)
+            return
+        finally:
+            self.metrics.increment('polls')
+
+        now = time.monotonic()
+        if done:
+            operation.future.set_result(result)
+        elif now >= operation.deadline:
+            self.metrics.increment('poll_timeouts')
+            operation.future.set_exception(TimeoutError(f'Operation timeout exceeded: {operation.description}'))
+        else:
+            poll_at = min(now + operation.delay, operation.deadline)
+            operation.delay = min(operation.delay * self.backoff, self.max_delay)
+            self._schedule(operation, poll_at)
+
+
+class OCRRequestScheduler:
+    """Rate limited, adaptive concurrency gateway to an OCR backend"""
+
+    def __init__(self,
+                 backend: str,
+                 rate: float,
+                 max_concurrency: int,
+                 min_concurrency: int = 1,
+                 burst: float = None,
+                 target_latency: float = None,
+                 is_throttled: Callable[[Exception], bool] = None,
+                 poll_initial_delay: float = 1.0,
+                 poll_max_delay: float = 5.0,
+                 poll_backoff: float = 1.5):
+        self.backend = backend
+        self.rate_limiter = TokenBucket(rate, burst)
+        self.concurrency_limiter = AdaptiveConcurrencyLimiter(initial_limit=max_concurrency,
+                                                              min_limit=min_concurrency,
+                                                              max_limit=max_concurrency,
+                                                              target_latency=target_latency)
+        self.is_throttled = is_throttled or is_http_throttled
+        self._metrics = OCRSchedulerMetrics()
+        self.poller = OperationPoller(self.rate_limiter,
+                                      self._metrics,
+                                      initial_delay=poll_initial_delay,
+                                      max_delay=poll_max_delay,
+                                      backoff=poll_backoff,
+                                      name=f'{backend}-ocr-poller')
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a single backend request under the rate and concurrency limits"""
+        rate_wait = self.rate_limiter.acquire()
+        concurrency_wait = self.concurrency_limiter.acquire()
+
+        start = time.monotonic()
+        throttled = failed = False
+        try:
+            return func(*args, **kwargs)
+        except Exception as err:
+            failed = True
+            throttled = self.is_throttled(err)
+            self._metrics.increment('throttled' if throttled else 'errors')
+            if throttled:
+                operations_logger.warning(f'{self.backend} OCR request is throttled, '
+                                          f'concurrency limit: {self.concurrency_limiter.limit}')
+            raise
+        finally:
+            latency = time.monotonic() - start
+            self.concurrency_limiter.release(latency=latency, throttled=throttled, failed=failed)
+            self._metrics.increment('requests')
+            self._metrics.record_request(latency, rate_wait, concurrency_wait)
+
+    def poll(self,
+             poll_func: Callable[[], Any],
+             is_done: Callable[[Any], bool],
+             timeout: float,
+             description: str = '') -> Future:
+        """Poll a long-running operation until is_done(), see OperationPoller.submit()"""
+        return self.poller.submit(poll_func, is_done, timeout, description)
+
+    def metrics(self) -> Dict[str, Any]:
+        data = self._metrics.snapshot()
+        data['backend'] = self.backend
+        data['concurrency_limit'] = self.concurrency_limiter.limit
+        data['in_flight'] = self.concurrency_limiter.in_flight
+        data['outstanding_operations'] = self.poller.outstanding
+        return data
+
+
+def is_http_throttled(err: Exception) -> bool:
+    """Detect HTTP 429 in Google API core and msrest (Azure) exceptions"""
+    code = getattr(err, 'code', None)
+    if code is None:
+        code = getattr(getattr(err, 'response', None), 'status_code', None)
+    return code == 429
+
+
+_schedulers: Dict[str, OCRRequestScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(backend: str) -> OCRRequestScheduler:
+    """Get the process-wide scheduler of the OCR backend, it's shared by all documents"""
+    scheduler = _schedulers.get(backend)
+    if scheduler is None:
+        with _schedulers_lock:
+            scheduler = _schedulers.get(backend)
+            if scheduler is None:
+                scheduler = _schedulers[backend] = _create_scheduler(backend)
+    return scheduler
+
+
+def _create_scheduler(backend: str) -> OCRRequestScheduler:
+    if backend == OCRBackend.GOOGLE:
+        return OCRRequestScheduler(backend,
+                                   rate=Environment.GVC_REQUESTS_PER_SECOND.value,
+                                   max_concurrency=Environment.GVC_MAX_CONCURRENT_REQUESTS.value,
+                                   target_latency=Environment.OCR_TARGET_LATENCY.value)
+    if backend == OCRBackend.AZURE:
+        return OCRRequestScheduler(backend,
+                                   rate=Environment.AZURE_REQUESTS_PER_SECOND.value,
+                                   max_concurrency=Environment.AZURE_MAX_CONCURRENT_REQUESTS.value,
+                                   target_latency=Environment.OCR_TARGET_LATENCY.value,
+                                   poll_initial_delay=Environment.AZURE_POLL_INTERVAL.value,
+                                   poll_max_delay=Environment.AZURE_POLL_MAX_INTERVAL.value)
+    raise ValueError(f'Unknown OCR backend: {backend}')
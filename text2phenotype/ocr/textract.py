@@ -1,9 +1,16 @@
 import os
-from typing import Union, List, Tuple, Any
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, List, Tuple, Any, Iterable
 
 from text2phenotype.common.log import operations_logger
 from text2phenotype.common import common
 from text2phenotype.constants.common import OCR_PAGE_SPLITTING_KEY
+from text2phenotype.ocr.textract_index import (
+    TextractIndex,
+    TextractPageIndex,
+    get_position_sort_key,
+    iter_streamed_pages,
+)
 from text2phenotype.ocr.trp import Document, Page, Line, Cell, Table
 
 
@@ -33,16 +40,30 @@ def textract_json_to_txt(response: Union[dict, list], lines_only: bool = False)
         for a given cell structure in a table
     :returns: str for the content on the target page
     """
-    doc = textract_doc(response)
-    text_out = ""
-    for page_num, page in enumerate(doc.pages):
-        page_text = page.text if lines_only else parse_page_text(page)
-        text_out += page_text
-        if page_num < len(doc.pages) - 1:
-            # don't add page break on last page
-            text_out += OCR_PAGE_SPLITTING_KEY[0]
+    return pages_to_txt(TextractIndex(response).pages, lines_only=lines_only)
 
-    return text_out
+
+def textract_file_to_txt(json_file_path: str, lines_only: bool = False, stream: bool = False) -> str:
+    """
+    Same as textract_json_to_txt() for a textract .json file
+    :param json_file_path: path to the textract .json output
+    :param lines_only: only use lines (not table formatting) for raw text output
+    :param stream: read the file page by page instead of loading the whole response,
+        use it for very large multi-page responses
+    :returns: str for the document content
+    """
+    if stream:
+        return pages_to_txt(iter_streamed_pages(json_file_path), lines_only=lines_only)
+    return textract_json_to_txt(load_textract_response(json_file_path), lines_only=lines_only)
+
+
+def pages_to_txt(pages: Iterable[TextractPageIndex], lines_only: bool = False) -> str:
+    """
+    Join the page texts with the page break character (not added after the last page)
+    :param pages: indexed textract pages
+    :param lines_only: only use lines (not table formatting) for raw text output
+    """
+    return OCR_PAGE_SPLITTING_KEY[0].join(page.text if lines_only else page.layout_text() for page in pages)
 
 
 def parse_page_text(page: Page) -> str:
@@ -85,34 +106,17 @@ def parse_page_text(page: Page) -> str:
             item.geometry.boundingBox.left,
             item.geometry.boundingBox.height,
         )
-        for item in not_table_lines
-    ] + [
-        (
-            item,
-            item.geometry.boundingBox.top,
-            item.geometry.boundingBox.left,
-            item.geometry.boundingBox.height,
-        )
-        for item in objects["tables"]
+        for item in not_table_lines + objects["tables"]
     ]
-    # a Line often has a height of 0.009 to 0.012, so round 'top' to 0.xxxx
-    round_top_digits = 3  # round the "top" boundingBox position
-    # make rounding more coarse if lines are taller, reduces positional noise
-    line_height_threshold = 0.012
     object_positions_sorted = sorted(
         object_positions,
         key=_get_position_sort_key,
     )
 
     # concatenate all of the text
-    text_out = ""
-    for item, top, left, height in object_positions_sorted:
-        if isinstance(item, Table):
-            text_out += table_to_text(item, delimiter="\t")
-        else:
-            text_out += item.text + "\n"
-
-    return text_out
+    return "".join(
+        table_to_text(item, delimiter="\t") if isinstance(item, Table) else item.text + "\n"
+        for item, top, left, height in object_positions_sorted)
 
 
 def _get_position_sort_key(x: Tuple[Any, float, float, float], round_top_digits=3):
@@ -121,10 +125,7 @@ def _get_position_sort_key(x: Tuple[Any, float, float, float], round_top_digits=
     :param x: expects a tuple with (item, top, left, height)
     :returns: Tuple(rounded_top, left)
     """
-    # make rounding more coarse if lines are taller, reduces positional noise
-    line_height_threshold = 0.012
-    round_to = round_top_digits if x[3] < line_height_threshold else round_top_digits - 1
-    return round(x[1], round_to), x[2]
+    return get_position_sort_key(x[1], x[2], x[3], round_top_digits=round_top_digits)
 
 
 def _collect_not_table_lines(line_list: List[Line], table_list: List[Table]) -> List[Line]:
@@ -136,25 +137,19 @@ def _collect_not_table_lines(line_list: List[Line], table_list: List[Table]) ->
     :returns: list of Lines that are NOT represented in a table
     """
     # get the ids for all "Words" that are in a table Cell in a flat set
-    cell_word_ids = []
-    for table in table_list:
-        for row in table.rows:
-            for cell in row.cells:
-                cell_word_ids.extend(get_child_ids(cell))
-    cell_word_ids = set(cell_word_ids)
+    cell_word_ids = {
+        child_id
+        for table in table_list
+        for row in table.rows
+        for cell in row.cells
+        for child_id in get_child_ids(cell)
+    }
     # get a list of all lines that arent in a table Cell
-    not_table_lines = []
-    table_lines = []
-    for line in line_list:
-        line_children_in_table = set(get_child_ids(line)).intersection(cell_word_ids)
-        if not line_children_in_table:
-            not_table_lines.append(line)
-        else:
-            # collecting these for debugging purposes
-            # a Line may not have ALL of the words in a cell, so one or more matching word is excluded
-            table_lines.append(line)
-    if table_lines:
-        operations_logger.debug(f"Found {len(table_lines)} duplicate lines in tables; filtering them out")
+    # a Line may not have ALL of the words in a cell, so one or more matching word is excluded
+    not_table_lines = [line for line in line_list if cell_word_ids.isdisjoint(get_child_ids(line))]
+    table_lines_count = len(line_list) - len(not_table_lines)
+    if table_lines_count:
+        operations_logger.debug(f"Found {table_lines_count} duplicate lines in tables; filtering them out")
     return not_table_lines
 
 
@@ -204,29 +199,42 @@ def table_to_text(table: Table, delimiter: str = "\t") -> str:
     :param delimiter: what string or character to use as a cell delimiter, default is TAB '\t'
     :returns: str
     """
-    output_text = ""
-    for r, row in enumerate(table.rows):
-        for c, cell in enumerate(row.cells):
-            output_text += cell.text
-            if c < len(row.cells) - 1:
-                output_text += delimiter
-        output_text += "\n"
-    return output_text
+    return "".join(delimiter.join(cell.text for cell in row.cells) + "\n" for row in table.rows)
 
 
-def convert_textract_json_files(input_dir, output_dir, lines_only=False):
+def convert_textract_json_file(json_file_path: str, output_dir: str, lines_only: bool = False,
+                               stream: bool = False) -> str:
+    """
+    Write the raw text of a textract .json file to output_dir, keeping the file name
+    :returns: path to the written .txt file
+    """
+    text_fn, _ = os.path.splitext(os.path.basename(json_file_path))
+    out_text = textract_file_to_txt(json_file_path, lines_only=lines_only, stream=stream)
+    return common.write_text(out_text, os.path.join(output_dir, text_fn + ".txt"))
+
+
+def convert_textract_json_files(input_dir, output_dir, lines_only=False, n_jobs: int = 1, stream: bool = False):
     """
     Iterate through all .json files in input_dir and write as raw text to output_dir
+    :param n_jobs: number of worker processes converting the files
+    :param stream: read every file page by page, see textract_file_to_txt()
     """
     json_files = common.get_file_list(input_dir, file_type=".json", recurse=True)
     os.makedirs(output_dir, exist_ok=True)
-    for i, json_file_path in enumerate(json_files):
-        text_fn, _ = os.path.splitext(os.path.basename(json_file_path))
-        response = load_textract_response(json_file_path)
-        operations_logger.info(f"[{i+1}/{len(json_files)}] Parsing {json_file_path}")
-        out_text = textract_json_to_txt(response, lines_only=lines_only)
-        out_text_path = os.path.join(output_dir, text_fn + ".txt")
-        common.write_text(out_text, out_text_path)
+    if n_jobs <= 1:
+        for i, json_file_path in enumerate(json_files):
+            operations_logger.info(f"[{i+1}/{len(json_files)}] Parsing {json_file_path}")
+            convert_textract_json_file(json_file_path, output_dir, lines_only=lines_only, stream=stream)
+        return
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [
+            executor.submit(convert_textract_json_file, json_file_path, output_dir, lines_only, stream)
+            for json_file_path in json_files
+        ]
+        for i, (json_file_path, future) in enumerate(zip(json_files, futures)):
+            future.result()
+            operations_logger.info(f"[{i+1}/{len(json_files)}] Parsed {json_file_path}")
 
 
 if __name__ == "__main__":
@@ -235,7 +243,9 @@ if __name__ == "__main__":
     parser.add_argument("input_dir", type=str, help="path to the input directory")
     parser.add_argument("output_dir", type=str, help="path to the output directory")
     parser.add_argument("--lines-only", action="store_true")
+    parser.add_argument("--jobs", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--stream", action="store_true", help="read the json files page by page")
     args = parser.parse_args()
 
-    convert_textract_json_files(args.input_dir, args.output_dir, lines_only=args.lines_only)
-
+    convert_textract_json_files(args.input_dir, args.output_dir, lines_only=args.lines_only,
+                                n_jobs=args.jobs, stream=args.stream)
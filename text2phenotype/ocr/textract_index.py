@@ -0,0 +1,208 @@
+"""
+Flat, index based parser of the Textract responses.
+
+Works on the raw response blocks without building the trp object graph:
+the blocks are grouped by page and resolved through a single id -> block map.
+The trp objects (Page, Line, Table ...) are only built on demand, see TextractPageIndex.page
+"""
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import ijson
+
+from text2phenotype.ocr.trp import Page
+
+Block = Dict[str, Any]
+
+# a Line often has a height of 0.009 to 0.012, so round 'top' to 0.xxxx
+ROUND_TOP_DIGITS = 3
+# make rounding more coarse if lines are taller, reduces positional noise
+LINE_HEIGHT_THRESHOLD = 0.012
+
+
+def get_position_sort_key(top: float, left: float, height: float, round_top_digits: int = ROUND_TOP_DIGITS):
+    """
+    Rounded top position and left position, for use in layout sorting
+    :returns: Tuple(rounded_top, left)
+    """
+    round_to = round_top_digits if height < LINE_HEIGHT_THRESHOLD else round_top_digits - 1
+    return round(top, round_to), left
+
+
+def iter_child_ids(block: Block) -> Iterator[str]:
+    """Ids of the CHILD relationships of the block"""
+    for relationship in block.get("Relationships") or []:
+        if relationship["Type"] == "CHILD":
+            yield from relationship["Ids"]
+
+
+def build_block_map(blocks: Iterable[Block]) -> Dict[str, Block]:
+    """Id -> block map"""
+    return {block["Id"]: block for block in blocks if "BlockType" in block and "Id" in block}
+
+
+def iter_page_blocks(blocks: Iterable[Block]) -> Iterator[List[Block]]:
+    """
+    Group the response blocks by page, every page starts with its PAGE block
+    :param blocks: flat iterable of the Textract blocks, may span several responses
+    """
+    page_blocks = []
+    for block in blocks:
+        if block["BlockType"] == "PAGE" and page_blocks:
+            yield page_blocks
+            page_blocks = []
+        page_blocks.append(block)
+    if page_blocks:
+        yield page_blocks
+
+
+def iter_response_blocks(response: Union[dict, list]) -> Iterator[Block]:
+    """Blocks of a single Textract response or a list of responses (paginated job output)"""
+    responses = response if isinstance(response, list) else [response]
+    for item in responses:
+        yield from item["Blocks"]
+
+
+def stream_textract_blocks(json_file_path: str) -> Iterator[Block]:
+    """
+    Stream the blocks out of a Textract json file without loading the whole response
+    :param json_file_path: single response or a list of responses
+    """
+    with open(json_file_path, "rb") as stream:
+        first_char = b""
+        while first_char in (b"", b" ", b"\n", b"\r", b"\t"):
+            first_char = stream.read(1)
+            if not first_char:
+                return
+        stream.seek(0)
+        prefix = "item.Blocks.item" if first_char == b"[" else "Blocks.item"
+        yield from ijson.items(stream, prefix, use_float=True)
+
+
+class TextractPageIndex:
+    """
+    Index of the blocks of a single page: lines and tables in page order, resolved through the block map
+    """
+    def __init__(self, blocks: List[Block], block_map: Optional[Dict[str, Block]] = None):
+        """
+        :param blocks: page blocks, starting with the PAGE block
+        :param block_map: id -> block for the whole document, page blocks are used if not set
+        """
+        self.blocks = blocks
+        self.block_map = block_map if block_map is not None else build_block_map(blocks)
+        self.lines: List[Block] = []
+        self.tables: List[Block] = []
+        for block in blocks:
+            block_type = block["BlockType"]
+            if block_type == "LINE":
+                self.lines.append(block)
+            elif block_type == "TABLE":
+                self.tables.append(block)
+        self._page = None
+
+    @property
+    def page(self) -> Page:
+        """The trp.Page object graph, built on the first access"""
+        if self._page is None:
+            self._page = Page(self.blocks, self.block_map)
+        return self._page
+
+    @property
+    def text(self) -> str:
+        """The page lines, one per row, same as trp.Page.text"""
+        return "".join(f"{block.get('Text') or ''}\n" for block in self.lines)
+
+    def table_rows(self, table: Block) -> List[List[Block]]:
+        """Cell blocks of the table grouped by rows, same as trp.Table.rows"""
+        rows = []
+        row = []
+        row_index = 1
+        for relationship in table.get("Relationships") or []:
+            if relationship["Type"] != "CHILD":
+                continue
+            for cell_id in relationship["Ids"]:
+                cell = self.block_map[cell_id]
+                if cell["RowIndex"] > row_index:
+                    rows.append(row)
+                    row = []
+                    row_index = cell["RowIndex"]
+                row.append(cell)
+            if row:
+                rows.append(row)
+        return rows
+
+    def cell_text(self, cell: Block) -> str:
+        """Cell words separated by spaces and selection statuses separated by commas, same as trp.Cell.text"""
+        parts = []
+        for child_id in iter_child_ids(cell):
+            child = self.block_map[child_id]
+            if child["BlockType"] == "WORD":
+                parts.append(f"{child.get('Text') or ''} ")
+            elif child["BlockType"] == "SELECTION_ELEMENT":
+                parts.append(f"{child['SelectionStatus']}, ")
+        return "".join(parts)
+
+    def table_text(self, table: Block, delimiter: str = "\t") -> str:
+        """Table written by rows, cells are separated with the delimiter"""
+        return "".join(
+            delimiter.join(self.cell_text(cell) for cell in row) + "\n"
+            for row in self.table_rows(table))
+
+    def table_word_ids(self) -> set:
+        """Ids of all the words in the page table cells"""
+        word_ids = set()
+        for table in self.tables:
+            for cell_id in iter_child_ids(table):
+                for child_id in iter_child_ids(self.block_map[cell_id]):
+                    if self.block_map[child_id]["BlockType"] == "WORD":
+                        word_ids.add(child_id)
+        return word_ids
+
+    def not_table_lines(self) -> List[Block]:
+        """Lines that don't share any word with a table cell"""
+        if not self.tables:
+            return self.lines
+        table_word_ids = self.table_word_ids()
+        return [line for line in self.lines if table_word_ids.isdisjoint(iter_child_ids(line))]
+
+    def layout_text(self, delimiter: str = "\t") -> str:
+        """
+        Page text with the lines and the tables sorted by position,
+        the lines already represented in a table are dropped (see textract.parse_page_text())
+        """
+        positions: List[Tuple[Tuple[float, float], bool, Block]] = []
+        for is_table, items in ((False, self.not_table_lines()), (True, self.tables)):
+            for block in items:
+                box = block["Geometry"]["BoundingBox"]
+                positions.append((get_position_sort_key(box["Top"], box["Left"], box["Height"]), is_table, block))
+        positions.sort(key=lambda item: item[0])
+
+        return "".join(
+            self.table_text(block, delimiter=delimiter) if is_table else f"{block.get('Text') or ''}\n"
+            for _, is_table, block in positions)
+
+
+class TextractIndex:
+    """Page indexes of a whole Textract response, sharing one block map"""
+
+    def __init__(self, response: Union[dict, list]):
+        blocks = list(iter_response_blocks(response))
+        self.block_map = build_block_map(blocks)
+        self.pages = [TextractPageIndex(page_blocks, self.block_map) for page_blocks in iter_page_blocks(blocks)]
+
+
+def iter_streamed_pages(json_file_path: str) -> Iterator[TextractPageIndex]:
+    """
+    Page indexes of a Textract json file, read page by page.
+    Only one page of blocks is kept in memory, the relationships are resolved inside the page
+    """
+    for page_blocks in iter_page_blocks(stream_textract_blocks(json_file_path)):
+        yield TextractPageIndex(page_blocks)
@@ -1,13 +1,34 @@
 import uuid
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import redis_lock
 from redis import Redis
-from redis.exceptions import ConnectionError
-from redis.sentinel import Sentinel
+from redis.client import (
+    Pipeline,
+    Script,
+)
+from redis.exceptions import ResponseError
 
-from text2phenotype.common.decorators import retry
 from text2phenotype.constants.environment import Environment
 from text2phenotype.constants.redis import DatabaseMapping
+from text2phenotype.redis_client.pool import (
+    CONNECTION_POOLS,
+    MASTER,
+    SLAVE,
+    PoolStats,
+)
+
+
+def _decode(data: Union[str, bytes, None]) -> Optional[str]:
+    if isinstance(data, bytes):
+        return data.decode()
+    return data
 
 
 class RedisClient:
@@ -18,50 +39,133 @@ class RedisClient:
         self._reader = None
         self._writer = None
         self._redis_lock_id = uuid.uuid4().hex
+        self._scripts: Dict[str, Script] = {}
         self.init_client(client_name=client_name)
 
-    @retry((ConnectionError,), tries=6, backoff_factor=0.5)
     def init_client(self, client_name: str = None):
-        common_settings = dict(
-            decode_responses=True,
-            db=self._db,
-        )
-        if Environment.REDIS_AUTH_REQUIRED.value:
-            common_settings['password'] = Environment.REDIS_AUTH_PASSWORD.value
-
-        if Environment.REDIS_HA_MODE.value:
-            sentinels = [(Environment.REDIS_HOST.value, Environment.REDIS_HA_SENTINEL_PORT.value)]
-            socket_timeout = Environment.REDIS_SOCKET_TIMEOUT.value
-            sentinel = Sentinel(sentinels, socket_timeout=socket_timeout, **common_settings)
-
-            self._reader = sentinel.slave_for(Environment.REDIS_HA_MASTER_NAME.value, socket_timeout=socket_timeout)
-            self._writer = sentinel.master_for(Environment.REDIS_HA_MASTER_NAME.value, socket_timeout=socket_timeout)
-        else:
-            self._reader = self._writer = Redis(host=Environment.REDIS_HOST.value,
-                                                port=Environment.REDIS_PORT.value,
-                                                retry_on_timeout=True,
-                                                **common_settings)
-
-        if client_name:
-            self._reader.client_setname(client_name)
-            self._writer.client_setname(client_name)
-
-    def lock(self, key: str, expire: int = None) -> redis_lock.Lock:
+        """
+        The clients share the connection pools of the process (see RedisConnectionPools),
+        the connections are opened on the first command and named after the client
+        """
+        self._reader = Redis(connection_pool=CONNECTION_POOLS.get(self._db, SLAVE, client_name))
+        self._writer = Redis(connection_pool=CONNECTION_POOLS.get(self._db, MASTER, client_name))
+
+    def pool_stats(self) -> Dict[str, PoolStats]:
+        """Statistics of the reader and writer connection pools, shared with the clients of the same database"""
+        return {SLAVE: self._reader.connection_pool.stats(),
+                MASTER: self._writer.connection_pool.stats()}
+
+    def lock(self, key: str, expire: int = None, auto_renewal: bool = False) -> redis_lock.Lock:
+        """The lock expires after expire seconds, renewed by a thread while held if auto_renewal"""
         expire = expire or Environment.REDIS_LOCK_EXPIRATION.value
-        return redis_lock.Lock(self._writer, key, expire, id=self._redis_lock_id)
+        return redis_lock.Lock(self._writer, key, expire, id=self._redis_lock_id, auto_renewal=auto_renewal)
 
     def is_locked(self, key: str) -> bool:
-        red_lock = redis_lock.Lock(self._writer, key)
-        return red_lock.locked() and red_lock.get_owner_id() != self._redis_lock_id
+        """Locked by another client"""
+        owner_id = _decode(self._writer.get(self.lock_key(key)))
+        return owner_id is not None and owner_id != self._redis_lock_id
+
+    @staticmethod
+    def lock_key(key: str) -> str:
+        """The key of the lock of the key, redis_lock stores the owner id there"""
+        return f'lock:{key}'
+
+    def script(self, source: str) -> Script:
+        """Lua script run on the writer, loaded once (EVALSHA)"""
+        script = self._scripts.get(source)
+        if script is None:
+            script = self._scripts[source] = self._writer.register_script(source)
+        return script
 
-    def set(self, key: str, val: str):
-        return self._writer.set(key, val)
+    def set(self, key: str, val: str, ex: Optional[int] = None, nx: bool = False):
+        """Set the value, expiring after ex seconds if given, only if the key is missing if nx"""
+        return self._writer.set(key, val, ex=ex, nx=nx)
 
     def get(self, key: str) -> str:
-        data = self._reader.get(key)
-        if isinstance(data, bytes):
-            return data.decode()
-        return data
+        return _decode(self._reader.get(key))
+
+    def mget(self, keys: List[str]) -> List[Optional[str]]:
+        """Values of the keys in one round trip, None for the missing keys"""
+        if not keys:
+            return []
+        return [_decode(value) for value in self._reader.mget(keys)]
+
+    def hget(self, key: str, field: str) -> Optional[str]:
+        return _decode(self._reader.hget(key, field))
+
+    def hgetall(self, key: str) -> Dict[str, str]:
+        return {_decode(field): _decode(value) for field, value in self._reader.hgetall(key).items()}
+
+    def hlen(self, key: str) -> int:
+        return self._reader.hlen(key)
+
+    def lrange(self, key: str, start: int = 0, end: int = -1) -> List[str]:
+        return [_decode(value) for value in self._reader.lrange(key, start, end)]
+
+    def get_with_hash(self, key: str, hash_key: str) -> Tuple[Optional[str], Dict[str, str]]:
+        """get() and hgetall() in one round trip"""
+        pipeline = self._reader.pipeline(transaction=False)
+        pipeline.get(key)
+        pipeline.hgetall(hash_key)
+        value, values = pipeline.execute()
+        return _decode(value), {_decode(field): _decode(field_value) for field, field_value in values.items()}
+
+    def hgetall_many(self, keys: List[str]) -> List[Dict[str, str]]:
+        """hgetall() of the keys in one round trip"""
+        pipeline = self._reader.pipeline(transaction=False)
+        for key in keys:
+            pipeline.hgetall(key)
+        return [{_decode(field): _decode(value) for field, value in values.items()}
+                for values in pipeline.execute()]
+
+    def zpopmin(self, key: str, count: int) -> List[str]:
+        """Remove the count members of the sorted set with the lowest scores"""
+        return [_decode(member) for member, _ in self._writer.zpopmin(key, count)]
+
+    def zrangebyscore(self, key: str, min_score: Union[float, str], max_score: Union[float, str]) -> List[str]:
+        """Members of the sorted set with the scores in the range, '-inf' and '+inf' for the open ends"""
+        return [_decode(member) for member in self._writer.zrangebyscore(key, min_score, max_score)]
+
+    def pipeline(self, transaction: bool = True) -> Pipeline:
+        """Commands of the pipeline are sent together on execute(), in a MULTI/EXEC transaction by default"""
+        return self._writer.pipeline(transaction=transaction)
 
     def delete(self, key: str) -> str:
         return self._writer.delete(key)
+
+    def exists(self, key: str) -> bool:
+        return bool(self._reader.exists(key))
+
+    # Streams, the consumer group commands change the group state and go to the writer
+
+    def xgroup_create(self, stream: str, group: str, last_id: str = '0') -> bool:
+        """Create the consumer group (and the stream), False if the group exists"""
+        try:
+            return self._writer.xgroup_create(stream, group, id=last_id, mkstream=True)
+        except ResponseError as err:
+            if 'BUSYGROUP' not in str(err):
+                raise
+            return False
+
+    def xreadgroup(self, stream: str, group: str, consumer: str, count: Optional[int] = None,
+                   block: Optional[int] = None) -> List[Tuple[str, Dict[str, str]]]:
+        """New messages of the stream for the consumer, [(message_id, fields)]"""
+        response = self._writer.xreadgroup(group, consumer, {stream: '>'}, count=count, block=block)
+        return [(_decode(message_id), {_decode(k): _decode(v) for k, v in fields.items()})
+                for _, messages in response or [] for message_id, fields in messages]
+
+    def xack(self, stream: str, group: str, *message_ids: str) -> int:
+        return self._writer.xack(stream, group, *message_ids)
+
+    def xclaim_idle(self, stream: str, group: str, consumer: str, min_idle_time: int,
+                    count: int) -> List[Tuple[str, Dict[str, str]]]:
+        """Claim the messages pending for more than min_idle_time ms in other consumers"""
+        pending = self._writer.xpending_range(stream, group, '-', '+', count)
+        message_ids = [message['message_id'] for message in pending]
+        if not message_ids:
+            return []
+        # XCLAIM skips the messages idle for less than min_idle_time
+        claimed = self._writer.xclaim(stream, group, consumer, min_idle_time, message_ids)
+        # the messages deleted from the stream are claimed with empty fields
+        return [(_decode(message_id), {_decode(k): _decode(v) for k, v in fields.items()})
+                for message_id, fields in claimed if fields]
@@ -0,0 +1,181 @@
+import threading
+import time
+from queue import (
+    Empty,
+    Full,
+)
+from typing import (
+    Dict,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from redis.connection import (
+    BlockingConnectionPool,
+    ConnectionPool,
+)
+from redis.sentinel import (
+    Sentinel,
+    SentinelConnectionPool,
+)
+
+from text2phenotype.constants.environment import Environment
+
+MASTER = 'master'
+SLAVE = 'slave'
+
+
+class PoolStats(NamedTuple):
+    max_connections: int
+    # connections opened so far, they are reused
+    created: int
+    in_use: int
+    # number of times a thread waited for a free connection, and the total time waited
+    waits: int
+    wait_seconds: float
+
+
+class InstrumentedPoolMixin:
+    """Connections in use and waits for a free connection of a BlockingConnectionPool"""
+
+    def reset(self):
+        self._stats_lock = threading.Lock()
+        self._in_use = set()
+        self.waits = 0
+        self.wait_seconds = 0.0
+        super().reset()
+
+    def get_connection(self, command_name, *keys, **options):
+        # approximate, another thread can release a connection meanwhile
+        waiting = self.pool.empty()
+        started_at = time.monotonic()
+
+        connection = super().get_connection(command_name, *keys, **options)
+
+        with self._stats_lock:
+            self._in_use.add(connection)
+            if waiting:
+                self.waits += 1
+                self.wait_seconds += time.monotonic() - started_at
+        return connection
+
+    def release(self, connection):
+        with self._stats_lock:
+            self._in_use.discard(connection)
+        super().release(connection)
+
+    def stats(self) -> PoolStats:
+        with self._stats_lock:
+            return PoolStats(max_connections=self.max_connections,
+                             created=len(self._connections),
+                             in_use=len(self._in_use),
+                             waits=self.waits,
+                             wait_seconds=self.wait_seconds)
+
+
+class InstrumentedConnectionPool(InstrumentedPoolMixin, BlockingConnectionPool):
+    pass
+
+
+class InstrumentedSentinelConnectionPool(InstrumentedPoolMixin, SentinelConnectionPool, BlockingConnectionPool):
+    """SentinelConnectionPool blocking when all the connections are in use"""
+
+    def disconnect(self, inuse_connections: bool = True):
+        """SentinelConnectionPool disconnects the idle connections when the master changes"""
+        if inuse_connections:
+            super().disconnect()
+            return
+
+        idle = []
+        try:
+            while True:
+                idle.append(self.pool.get_nowait())
+        except Empty:
+            pass
+        for connection in idle:
+            if connection is not None:
+                connection.disconnect()
+            try:
+                self.pool.put_nowait(connection)
+            except Full:
+                pass
+
+
+class RedisConnectionPools:
+    """
+    Connection pools of the process, shared by all the Redis clients of the same database, role
+    (master or slave) and client name. A Redis connection is bound to its database (SELECT),
+    so the clients of different databases only share the Sentinel connections.
+    The pools are created on the first use, safely from any thread
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools: Dict[Tuple[int, str, Optional[str]], ConnectionPool] = {}
+        self._sentinel: Optional[Sentinel] = None
+
+    @staticmethod
+    def _connection_settings(db: int, client_name: Optional[str]) -> dict:
+        settings = dict(
+            decode_responses=True,
+            db=db,
+            client_name=client_name,
+            max_connections=Environment.REDIS_MAX_CONNECTIONS.value,
+            timeout=Environment.REDIS_POOL_TIMEOUT.value,
+        )
+        if Environment.REDIS_AUTH_REQUIRED.value:
+            settings['password'] = Environment.REDIS_AUTH_PASSWORD.value
+        return settings
+
+    def _get_sentinel(self) -> Sentinel:
+        if self._sentinel is None:
+            sentinels = [(Environment.REDIS_HOST.value, Environment.REDIS_HA_SENTINEL_PORT.value)]
+            self._sentinel = Sentinel(sentinels, socket_timeout=Environment.REDIS_SOCKET_TIMEOUT.value)
+        return self._sentinel
+
+    def _create_pool(self, db: int, role: str, client_name: Optional[str]) -> ConnectionPool:
+        settings = self._connection_settings(db, client_name)
+
+        if Environment.REDIS_HA_MODE.value:
+            return InstrumentedSentinelConnectionPool(Environment.REDIS_HA_MASTER_NAME.value,
+                                                      self._get_sentinel(),
+                                                      is_master=role == MASTER,
+                                                      socket_timeout=Environment.REDIS_SOCKET_TIMEOUT.value,
+                                                      **settings)
+
+        return InstrumentedConnectionPool(host=Environment.REDIS_HOST.value,
+                                          port=Environment.REDIS_PORT.value,
+                                          retry_on_timeout=True,
+                                          **settings)
+
+    def get(self, db: int, role: str = MASTER, client_name: Optional[str] = None) -> ConnectionPool:
+        """The pool of the database, the master and the slave are the same server without HA mode"""
+        if not Environment.REDIS_HA_MODE.value:
+            role = MASTER
+
+        key = (db, role, client_name)
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(key)
+                if pool is None:
+                    pool = self._pools[key] = self._create_pool(db, role, client_name)
+        return pool
+
+    def stats(self) -> Dict[Tuple[int, str, Optional[str]], PoolStats]:
+        """(db, role, client name) -> statistics of the pool"""
+        with self._lock:
+            pools = dict(self._pools)
+        return {key: pool.stats() for key, pool in pools.items()}
+
+    def disconnect(self):
+        """Close the connections and forget the pools, e.g. after the Redis settings are changed"""
+        with self._lock:
+            pools, self._pools = self._pools, {}
+            self._sentinel = None
+        for pool in pools.values():
+            pool.disconnect()
+
+
+CONNECTION_POOLS = RedisConnectionPools()
@@ -1,4 +1,16 @@
-from .aws import SqsQueueService
+from text2phenotype.common.lazy_import import (
+    lazy_attributes,
+    lazy_dir,
+)
+
 from .base import QueueService
-from .kubemq_rest import KubeQueueService
-from .rabbitmq import RmqQueueService
\ No newline at end of file
+
+# drivers are imported on the first access, see lazy_attributes()
+_LAZY_DRIVERS = {
+    'SqsQueueService': '.aws',
+    'KubeQueueService': '.kubemq_rest',
+    'RmqQueueService': '.rabbitmq',
+}
+
+__getattr__ = lazy_attributes(__name__, _LAZY_DRIVERS)
+__dir__ = lazy_dir(globals(), _LAZY_DRIVERS)
@@ -1,8 +1,12 @@
 import inspect
 from contextlib import contextmanager
 from typing import (
+    Dict,
     Iterable,
-    Set
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
 )
 
 import pika
@@ -13,6 +17,20 @@ from text2phenotype.constants.environment import Environment
 from text2phenotype.common.log import operations_logger
 
 
+def queue_arguments() -> Dict[str, int]:
+    """The arguments of the declared queues: the priority queues if RMQ_MAX_PRIORITY is set"""
+    max_priority = Environment.RMQ_MAX_PRIORITY.value
+    return {'x-max-priority': max_priority} if max_priority else {}
+
+
+def message_priority(priority: Optional[int]) -> Optional[int]:
+    """The priority of a message within 0 and RMQ_MAX_PRIORITY, None without the priority queues"""
+    max_priority = Environment.RMQ_MAX_PRIORITY.value
+    if not max_priority or priority is None:
+        return None
+    return min(max(priority, 0), max_priority)
+
+
 class RMQBasicPublisher:
     # The set of queues which were checked and exist in the RabbitMQ
     __checked_queues: Set[str] = set()
@@ -46,7 +64,8 @@ class RMQBasicPublisher:
         with pika.BlockingConnection(self._parameters) as connection:
             yield connection.channel()
 
-    def publish_message(self, message: str):
+    def publish_message(self, message: str, priority: Optional[int] = None):
+        """The messages of higher priority are delivered first by the priority queues (see RMQ_MAX_PRIORITY)"""
         frame = inspect.stack()[-1]
         operations_logger.debug(f"'publish_message' was called from "
                                 f"File '{frame.filename}', line {frame.lineno}")
@@ -55,9 +74,7 @@ class RMQBasicPublisher:
 
         try:
             with self.open_channel() as channel:
-                channel.basic_publish(Environment.RMQ_DEFAULT_EXCHANGE.value,
-                                      self._queue_name, message,
-                                      pika.BasicProperties(delivery_mode=2))
+                self._basic_publish(channel, message, priority)
 
         except Exception:
             operations_logger.error(f"Failed to publish message: '{message}' "
@@ -67,6 +84,34 @@ class RMQBasicPublisher:
         else:
             operations_logger.info('Published successfully')
 
+    def publish_messages(self, messages: Sequence[Tuple[str, Optional[int]]]) -> int:
+        """
+        Publish the (message, priority) pairs over one connection, in order.
+        Stops at the first failure (logged): returns the number of the published messages
+        """
+        operations_logger.info(f"Publishing {len(messages)} messages to queue '{self._queue_name}'")
+
+        published = 0
+        try:
+            with self.open_channel() as channel:
+                for message, priority in messages:
+                    self._basic_publish(channel, message, priority)
+                    published += 1
+
+        except Exception:
+            operations_logger.exception(f"Failed to publish message: '{messages[published][0]}' "
+                                        f"to the queue '{self._queue_name}'")
+
+        else:
+            operations_logger.info('Published successfully')
+
+        return published
+
+    def _basic_publish(self, channel: BlockingChannel, message: str, priority: Optional[int]):
+        channel.basic_publish(Environment.RMQ_DEFAULT_EXCHANGE.value,
+                              self._queue_name, message,
+                              pika.BasicProperties(delivery_mode=2, priority=message_priority(priority)))
+
     def check_connection(self):
         try:
             with self.open_channel() as channel:
@@ -1,5 +1,6 @@
 from enum import Enum
 from typing import (
+    TYPE_CHECKING,
     Any,
     Dict,
     Optional,
@@ -7,11 +8,11 @@ from typing import (
 )
 
 from text2phenotype.constants.environment import Environment
-from .drivers import (
-    KubeQueueService,
-    RmqQueueService,
-    SqsQueueService,
-)
+from . import drivers
+
+if TYPE_CHECKING:
+    from .drivers.aws import SqsQueueService
+    from .drivers.rabbitmq import RmqQueueService
 
 
 class QueueProvidersEnum(Enum):
@@ -28,7 +29,7 @@ class QueueProvider:
 
     def __init__(self, queue_service: Optional[QueueProvidersEnum] = QueueProvidersEnum.SQS, **kwargs):
         if queue_service == QueueProvidersEnum.SQS:
-            self.provider = SqsQueueService
+            self.provider = drivers.SqsQueueService
             self.options = {
                 'aws_access_key_id': Environment.AWS_ACCESS_ID.value,
                 'aws_secret_access_key': Environment.AWS_ACCESS_KEY.value,
@@ -38,7 +39,7 @@ class QueueProvider:
             }
 
         elif queue_service == QueueProvidersEnum.RMQ:
-            self.provider = RmqQueueService
+            self.provider = drivers.RmqQueueService
             self.options = {
                 # RabbitMQ (pika) specific kwargs
                 'host': Environment.RMQ_HOST.value,
@@ -54,7 +55,7 @@ class QueueProvider:
             }
 
         elif queue_service == QueueProvidersEnum.KUBEMQ:
-            self.provider = KubeQueueService
+            self.provider = drivers.KubeQueueService
             self.options = {
                 'host': Environment.KUBEMQ_HOST.value,
                 'port': int(Environment.KUBEMQ_PORT.value),
@@ -69,7 +70,7 @@ class QueueProvider:
 
 
 def get_queue_service(provider: Optional[QueueProvidersEnum] = None, config: Dict[str, Any] = None) -> \
-        Union[SqsQueueService, RmqQueueService]:
+        Union['SqsQueueService', 'RmqQueueService']:
     """ Get Queue service instance
 
     :param provider: Value for a queue provider, by default, will be used DEFAULT_QUEUE_SERVICE
@@ -1,2 +1,14 @@
+from text2phenotype.common.lazy_import import (
+    lazy_attributes,
+    lazy_dir,
+)
+
 from .base import StorageService
-from .s3 import S3Storage
+
+# drivers are imported on the first access, see lazy_attributes()
+_LAZY_DRIVERS = {
+    'S3Storage': '.s3',
+}
+
+__getattr__ = lazy_attributes(__name__, _LAZY_DRIVERS)
+__dir__ = lazy_dir(globals(), _LAZY_DRIVERS)
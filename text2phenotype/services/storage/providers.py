@@ -1,5 +1,6 @@
 from enum import Enum
 from typing import (
+    TYPE_CHECKING,
     Any,
     Dict,
     Optional,
@@ -7,7 +8,10 @@ from typing import (
 )
 
 from text2phenotype.constants.environment import Environment
-from .drivers import S3Storage
+from . import drivers
+
+if TYPE_CHECKING:
+    from .drivers.s3 import S3Storage
 
 
 class StorageProvidersEnum(Enum):
@@ -22,7 +26,7 @@ class StorageProvider:
 
     def __init__(self, storage_service: Optional[StorageProvidersEnum] = StorageProvidersEnum.S3, **kwargs):
         if storage_service == StorageProvidersEnum.S3:
-            self.provider = S3Storage
+            self.provider = drivers.S3Storage
             self.options = {
                 'aws_access_key_id': Environment.AWS_ACCESS_ID.value,
                 'aws_secret_access_key': Environment.AWS_ACCESS_KEY.value,
@@ -34,7 +38,7 @@ class StorageProvider:
 
 
 def get_storage_service(provider: Optional[StorageProvidersEnum] = None, options: Dict[str, Any] = None) -> \
-        Union[S3Storage]:
+        Union['S3Storage']:
     """ Get Storage service instance
 
     :param provider: Value for a storage provider, by default, will be used DEFAULT_STORAGE_SERVICE
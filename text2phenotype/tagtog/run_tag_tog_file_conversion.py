@@ -21,11 +21,13 @@ def parse_arguments():
         help=("The expected label type class name, if annotations are only one type. "
               "E.g. 'LabLabel', 'DocumentTypeLabel'. "
               "Specify to avoid name collisions, eg between LabLabel and CovidLabLabel"))
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes converting the documents')
     return parser.parse_args()
 
 
 if __name__ == '__main__':
     parsed_args = vars(parse_arguments())
+    n_jobs = parsed_args.pop("jobs")
     if parsed_args["label_type"]:
         parsed_args["label_type"] = deserialize_label_type(parsed_args["label_type"])
-    TagTogAsyncDataSource(**parsed_args).write_raw_materials_for_annotated_materials()
+    TagTogAsyncDataSource(**parsed_args).write_raw_materials_for_annotated_materials(n_jobs=n_jobs)
@@ -3,7 +3,7 @@ from typing import List
 from text2phenotype.annotations.file_helpers import Annotation, AnnotationSet
 from text2phenotype.common.log import operations_logger
 from text2phenotype.constants.common import VERSION_INFO_KEY
-from text2phenotype.constants.features.label_types import LabelEnum, LabelList
+from text2phenotype.constants.features.label_types import LabelEnum, get_label_from_text
 from text2phenotype.tagtog.tagtog_html_to_text import TagTogText
 from text2phenotype.constants.environment import Environment
 
@@ -101,17 +101,10 @@ class TagTogEntity:
         :param text: label text from tag tog
         :param label_type: LabelEnum; if specified, look for label text match in this category
         """
-        non_na_label = None
         if label_type:
-            non_na_label = label_type.from_brat(text)
-        else:
-            # NOTE: may return an incorrect label name if the name exists in multiple LabelTypes
-            for label_type_enum in LabelList:
-                label = label_type_enum.from_brat(text)
-                if label.value.column_index != 0 and label.value.persistent_label not in ['na',  'other']:
-                    non_na_label = label
-
-        return non_na_label
+            return label_type.from_brat(text)
+        # NOTE: may return an incorrect label name if the name exists in multiple LabelTypes
+        return get_label_from_text(text)
 
     @classmethod
     def from_annotation(
@@ -267,29 +260,31 @@ class TagTogAnnotationSet:
                 "entities": [ent.to_json() for ent in self.entities]
                 }
 
-    def check_clean_entities(self, entry: TagTogEntity, text: str) -> List[TagTogEntity]:
+    def check_clean_entities(self, entry: TagTogEntity, text: str, text_offset: int = 0) -> List[TagTogEntity]:
         """
         :param entry: a single tag tog entity
         :param text: the full record text
+        :param text_offset: position of the entity part in the text, the entity range is relative to it
         :return: list of tag tog entities that map to the text, splits annotations that contain new lines into two
          annotations bc tag tog gets mad if we don't, if the annotation does not match the text exactly,
           look around a little bit, sometimes tag tog messes up offsets
         """
         entry_list = []
+        entry_text = text[text_offset + entry.range[0]: text_offset + entry.range[1]]
         if isinstance(entry.text,  float):
-            entry.text = text[entry.range[0]: entry.range[1]]
+            entry.text = entry_text
             entry_list.append(entry)
             return entry_list
 
 
-        if text[entry.range[0]: entry.range[1]].strip() == entry.text.strip():
+        if entry_text.strip() == entry.text.strip():
             entry_list.append(entry)
 
-        elif '\n' in text[entry.range[0]: entry.range[1]].strip():
-            if entry.text.replace(' ', '') == text[entry.range[0]: entry.range[1]].replace('\n', ' ').replace(' ', ''):
+        elif '\n' in entry_text.strip():
+            if entry.text.replace(' ', '') == entry_text.replace('\n', ' ').replace(' ', ''):
                 # split entries
                 offset = 0
-                for txt in text[entry.range[0]: entry.range[1]].split('\n'):
+                for txt in entry_text.split('\n'):
                     if len(txt) >= 1:
                         new_entry = TagTogEntity(
                             text=txt,
@@ -303,8 +298,13 @@ class TagTogAnnotationSet:
 
         else:
             range_to_look_around = 10
-            found_offset = text[entry.range[0] - range_to_look_around:entry.range[1] + range_to_look_around].find(
-                entry.text)
+            # a negative start would wrap around to the end of the text
+            look_around_start = entry.range[0] - range_to_look_around
+            if look_around_start >= 0:
+                found_offset = text[text_offset + look_around_start:
+                                    text_offset + entry.range[1] + range_to_look_around].find(entry.text)
+            else:
+                found_offset = -1
             if found_offset > 0:
                 entry.range = [entry.range[0] - range_to_look_around + found_offset,
                                entry.range[0] - range_to_look_around + found_offset + len(entry.text)]
@@ -339,9 +339,13 @@ class TagTogAnnotationSet:
         :param tag_tog_text: tag tog text object initialized from a tag tog html output
         :return: None, updates self entities in place
         """
-        for annotation in annotation_set.entries:
-            part_start, offset_start = tag_tog_text.offset_from_text_pos(annotation.text_range[0])
-            part_end, offset_end = tag_tog_text.offset_from_text_pos(annotation.text_range[1])
+        annotations = annotation_set.entries
+        # the html parts of all the annotation ranges at once
+        part_offsets = tag_tog_text.offsets_from_text_positions(
+            position for annotation in annotations for position in annotation.text_range[:2])
+        for i, annotation in enumerate(annotations):
+            part_start, offset_start = part_offsets[2 * i]
+            part_end, offset_end = part_offsets[2 * i + 1]
             if part_start == part_end:
 
                 entry = TagTogEntity.from_annotation(annotation, inverse_annotation_legend,
@@ -351,7 +355,8 @@ class TagTogAnnotationSet:
 
                 # ensure clean match up between annotation text and tag tog text, ensure there are no newlines
                 part_start_index = tag_tog_text.html_mapping_to_text[part_start]
-                self.entities.extend(self.check_clean_entities(entry, text=tag_tog_text.raw_text[part_start_index:]))
+                self.entities.extend(self.check_clean_entities(
+                    entry, text=tag_tog_text.raw_text, text_offset=part_start_index))
             else:
                 operations_logger.warning(
                     "Trying to add an annotation that spans sections is not supported at this time")
@@ -2,8 +2,10 @@ import datetime
 import json
 import os
 import shutil
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
-from typing import List, Tuple
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
 from text2phenotype.annotations.file_helpers import AnnotationSet
 from text2phenotype.common import common
@@ -14,6 +16,22 @@ from text2phenotype.tagtog.tag_tog_annotation import TagTogAnnotationSet
 from text2phenotype.tagtog.tagtog_html_to_text import TagTogText
 
 
+class TagTogAnnotationFile(NamedTuple):
+    """An .ann.json file of the TagTog export"""
+    file_id: str
+    project_subfolder: str
+    annotator_dir: str
+    path: str
+    anncomplete: bool
+
+
+class TagTogConvertedFile(NamedTuple):
+    """The Text2phenotype .ann file written for a TagTogAnnotationFile"""
+    annotation_file: TagTogAnnotationFile
+    ann_path: str
+    ann_content: str
+
+
 class TagTogAsyncDataSource:
     """
     This objects only purpose is to work on the unzipped version of the folder you get in tagtog
@@ -84,6 +102,7 @@ class TagTogAsyncDataSource:
         self.include_master_annotations = include_master_annotations
 
         self._annotation_legend = None
+        self._annotation_files = None
         self._original_text_dirs = None
         self.date = datetime.date.today().isoformat()
 
@@ -101,6 +120,14 @@ class TagTogAsyncDataSource:
     def annotation_legend(self, value):
         self._annotation_legend = value
 
+    def __getstate__(self):
+        # sent to the conversion processes, which don't need the file index;
+        # the legend is read once, instead of in every process
+        state = self.__dict__.copy()
+        state['_annotation_files'] = None
+        state['_annotation_legend'] = self.annotation_legend
+        return state
+
     @property
     def output_parent_dir(self) -> str:
         return os.path.join(self.parent_dir, self.OUTPUT_FOLDER)
@@ -163,21 +190,20 @@ class TagTogAsyncDataSource:
 
     def __get_raw_text_raw_ann(
             self,
-            html_path,
-            ann_json_path,
+            tag_tog_text: TagTogText,
+            ann_json_content: Dict[str, Any],
             convert_to_gold: bool = False,
     ) -> Tuple[str, AnnotationSet]:
         """
-        :param html_path: local path for the .html file
-        :param ann_json_path: local path for the .ann_json path
+        :param tag_tog_text: the parsed .html file
+        :param ann_json_content: the parsed .ann.json file
         :param convert_to_gold: boolean, if True, convert annotation ranges to
             the expected position in the raw text file with character length changes
 
         :return: Tuple of [text, AnnotationSet]
         """
-        tag_tog_text = TagTogText(common.read_text(html_path))
         ann_json = TagTogAnnotationSet(
-            ann_json_content=common.read_json(ann_json_path),
+            ann_json_content=ann_json_content,
             label_type=self.label_type,
             norm_text_field=self.norm_text_field,
             convert_to_gold=convert_to_gold,
@@ -230,9 +256,11 @@ class TagTogAsyncDataSource:
         ann_dir = annotator_dir.replace(f'{self.MEMBERS}/', '')
         return os.path.join(self.annotation_parent_dir, ann_dir, project_subfolder, file_name)
 
-    def _get_all_annotation_files(self):
+    def _index_annotation_files(self) -> List[TagTogAnnotationFile]:
         """
-        :return: List tuple of (file_id, project_subfolder, annotator_path
+        Read every .ann.json file of the export, only the paths and the anncomplete flags are kept,
+        the files are parsed again by the conversion (in the worker processes)
+        :return: the annotation files in the file system order
         """
         if self.include_master_annotations:
             all_ann_files = common.get_file_list(self.ann_json_dir, self.ANN_JSON_SUFFIX, True)
@@ -253,68 +281,134 @@ class TagTogAsyncDataSource:
                 json_dict = json.loads(json_text[:-1])
                 common.write_json(json_dict, file)
                 continue
-            if self.require_complete:
-                if not common.read_json(file).get('anncomplete', False):
-                    continue
             file_dir, file_id = os.path.split(file)
             file_id = file_id.replace(self.ANN_JSON_SUFFIX, '')
             file_dir_info = file_dir.replace(self.ann_json_dir, '')
             split_on_pool = file_dir_info.split(self.POOL)
             member_dir = split_on_pool[0]
             project_subfolder = split_on_pool[1]
-            output.append((file_id, self.trim(project_subfolder), self.trim(member_dir)))
+            output.append(TagTogAnnotationFile(file_id=file_id,
+                                               project_subfolder=self.trim(project_subfolder),
+                                               annotator_dir=self.trim(member_dir),
+                                               path=file,
+                                               anncomplete=bool(ann_json.get('anncomplete', False))))
         return output
 
+    @property
+    def annotation_files(self) -> List[TagTogAnnotationFile]:
+        """The annotation files to convert, the export is scanned on the first access"""
+        if self._annotation_files is None:
+            annotation_files = self._index_annotation_files()
+            if self.require_complete:
+                annotation_files = [ann_file for ann_file in annotation_files if ann_file.anncomplete]
+            self._annotation_files = annotation_files
+        return self._annotation_files
+
+    def _get_all_annotation_files(self):
+        """
+        :return: List tuple of (file_id, project_subfolder, annotator_path
+        """
+        return [(ann_file.file_id, ann_file.project_subfolder, ann_file.annotator_dir)
+                for ann_file in self.annotation_files]
+
+    def _convert_document(
+            self,
+            file_id: str,
+            project_subfolder: str,
+            annotation_files: List[TagTogAnnotationFile],
+    ) -> List[TagTogConvertedFile]:
+        """
+        Write the raw text of a document and the .ann file of every annotator, the html is parsed once
+        :return: the written annotations
+        """
+        html_path = self.__html_path(file_id=file_id, project_subfolder=project_subfolder)
+        tag_tog_text = TagTogText(common.read_text(html_path))
+        cleaned_file_id = file_id.split('-')[1]
+        text_path = self.raw_text_out_path(file_id=cleaned_file_id, project_subfolder=project_subfolder)
+        text_written = False
+
+        output = []
+        for ann_file in annotation_files:
+            text, ann_set = self.__get_raw_text_raw_ann(tag_tog_text, common.read_json(ann_file.path))
+
+            if isinstance(text, str) and isinstance(ann_set, AnnotationSet):
+                ann_path_out = self.raw_ann_out_path(
+                    file_id=cleaned_file_id, annotator_dir=ann_file.annotator_dir,
+                    project_subfolder=project_subfolder)
+
+                # write text and ann out
+                assert os.path.isdir(os.path.dirname(text_path))
+                assert os.path.isdir(os.path.dirname(ann_path_out))
+                if not text_written:
+                    common.write_text(text, text_path)
+                    text_written = True
+                ann_content = ann_set.to_file_content()
+                common.write_text(ann_content, ann_path_out)
+                output.append(TagTogConvertedFile(annotation_file=ann_file, ann_path=ann_path_out,
+                                                  ann_content=ann_content))
+            else:
+                operations_logger.info('No text or ann set found')
+        return output
+
+    def _write_combined(self, converted_file: TagTogConvertedFile):
+        annotator_out = converted_file.annotation_file.annotator_dir.split("/")[-1]
+        combined_ann_path_out = converted_file.ann_path.replace(f"/{annotator_out}/", "/combined/")
+        # TODO: add merge duplicates for files annotated by multiple people?
+        if os.path.isfile(combined_ann_path_out):
+            # append extension so we have both, but the duplicate isnt used
+            orig = combined_ann_path_out
+            combined_ann_path_out += f".duplicatefrom_{annotator_out}"
+            operations_logger.warning(f"COMBINE_ANN: Found duplicate file: {orig}, "
+                                      f"writing current ann to: {combined_ann_path_out}")
+        common.write_text(converted_file.ann_content, combined_ann_path_out)
+
     def write_raw_materials_for_annotated_materials(
             self,
             create_combined: bool = False,
+            n_jobs: int = 1,
     ):
         """
         Create Text2phenotype formatted .ann and .txt files from TagTogAnnotations
 
         :param create_combined: bool, if true concatenate all annotation files into 'combined' folder
-        :param norm_text_field: str, name of Entity Field from TagTog that contains the "normalized"
-            (visually correct) text from the annotation; used in PDF annotations
+        :param n_jobs: number of worker processes converting the documents
         """
-        all_annot = self._get_all_annotation_files()
+        all_annot = self.annotation_files
         operations_logger.info(f'Found {len(all_annot)} annotations')
-        proj_subfolders = set([entry[1] for entry in all_annot])
-        ann_dirs = set([self.trim(entry[2].replace(self.MEMBERS, '')) for entry in all_annot])
+        proj_subfolders = set([entry.project_subfolder for entry in all_annot])
+        ann_dirs = set([self.trim(entry.annotator_dir.replace(self.MEMBERS, '')) for entry in all_annot])
         # make sure out dir exists locally
         self.__create_out_file_system(
             project_subfolders=list(proj_subfolders),
             ann_dirs=list(ann_dirs),
             create_combined=create_combined)
-        for row in all_annot:
-            file_id, project_subfolder, annotator = row
-            html_path = self.__html_path(file_id=file_id, project_subfolder=project_subfolder)
-            ann_path = self.__ann_json_path(file_id=file_id, annotator_dir=annotator, project_subfolder=project_subfolder)
-            text, ann_set = self.__get_raw_text_raw_ann(html_path, ann_path)
-
-            if isinstance(text,  str) and isinstance(ann_set, AnnotationSet):
-                cleaned_file_id = file_id.split('-')[1]
-                text_path = self.raw_text_out_path(file_id=cleaned_file_id, project_subfolder=project_subfolder)
-                ann_path_out = self.raw_ann_out_path(
-                    file_id=cleaned_file_id, annotator_dir=annotator, project_subfolder=project_subfolder)
 
-                # write text and ann out
-                assert os.path.isdir(os.path.dirname(text_path))
-                assert os.path.isdir(os.path.dirname(ann_path_out))
-                common.write_text(text, text_path)
-                common.write_text(ann_set.to_file_content(), ann_path_out)
-                if create_combined:
-                    annotator_out = annotator.split("/")[-1]
-                    combined_ann_path_out = ann_path_out.replace(f"/{annotator_out}/", "/combined/")
-                    # TODO: add merge duplicates for files annotated by multiple people?
-                    if os.path.isfile(combined_ann_path_out):
-                        # append extension so we have both, but the duplicate isnt used
-                        orig = combined_ann_path_out
-                        combined_ann_path_out += f".duplicatefrom_{annotator_out}"
-                        operations_logger.warning(f"COMBINE_ANN: Found duplicate file: {orig}, "
-                                                  f"writing current ann to: {combined_ann_path_out}")
-                    common.write_text(ann_set.to_file_content(), combined_ann_path_out)
-            else:
-                operations_logger.info('No text or ann set found')
+        # all the annotators of a document are converted together
+        documents: Dict[Tuple[str, str], List[TagTogAnnotationFile]] = defaultdict(list)
+        for ann_file in all_annot:
+            documents[(ann_file.file_id, ann_file.project_subfolder)].append(ann_file)
+        # by the .ann.json path, the annotation files are not hashable
+        converted: Dict[str, TagTogConvertedFile] = {}
+        if n_jobs <= 1:
+            for (file_id, project_subfolder), annotation_files in documents.items():
+                for converted_file in self._convert_document(file_id, project_subfolder, annotation_files):
+                    converted[converted_file.annotation_file.path] = converted_file
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [
+                    executor.submit(self._convert_document, file_id, project_subfolder, annotation_files)
+                    for (file_id, project_subfolder), annotation_files in documents.items()
+                ]
+                for i, future in enumerate(futures):
+                    for converted_file in future.result():
+                        converted[converted_file.annotation_file.path] = converted_file
+                    operations_logger.info(f'[{i + 1}/{len(futures)}] Converted documents')
+
+        if create_combined:
+            # in the file order, the first annotator of a document wins
+            for ann_file in all_annot:
+                if ann_file.path in converted:
+                    self._write_combined(converted[ann_file.path])
 
     def write_normalized_ann_for_ann_materials(self):
         """
@@ -322,18 +416,15 @@ class TagTogAsyncDataSource:
         """
         pass
 
-    def get_tagtog_text(self, filename):
+    def get_tagtog_text(self, filename) -> Optional[TagTogText]:
         """Given a target filename, return the TagTogText object for that file"""
-        all_annot = self._get_all_annotation_files()
-        matching = [row for row in all_annot if filename in row[0]]
-        if len(matching) > 1:
-            operations_logger.info(f"Found more than one match for filename: {filename}: {matching}")
-        elif not matching:
+        matching = [ann_file for ann_file in self.annotation_files if filename in ann_file.file_id]
+        if not matching:
             operations_logger.info(f"No match found for filename: {filename}")
-        else:
-            matching = matching[0]
+            return None
+        if len({(ann_file.file_id, ann_file.project_subfolder) for ann_file in matching}) > 1:
+            operations_logger.info(f"Found more than one match for filename: {filename}: {matching}")
 
-        html_path = self.__html_path(file_id=matching[0], project_subfolder=matching[1])
+        html_path = self.__html_path(file_id=matching[0].file_id, project_subfolder=matching[0].project_subfolder)
         tag_tog_text = TagTogText(common.read_text(html_path))
         return tag_tog_text
-
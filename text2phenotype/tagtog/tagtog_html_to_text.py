@@ -1,5 +1,16 @@
-from lxml import html
+import bisect
+import functools
 import re
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+import numpy
+from lxml import html
 
 from text2phenotype.common import common
 from text2phenotype.common.log import operations_logger
@@ -12,24 +23,25 @@ class TagTogText:
         self.raw_text = None
         self.html_mapping_to_text = None
         self._page_break_char_ix = None
+        # html part ids and their (non decreasing) text start positions, in the document order
+        self._part_ids = None
+        self._part_starts = None
         self.ingest()
 
     def ingest(self):
+        txt, pos_mapping = parse_html(self.html_input)
 
-        tree = html.fromstring(self.html_input)
-        doc_metadata = self.get_doc_metadata(tree)
-        if doc_metadata.get('charset') != 'UTF-8':
-            raise TypeError("Cannot parse a document with charset != utf-8")
-
-        txt, pos_mapping = self.parse_tree(tree)
-
-        self.html_mapping_to_text = pos_mapping
+        # the cached mapping is shared
+        self.html_mapping_to_text = dict(pos_mapping)
         self.raw_text = txt
+        self._part_ids = list(pos_mapping.keys())
+        self._part_starts = list(pos_mapping.values())
 
     @staticmethod
     def parse_tree(tree):
         article = tree.body
-        txt = ""
+        parts = []
+        length = 0
         pos_mapping = dict()
 
         for art in article:
@@ -37,33 +49,45 @@ class TagTogText:
                 for div in section:
                     for p in div:
                         if 'id' in p.attrib:
-                            pos_mapping[p.attrib['id']] = len(txt)
+                            pos_mapping[p.attrib['id']] = length
                             if p.text:
-                                txt += p.text
-                                txt += '\n'
+                                parts.append(p.text)
+                                parts.append('\n')
+                                length += len(p.text) + 1
                 # ADD KEY FOR SECTION (IE: PAGE BREAKS)
-                txt += OCR_PAGE_SPLITTING_KEY[0]
-        return txt[:-1], pos_mapping
+                parts.append(OCR_PAGE_SPLITTING_KEY[0])
+                length += 1
+        return ''.join(parts)[:-1], pos_mapping
 
     @staticmethod
     def get_doc_metadata(tree):
         header = tree.head
         metadata = dict()
-        for i in header.getiterator('meta'):
-            metadata = {**metadata, **i.attrib}
+        for i in header.iter('meta'):
+            metadata.update(i.attrib)
         return metadata
 
-    def offset_from_text_pos(self, text_pos):
-        part = None
-        offset = None
-        for section, start in self.html_mapping_to_text.items():
+    def offset_from_text_pos(self, text_pos) -> Tuple[Optional[str], Optional[int]]:
+        """
+        :return: the html part containing the text position and the offset of the position in the part,
+            (None, None) if the position is before the first part
+        """
+        # last part starting at or before the position
+        index = bisect.bisect_right(self._part_starts, text_pos) - 1
+        if index < 0:
+            return None, None
+        return self._part_ids[index], text_pos - self._part_starts[index]
 
-            if text_pos >= start:
-                part = section
-                offset = text_pos - start
-            else:
-                break
-        return part, offset
+    def offsets_from_text_positions(self, text_positions: Iterable[int]) -> List[Tuple[Optional[str], Optional[int]]]:
+        """offset_from_text_pos() of all the positions of a document at once"""
+        text_positions = numpy.asarray(list(text_positions), dtype=numpy.int64)
+        if not text_positions.size:
+            return []
+        part_starts = numpy.asarray(self._part_starts, dtype=numpy.int64)
+        indices = numpy.searchsorted(part_starts, text_positions, side='right') - 1
+        offsets = text_positions - part_starts[numpy.maximum(indices, 0)]
+        return [(self._part_ids[index], offset) if index >= 0 else (None, None)
+                for index, offset in zip(indices.tolist(), offsets.tolist())]
 
     def get_part_offsets_range(self, range: list):
         part = None
@@ -90,3 +114,17 @@ class TagTogText:
                 x.start() + 1 for x in re.finditer(OCR_PAGE_SPLITTING_KEY[0], self.raw_text)
             ]
         return self._page_break_char_ix
+
+
+@functools.lru_cache(maxsize=16)
+def parse_html(html_input: str) -> Tuple[str, Dict[str, int]]:
+    """
+    Raw text and the html part id -> text position mapping of a TagTog html document.
+    The same document is parsed for every annotator (and every lookup), so the last results are cached
+    """
+    tree = html.fromstring(html_input)
+    doc_metadata = TagTogText.get_doc_metadata(tree)
+    if doc_metadata.get('charset') != 'UTF-8':
+        raise TypeError("Cannot parse a document with charset != utf-8")
+
+    return TagTogText.parse_tree(tree)
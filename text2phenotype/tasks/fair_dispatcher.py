@@ -0,0 +1,197 @@
+from typing import (
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+)
+
+from text2phenotype.common.log import operations_logger
+from text2phenotype.constants.environment import Environment
+from text2phenotype.redis_client.client import RedisClient
+from text2phenotype.services.queue.drivers.rmq_updated import RMQBasicPublisher
+from text2phenotype.tasks.task_message import TaskMessage
+
+# KEYS: messages of the job, ring of the jobs, weights, ARGV: job id, weight, messages.
+# The job joins the ring with its first message
+ENQUEUE_SCRIPT = """
+local length = 0
+for i = 3, #ARGV do
+    length = redis.call('RPUSH', KEYS[1], ARGV[i])
+end
+if length == #ARGV - 2 then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+end
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[2])
+return length
+"""
+# KEYS: ring of the jobs, weights, in-flight messages, then the messages of every job,
+# ARGV: max messages, then the job ids in the order of their keys.
+# Up to weight messages of every job are moved to the in-flight list as '<job id>\n<message>' entries,
+# the served job goes to the end of the ring or leaves it with its last message. Returns the entries
+TAKE_SCRIPT = """
+local result = {}
+local remaining = tonumber(ARGV[1])
+for i = 4, #KEYS do
+    if remaining <= 0 then
+        break
+    end
+    local job = ARGV[i - 2]
+    if redis.call('LREM', KEYS[1], 1, job) > 0 then
+        local weight = math.max(tonumber(redis.call('HGET', KEYS[2], job) or '1'), 1)
+        local messages = redis.call('LRANGE', KEYS[i], 0, math.min(weight, remaining) - 1)
+        redis.call('LTRIM', KEYS[i], #messages, -1)
+        for _, message in ipairs(messages) do
+            local entry = job .. '\\n' .. message
+            redis.call('RPUSH', KEYS[3], entry)
+            result[#result + 1] = entry
+        end
+        remaining = remaining - #messages
+        if redis.call('LLEN', KEYS[i]) > 0 then
+            redis.call('RPUSH', KEYS[1], job)
+        else
+            redis.call('HDEL', KEYS[2], job)
+        end
+    end
+end
+return result
+"""
+
+
+class DispatchedMessage(NamedTuple):
+    job_id: str
+    message: TaskMessage
+    # the entry of the in-flight list
+    entry: str
+
+    @classmethod
+    def from_entry(cls, entry: str) -> 'DispatchedMessage':
+        job_id, message = entry.split('\n', 1)
+        return cls(job_id=job_id, message=TaskMessage.from_json(message), entry=entry)
+
+
+class FairTaskDispatcher:
+    """
+    Weighted fair dispatch of the task messages across the jobs: the messages wait in Redis per job
+    and are published to the queue in turns of weight messages per job, so a bulk job does not hold
+    back the jobs submitted after it. The weight is the message priority + 1 by default.
+    The taken messages stay in the in-flight list until they are published (ack) or returned to their
+    jobs (release), recover() returns the messages of a crashed dispatcher.
+    The keys of the queue share a hash tag (one Redis Cluster slot) and are all passed to the scripts.
+    The dispatcher is opt-in and nothing in this package publishes through it: it sits between the service
+    creating the task messages of the jobs (the sequencer), which calls enqueue() instead of publishing
+    the messages of a job to the worker queue, and a dispatch loop of that service calling dispatch().
+    The messages published directly to the queue, e.g. by the workers back to the sequencer, are not affected
+    """
+    KEY_PREFIX = 'fair-dispatch:'
+
+    def __init__(self, client: RedisClient, queue_name: str):
+        self.client = client
+        self.queue_name = queue_name
+        prefix = f'{self.KEY_PREFIX}{{{queue_name}}}:'
+        self.ring_key = f'{prefix}jobs'
+        self.weights_key = f'{prefix}weights'
+        self.in_flight_key = f'{prefix}in-flight'
+        self.messages_prefix = f'{prefix}messages:'
+
+    def messages_key(self, job_id: str) -> str:
+        return f'{self.messages_prefix}{job_id}'
+
+    def enqueue(self, job_id: str, messages: Sequence[TaskMessage], weight: Optional[int] = None) -> int:
+        """Add the messages of the job, returns the number of the waiting messages of the job"""
+        if weight is None:
+            weight = max((message.priority or 0 for message in messages), default=0) + 1
+        return self._enqueue(job_id, [message.to_json() for message in messages], weight)
+
+    def _enqueue(self, job_id: str, messages: List[str], weight: int) -> int:
+        length = 0
+        batch_size = Environment.REDIS_BATCH_SIZE.value
+        for i in range(0, len(messages), batch_size):
+            length = self.client.script(ENQUEUE_SCRIPT)(
+                keys=[self.messages_key(job_id), self.ring_key, self.weights_key],
+                args=[job_id, weight, *messages[i:i + batch_size]])
+        return length
+
+    def take(self, max_messages: int) -> List[DispatchedMessage]:
+        """Move up to max_messages messages to the in-flight list in the fair order"""
+        entries = []
+        while len(entries) < max_messages:
+            remaining = max_messages - len(entries)
+            # every job of the round gives one message at least
+            job_ids = self.client.lrange(self.ring_key, 0, remaining - 1)
+            if not job_ids:
+                break
+
+            taken = self.client.script(TAKE_SCRIPT)(
+                keys=[self.ring_key, self.weights_key, self.in_flight_key,
+                      *(self.messages_key(job_id) for job_id in job_ids)],
+                args=[remaining, *job_ids])
+            if not taken:
+                break
+            entries.extend(_decode(entry) for entry in taken)
+
+        return [DispatchedMessage.from_entry(entry) for entry in entries]
+
+    def ack(self, messages: Sequence[DispatchedMessage]):
+        """The messages are published, removed from the in-flight list"""
+        if not messages:
+            return
+        pipeline = self.client.pipeline(transaction=False)
+        for message in messages:
+            pipeline.lrem(self.in_flight_key, 1, message.entry)
+        pipeline.execute()
+
+    def release(self, messages: Sequence[DispatchedMessage]):
+        """Return the in-flight messages to their jobs, at the end of the job messages"""
+        jobs: Dict[str, List[str]] = {}
+        for message in messages:
+            jobs.setdefault(message.job_id, []).append(message.entry.split('\n', 1)[1])
+        # a message returned twice rather than lost if interrupted
+        for job_id, job_messages in jobs.items():
+            weight = self.client.hget(self.weights_key, job_id) or 1
+            self._enqueue(job_id, job_messages, int(weight))
+        self.ack(messages)
+
+    def recover(self) -> int:
+        """
+        Return the in-flight messages left by a crashed dispatcher to their jobs,
+        to be called when no other dispatcher of the queue is running
+        """
+        messages = [DispatchedMessage.from_entry(entry) for entry in self.client.lrange(self.in_flight_key)]
+        self.release(messages)
+        return len(messages)
+
+    def dispatch(self, max_messages: Optional[int] = None, client_tag: Optional[str] = None) -> int:
+        """Publish up to max_messages waiting messages to the queue, returns the number of published messages"""
+        messages = self.take(max_messages or Environment.REDIS_BATCH_SIZE.value)
+        if not messages:
+            return 0
+
+        try:
+            publisher = RMQBasicPublisher(queue_name=self.queue_name, client_tag=client_tag)
+            published = publisher.publish_messages([(message.message.to_json(), message.message.priority)
+                                                    for message in messages])
+        except Exception:
+            self.release(messages)
+            raise
+
+        self.ack(messages[:published])
+        if published < len(messages):
+            operations_logger.error(f'Failed to publish to {self.queue_name}, '
+                                    f'{len(messages) - published} messages are returned to the dispatcher')
+            self.release(messages[published:])
+            raise ConnectionError(f'{published} of {len(messages)} messages were published to {self.queue_name}')
+        return published
+
+    def queue_depths(self) -> Dict[str, int]:
+        """The number of the waiting messages per job"""
+        job_ids = self.client.lrange(self.ring_key)
+
+        pipeline = self.client.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipeline.llen(self.messages_key(job_id))
+        return {job_id: depth for job_id, depth in zip(job_ids, pipeline.execute()) if depth}
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
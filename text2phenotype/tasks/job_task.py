@@ -1,6 +1,10 @@
+import math
 import os
 import uuid
-from collections import deque
+from collections import (
+    Counter,
+    deque,
+)
 from datetime import datetime, timezone
 from enum import Enum
 from typing import (
@@ -8,6 +12,7 @@ from typing import (
     Dict,
     Iterable,
     List,
+    Mapping,
     Optional,
     Set,
     Union,
@@ -22,6 +27,7 @@ from pydantic import (
 )
 
 from text2phenotype.constants.deid import DeidGroupings
+from text2phenotype.constants.environment import Environment
 from text2phenotype.constants.features import FeatureType
 from text2phenotype.open_api.models import ReprocessOptions
 from text2phenotype.tasks.task_enums import (
@@ -34,10 +40,147 @@ from text2phenotype.tasks.utils import get_manifest_job_storage_key
 from text2phenotype.tasks.work_tasks import BaseTask
 
 
+class JobDocumentOwner:
+    """The JobDocuments a JobDocumentInfo belongs to, deep copies and pickled documents don't belong to any"""
+    __slots__ = ('documents', 'document_id')
+
+    def __init__(self, documents: 'JobDocuments', document_id: str):
+        self.documents = documents
+        self.document_id = document_id
+
+    def __deepcopy__(self, memo):
+        return None
+
+    def __reduce__(self):
+        return type(None), ()
+
+
 class JobDocumentInfo(BaseModel):
     status: WorkStatus = None
     filename: str = None
 
+    _owner: Optional[JobDocumentOwner] = PrivateAttr(None)
+
+    def __setattr__(self, name, value):
+        documents = self._owned_by()
+        if documents is None or name not in JobDocuments.INDEXED_FIELDS:
+            super().__setattr__(name, value)
+            return
+
+        document_id = self._owner.document_id
+        documents._remove_from_index(document_id, self)
+        super().__setattr__(name, value)
+        documents._add_to_index(document_id, self)
+
+    def _owned_by(self) -> Optional['JobDocuments']:
+        owner = self._owner
+        # shallow copies of the document keep the owner
+        if owner is not None and dict.get(owner.documents, owner.document_id) is self:
+            return owner.documents
+        return None
+
+
+class JobDocuments(dict):
+    """
+    document_id -> JobDocumentInfo of a job.
+    The number of documents per status and the filename -> document_id mapping are updated
+    on every change, including the status changes of the JobDocumentInfo items,
+    the changed documents are tracked to store only them in Redis.
+    """
+    INDEXED_FIELDS: ClassVar[Set[str]] = {'status', 'filename'}
+
+    def __init__(self, documents: Optional[Mapping[str, Union[JobDocumentInfo, dict]]] = None):
+        super().__init__()
+        self.status_counts: Counter = Counter()
+        self.filenames: Dict[str, str] = {}
+        # the documents are stored in Redis, only the changes since have to be written
+        self.stored: bool = False
+        self.changed: Set[str] = set()
+        self.deleted: Set[str] = set()
+        if documents:
+            self.update(documents)
+
+    def _add_to_index(self, document_id: str, document: JobDocumentInfo):
+        self.status_counts[document.status] += 1
+        self.filenames[document.filename] = document_id
+        self.changed.add(document_id)
+
+    def _remove_from_index(self, document_id: str, document: JobDocumentInfo):
+        self.status_counts[document.status] -= 1
+        if not self.status_counts[document.status]:
+            del self.status_counts[document.status]
+        if self.filenames.get(document.filename) == document_id:
+            del self.filenames[document.filename]
+
+    def __setitem__(self, document_id: str, document: Union[JobDocumentInfo, dict]):
+        if not isinstance(document, JobDocumentInfo):
+            document = JobDocumentInfo.parse_obj(document)
+        else:
+            owner = document._owned_by()
+            if owner is not None and (owner is not self or document._owner.document_id != document_id):
+                # the document belongs to another job (or id), it can't update both
+                document = document.copy()
+
+        previous = self.get(document_id)
+        if previous is not None:
+            self._remove_from_index(document_id, previous)
+            object.__setattr__(previous, '_owner', None)
+
+        super().__setitem__(document_id, document)
+        object.__setattr__(document, '_owner', JobDocumentOwner(self, document_id))
+        self._add_to_index(document_id, document)
+        self.deleted.discard(document_id)
+
+    def __delitem__(self, document_id: str):
+        document = self[document_id]
+        super().__delitem__(document_id)
+        self._remove_from_index(document_id, document)
+        object.__setattr__(document, '_owner', None)
+        self.changed.discard(document_id)
+        self.deleted.add(document_id)
+
+    def update(self, *args, **kwargs):
+        for document_id, document in dict(*args, **kwargs).items():
+            self[document_id] = document
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def setdefault(self, document_id: str, default=None):
+        if document_id not in self:
+            self[document_id] = default
+        return self[document_id]
+
+    def pop(self, document_id: str, *default):
+        if document_id not in self:
+            if default:
+                return default[0]
+            raise KeyError(document_id)
+        document = self[document_id]
+        del self[document_id]
+        return document
+
+    def popitem(self):
+        document_id = next(reversed(self.keys()))
+        return document_id, self.pop(document_id)
+
+    def clear(self):
+        for document_id in list(self):
+            del self[document_id]
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+    def copy(self) -> 'JobDocuments':
+        return self.__class__(self)
+
+    def mark_stored(self):
+        """The documents are written to Redis"""
+        self.stored = True
+        self.changed.clear()
+        self.deleted.clear()
+
 
 class UserInfo(BaseModel):
     key_id: Optional[str] = Field(None, nullable=True)
@@ -72,10 +215,9 @@ class JobTask(BaseTask):
         'stop_documents_on_failure',
         'reprocess_options',
         'model_version',
+        'priority',
     }
 
-    _processed_files: Optional[Dict[str, str]] = PrivateAttr(None)
-
     job_id: str = Field(None, description='By default will be generated random UUID')
     document_info: Dict[str, JobDocumentInfo] = {}  # document_id -> JobDocumentInfo
 
@@ -98,6 +240,8 @@ class JobTask(BaseTask):
 
     user_canceled: Optional[bool] = None
     stop_documents_on_failure: Optional[bool] = True
+    # RabbitMQ message priority of the task messages, 0 is the lowest, by the job size if not set
+    priority: Optional[int] = None
 
     user_actions_log: List[UserActionLogEntry] = []
 
@@ -175,6 +319,15 @@ class JobTask(BaseTask):
     def set_document_info_default(cls, v):
         return v if v is not None else {}
 
+    @validator('document_info', always=True)
+    def set_document_info_type(cls, v):
+        return JobDocuments(v)
+
+    def __setattr__(self, name, value):
+        if name == 'document_info' and not isinstance(value, JobDocuments):
+            value = JobDocuments(value)
+        super().__setattr__(name, value)
+
     @validator('required_features', pre=True)
     def set_required_features(cls, v):
         if isinstance(v, dict):
@@ -202,26 +355,47 @@ class JobTask(BaseTask):
 
     @property
     def status(self) -> WorkStatus:
-        if not self.document_info:
-            return WorkStatus.not_started
+        return self.status_from_counts(self.document_info.status_counts, self.user_canceled)
+
+    @property
+    def status_counts(self) -> Dict[WorkStatus, int]:
+        """Number of documents per status"""
+        return dict(self.document_info.status_counts)
+
+    @staticmethod
+    def status_from_counts(status_counts: Mapping[WorkStatus, int], user_canceled: Optional[bool]) -> WorkStatus:
+        """The job status is the lowest status (see WorkStatus) of its documents"""
+        # WorkStatus items are in the order of the statuses
+        min_docs_status = next((status for status in WorkStatus if status_counts.get(status, 0) > 0),
+                               WorkStatus.not_started)
 
         # Return "canceling" status if there are "processing" documents in the canceled job
-        min_docs_status = min(document.status for document in self.document_info.values())
-        if min_docs_status is WorkStatus.processing and self.user_canceled:
+        if min_docs_status is WorkStatus.processing and user_canceled:
             return WorkStatus.canceling
 
         return min_docs_status
 
+    def message_priority(self, document_count: Optional[int] = None) -> int:
+        """
+        The priority of the task messages of the job, within 0 and RMQ_MAX_PRIORITY: the priority
+        of the job if set, otherwise one less for every order of magnitude of the documents,
+        so the small interactive jobs are not queued behind the bulk ones
+        """
+        max_priority = Environment.RMQ_MAX_PRIORITY.value
+        if self.priority is not None:
+            return min(max(self.priority, 0), max_priority)
+
+        if document_count is None:
+            document_count = len(self.document_info)
+        return max(max_priority - int(math.log10(max(document_count, 1))), 0)
+
     def add_file(self, source: str, document_id: str):
-        if source in self.processed_files:
+        if source in self.document_info.filenames:
             return
 
         self.document_info[document_id] = JobDocumentInfo(status=WorkStatus.processing,
                                                           filename=source)
 
-        # Update "processed_files" mapping to be able to lookup document_id by file name
-        self.processed_files[source] = document_id
-
     def log_user_action(self,
                         action: UserAction,
                         user_info: Optional[Union[UserInfo, dict]] = None) -> None:
@@ -247,13 +421,8 @@ class JobTask(BaseTask):
 
     @property
     def processed_files(self) -> Dict[str, str]:
-        """Generate "process_files" dict for backwards compatibility"""
-
-        if self._processed_files is None:
-            self._processed_files = {doc.filename: doc_id
-                                     for doc_id, doc in self.document_info.items()}
-
-        return self._processed_files
+        """filename -> document_id mapping, for backwards compatibility (a copy of the index)"""
+        return dict(self.document_info.filenames)
 
     @property
     def complete(self) -> bool:
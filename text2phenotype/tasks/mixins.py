@@ -2,18 +2,41 @@ import threading
 from contextlib import contextmanager
 from typing import (
     Dict,
+    Iterable,
     Iterator,
+    List,
     Optional,
+    Sequence,
+    Tuple,
     Type,
 )
 
 import redis
 import redis_lock
+from redis.client import Pipeline
 
+from text2phenotype.constants.environment import Environment
 from text2phenotype.redis_client.client import RedisClient
-from text2phenotype.tasks.job_task import JobTask
-from text2phenotype.tasks.task_enums import WorkType
+from text2phenotype.tasks.job_task import (
+    JobDocumentInfo,
+    JobTask,
+)
+from text2phenotype.tasks.task_enums import (
+    TaskEnum,
+    WorkType,
+)
+from text2phenotype.tasks.task_events import (
+    TaskEvent,
+    TaskEventStream,
+)
 from text2phenotype.tasks.task_message import TaskMessage
+from text2phenotype.tasks.task_state import (
+    TRANSITION_APPLIED,
+    TRANSITION_SCRIPT,
+    TaskStateChange,
+    apply_task_state,
+    event_script_args,
+)
 from text2phenotype.tasks.work_tasks import (
     BaseTask,
     ChunkTask,
@@ -21,25 +44,41 @@ from text2phenotype.tasks.work_tasks import (
     WorkTask,
 )
 
-
 class RedisMethodsMixin:
     """This mixin implements methods useful for communicate with Redis"""
 
     _redis_clients: Dict[WorkType, RedisClient] = {}
+    _redis_clients_lock = threading.Lock()
 
     @classmethod
     def _cached_properties_key(cls, redis_key: str) -> str:
         return f'{redis_key}-cached-properties'
 
+    @classmethod
+    def _job_documents_key(cls, redis_key: str) -> str:
+        return f'{redis_key}-documents'
+
+    @classmethod
+    def _task_checkpoints_key(cls, redis_key: str, task: TaskEnum) -> str:
+        return f'{redis_key}-checkpoints-{task.value}'
+
+    @classmethod
+    def _task_state_key(cls, redis_key: str) -> str:
+        return f'{redis_key}-task-state'
+
     @classmethod
     def get_redis_client(cls, work_type: WorkType) -> RedisClient:
         client = cls._redis_clients.get(work_type)
 
         if client is None:
-            client_name = getattr(cls, 'NAME', None)
-            client = RedisClient(db=work_type.redis_db,
-                                 client_name=client_name)
-            cls._redis_clients[work_type] = client
+            # the consumer threads can get the first client at the same time
+            with cls._redis_clients_lock:
+                client = cls._redis_clients.get(work_type)
+                if client is None:
+                    client_name = getattr(cls, 'NAME', None)
+                    client = RedisClient(db=work_type.redis_db,
+                                         client_name=client_name)
+                    cls._redis_clients[work_type] = client
 
         return client
 
@@ -55,19 +94,113 @@ class RedisMethodsMixin:
 
         if cached_properties:
             key = cls._cached_properties_key(redis_key)
-            json_str = client.get(key)
+            json_str, task_state = cls._get_task_json(client, work_type, key, redis_key)
+        cached = json_str is not None
 
         if json_str is None:
-            json_str = client.get(redis_key)
+            json_str, task_state = cls._get_task_json(client, work_type, redis_key, redis_key)
 
         if not json_str:
             return None
 
+        task = cls._parse_task(json_str, work_task_class)
+
+        if isinstance(task, JobTask) and not cached:
+            cls._load_job_documents(client, task)
+        elif task_state:
+            apply_task_state(task, task_state)
+
+        return task
+
+    @classmethod
+    def _get_task_json(cls, client: RedisClient, work_type: WorkType, key: str,
+                       redis_key: str) -> Tuple[Optional[str], Dict[str, str]]:
+        """The JSON of the key and, for the work tasks, the task state hash (see set_task_state)"""
+        if work_type is WorkType.job:
+            return client.get(key), {}
+        return client.get_with_hash(key, cls._task_state_key(redis_key))
+
+    @classmethod
+    def _parse_task(cls, json_str: str, work_task_class: Optional[Type[BaseTask]] = None) -> BaseTask:
         if work_task_class:
             return work_task_class.from_json(json_str)
-
         return BaseTask.from_json(json_str)
 
+    @classmethod
+    def _load_job_documents(cls, client: RedisClient, job_task: JobTask):
+        """The job documents are stored in a hash, apart from the job JSON"""
+        cls._set_job_documents(job_task, client.hgetall(cls._job_documents_key(job_task.redis_key)))
+
+    @classmethod
+    def _set_job_documents(cls, job_task: JobTask, documents: Dict[str, str]):
+        # the job written before the documents hash keeps the documents of the JSON,
+        # they are moved to the hash by the next set_task()
+        if documents:
+            job_task.document_info = {document_id: JobDocumentInfo.parse_raw(document)
+                                      for document_id, document in documents.items()}
+            job_task.document_info.mark_stored()
+
+    @classmethod
+    def mget_tasks(cls,
+                   work_type: WorkType,
+                   redis_keys: Iterable[str],
+                   cached_properties: bool = False,
+                   work_task_class: Optional[Type[BaseTask]] = None) -> List[Optional[BaseTask]]:
+        """
+        get_task() of many keys of the work type, in a few MGET round trips (REDIS_BATCH_SIZE keys each).
+        The tasks are in the order of the keys, None for the missing ones
+        """
+        client = cls.get_redis_client(work_type)
+        redis_keys = list(redis_keys)
+        json_strs: List[Optional[str]] = [None] * len(redis_keys)
+        cached = [False] * len(redis_keys)
+
+        if cached_properties:
+            json_strs = cls._mget(client, [cls._cached_properties_key(key) for key in redis_keys])
+            cached = [json_str is not None for json_str in json_strs]
+
+        missing = [i for i, json_str in enumerate(json_strs) if json_str is None]
+        for i, json_str in zip(missing, cls._mget(client, [redis_keys[i] for i in missing])):
+            json_strs[i] = json_str
+
+        tasks = [cls._parse_task(json_str, work_task_class) if json_str else None for json_str in json_strs]
+
+        batch_size = Environment.REDIS_BATCH_SIZE.value
+        if work_type is WorkType.job:
+            jobs = [task for task, from_cache in zip(tasks, cached) if task is not None and not from_cache]
+            for start in range(0, len(jobs), batch_size):
+                batch = jobs[start:start + batch_size]
+                all_documents = client.hgetall_many([cls._job_documents_key(job_task.redis_key)
+                                                     for job_task in batch])
+                for job_task, documents in zip(batch, all_documents):
+                    cls._set_job_documents(job_task, documents)
+        else:
+            work_tasks = [task for task in tasks if task is not None]
+            for start in range(0, len(work_tasks), batch_size):
+                batch = work_tasks[start:start + batch_size]
+                task_states = client.hgetall_many([cls._task_state_key(task.redis_key) for task in batch])
+                for task, task_state in zip(batch, task_states):
+                    if task_state:
+                        apply_task_state(task, task_state)
+
+        return tasks
+
+    @classmethod
+    def _mget(cls, client: RedisClient, keys: List[str]) -> List[Optional[str]]:
+        batch_size = Environment.REDIS_BATCH_SIZE.value
+        values = []
+        for start in range(0, len(keys), batch_size):
+            values.extend(client.mget(keys[start:start + batch_size]))
+        return values
+
+    @classmethod
+    def get_document_chunk_tasks(cls,
+                                 doc_task: DocumentTask,
+                                 cached_properties: bool = False) -> List[Optional[ChunkTask]]:
+        """The chunk tasks of the document, in the doc_task.chunks order"""
+        return cls.mget_tasks(WorkType.chunk, doc_task.chunks,
+                              cached_properties=cached_properties, work_task_class=ChunkTask)
+
     @classmethod
     def refresh_task(cls, task: BaseTask, cached_properties: bool = False) -> Optional[BaseTask]:
         return cls.get_task(task.WORK_TYPE,
@@ -76,42 +209,222 @@ class RedisMethodsMixin:
                             work_task_class=type(task))
 
     @classmethod
-    def set_task(cls, task: BaseTask):
+    def set_task(cls, task: BaseTask, events: Sequence[TaskEvent] = ()):
+        """
+        Write the task, its cached properties and the task events (if enabled) in one transaction,
+        the events go to the task event stream of the task work type
+        """
         client = cls.get_redis_client(task.WORK_TYPE)
+        pipeline = client.pipeline()
+
+        cls._add_set_task(pipeline, task)
 
-        # Write entire JSON to Redis
-        resp = client.set(task.redis_key, task.to_json())
-        if not resp:
+        if events and Environment.TASK_EVENTS_ENABLED.value:
+            TaskEventStream(client).add(events, pipeline=pipeline)
+
+        if not pipeline.execute()[0]:
             raise redis.RedisError()
 
+        if isinstance(task, JobTask):
+            cls._mark_job_documents_stored(task)
+
+    @classmethod
+    def set_tasks(cls, tasks: Iterable[BaseTask]):
+        """
+        set_task() of many tasks, a pipeline of REDIS_BATCH_SIZE tasks per work type.
+        Every pipeline is a transaction, a failed pipeline doesn't undo the previous ones
+        """
+        tasks_by_work_type: Dict[WorkType, List[BaseTask]] = {}
+        for task in tasks:
+            tasks_by_work_type.setdefault(task.WORK_TYPE, []).append(task)
+
+        batch_size = Environment.REDIS_BATCH_SIZE.value
+        for work_type, work_type_tasks in tasks_by_work_type.items():
+            client = cls.get_redis_client(work_type)
+
+            for start in range(0, len(work_type_tasks), batch_size):
+                batch = work_type_tasks[start:start + batch_size]
+                pipeline = client.pipeline()
+                # the first command of every task writes its JSON
+                positions = []
+                for task in batch:
+                    positions.append(len(pipeline))
+                    cls._add_set_task(pipeline, task)
+
+                responses = pipeline.execute()
+                if not all(responses[position] for position in positions):
+                    raise redis.RedisError()
+
+                for task in batch:
+                    if isinstance(task, JobTask):
+                        cls._mark_job_documents_stored(task)
+
+    @classmethod
+    def _add_set_task(cls, pipeline: Pipeline, task: BaseTask):
+        """Add the commands writing the task to the pipeline, the first one writes the task JSON"""
+        if isinstance(task, JobTask):
+            cls._set_job_task(pipeline, task)
+        else:
+            # Write entire JSON to Redis
+            pipeline.set(task.redis_key, task.to_json())
+            # the JSON has the state changes the task was read with
+            pipeline.delete(cls._task_state_key(task.redis_key))
+
         # Write small subset of properties if required
         if task.CACHED_PROPERTIES:
             key = cls._cached_properties_key(task.redis_key)
             fields_set = set(task.CACHED_PROPERTIES) | set(task.DEFAULT_CACHED_PROPERTIES)
-            client.set(key, task.json(include=fields_set))
+            pipeline.set(key, task.json(include=fields_set))
+
+    @classmethod
+    def _mark_job_documents_stored(cls, job_task: JobTask):
+        # the next write of the hash has only the changed documents, the JSON has all of them
+        if Environment.JOB_DOCUMENTS_HASH_ENABLED.value:
+            job_task.document_info.mark_stored()
+
+    @classmethod
+    def _set_job_task(cls, pipeline: Pipeline, job_task: JobTask):
+        """
+        Write the job JSON without the documents and the changed documents to the documents hash
+        if JOB_DOCUMENTS_HASH_ENABLED, otherwise the whole job JSON (the readers with an older library
+        read the documents from the JSON only)
+        """
+        documents = job_task.document_info
+        documents_key = cls._job_documents_key(job_task.redis_key)
+
+        if not Environment.JOB_DOCUMENTS_HASH_ENABLED.value:
+            pipeline.set(job_task.redis_key, job_task.json())
+            # the hash written while enabled is read first
+            pipeline.delete(documents_key)
+            return
+
+        pipeline.set(job_task.redis_key, job_task.json(exclude={'document_info'}))
+
+        if documents.stored:
+            changed = documents.changed
+            if documents.deleted:
+                pipeline.hdel(documents_key, *documents.deleted)
+        else:
+            changed = documents.keys()
+            pipeline.delete(documents_key)
+        if changed:
+            pipeline.hset(documents_key, mapping={document_id: documents[document_id].json()
+                                                  for document_id in changed})
+
+    @classmethod
+    def get_task_event_stream(cls, work_type: WorkType) -> TaskEventStream:
+        """Events of the tasks of the work type, see TaskEventStream"""
+        return TaskEventStream(cls.get_redis_client(work_type))
+
+    @classmethod
+    def task_events(cls, work_task: BaseTask) -> Sequence[TaskEvent]:
+        """Events written with the work task by save_work_task() and task_update_manager(), none by default"""
+        return ()
+
+    @classmethod
+    def set_task_state(cls,
+                       work_type: WorkType,
+                       redis_key: str,
+                       change: TaskStateChange,
+                       events: Sequence[TaskEvent] = ()) -> bool:
+        """
+        Apply the task status transitions to the work task (and write the task events if enabled)
+        in one round trip, without reading the task or taking its lock.
+        The changes are kept in the task state hash, merged on read and replaced by the next set_task().
+        False if the task is locked or missing or TASK_STATE_SCRIPT_ENABLED is off (the readers with
+        an older library don't merge the hash): the caller falls back to task_update_manager()
+        """
+        if not Environment.TASK_STATE_SCRIPT_ENABLED.value:
+            return False
+
+        client = cls.get_redis_client(work_type)
+        keys = [redis_key, cls._task_state_key(redis_key), client.lock_key(redis_key)]
+        args = change.script_args()
+
+        if events and Environment.TASK_EVENTS_ENABLED.value:
+            stream = TaskEventStream(client)
+            keys.append(stream.name)
+            args.extend(event_script_args(stream.max_len, [event.to_fields() for event in events]))
+
+        return client.script(TRANSITION_SCRIPT)(keys=keys, args=args) == TRANSITION_APPLIED
+
+    @classmethod
+    def get_job_message_priority(cls, job_id: str) -> Optional[int]:
+        """JobTask.message_priority() from the number of documents, without reading the job documents"""
+        job_task = cls.get_task(WorkType.job, job_id, cached_properties=True, work_task_class=JobTask)
+        if job_task is None:
+            return None
+
+        document_count = cls.get_redis_client(WorkType.job).hlen(cls._job_documents_key(job_id))
+        if not document_count:
+            # no documents or the job written before the documents hash
+            if not job_task.document_info:
+                job_task = cls.get_task(WorkType.job, job_id, work_task_class=JobTask)
+            document_count = len(job_task.document_info)
+        return job_task.message_priority(document_count)
 
     @classmethod
     def delete_task(cls, task: BaseTask):
         client = cls.get_redis_client(task.WORK_TYPE)
 
-        # Delete cached properties if required
-        if task.CACHED_PROPERTIES:
-            key = cls._cached_properties_key(task.redis_key)
+        for key in cls._task_secondary_keys(task):
             client.delete(key)
 
         # Delete entire JSON
         return client.delete(task.redis_key)
 
     @classmethod
-    def lock_task(cls, task: BaseTask, expire: Optional[int] = None) -> redis_lock.Lock:
+    def delete_tasks(cls, tasks: Iterable[BaseTask]) -> int:
+        """delete_task() of many tasks, a few DEL commands per work type, the number of deleted tasks"""
+        keys_by_work_type: Dict[WorkType, Tuple[List[str], List[str]]] = {}
+        for task in tasks:
+            task_keys, secondary_keys = keys_by_work_type.setdefault(task.WORK_TYPE, ([], []))
+            task_keys.append(task.redis_key)
+            secondary_keys.extend(cls._task_secondary_keys(task))
+
+        batch_size = Environment.REDIS_BATCH_SIZE.value
+        deleted = 0
+        for work_type, (task_keys, secondary_keys) in keys_by_work_type.items():
+            pipeline = cls.get_redis_client(work_type).pipeline(transaction=False)
+            for start in range(0, len(task_keys), batch_size):
+                pipeline.delete(*task_keys[start:start + batch_size])
+            task_commands = len(pipeline)
+            for start in range(0, len(secondary_keys), batch_size):
+                pipeline.delete(*secondary_keys[start:start + batch_size])
+
+            deleted += sum(pipeline.execute()[:task_commands])
+
+        return deleted
+
+    @classmethod
+    def _task_secondary_keys(cls, task: BaseTask) -> List[str]:
+        """
+        The keys stored with the task JSON: the cached properties, the job documents
+        or the task state and the checkpoints of the tasks
+        """
+        keys = []
+        if isinstance(task, JobTask):
+            keys.append(cls._job_documents_key(task.redis_key))
+        else:
+            keys.append(cls._task_state_key(task.redis_key))
+            if isinstance(task, WorkTask):
+                keys.extend(cls._task_checkpoints_key(task.redis_key, task_type) for task_type in task.task_statuses)
+
+        if task.CACHED_PROPERTIES:
+            keys.append(cls._cached_properties_key(task.redis_key))
+        return keys
+
+    @classmethod
+    def lock_task(cls, task: BaseTask, expire: Optional[int] = None, auto_renewal: bool = False) -> redis_lock.Lock:
         client = cls.get_redis_client(task.WORK_TYPE)
-        return client.lock(task.redis_key, expire)
+        return client.lock(task.redis_key, expire, auto_renewal=auto_renewal)
 
     @classmethod
     @contextmanager
     def task_update_manager(cls,
                             work_task: BaseTask,
-                            lock_expire: Optional[int] = None) -> Iterator[BaseTask]:
+                            lock_expire: Optional[int] = None,
+                            auto_renewal: bool = False) -> Iterator[BaseTask]:
         """Context manager for safe updates of Redis resources in case of concurrency.
 
         The context manager do the next steps:
@@ -130,13 +443,16 @@ class RedisMethodsMixin:
                 work_task.started_at = datetime.utcnow()
 
             # The updated object state will be saved in the Redis on exit from context manager
+
+        The lock expires after lock_expire seconds (REDIS_LOCK_EXPIRATION by default),
+        a slow update is done with auto_renewal: the lock is renewed until the update is completed
         """
 
-        with cls.lock_task(work_task, expire=lock_expire):
+        with cls.lock_task(work_task, expire=lock_expire, auto_renewal=auto_renewal):
             # Use initial object in case of Redis does not have the key
             work_task = cls.refresh_task(work_task) or work_task
             yield work_task
-            cls.set_task(work_task)
+            cls.set_task(work_task, events=cls.task_events(work_task))
 
 
 class ThreadingLocalDataMixin:
@@ -193,7 +509,7 @@ class WorkTaskMethodsMixin(RedisMethodsMixin, ThreadingLocalDataMixin):
     def save_work_task(self):
         if self.work_task.complete and not self.work_task.completed_at:
             self.work_task.completed_at = self._dt_now_utc()
-        self.set_task(self.work_task)
+        self.set_task(self.work_task, events=self.task_events(self.work_task))
 
     def get_document_task(self, cached_properties: bool = False) -> Optional[DocumentTask]:
         if self.work_task and self.work_task.document_id:
@@ -215,17 +531,18 @@ class WorkTaskMethodsMixin(RedisMethodsMixin, ThreadingLocalDataMixin):
     @contextmanager
     def task_update_manager(self,
                             work_task: Optional[BaseTask] = None,
-                            lock_expire: Optional[int] = None) -> Iterator[BaseTask]:
+                            lock_expire: Optional[int] = None,
+                            auto_renewal: bool = False) -> Iterator[BaseTask]:
         """Implementation of "task_update_manager()" use "self.work_task" by default"""
 
         if work_task:
             # Reuse base implementation
-            with super().task_update_manager(work_task, lock_expire) as wt:
+            with super().task_update_manager(work_task, lock_expire, auto_renewal) as wt:
                 yield wt
 
         elif self.work_task:
             # Refresh and save self.work_task
-            with self.lock_task(self.work_task, lock_expire):
+            with self.lock_task(self.work_task, lock_expire, auto_renewal):
                 self.refresh_work_task()
                 yield self.work_task
                 self.save_work_task()
@@ -0,0 +1,151 @@
+import hashlib
+import os
+import time
+from typing import (
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+)
+
+from text2phenotype.common.log import operations_logger
+from text2phenotype.constants.environment import Environment
+from text2phenotype.redis_client.client import RedisClient
+from text2phenotype.tasks.task_enums import TaskEnum
+from text2phenotype.tasks.tasks_constants import TasksConstants
+
+
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ChunkResultCache:
+    """
+    Content addressed cache of the chunk task results, e.g. for the reprocessed or duplicated documents.
+    The results are copied in the storage under STORAGE_RESULT_CACHE_PREFIX, keyed by the hash of
+    the chunk text, the task and the version of the models, and indexed in Redis.
+    The index entries expire after ttl seconds without a hit, their storage objects are deleted
+    by the next put() (see evict_expired()). The least recently used entries are evicted above max_entries
+    """
+    INDEX_PREFIX = 'chunk-result-cache:'
+    # storage key -> time of the last use
+    LRU_KEY = 'chunk-result-cache-lru'
+    # '<task>:hits' and '<task>:misses' -> count
+    STATS_KEY = 'chunk-result-cache-stats'
+
+    def __init__(self, client: RedisClient, storage_client,
+                 ttl: Optional[int] = None, max_entries: Optional[int] = None):
+        self.client = client
+        self.storage_client = storage_client
+        self.ttl = ttl or Environment.CHUNK_RESULT_CACHE_TTL.value
+        self.max_entries = max_entries or Environment.CHUNK_RESULT_CACHE_MAX_ENTRIES.value
+
+    @staticmethod
+    def text_digest(text: bytes) -> str:
+        """The hash of the chunk text, see ChunkTask.text_digest"""
+        return hashlib.sha256(text).hexdigest()
+
+    @staticmethod
+    def cache_key(text_digest: str, task: TaskEnum, version: str) -> str:
+        """The key of the results of the task for the chunk text digest, the version identifies the models"""
+        digest = hashlib.sha256()
+        for part in (task.value.encode(), version.encode(), text_digest.encode()):
+            digest.update(part)
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    @staticmethod
+    def storage_key(cache_key: str, task: TaskEnum, extension: str) -> str:
+        return os.path.join(TasksConstants.STORAGE_RESULT_CACHE_PREFIX, task.value, f'{cache_key}.{extension}')
+
+    @classmethod
+    def _index_key(cls, storage_key: str) -> str:
+        cache_key = os.path.basename(storage_key).split('.', 1)[0]
+        return f'{cls.INDEX_PREFIX}{cache_key}'
+
+    def get(self, cache_key: str, task: TaskEnum) -> Optional[bytes]:
+        """The cached results, None on a miss. A hit renews the entry"""
+        index_key = f'{self.INDEX_PREFIX}{cache_key}'
+        storage_key = self.client.get(index_key)
+
+        results = None
+        if storage_key is not None:
+            try:
+                results = self.storage_client.get_content(storage_key)
+            except Exception as e:
+                # evicted meanwhile
+                operations_logger.info(f'The cached results {storage_key} were not found: {e}')
+
+        pipeline = self.client.pipeline(transaction=False)
+        if results is not None:
+            pipeline.expire(index_key, self.ttl)
+            pipeline.zadd(self.LRU_KEY, {storage_key: time.time()}, xx=True)
+        pipeline.hincrby(self.STATS_KEY, f'{task.value}:{"hits" if results is not None else "misses"}')
+        pipeline.execute()
+
+        return results
+
+    def put(self, cache_key: str, task: TaskEnum, results: bytes, extension: str):
+        storage_key = self.storage_key(cache_key, task, extension)
+        self.storage_client.container.write_bytes(data=results, file_name=storage_key)
+
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.set(f'{self.INDEX_PREFIX}{cache_key}', storage_key, ex=self.ttl)
+        pipeline.zadd(self.LRU_KEY, {storage_key: time.time()})
+        pipeline.zcard(self.LRU_KEY)
+        entries = pipeline.execute()[-1]
+
+        entries -= self.evict_expired()
+        if entries > self.max_entries:
+            self.evict(entries - self.max_entries)
+
+    def evict(self, count: int) -> int:
+        """Remove the count least recently used entries and their storage objects"""
+        return self._delete(self.client.zpopmin(self.LRU_KEY, count))
+
+    def evict_expired(self) -> int:
+        """
+        Remove the storage objects of the expired index entries: the LRU time of an entry is updated
+        with the expiration of its index key, so the entries unused for ttl seconds are expired
+        """
+        storage_keys = self.client.zrangebyscore(self.LRU_KEY, '-inf', time.time() - self.ttl)
+        if not storage_keys:
+            return 0
+
+        pipeline = self.client.pipeline(transaction=False)
+        for storage_key in storage_keys:
+            pipeline.zrem(self.LRU_KEY, storage_key)
+        # removed by one of the concurrent workers only
+        return self._delete([storage_key for storage_key, removed in zip(storage_keys, pipeline.execute())
+                             if removed])
+
+    def _delete(self, storage_keys: List[str]) -> int:
+        if not storage_keys:
+            return 0
+
+        pipeline = self.client.pipeline(transaction=False)
+        pipeline.delete(*[self._index_key(storage_key) for storage_key in storage_keys])
+        pipeline.execute()
+
+        container = self.storage_client.container
+        for storage_key in storage_keys:
+            try:
+                container.get_object(storage_key).delete()
+            except Exception as e:
+                operations_logger.warning(f'Failed to delete the cached results {storage_key}: {e}')
+        return len(storage_keys)
+
+    def stats(self) -> Dict[TaskEnum, CacheStats]:
+        """Hits and misses per task, since the cache was created"""
+        counts = {}
+        for field, value in self.client.hgetall(self.STATS_KEY).items():
+            task, kind = field.rsplit(':', 1)
+            counts.setdefault(TaskEnum(task), {})[kind] = int(value)
+        return {task: CacheStats(hits=task_counts.get('hits', 0), misses=task_counts.get('misses', 0))
+                for task, task_counts in counts.items()}
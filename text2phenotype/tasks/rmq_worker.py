@@ -12,15 +12,23 @@ from abc import (
     abstractmethod,
 )
 from collections import Counter
+from contextlib import (
+    ExitStack,
+    contextmanager,
+)
 from datetime import (
     datetime,
     timezone,
 )
 from pathlib import Path
 from typing import (
+    Any,
     Dict,
+    Iterator,
     List,
     Optional,
+    Sequence,
+    Tuple,
     Union,
 )
 
@@ -30,17 +38,17 @@ from pydantic import ValidationError
 
 from text2phenotype import tasks
 from text2phenotype.common.log import operations_logger
-from text2phenotype.common.log_formatters import (
-    OperationsFormatter,
-    WorkerFormatter,
-)
+from text2phenotype.common.log_context import log_context
 from text2phenotype.common.version_info import (
     get_version_info,
     VersionInfo,
 )
 from text2phenotype.constants.docker import MDL_SIGTERM
 from text2phenotype.constants.environment import Environment
-from text2phenotype.services.queue.drivers.rmq_updated import RMQBasicPublisher
+from text2phenotype.services.queue.drivers.rmq_updated import (
+    RMQBasicPublisher,
+    queue_arguments,
+)
 from text2phenotype.services.storage import get_storage_service
 from text2phenotype.services.storage.drivers import StorageService
 from text2phenotype.tasks.mixins import (
@@ -48,47 +56,55 @@ from text2phenotype.tasks.mixins import (
     ThreadingLocalDataMixin,
     WorkTaskMethodsMixin,
 )
+from text2phenotype.tasks.result_cache import ChunkResultCache
 from text2phenotype.tasks.task_enums import (
     TaskEnum,
     TaskStatus,
     WorkType,
 )
+from text2phenotype.tasks.task_events import TaskEvent
+from text2phenotype.tasks.task_lease import (
+    LEASE_MANAGER,
+    TaskLease,
+    TaskLeaseHeld,
+)
 from text2phenotype.tasks.task_info import TaskInfo
+from text2phenotype.tasks.task_state import TaskStateChange
 from text2phenotype.tasks.task_message import TaskMessage
 from text2phenotype.tasks.tasks_constants import TasksConstants
-from text2phenotype.tasks.work_tasks import DocumentTask
+from text2phenotype.tasks.work_tasks import (
+    BaseTask,
+    DocumentTask,
+)
+
+
+def worker_log_context(worker: 'RMQConsumerWorker', message: TaskMessage):
+    """
+    Log context of the message processing: worker name, document id and chunk number
+    (job id instead of the document id for the bulk intake worker)
+    """
+    doc_id_args = (message.redis_key or '').split('_')
+    document_id = doc_id_args[0] or None
+    chunk_number = doc_id_args[1] if len(doc_id_args) > 1 else None
+
+    fields = {
+        'worker_name': worker.__class__.__name__,
+        'document_id': document_id,
+        'chunk_number': chunk_number,
+    }
+    if worker.QUEUE_NAME == Environment.BULK_INTAKE_QUEUE.value:
+        fields['document_id'] = None
+        fields['job_id'] = document_id
+
+    return log_context(**fields)
 
 
 def redis_logger(func):
     @functools.wraps(func)
     def wrapper(worker: RMQConsumerWorker, deliver: pika.spec.Basic.Deliver, message_body: str, **kwargs):
         message = TaskMessage.construct(**json.loads(message_body))
-        doc_id_args = message.redis_key.split('_')
-        document_id = doc_id_args[0]
-        chunk_number = doc_id_args[1] if len(doc_id_args) > 1 else None
-
-        worker_formatter = WorkerFormatter(
-            worker_name=worker.__class__.__name__,
-            document_id=document_id,
-            chunk_number=chunk_number,
-        )
-        if worker.QUEUE_NAME == Environment.BULK_INTAKE_QUEUE.value:
-            worker_formatter.document_id = None
-            worker_formatter.job_id = document_id
-
-        # Set formatters
-        formatter_map = {}
-        for handler in operations_logger.logger.handlers:
-            formatter_map[handler] = handler.formatter
-            if isinstance(handler.formatter, OperationsFormatter):
-                handler.setFormatter(worker_formatter)
-        try:
-            result = func(worker, deliver, message_body, **kwargs)
-        finally:
-            # Reset formatters
-            for handler in operations_logger.logger.handlers:
-                handler.setFormatter(formatter_map[handler])
-        return result
+        with worker_log_context(worker, message):
+            return func(worker, deliver, message_body, **kwargs)
 
     return wrapper
 
@@ -247,15 +263,18 @@ class RMQConsumerWorker(RedisMethodsMixin, ThreadingLocalDataMixin, ABC):
                         message: Union[str, TaskMessage],
                         client_tag: Optional[str] = None) -> None:
 
+        priority = None
         if isinstance(message, TaskMessage):
             message = message.copy(deep=True)
             message.sender = self.NAME
             message_body = message.to_json()
+            # the priority of the job is kept along the pipeline
+            priority = message.priority
         else:
             message_body = message
 
         client = RMQBasicPublisher(queue_name=queue_name, client_tag=client_tag)
-        client.publish_message(message_body)
+        client.publish_message(message_body, priority=priority)
 
     def task_message_from_json(self, message_body: str):
         return TaskMessage.from_json(message_body)
@@ -275,19 +294,20 @@ class RMQConsumerWorker(RedisMethodsMixin, ThreadingLocalDataMixin, ABC):
         self._clear_threading_local_data()
 
         self.task_message = self.task_message_from_json(message_body)
-        with WorkerHealthcheckFile():
-            redis_logger(self.process_message())
+        with worker_log_context(self, self.task_message):
+            with WorkerHealthcheckFile():
+                self.process_message()
 
-        try:
-            version_info = json.dumps(self.version_info.to_dict())
-        except Exception:
-            version_info = None
+            try:
+                version_info = json.dumps(self.version_info.to_dict())
+            except Exception:
+                version_info = None
 
-        operations_logger.info(f'Finished processing the message.'
-                               f'Thread ID {threading.get_ident()}, '
-                               f'Delivery Tag {delivery.delivery_tag}, '
-                               f'Message Body {message_body}, '
-                               f'Version Info: {version_info}')
+            operations_logger.info(f'Finished processing the message.'
+                                   f'Thread ID {threading.get_ident()}, '
+                                   f'Delivery Tag {delivery.delivery_tag}, '
+                                   f'Message Body {message_body}, '
+                                   f'Version Info: {version_info}')
 
     def process_message(self):
         return self.do_work()
@@ -438,7 +458,12 @@ class RMQConsumerWorker(RedisMethodsMixin, ThreadingLocalDataMixin, ABC):
         operations_logger.debug('Exchange declared: %s', userdata)
         operations_logger.debug('Declaring queue %s', self.QUEUE_NAME)
         cb = functools.partial(self.on_queue_declareok, userdata=self.QUEUE_NAME)
-        self._channel.queue_declare(queue=self.QUEUE_NAME, callback=cb, passive=True)
+        arguments = queue_arguments()
+        if arguments:
+            # the priority queue is declared unless it exists with the same arguments already
+            self._channel.queue_declare(queue=self.QUEUE_NAME, callback=cb, durable=True, arguments=arguments)
+        else:
+            self._channel.queue_declare(queue=self.QUEUE_NAME, callback=cb, passive=True)
 
     def on_connection_open_error(self, _unused_connection, err):
         """This method is called by pika if the connection to RabbitMQ
@@ -596,12 +621,40 @@ class RMQConsumerWorker(RedisMethodsMixin, ThreadingLocalDataMixin, ABC):
         self._was_consuming = False
 
 
+class BatchItem:
+    """A message of a batch (see RMQConsumerTaskWorker.process_batch) with its threading.local() state"""
+
+    def __init__(self, message_body: str, deliver: pika.spec.Basic.Deliver):
+        self.message_body = message_body
+        self.deliver = deliver
+        self.state: Dict[str, Any] = {}
+        self.model_version: Optional[str] = None
+        self.cache_key: Optional[str] = None
+        self.error: Optional[Exception] = None
+
+        # resolved once the message is processed, the message is acked by on_process_done()
+        self.future = concurrent.futures.Future()
+        setattr(self.future, 'deliver', deliver)
+        setattr(self.future, 'message', message_body)
+
+
 class RMQConsumerTaskWorker(WorkTaskMethodsMixin, RMQConsumerWorker):
     TASK_TYPE: TaskEnum = None
     RESULTS_FILE_EXTENSION: str = None
     WORK_TYPE: WorkType = None
     NAME: str = 'RMQConsumerTaskWorker'
 
+    def __init__(self):
+        super().__init__()
+
+        # batch mode if greater than 1, see process_batch()
+        self.batch_size = Environment.TASK_BATCH_SIZE.value
+        self._batch: List[BatchItem] = []
+        self._batch_timeout = None
+        if self.batch_size > 1:
+            # the next batch is collected while the previous one is processed
+            self._prefetch_count = 2 * self.batch_size
+
     @property
     def task_info(self) -> TaskInfo:
         return self.work_task.task_statuses[self.TASK_TYPE]
@@ -610,7 +663,38 @@ class RMQConsumerTaskWorker(WorkTaskMethodsMixin, RMQConsumerWorker):
     def tid(self):
         return self.work_task.redis_key
 
+    @classmethod
+    def task_events(cls, work_task: BaseTask) -> Sequence[TaskEvent]:
+        """The event of the worker task once it is done or failed, for the consumers of the task event stream"""
+        task_info = work_task.task_statuses.get(cls.TASK_TYPE) if work_task.WORK_TYPE is cls.WORK_TYPE else None
+        if task_info is None or not (task_info.complete or task_info.status is TaskStatus.failed):
+            return ()
+        return (TaskEvent(task=cls.TASK_TYPE,
+                          work_type=work_task.WORK_TYPE,
+                          redis_key=work_task.redis_key,
+                          status=task_info.status),)
+
+    def transition_task(self, change: TaskStateChange):
+        """
+        Apply the status transitions of the worker task to self.work_task and to Redis, in one round trip
+        (see set_task_state) or with the lock if the task is locked
+        """
+        change.apply_task_info(self.TASK_TYPE, self.task_info)
+
+        if not self.set_task_state(self.work_task.WORK_TYPE, self.work_task.redis_key, change,
+                                   events=self.task_events(self.work_task)):
+            # the task is locked, the change is applied again to the task refreshed under the lock
+            with self.task_update_manager():
+                change.apply_task_info(self.TASK_TYPE, self.task_info)
+
     def on_process_done(self, future: concurrent.futures.Future):
+        if isinstance(future.exception(), TaskLeaseHeld):
+            # the task is still in progress in another worker, the message is retried later
+            deliver: pika.spec.Basic.Deliver = getattr(future, 'deliver')
+            operations_logger.info(f'{future.exception()}, requeue message {deliver.delivery_tag}')
+            self.requeue(deliver.delivery_tag)
+            return
+
         super().on_process_done(future)
         message_body: str = getattr(future, 'message')
         # If the message is successful, send it back to the sequencer
@@ -632,14 +716,14 @@ class RMQConsumerTaskWorker(WorkTaskMethodsMixin, RMQConsumerWorker):
                                    f'but it will be stopped forcibly',
                                    tid=message.redis_key)
 
+            change = TaskStateChange().fail(self.TASK_TYPE, self._dt_now_utc(), 'Forced termination of work')
             work_task = self.get_task(WorkType[message.work_type], message.redis_key)
+            change.apply(work_task)
 
-            with self.task_update_manager(work_task) as wt:
-                task_info = wt.task_statuses[self.TASK_TYPE]
-
-                task_info.status = TaskStatus.failed
-                task_info.error_messages.append('Forced termination of work')
-                task_info.completed_at = self._dt_now_utc()
+            if not self.set_task_state(work_task.WORK_TYPE, work_task.redis_key, change,
+                                       events=self.task_events(work_task)):
+                with self.task_update_manager(work_task) as wt:
+                    change.apply(wt)
 
             # to send message back to sequencer
             self.publish_message(Environment.SEQUENCER_QUEUE.value, message)
@@ -647,9 +731,22 @@ class RMQConsumerTaskWorker(WorkTaskMethodsMixin, RMQConsumerWorker):
         super().exit_with_grace(signum, frame)
 
     def publish_message(self, queue_name: str, message: Union[str, TaskMessage]) -> None:
+        if isinstance(message, TaskMessage) and message.priority is None and Environment.RMQ_MAX_PRIORITY.value:
+            # the message created without the priority, the priority of the job is kept along the pipeline
+            message = message.copy()
+            message.priority = self.get_message_priority(message)
         super().publish_message(queue_name, message,
                                 client_tag=f'{self.TASK_TYPE.value} task worker')
 
+    def get_message_priority(self, message: TaskMessage) -> Optional[int]:
+        """The priority of the job of the task, see RedisMethodsMixin.get_job_message_priority()"""
+        if message.work_type is WorkType.job:
+            job_id = message.redis_key
+        else:
+            work_task = self.get_task(message.work_type, message.redis_key, cached_properties=True)
+            job_id = work_task.job_id if work_task else None
+        return self.get_job_message_priority(job_id) if job_id else None
+
     def init_task_result(self) -> TaskInfo:
         task_result = self.task_info
         task_result.results_file_key = None
@@ -748,6 +845,15 @@ class RMQConsumerTaskWorker(WorkTaskMethodsMixin, RMQConsumerWorker):
         return result_data
 
     def process_message(self):
+        if not self.prepare_work_task():
+            return
+
+        with self.task_lease() as leased:
+            if leased:
+                self.__perform_work_task()
+
+    def prepare_work_task(self) -> bool:
+        """Initialize the work task of self.task_message, False if there is nothing to do"""
         # Check work type of current task
         if self.task_message.work_type is not self.WORK_TYPE:
             raise Exception(f'Received message {self.task_message} is not compatible '
@@ -756,15 +862,24 @@ class RMQConsumerTaskWorker(WorkTaskMethodsMixin, RMQConsumerWorker):
         self.init_work_task(self.task_message)
 
         # Perform all required checks
-        if not self.__is_it_necessary_to_perform_work_task():
-            return
+        return self.__is_it_necessary_to_perform_work_task()
 
+    def __perform_work_task(self):
+        self._start_work_task()
+        try:
+            task_result = self.do_cached_work()
+        except Exception as err:
+            operations_logger.exception(f'An exception occurred in the '
+                                        f'TaskWorker ({self.TASK_TYPE.value})',
+                                        exc_info=True,
+                                        tid=self.tid)
+            self._fail_work_task(err)
+        else:
+            self._complete_work_task(task_result)
+
+    def _start_work_task(self):
         # Set Task "started_at" timestamp and increment attempts
-        with self.task_update_manager():
-            self.task_info.started_at = self._dt_now_utc()
-            self.task_info.completed_at = None
-            self.task_info.status = TaskStatus.started
-            self.task_info.attempts += 1
+        self.transition_task(TaskStateChange().start(self.TASK_TYPE, self._dt_now_utc()))
 
         operations_logger.info(f'TaskWorker ({self.TASK_TYPE.value}) '
                                f'starting work on new task for '
@@ -772,22 +887,314 @@ class RMQConsumerTaskWorker(WorkTaskMethodsMixin, RMQConsumerWorker):
                                f'{self.work_task.redis_key}, '
                                f'attempt # {self.task_info.attempts}',
                                tid=self.tid)
+
+    def _fail_work_task(self, err: Exception):
+        self.transition_task(TaskStateChange().fail(self.TASK_TYPE, self._dt_now_utc(), repr(err)))
+
+    def _complete_work_task(self, task_result: TaskInfo):
+        self.mark_task_as_completed(task_result)
+        self.update_task_result(task_result)
+        self.clear_checkpoints()
+
+    def on_message(self,
+                   ch: pika.spec.Channel,
+                   deliver: pika.spec.Basic.Deliver,
+                   props: pika.spec.BasicProperties,
+                   body: bytes) -> concurrent.futures.Future:
+        """In the batch mode, the message waits for batch_size messages or the TASK_BATCH_WINDOW seconds"""
+        if self.batch_size <= 1:
+            return super().on_message(ch, deliver, props, body)
+
+        item = BatchItem(body.decode(), deliver)
+        item.future.add_done_callback(self.on_process_done)
+        self._batch.append(item)
+
+        self.futures = [f for f in self.futures if not f.done()]
+        self.futures.append(item.future)
+
+        if len(self._batch) >= self.batch_size:
+            self.flush_batch()
+        elif self._batch_timeout is None:
+            self._batch_timeout = self._connection.ioloop.call_later(Environment.TASK_BATCH_WINDOW.value,
+                                                                     self._on_batch_window)
+        return item.future
+
+    def _on_batch_window(self):
+        self._batch_timeout = None
+        self.flush_batch()
+
+    def flush_batch(self):
+        """Submit the collected messages to the executor as one batch"""
+        if self._batch_timeout is not None:
+            self._connection.ioloop.remove_timeout(self._batch_timeout)
+            self._batch_timeout = None
+
+        batch, self._batch = self._batch, []
+        if batch:
+            self.executor.submit(self.process_batch, batch)
+
+    @contextmanager
+    def batch_item_context(self, item: BatchItem) -> Iterator[None]:
+        """
+        The threading.local() state of the item (the message, the work task), kept between the calls,
+        and the log context of the item message
+        """
+        self._clear_threading_local_data()
+        vars(self._local_data).update(item.state)
         try:
-            task_result = self.do_work()
+            with worker_log_context(self, TaskMessage.construct(**json.loads(item.message_body))):
+                yield
+        finally:
+            item.state = dict(vars(self._local_data))
+
+    def process_batch(self, batch: List[BatchItem]):
+        """
+        The checks, the lease and the result cache per message as in process_message(), then one do_batch_work()
+        call for the messages of the same model version. The messages are completed, acked or rejected one by one,
+        the failure of a message does not fail the others. The messages of the tasks leased by another worker
+        are deferred until the rest of the batch is done, then processed one by one waiting for the lease
+        """
+        operations_logger.info(f'Received the batch of {len(batch)} messages from queue {self.QUEUE_NAME}. '
+                               f'Thread ID {threading.get_ident()}, '
+                               f'Delivery Tags {[item.deliver.delivery_tag for item in batch]}')
+        try:
+            with WorkerHealthcheckFile():
+                deferred = self._process_batch(batch, wait=False)
+                for item in deferred:
+                    self._process_batch([item], wait=True)
         except Exception as err:
-            operations_logger.exception(f'An exception occurred in the '
-                                        f'TaskWorker ({self.TASK_TYPE.value})',
-                                        exc_info=True,
-                                        tid=self.tid)
+            operations_logger.exception(f'Failed to process the batch of {len(batch)} messages')
+            for item in batch:
+                item.error = item.error or err
+        finally:
+            self._clear_threading_local_data()
 
-            # get most up-to-date version before saving the update
-            with self.task_update_manager():
-                self.task_info.status = TaskStatus.failed
-                self.task_info.error_messages.append(repr(err))
-                self.task_info.completed_at = self._dt_now_utc()
-        else:
-            self.mark_task_as_completed(task_result)
-            self.update_task_result(task_result)
+        for item in batch:
+            if item.error is not None:
+                item.future.set_exception(item.error)
+            else:
+                item.future.set_result(None)
+
+    def _process_batch(self, batch: List[BatchItem], wait: bool) -> List[BatchItem]:
+        """Process the items holding their leases, returns the items leased by another worker if not wait"""
+        deferred = []
+        with ExitStack() as leases:
+            groups: Dict[Optional[str], List[BatchItem]] = {}
+            for item in batch:
+                prepared = self._prepare_batch_item(item, leases, wait)
+                if prepared is None:
+                    deferred.append(item)
+                elif prepared:
+                    groups.setdefault(item.model_version, []).append(item)
+
+            for items in groups.values():
+                self._process_batch_items(items)
+        return deferred
+
+    def _prepare_batch_item(self, item: BatchItem, leases: ExitStack, wait: bool = True) -> Optional[bool]:
+        """
+        False if the item is done already: nothing to do, the cached results or the error.
+        None if not wait and the task is leased by another worker
+        """
+        try:
+            with self.batch_item_context(item):
+                self.task_message = self.task_message_from_json(item.message_body)
+                if not self.prepare_work_task():
+                    return False
+                leased = leases.enter_context(self.task_lease(wait))
+                if not leased:
+                    return leased
+
+                self._start_work_task()
+                item.model_version = self.work_task.model_version
+                item.cache_key, task_result = self._get_cached_result()
+                if task_result is not None:
+                    self._complete_work_task(task_result)
+                    return False
+                return True
+        except Exception as err:
+            operations_logger.exception(f'Failed to prepare the message {item.message_body}')
+            item.error = err
+            return False
+
+    def _process_batch_items(self, items: List[BatchItem]):
+        try:
+            results = self.do_batch_work(items)
+            if len(results) != len(items):
+                raise ValueError(f'{len(results)} results of the batch of {len(items)} tasks')
+        except Exception as err:
+            operations_logger.exception(f'An exception occurred in the TaskWorker ({self.TASK_TYPE.value}) '
+                                        f'for the batch of {len(items)} tasks')
+            results = [err] * len(items)
+
+        for item, result in zip(items, results):
+            try:
+                with self.batch_item_context(item):
+                    if isinstance(result, Exception):
+                        operations_logger.error(f'An exception occurred in the TaskWorker '
+                                                f'({self.TASK_TYPE.value}): {result!r}', tid=self.tid)
+                        self._fail_work_task(result)
+                    else:
+                        self._put_cached_result(item.cache_key, result)
+                        self._complete_work_task(result)
+            except Exception as err:
+                operations_logger.exception(f'Failed to complete the message {item.message_body}')
+                item.error = err
+
+    def do_batch_work(self, items: List[BatchItem]) -> List[Union[TaskInfo, Exception]]:
+        """
+        The task results of the items of the same model version or the exceptions of the failed items,
+        in the order of the items. do_work() for every item by default, override with one batched call
+        (e.g. one request for the texts of all the chunks) reading the work tasks within batch_item_context().
+        Only the batching framework is provided here: the model workers live in the services built on this
+        package, and a worker gains from TASK_BATCH_SIZE only once it overrides this method
+        """
+        results = []
+        for item in items:
+            with self.batch_item_context(item):
+                try:
+                    results.append(self.do_work())
+                except Exception as err:
+                    results.append(err)
+        return results
+
+    @contextmanager
+    def task_lease(self, wait: bool = True) -> Iterator[Optional[bool]]:
+        """
+        Hold the lease of the task while working on it, renewed by the LEASE_MANAGER (see TaskLease).
+        A message of the task redelivered meanwhile waits for the lease up to its expiration, i.e. until
+        the lease of a dead or stalled worker expires, then the task is checked again: False if there is
+        nothing left to do. TaskLeaseHeld if the lease is still held, the message is requeued (see on_process_done).
+        None without waiting if not wait and the lease is held.
+        The lease is renewed while the worker makes progress, see report_progress()
+        """
+        if not Environment.TASK_LEASE_ENABLED.value:
+            yield True
+            return
+
+        lease = TaskLease(self.get_redis_client(self.work_task.WORK_TYPE), self.work_task.redis_key, self.TASK_TYPE)
+
+        if not lease.acquire():
+            if not wait:
+                yield None
+                return
+
+            operations_logger.info(f'TaskWorker ({self.TASK_TYPE.value}) waits for the lease of '
+                                   f'{self.work_task.work_type.value} = {self.work_task.redis_key}, '
+                                   f'the task is in progress in another worker',
+                                   tid=self.tid)
+            interval = lease.expire / 3
+            deadline = time.monotonic() + lease.expire + interval
+            while not lease.acquire():
+                if time.monotonic() >= deadline:
+                    raise TaskLeaseHeld(f'The lease of {self.work_task.work_type.value} = '
+                                        f'{self.work_task.redis_key} is renewed by another worker')
+                time.sleep(interval)
+
+            self.refresh_work_task()
+            if not self.__is_it_necessary_to_perform_work_task():
+                lease.release()
+                yield False
+                return
+
+        LEASE_MANAGER.add(lease)
+        try:
+            yield True
+        finally:
+            LEASE_MANAGER.remove(lease)
+            lease.release()
+
+    @staticmethod
+    def report_progress():
+        """
+        The task of the current thread makes progress, its lease is renewed for another
+        TASK_LEASE_PROGRESS_TIMEOUT seconds. Called by save_checkpoint(), call it from long running steps
+        """
+        LEASE_MANAGER.progress()
+
+    @property
+    def checkpoints_key(self) -> str:
+        return self._task_checkpoints_key(self.work_task.redis_key, self.TASK_TYPE)
+
+    def get_checkpoints(self) -> Dict[str, str]:
+        """The steps of the task completed by the previous attempts, step -> the value saved with the step"""
+        return self.get_redis_client(self.work_task.WORK_TYPE).hgetall(self.checkpoints_key)
+
+    def save_checkpoint(self, step: str, value: str = ''):
+        """
+        Record a completed step of the task, e.g. with the storage key of its results,
+        so a retry of the task resumes after the steps in get_checkpoints().
+        The checkpoints are cleared once the task is completed
+        """
+        pipeline = self.get_redis_client(self.work_task.WORK_TYPE).pipeline(transaction=False)
+        pipeline.hset(self.checkpoints_key, step, value)
+        pipeline.expire(self.checkpoints_key, Environment.TASK_CHECKPOINTS_EXPIRATION.value)
+        pipeline.execute()
+        self.report_progress()
+
+    def clear_checkpoints(self):
+        self.get_redis_client(self.work_task.WORK_TYPE).delete(self.checkpoints_key)
+
+    def result_cache_key(self) -> Optional[str]:
+        """The key of the results in the ChunkResultCache, None if the results of the task are not cached"""
+        if not (Environment.CHUNK_RESULT_CACHE_ENABLED.value and
+                self.work_task.work_type is WorkType.chunk and
+                type(self.task_info).RESULT_CACHEABLE and
+                self.work_task.text_file_key):
+            return None
+
+        version = f'{self.work_task.model_version}:' \
+                  f'{self.version_info.docker_image or self.version_info.to_version_str()}'
+        text_digest = self.work_task.text_digest
+        if not text_digest:
+            # not set by the creator of the chunk task
+            text_digest = ChunkResultCache.text_digest(self.download_object_bytes(self.work_task.text_file_key))
+        return ChunkResultCache.cache_key(text_digest, self.TASK_TYPE, version)
+
+    def do_cached_work(self) -> TaskInfo:
+        """
+        do_work(), unless the results of the same chunk text are in the ChunkResultCache:
+        they are copied to the results file of the chunk
+        """
+        cache_key, task_result = self._get_cached_result()
+        if task_result is not None:
+            return task_result
+
+        task_result = self.do_work()
+        self._put_cached_result(cache_key, task_result)
+        return task_result
+
+    def _get_cached_result(self) -> Tuple[Optional[str], Optional[TaskInfo]]:
+        """The key of the results in the ChunkResultCache and the task result if the results are cached"""
+        try:
+            cache_key = self.result_cache_key()
+            results = self._result_cache().get(cache_key, self.TASK_TYPE) if cache_key else None
+        except Exception:
+            operations_logger.exception('Failed to read the result cache', tid=self.tid)
+            return None, None
+
+        if results is None:
+            return cache_key, None
+
+        operations_logger.info(f'TaskWorker ({self.TASK_TYPE.value}) reuses the cached results '
+                               f'for chunk = {self.work_task.redis_key}', tid=self.tid)
+        task_result = self.init_task_result()
+        task_result.results_file_key = self.upload_results(results)
+        return cache_key, task_result
+
+    def _put_cached_result(self, cache_key: Optional[str], task_result: TaskInfo):
+        # completed successfully, see mark_task_as_completed()
+        succeeded = not task_result.complete or task_result.status is TaskStatus.completed_success
+        if cache_key and succeeded and task_result.results_file_key and not task_result.error_messages:
+            try:
+                self._result_cache().put(cache_key, self.TASK_TYPE,
+                                         self.download_object_bytes(task_result.results_file_key),
+                                         self.RESULTS_FILE_EXTENSION)
+            except Exception:
+                operations_logger.exception('Failed to write the result cache', tid=self.tid)
+
+    def _result_cache(self) -> ChunkResultCache:
+        return ChunkResultCache(self.get_redis_client(WorkType.chunk), self.storage_client)
 
     def mark_task_as_completed(self, task_result):
         task_result.completed_at = self._dt_now_utc()  # Set Task "completed_at" timestamp
@@ -834,11 +1241,7 @@ class RMQConsumerTaskWorker(WorkTaskMethodsMixin, RMQConsumerWorker):
         job_task = self.get_job_task(cached_properties=True)
 
         if job_task.user_canceled:
-            with self.task_update_manager():
-                self.task_info.started_at = self._dt_now_utc()
-                self.task_info.completed_at = self._dt_now_utc()
-                self.task_info.status = TaskStatus.canceled
-                self.task_info.attempts += 1
+            self.transition_task(TaskStateChange().cancel(self.TASK_TYPE, self._dt_now_utc()))
 
             operations_logger.info(f'{task_details_message}. '
                                    f'Job was canceled, no need to perform this task. '
@@ -861,16 +1264,11 @@ class RMQConsumerTaskWorker(WorkTaskMethodsMixin, RMQConsumerWorker):
                                    f'and document won\'t be processed successfully. '
                                    f'Sending back to Sequencer.')
 
-            with self.task_update_manager():
-                self.task_info.started_at = self._dt_now_utc()
-                self.task_info.completed_at = self._dt_now_utc()
-                self.task_info.status = TaskStatus.canceled
-                self.task_info.attempts += 1
-
-                self.task_info.error_messages.append(
-                    f'Task was marked as "{TaskStatus.canceled.value}" because of '
-                    f'the current document has failed in the "{failed_task}" worker '
-                    f'and won\'t be processed successfully.')
+            self.transition_task(TaskStateChange().cancel(
+                self.TASK_TYPE, self._dt_now_utc(),
+                f'Task was marked as "{TaskStatus.canceled.value}" because of '
+                f'the current document has failed in the "{failed_task}" worker '
+                f'and won\'t be processed successfully.'))
             return False
 
         # Check the number of attempts
@@ -878,26 +1276,21 @@ class RMQConsumerTaskWorker(WorkTaskMethodsMixin, RMQConsumerWorker):
             operations_logger.info(f'{task_details_message} has exceeded retries. '
                                    f'Sending back to Sequencer.')
 
-            doc_task: DocumentTask = doc_task or self.get_document_task()
-
-            with self.task_update_manager(doc_task) as doc_task:
-                doc_task.failed_tasks.append(self.TASK_TYPE)
-
-                # Save info about failed chunks for more convenient problem investigation
-                if self.work_task.WORK_TYPE is WorkType.chunk:
-                    chunk_id = self.work_task.redis_key
-                    doc_task.failed_chunks.setdefault(chunk_id, []).append(self.TASK_TYPE)
-
-            with self.task_update_manager():
-                self.task_info.started_at = self._dt_now_utc()
-                self.task_info.completed_at = self._dt_now_utc()
-                self.task_info.status = TaskStatus.completed_failure
-                self.task_info.attempts += 1  # Indicate that one more attempt was performed
-
-                self.task_info.error_messages.append(
-                    f'Task has exceeded retries. '
-                    f'(Attempts: {self.task_info.attempts}, '
-                    f'max retries: {Environment.RETRY_TASK_COUNT_MAX.value} )')
+            # Save info about failed chunks for more convenient problem investigation
+            chunk_id = self.work_task.redis_key if self.work_task.WORK_TYPE is WorkType.chunk else None
+            doc_change = TaskStateChange().append_failed_task(self.TASK_TYPE, chunk_id)
+
+            if not self.set_task_state(WorkType.document, self.work_task.document_id, doc_change):
+                doc_task: DocumentTask = doc_task or self.get_document_task()
+                with self.task_update_manager(doc_task) as doc_task:
+                    doc_change.apply(doc_task)
+
+            # Indicate that one more attempt was performed
+            self.transition_task(TaskStateChange().start(self.TASK_TYPE, self._dt_now_utc()).finish(
+                self.TASK_TYPE, TaskStatus.completed_failure, self._dt_now_utc(),
+                f'Task has exceeded retries. '
+                f'(Attempts: {self.task_info.attempts + 1}, '
+                f'max retries: {Environment.RETRY_TASK_COUNT_MAX.value} )'))
             return False
 
         # Now work-task looks good and ready to be processed
@@ -0,0 +1,89 @@
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+from pydantic import BaseModel
+from redis.client import Pipeline
+
+from text2phenotype.constants.environment import Environment
+from text2phenotype.redis_client.client import RedisClient
+from text2phenotype.tasks.task_enums import (
+    TaskEnum,
+    TaskStatus,
+    WorkType,
+)
+
+
+class TaskEvent(BaseModel):
+    """The task of the work task (document or chunk) got the status"""
+    task: TaskEnum
+    work_type: WorkType
+    redis_key: str
+    status: TaskStatus
+
+    def to_fields(self) -> Dict[str, str]:
+        return {'task': self.task.value,
+                'work_type': self.work_type.value,
+                'redis_key': self.redis_key,
+                'status': self.status.value}
+
+    @classmethod
+    def from_fields(cls, fields: Dict[str, str]) -> 'TaskEvent':
+        return cls(**fields)
+
+
+class TaskEventStream:
+    """
+    Log of the task events on a Redis stream, read by consumer groups.
+    The events are written in the pipeline writing the work task (see RedisMethodsMixin.set_task),
+    a consumer reads them in batches and acks them once processed, the events of a failed consumer
+    are claimed by the other consumers of the group after min_idle_time.
+    The delivery is at least once, the same event can be read again
+    """
+
+    def __init__(self, client: RedisClient, name: Optional[str] = None, max_len: Optional[int] = None):
+        self.client = client
+        self.name = name or Environment.TASK_EVENTS_STREAM.value
+        self.max_len = max_len or Environment.TASK_EVENTS_STREAM_MAX_LEN.value
+
+    def add(self, events: Iterable[TaskEvent], pipeline: Optional[Pipeline] = None):
+        """Add the events, with the commands of the pipeline if given (the caller executes it)"""
+        execute = pipeline is None
+        if execute:
+            pipeline = self.client.pipeline()
+
+        for event in events:
+            # the oldest events are trimmed, approximately to be cheap
+            pipeline.xadd(self.name, event.to_fields(), maxlen=self.max_len, approximate=True)
+
+        if execute:
+            pipeline.execute()
+
+    def create_group(self, group: str, last_id: str = '0') -> bool:
+        """
+        Create the consumer group if missing, reading the events after last_id
+        ('0' all the events of the stream, '$' only the new ones)
+        """
+        return self.client.xgroup_create(self.name, group, last_id=last_id)
+
+    def read(self, group: str, consumer: str, count: int = 100,
+             block: Optional[int] = None) -> List[Tuple[str, TaskEvent]]:
+        """Up to count events not delivered to the group yet, waiting up to block ms if there is none"""
+        return [(event_id, TaskEvent.from_fields(fields))
+                for event_id, fields in self.client.xreadgroup(self.name, group, consumer, count=count, block=block)]
+
+    def ack(self, group: str, event_ids: Iterable[str]) -> int:
+        event_ids = list(event_ids)
+        if not event_ids:
+            return 0
+        return self.client.xack(self.name, group, *event_ids)
+
+    def claim_pending(self, group: str, consumer: str, min_idle_time: int,
+                      count: int = 100) -> List[Tuple[str, TaskEvent]]:
+        """Events delivered to the group but not acked for min_idle_time ms, now owned by the consumer"""
+        return [(event_id, TaskEvent.from_fields(fields))
+                for event_id, fields in self.client.xclaim_idle(self.name, group, consumer, min_idle_time, count)]
@@ -1,4 +1,5 @@
 import copy
+import functools
 import inspect
 import json
 import os
@@ -9,9 +10,11 @@ from datetime import datetime
 from typing import (
     BinaryIO,
     ClassVar,
+    Collection,
     Dict,
     Iterable,
     List,
+    NamedTuple,
     Optional,
     Set,
     Tuple,
@@ -89,6 +92,8 @@ class TaskInfo(BaseModel, ABC):
     WORK_TYPE: ClassVar[WorkType] = None
     RESULTS_FILE_EXTENSION: ClassVar[str] = None
     TASK_TYPE: ClassVar[TaskEnum] = None
+    # the results depend only on the chunk text and the models, see ChunkResultCache
+    RESULT_CACHEABLE: ClassVar[bool] = False
 
     task: TaskEnum = None
     status: TaskStatus = Field(None, description=f'By default will be set {TaskStatus.not_started.value} status')
@@ -349,6 +354,7 @@ class AnnotationTaskInfo(ChunkTaskInfo):
     QUEUE_NAME: ClassVar[str] = Environment.ANNOTATE_TASKS_QUEUE.value
     RESULTS_FILE_EXTENSION: ClassVar[str] = 'annotations.json'
     TASK_TYPE: ClassVar[TaskEnum] = TaskEnum.annotate
+    RESULT_CACHEABLE: ClassVar[bool] = True
     FDL_ENABLED: ClassVar[bool] = Environment.FDL_ENABLED.value
 
     @validator('dependencies', always=True, pre=True)
@@ -400,11 +406,13 @@ class VectorizeTaskInfo(ChunkTaskInfo):
     QUEUE_NAME: ClassVar[str] = Environment.VECTORIZE_TASKS_QUEUE.value
     RESULTS_FILE_EXTENSION: ClassVar[str] = 'vectorization.json'
     TASK_TYPE: ClassVar[TaskEnum] = TaskEnum.vectorize
+    RESULT_CACHEABLE: ClassVar[bool] = True
 
     dependencies: List[TaskEnum] = [TaskEnum.annotate]
 
 
 class SingleModelTaskInfo(ChunkTaskInfo):
+    RESULT_CACHEABLE: ClassVar[bool] = True
     dependencies: List[TaskEnum] = [TaskEnum.vectorize]
 
 
@@ -662,32 +670,134 @@ class PurgeTaskInfo(TaskInfo):
     WORK_TYPE: ClassVar[WorkType] = WorkType.document
 
 
-class TaskDependencies:
-    @classmethod
-    def iter_dependent_tasks(cls, task: TaskEnum) -> Iterable[TaskEnum]:
-        skip_for_next = {task}
+class TaskNode(NamedTuple):
+    work_type: Optional[WorkType]
+    dependencies: Tuple[TaskEnum, ...]
+    # dependencies and model dependencies, in the order iter_dependencies_deep visits them
+    sub_tasks: Tuple[TaskEnum, ...]
 
-        def _iter_deep(task: TaskEnum) -> Iterable:
-            yield task
-
-            for sup_task in TASK_MAPPING:
-                if sup_task in skip_for_next:
-                    continue
+    @classmethod
+    def from_task_info(cls, task_info: TaskInfo) -> 'TaskNode':
+        return cls(work_type=task_info.WORK_TYPE,
+                   dependencies=tuple(task_info.dependencies),
+                   sub_tasks=tuple(set(task_info.dependencies + task_info.model_dependencies)))
+
+
+class TaskDependencyGraph:
+    """
+    Dependencies of the default TaskInfo of every task in the task mapping, computed once.
+    The traversals are memoized, so planning the tasks of a job doesn't create TaskInfo objects
+    for anything but the returned tasks
+    """
+
+    def __init__(self, task_mapping: Dict[TaskEnum, Type[TaskInfo]]):
+        self.nodes: Dict[TaskEnum, TaskNode] = {
+            task: TaskNode.from_task_info(task_info_class()) for task, task_info_class in task_mapping.items()}
+
+        # task -> tasks depending on it, in the task mapping order
+        dependents: Dict[TaskEnum, List[TaskEnum]] = {}
+        for task, node in self.nodes.items():
+            for dependency in dict.fromkeys(node.dependencies):
+                dependents.setdefault(dependency, []).append(task)
+        self.dependents: Dict[TaskEnum, Tuple[TaskEnum, ...]] = {
+            task: tuple(sup_tasks) for task, sup_tasks in dependents.items()}
+
+        self.topological_order: Tuple[TaskEnum, ...] = self.__topological_order()
+
+    def __topological_order(self) -> Tuple[TaskEnum, ...]:
+        """The tasks of the mapping, every task after its dependencies and model dependencies"""
+        order = []
+        # 1 - visiting, 2 - done
+        state: Dict[TaskEnum, int] = {}
+
+        def visit(task: TaskEnum):
+            if state.get(task) == 2:
+                return
+            if state.get(task) == 1:
+                raise ValueError(f'Task dependencies cycle through "{task.value}"')
+            state[task] = 1
+            for sub_task in self.nodes[task].sub_tasks:
+                if sub_task in self.nodes:
+                    visit(sub_task)
+            state[task] = 2
+            order.append(task)
+
+        for task in self.nodes:
+            visit(task)
+        return tuple(order)
+
+    def node(self, task: TaskEnum) -> TaskNode:
+        node = self.nodes.get(task)
+        if node is None:
+            # create_task_info reports the missing TaskInfo class
+            node = TaskNode.from_task_info(create_task_info(task))
+        return node
+
+    @functools.lru_cache(maxsize=None)
+    def dependent_tasks(self, task: TaskEnum) -> Tuple[TaskEnum, ...]:
+        """The task and all the tasks depending on it, directly or not"""
+        visited = {task}
+        result = []
+
+        def visit(task: TaskEnum):
+            result.append(task)
+            for sup_task in self.dependents.get(task, ()):
+                if sup_task not in visited:
+                    visited.add(sup_task)
+                    visit(sup_task)
+
+        visit(task)
+        return tuple(result)
+
+    @functools.lru_cache(maxsize=None)
+    def visit_order(self, task: TaskEnum) -> Tuple[TaskEnum, ...]:
+        """The task and its dependencies, recursively, the shared dependencies are repeated"""
+        result = [task]
+        for sub_task in self.node(task).sub_tasks:
+            result.extend(self.visit_order(sub_task))
+        return tuple(result)
+
+    @functools.lru_cache(maxsize=None)
+    def deep_dependencies(self, tasks: Tuple[TaskEnum, ...], work_type: WorkType) -> Tuple[TaskEnum, ...]:
+        """The tasks and their dependencies of the work type, recursively, in the first visit order"""
+        result = {}
+        for task in tasks:
+            for sub_task in self.visit_order(task):
+                if sub_task not in result and self.node(sub_task).work_type is work_type:
+                    result[sub_task] = None
+        return tuple(result)
+
+    def ready_tasks(self,
+                    planned: Iterable[TaskEnum],
+                    completed: Collection[TaskEnum],
+                    completed_task: Optional[TaskEnum] = None) -> Tuple[TaskEnum, ...]:
+        """
+        The planned tasks not completed yet with all their planned dependencies completed.
+        With completed_task (e.g. from a task event), only the tasks depending directly on it.
+        The tasks are in the topological order
+        """
+        planned = set(planned)
+        ready = []
+        for task in self.topological_order:
+            if task not in planned or task in completed:
+                continue
+            sub_tasks = self.nodes[task].sub_tasks
+            if completed_task is not None and completed_task not in sub_tasks:
+                continue
+            if all(sub_task in completed or sub_task not in planned for sub_task in sub_tasks):
+                ready.append(task)
+        return tuple(ready)
 
-                dependencies = create_task_info(sup_task).dependencies
-                if task in dependencies:
-                    skip_for_next.add(sup_task)
-                    yield from _iter_deep(sup_task)
 
-        yield from _iter_deep(task)
+class TaskDependencies:
+    @classmethod
+    def iter_dependent_tasks(cls, task: TaskEnum) -> Iterable[TaskEnum]:
+        yield from TASK_DEPENDENCY_GRAPH.dependent_tasks(task)
 
     @classmethod
     def iter_dependencies_deep(cls, task: TaskEnum) -> Iterable[Tuple[TaskEnum, TaskInfo]]:
-        task_info = create_task_info(task)
-        yield task, task_info
-
-        for sub_task in set(task_info.dependencies + task_info.model_dependencies):
-            yield from cls.iter_dependencies_deep(sub_task)
+        for sub_task in TASK_DEPENDENCY_GRAPH.visit_order(task):
+            yield sub_task, create_task_info(sub_task)
 
     @classmethod
     def get_chunk_tasks(
@@ -702,20 +812,9 @@ class TaskDependencies:
             operations |= SummaryTask.collect_tasks_set(summary_tasks,
                                                         expected_type=TaskOperation)
 
-        def iter_chunk_tasks_deep(task: TaskEnum):
-            for task, task_info in cls.iter_dependencies_deep(task):
-                if task_info.WORK_TYPE is WorkType.chunk:
-                    yield task, task_info
-
-        tasks_dir: Dict[TaskEnum, TaskInfo] = dict()
-
-        for operation in operations:
-            task = TaskEnum(operation.value)
-
-            for dep, task_info in iter_chunk_tasks_deep(task):
-                tasks_dir.setdefault(dep, task_info)
-
-        return tasks_dir
+        tasks = tuple(TaskEnum(operation.value) for operation in operations)
+        return {task: create_task_info(task)
+                for task in TASK_DEPENDENCY_GRAPH.deep_dependencies(tasks, WorkType.chunk)}
 
     @classmethod
     def get_document_tasks(
@@ -749,18 +848,11 @@ class TaskDependencies:
         tasks_dir[TaskEnum.reassemble] = ReassembleTaskInfo(
             requires_ocr=requires_ocr)  # must reassemble after we disassemble
 
-        def iter_document_tasks_deep(task: TaskEnum):
-            for task, task_info in cls.iter_dependencies_deep(task):
-                if task_info.WORK_TYPE is WorkType.document:
-                    yield task, task_info
-
-        for operation in operations:
-            task = TaskEnum(operation.value)
-
-            for task, task_info in iter_document_tasks_deep(task):
-                if task not in tasks_dir:
-                    tasks_dir.setdefault(task, task_info)
-                    discharge_task.dependencies.append(task)
+        tasks = tuple(TaskEnum(operation.value) for operation in operations)
+        for task in TASK_DEPENDENCY_GRAPH.deep_dependencies(tasks, WorkType.document):
+            if task not in tasks_dir:
+                tasks_dir[task] = create_task_info(task)
+                discharge_task.dependencies.append(task)
 
         # Fill SummaryCustomTaskInfo
         summary_task_info: Optional[SummaryCustomTaskInfo] = tasks_dir.get(TaskEnum.summary_custom)
@@ -810,3 +902,6 @@ def create_task_info(task_enum: TaskEnum, **kwargs) -> TaskInfo:
                                 f'The base class "{task_info_class.__name__}" is used instead.')
 
     return task_info_class(**kwargs)
+
+
+TASK_DEPENDENCY_GRAPH = TaskDependencyGraph(TASK_MAPPING)
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+import uuid
+from typing import (
+    Optional,
+    Set,
+)
+
+from text2phenotype.common.log import operations_logger
+from text2phenotype.constants.environment import Environment
+from text2phenotype.redis_client.client import RedisClient
+from text2phenotype.tasks.task_enums import TaskEnum
+
+# KEYS: lease, ARGV: owner, expiration in ms. The lease is changed only by its owner
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class TaskLeaseHeld(Exception):
+    """The lease of the task is held by another worker, the message is requeued"""
+
+
+class TaskLease:
+    """
+    The worker owning the lease of a task is working on it. The lease expires unless renewed
+    (see LeaseManager), e.g. when the worker dies or stops making progress, so a redelivered message
+    of the task waits for the lease instead of doing the same work twice
+    """
+
+    def __init__(self, client: RedisClient, redis_key: str, task: TaskEnum, expire: Optional[int] = None):
+        self.client = client
+        self.key = f'lease:{redis_key}:{task.value}'
+        self.owner = uuid.uuid4().hex
+        self.expire = expire or Environment.TASK_LEASE_EXPIRATION.value
+        # the thread working on the task and the time of its last progress, see LeaseManager.progress()
+        self.thread_id = threading.get_ident()
+        self.progressed_at = time.monotonic()
+
+    def acquire(self) -> bool:
+        """False if another worker holds the lease"""
+        self.progressed_at = time.monotonic()
+        return bool(self.client.set(self.key, self.owner, ex=self.expire, nx=True))
+
+    def renew(self) -> bool:
+        """False if the lease expired meanwhile"""
+        return bool(self.client.script(RENEW_SCRIPT)(keys=[self.key], args=[self.owner, self.expire * 1000]))
+
+    def release(self):
+        self.client.script(RELEASE_SCRIPT)(keys=[self.key], args=[self.owner])
+
+    def is_held(self) -> bool:
+        """Held by a worker, possibly this one"""
+        return self.client.exists(self.key)
+
+    def is_stalled(self) -> bool:
+        """No progress for TASK_LEASE_PROGRESS_TIMEOUT seconds, the lease is left to expire"""
+        return time.monotonic() - self.progressed_at > Environment.TASK_LEASE_PROGRESS_TIMEOUT.value
+
+
+class LeaseManager:
+    """
+    Renews the leases of the tasks in progress in the process, every third of their expiration,
+    as long as their workers make progress (see progress()).
+    The renewal thread is started on the first lease, and started again if it died or after a fork
+    """
+
+    def __init__(self):
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # the leases and the thread of the parent process are not inherited
+        self._lock = threading.Lock()
+        self._leases: Set[TaskLease] = set()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def interval(self) -> float:
+        with self._lock:
+            expire = min((lease.expire for lease in self._leases), default=Environment.TASK_LEASE_EXPIRATION.value)
+        return expire / 3
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def add(self, lease: TaskLease):
+        with self._lock:
+            self._leases.add(lease)
+            if not self.is_alive():
+                self._thread = threading.Thread(target=self.run, name='LeaseManager', daemon=True)
+                self._thread.start()
+        # a shorter interval is used right away
+        self._wakeup.set()
+
+    def remove(self, lease: TaskLease):
+        with self._lock:
+            self._leases.discard(lease)
+
+    def progress(self, thread_id: Optional[int] = None):
+        """The worker thread (the current one by default) makes progress on its tasks"""
+        thread_id = thread_id or threading.get_ident()
+        now = time.monotonic()
+        with self._lock:
+            for lease in self._leases:
+                if lease.thread_id == thread_id:
+                    lease.progressed_at = now
+
+    def renew(self):
+        with self._lock:
+            leases = list(self._leases)
+
+        for lease in leases:
+            if lease.is_stalled():
+                operations_logger.warning(f'The lease {lease.key} is not renewed, no progress for '
+                                          f'{Environment.TASK_LEASE_PROGRESS_TIMEOUT.value} seconds')
+                continue
+            try:
+                if not lease.renew():
+                    operations_logger.warning(f'The lease {lease.key} expired before it was renewed')
+            except Exception:
+                # renewed on the next round, before the expiration hopefully
+                operations_logger.exception(f'Failed to renew the lease {lease.key}')
+
+    def run(self) -> None:
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.renew()
+
+
+LEASE_MANAGER = LeaseManager()
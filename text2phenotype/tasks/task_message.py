@@ -16,6 +16,8 @@ class TaskMessage(BaseModel):
     is_reprocess_task: Optional[bool] = None
     sender: Optional[str] = None
     version: Optional[str] = None
+    # RabbitMQ message priority of the job, see JobTask.message_priority()
+    priority: Optional[int] = None
 
     @validator('version', pre=True, always=True)
     def check_version(cls, v):
@@ -0,0 +1,211 @@
+import json
+from datetime import datetime
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Sequence,
+)
+
+from pydantic.datetime_parse import parse_datetime
+
+from text2phenotype.tasks.task_enums import (
+    TaskEnum,
+    TaskStatus,
+)
+from text2phenotype.tasks.task_info import TaskInfo
+from text2phenotype.tasks.work_tasks import (
+    DocumentTask,
+    WorkTask,
+)
+
+# kinds of the changes, see TRANSITION_SCRIPT
+SET = 'set'
+INCREMENT = 'incr'
+APPEND = 'append'
+
+TASK_FIELD_PREFIX = 'task:'
+FAILED_TASKS_FIELD = 'failed_tasks'
+FAILED_CHUNKS_FIELD_PREFIX = 'failed_chunks:'
+
+# The changes are merged in the task state hash, the lock of the task (redis_lock) is respected:
+# set_task() of the lock owner replaces the hash with the task JSON.
+# Only the readers merging the hash (get_task) see the changes, see TASK_STATE_SCRIPT_ENABLED.
+# KEYS: task JSON, task state hash, task lock, task event stream (optional)
+# ARGV: number of changes, (kind, field, value) of every change,
+#       then the stream max length and (number of fields, field, value...) of every event
+# Returns 1 when applied, 0 if the task doesn't exist, -1 if the task is locked
+TRANSITION_SCRIPT = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return -1
+end
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+
+local changes = tonumber(ARGV[1])
+for i = 0, changes - 1 do
+    local kind, field, value = ARGV[2 + i * 3], ARGV[3 + i * 3], ARGV[4 + i * 3]
+    if kind == 'set' then
+        redis.call('HSET', KEYS[2], field, value)
+    elseif kind == 'incr' then
+        redis.call('HINCRBY', KEYS[2], field, value)
+    else
+        -- JSON arrays, '[a]' + '[b]' -> '[a,b]'
+        local items = redis.call('HGET', KEYS[2], field)
+        if items then
+            value = string.sub(items, 1, -2) .. ',' .. string.sub(value, 2)
+        end
+        redis.call('HSET', KEYS[2], field, value)
+    end
+end
+
+if KEYS[4] then
+    local unpack = unpack or table.unpack
+    local i = 2 + changes * 3
+    local max_len = ARGV[i]
+    i = i + 1
+    while ARGV[i] do
+        local count = tonumber(ARGV[i])
+        local fields = {}
+        for j = 1, count * 2 do
+            fields[j] = ARGV[i + j]
+        end
+        redis.call('XADD', KEYS[4], 'MAXLEN', '~', max_len, '*', unpack(fields))
+        i = i + 1 + count * 2
+    end
+end
+return 1
+"""
+TRANSITION_APPLIED = 1
+TRANSITION_MISSING = 0
+TRANSITION_LOCKED = -1
+
+
+def _format_datetime(value: Optional[datetime]) -> str:
+    # '' is None
+    return value.isoformat() if value else ''
+
+
+class TaskStateChange:
+    """
+    Transitions of the task statuses of a work task, written without reading the task
+    (see RedisMethodsMixin.set_task_state). The changes can be chained, the last value of a field wins:
+
+    TaskStateChange().start(TaskEnum.drug, now).finish(TaskEnum.drug, TaskStatus.canceled, now)
+    """
+
+    def __init__(self):
+        self.changes: Dict[str, str] = {}
+        self.increments: Dict[str, int] = {}
+        self.appends: Dict[str, List] = {}
+
+    @staticmethod
+    def task_field(task: TaskEnum, name: str) -> str:
+        return f'{TASK_FIELD_PREFIX}{task.value}:{name}'
+
+    def start(self, task: TaskEnum, now: datetime) -> 'TaskStateChange':
+        """The worker starts the task: started_at, no completed_at, one more attempt"""
+        self.changes[self.task_field(task, 'status')] = TaskStatus.started.value
+        self.changes[self.task_field(task, 'started_at')] = _format_datetime(now)
+        self.changes[self.task_field(task, 'completed_at')] = _format_datetime(None)
+        return self.increment_attempts(task)
+
+    def finish(self, task: TaskEnum, status: TaskStatus, now: datetime,
+               error_message: Optional[str] = None) -> 'TaskStateChange':
+        self.changes[self.task_field(task, 'status')] = status.value
+        self.changes[self.task_field(task, 'completed_at')] = _format_datetime(now)
+        if error_message is not None:
+            self.appends.setdefault(self.task_field(task, 'error_messages'), []).append(error_message)
+        return self
+
+    def complete(self, task: TaskEnum, now: datetime) -> 'TaskStateChange':
+        return self.finish(task, TaskStatus.completed_success, now)
+
+    def fail(self, task: TaskEnum, now: datetime, error_message: str) -> 'TaskStateChange':
+        return self.finish(task, TaskStatus.failed, now, error_message)
+
+    def cancel(self, task: TaskEnum, now: datetime, error_message: Optional[str] = None) -> 'TaskStateChange':
+        """The task is canceled before the work, counted as an attempt"""
+        return self.start(task, now).finish(task, TaskStatus.canceled, now, error_message)
+
+    def increment_attempts(self, task: TaskEnum) -> 'TaskStateChange':
+        field = self.task_field(task, 'attempts')
+        self.increments[field] = self.increments.get(field, 0) + 1
+        return self
+
+    def append_failed_task(self, task: TaskEnum, chunk_id: Optional[str] = None) -> 'TaskStateChange':
+        """The document failed in the task, in the chunk if given"""
+        self.appends.setdefault(FAILED_TASKS_FIELD, []).append(task.value)
+        if chunk_id is not None:
+            self.appends.setdefault(f'{FAILED_CHUNKS_FIELD_PREFIX}{chunk_id}', []).append(task.value)
+        return self
+
+    def script_args(self) -> List[str]:
+        """The (kind, field, value) ARGV of TRANSITION_SCRIPT, after the number of changes"""
+        args = []
+        for field, value in self.changes.items():
+            args.extend((SET, field, value))
+        for field, increment in self.increments.items():
+            args.extend((INCREMENT, field, str(increment)))
+        for field, items in self.appends.items():
+            args.extend((APPEND, field, json.dumps(items)))
+        return [str(len(args) // 3)] + args
+
+    def state(self) -> Dict[str, str]:
+        """The task state hash of the change alone"""
+        state = dict(self.changes)
+        state.update((field, str(increment)) for field, increment in self.increments.items())
+        state.update((field, json.dumps(items)) for field, items in self.appends.items())
+        return state
+
+    def apply(self, work_task: WorkTask):
+        """Apply the change to the task object"""
+        apply_task_state(work_task, self.state())
+
+    def apply_task_info(self, task: TaskEnum, task_info: TaskInfo):
+        """Apply the changes of the task to its TaskInfo"""
+        prefix = f'{TASK_FIELD_PREFIX}{task.value}:'
+        for field, value in self.state().items():
+            if field.startswith(prefix):
+                _apply_task_info_field(task_info, field[len(prefix):], value)
+
+
+def _apply_task_info_field(task_info: TaskInfo, name: str, value: str):
+    if name == 'status':
+        task_info.status = TaskStatus(value)
+    elif name in ('started_at', 'completed_at'):
+        setattr(task_info, name, parse_datetime(value) if value else None)
+    elif name == 'attempts':
+        task_info.attempts += int(value)
+    elif name == 'error_messages':
+        task_info.error_messages.extend(json.loads(value))
+
+
+def apply_task_state(work_task: WorkTask, state: Dict[str, str]):
+    """Apply the task state hash (the transitions since the task JSON was written) to the task"""
+    for field, value in state.items():
+        if field.startswith(TASK_FIELD_PREFIX):
+            task, name = field[len(TASK_FIELD_PREFIX):].split(':', 1)
+            task_info = work_task.task_statuses.get(TaskEnum(task))
+            # e.g. the cached properties of the task
+            if task_info is not None:
+                _apply_task_info_field(task_info, name, value)
+
+        elif isinstance(work_task, DocumentTask):
+            failed_tasks = [TaskEnum(task) for task in json.loads(value)]
+            if field == FAILED_TASKS_FIELD:
+                work_task.failed_tasks.extend(failed_tasks)
+            elif field.startswith(FAILED_CHUNKS_FIELD_PREFIX):
+                chunk_id = field[len(FAILED_CHUNKS_FIELD_PREFIX):]
+                work_task.failed_chunks.setdefault(chunk_id, []).extend(failed_tasks)
+
+
+def event_script_args(max_len: int, events_fields: Sequence[Dict[str, str]]) -> List[str]:
+    """The ARGV of the events of TRANSITION_SCRIPT"""
+    args = [str(max_len)]
+    for fields in events_fields:
+        args.append(str(len(fields)))
+        for field, value in fields.items():
+            args.extend((field, value))
+    return args
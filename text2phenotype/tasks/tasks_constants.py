@@ -8,6 +8,7 @@ class TasksConstants:
     STORAGE_DOCUMENTS_PREFIX = os.path.join(STORAGE_BASE_PREFIX, 'documents')
     STORAGE_CHUNKS_PREFIX = 'chunks'
     STORAGE_JOBS_PREFIX = os.path.join(STORAGE_BASE_PREFIX, 'jobs')
+    STORAGE_RESULT_CACHE_PREFIX = os.path.join(STORAGE_BASE_PREFIX, 'result_cache')
 
     STORAGE_PURGED_JOBS_PREFIX = os.path.join('purged', 'jobs')
 
@@ -27,6 +27,7 @@ from pydantic import (
     validator,
 )
 
+from text2phenotype.common import json_codec
 from text2phenotype.common.log import operations_logger
 from text2phenotype.constants.environment import Environment
 from text2phenotype.tasks.document_info import DocumentInfo
@@ -62,6 +63,8 @@ class BaseTask(BaseModel, ABC):
     work_type: WorkType = None
 
     class Config:
+        json_loads = json_codec.loads
+
         @staticmethod
         def schema_extra(schema: Dict[str, Any], model: Type['BaseTask']) -> None:
             total_duration_field = {
@@ -127,15 +130,16 @@ class BaseTask(BaseModel, ABC):
     def get_metadata_file_key(cls, **kwargs) -> str:
         pass
 
-    def create_task_message(self):
+    def create_task_message(self, priority: Optional[int] = None):
         return TaskMessage(work_type=self.WORK_TYPE,
-                           redis_key=self.redis_key)
+                           redis_key=self.redis_key,
+                           priority=priority)
 
     @classmethod
     def from_json(cls,
                   json_str: Union[str, bytes]) -> Union['DocumentTask', 'ChunkTask', 'JobTask']:
 
-        data = json.loads(json_str)
+        data = json_codec.loads(json_str)
         work_type = WorkType(data['work_type'])
 
         if work_type is WorkType.document:
@@ -330,6 +334,9 @@ class ChunkTask(WorkTask):
     chunk_num: int
     chunk_size: int
     text_file_key: str = None
+    # ChunkResultCache.text_digest() of the chunk text, optional: set by the service creating the chunk tasks
+    # to spare the download of the text on a cache lookup, see RMQConsumerTaskWorker.result_cache_key()
+    text_digest: Optional[str] = None
     processing_duration: Optional[int] = None
 
     @validator('processing_duration', always=True)
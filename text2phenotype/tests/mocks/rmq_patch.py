@@ -2,6 +2,8 @@ from collections import deque
 from typing import (
     Dict,
     Optional,
+    Sequence,
+    Tuple,
 )
 from unittest.case import TestCase
 from unittest.mock import patch
@@ -16,9 +18,13 @@ class MockRmqBasicPublisher:
     def __str__(self):
         return f'{self.__class__.__name__}({self._queues})'
 
-    def publish_message(self, message: str) -> None:
+    def publish_message(self, message: str, priority: Optional[int] = None) -> None:
         self.queue.append(message)
 
+    def publish_messages(self, messages: Sequence[Tuple[str, Optional[int]]]) -> int:
+        self.queue.extend(message for message, _ in messages)
+        return len(messages)
+
     def clear(self):
         self._queues.clear()
 
@@ -101,7 +101,7 @@ class MockStorageContainer(dict):
     def get_object(self, object_name: str) -> Optional[File]:
         data = self.get(object_name)
         if data:
-            return File(name=object_name, data=data)
+            return File(name=object_name, data=data, storage=self)
 
     def download_object_bytes(self, storage_key):
         return self.get(storage_key)